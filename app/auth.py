@@ -8,35 +8,43 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from app.config import settings
+from app.tokens import AuthenticatedToken, create_token_registry
+from app.tracing import span
 
 logger = logging.getLogger(__name__)
 
 # HTTP Bearer схема для автоматической документации
 security = HTTPBearer()
 
+# Реестр допущенных токенов (строится один раз, файл токенов перечитывается сам)
+token_registry = create_token_registry(settings)
 
-async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+
+async def authenticate(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> AuthenticatedToken:
     """
-    Проверка Bearer Token из заголовка Authorization.
+    Проверка Bearer Token из заголовка Authorization по реестру токенов.
 
     Args:
         credentials: Credentials из HTTP Bearer схемы
 
     Returns:
-        str: Валидный токен
+        AuthenticatedToken: Токен с его политикой (лимиты, TTL кеша, базы)
 
     Raises:
-        HTTPException: 401 если токен невалидный
+        HTTPException: 401 если токен невалидный, 403 если токену закрыта база
 
     Usage:
         @app.get("/protected")
-        async def protected_route(token: str = Depends(verify_token)):
-            return {"message": "Access granted"}
+        async def protected_route(auth: AuthenticatedToken = Depends(authenticate)):
+            return {"limit": auth.policy.max_rows}
     """
     token = credentials.credentials
-    valid_tokens = settings.get_api_tokens()
+    with span("auth"):
+        auth = token_registry.lookup(token)
 
-    if token not in valid_tokens:
+    if auth is None:
         # Логируем только первые 10 символов токена для безопасности
         logger.warning(f"Invalid token attempt: {token[:10]}... " f"(length: {len(token)})")
         raise HTTPException(
@@ -45,8 +53,36 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    logger.debug(f"Token verified successfully: {token[:10]}...")
-    return token
+    if not auth.policy.allows_database(settings.db_name):
+        logger.warning(f"Token {auth.label} is not allowed to access {settings.db_name}")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Token is not allowed to access this database",
+        )
+
+    logger.debug(f"Token verified successfully: {auth.label}")
+    return auth
+
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """
+    Проверка Bearer Token из заголовка Authorization.
+
+    Args:
+        credentials: Credentials из HTTP Bearer схемы
+
+    Returns:
+        str: Валидный токен
+
+    Raises:
+        HTTPException: 401 если токен невалидный, 403 если токену закрыта база
+
+    Usage:
+        @app.get("/protected")
+        async def protected_route(token: str = Depends(verify_token)):
+            return {"message": "Access granted"}
+    """
+    return (await authenticate(credentials)).token
 
 
 def get_optional_token(
@@ -0,0 +1,506 @@
+"""
+Кеш результатов запросов
+
+CacheBackend - интерфейс хранилища; здесь же реализация в памяти процесса
+(QueryCache), общие для нескольких процессов бэкенды - в app/cache_backends.py.
+
+QueryCache - ограниченный по памяти LRU кеш с TTL. Ключи распределяются по шардам, у
+каждого шарда свой lock и своя доля бюджета памяти, поэтому потоки executor'а
+БД почти не конкурируют за блокировку. Записи больше доли шарда хранятся в
+отдельном общем шарде (overflow) и занимают место в общем бюджете, так что
+сохранить можно запись размером до всего max_bytes. Размер записи оценивается
+приблизительно; просроченные записи удаляются при чтении и фоновой очисткой.
+
+С stale_grace > 0 запись после истечения TTL еще stale_grace секунд доступна
+как устаревшая (lookup(..., allow_stale=True)) - для stale-while-revalidate.
+"""
+
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Сколько элементов просматривать при оценке размера больших значений
+SIZE_SAMPLE = 64
+
+# Как часто ожидающий single-flight вызов проверяет свою отмену (сек)
+JOIN_POLL_INTERVAL = 0.05
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Приблизительный размер значения в байтах.
+
+    Объекты могут сообщить свой размер методом approx_size(); для списков
+    размер оценивается по выборке элементов (без учета глубокой вложенности).
+    """
+    approx_size = getattr(value, "approx_size", None)
+    if approx_size is not None:
+        return approx_size()
+    if isinstance(value, (list, tuple)) and value:
+        sample = value[:SIZE_SAMPLE]
+        per_item = sum(sys.getsizeof(item) for item in sample) / len(sample)
+        return sys.getsizeof(value) + int(per_item * len(value))
+    return sys.getsizeof(value)
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at")
+
+    def __init__(self, value: Any, size: int, expires_at: float):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+
+class _Shard:
+    """Один шард: LRU (OrderedDict) + собственный lock и бюджет"""
+
+    __slots__ = ("lock", "entries", "bytes", "max_bytes")
+
+    def __init__(self, max_bytes: int):
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.bytes = 0
+        self.max_bytes = max_bytes
+
+
+class CacheBackend:
+    """
+    Интерфейс хранилища кеша результатов.
+
+    Реализации: QueryCache (память процесса), SqliteCacheBackend (общий файл
+    для всех worker-процессов на хосте), RedisCacheBackend (внешний сервер по
+    протоколу Redis). Ошибки хранилища не должны ломать выполнение запросов:
+    внешние бэкенды при сбое ведут себя как промах кеша.
+    """
+
+    name = "base"
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        default_ttl: float = 300,
+        sweep_interval: float = 60,
+        stale_grace: float = 0,
+    ):
+        """
+        Args:
+            max_bytes: Бюджет размера кеша в байтах (None - не ограничен бэкендом)
+            default_ttl: Время жизни записи по умолчанию в секундах
+            sweep_interval: Период фоновой очистки просроченных записей (0 - выкл.)
+            stale_grace: Сколько секунд после TTL запись еще можно отдать как
+                устаревшую (0 - записи истекают сразу)
+        """
+        self.max_bytes = max_bytes
+        # Самая большая запись, которую бэкенд может сохранить (None - без лимита)
+        self.max_entry_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.sweep_interval = sweep_interval
+        self.stale_grace = stale_grace
+
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._rejected = 0
+        self._errors = 0
+
+        self._stop_event = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    # ==================== GET / SET ====================
+
+    def get(self, key: str) -> Optional[Any]:
+        """Получить значение, если оно есть и не просрочено"""
+        return self.lookup(key)[0]
+
+    def lookup(self, key: str, allow_stale: bool = False) -> Tuple[Optional[Any], bool]:
+        """
+        Найти значение.
+
+        Args:
+            key: Ключ
+            allow_stale: Отдавать запись с истекшим TTL в пределах stale_grace
+
+        Returns:
+            Tuple: (значение или None, True если значение устаревшее)
+        """
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Сохранить значение; False если запись не была сохранена"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Удалить запись"""
+        raise NotImplementedError
+
+    def clear(self) -> int:
+        """Очистить кеш; возвращает количество удаленных записей"""
+        raise NotImplementedError
+
+    # ==================== EXPIRATION ====================
+
+    def sweep(self) -> int:
+        """Удалить все просроченные записи (с учетом stale_grace); возвращает их количество"""
+        return 0
+
+    def start(self) -> None:
+        """Запустить фоновую очистку просроченных записей"""
+        if self.sweep_interval <= 0 or self._sweeper is not None:
+            return
+        self._stop_event.clear()
+        self._sweeper = threading.Thread(
+            target=self._sweep_loop, name=f"cache-sweeper-{self.name}", daemon=True
+        )
+        self._sweeper.start()
+
+    def stop(self) -> None:
+        """Остановить фоновую очистку и освободить ресурсы"""
+        self._stop_event.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+    def _sweep_loop(self) -> None:
+        while not self._stop_event.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Cache sweep error: {e}")
+
+    # ==================== STATS ====================
+
+    def _count(self, **deltas: int) -> None:
+        """Увеличить счетчики статистики (hits=1, misses=1, ...)"""
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                setattr(self, f"_{name}", getattr(self, f"_{name}") + delta)
+
+    def _usage(self) -> Tuple[Optional[int], Optional[int]]:
+        """(количество записей, занятый объем в байтах); None - неизвестно"""
+        return None, None
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики и текущий размер кеша"""
+        entries, size = self._usage()
+        with self._stats_lock:
+            lookups = self._hits + self._misses
+            return {
+                "backend": self.name,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "max_entry_bytes": self.max_entry_bytes,
+                "hits": self._hits,
+                "stale_hits": self._stale_hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "rejected": self._rejected,
+                "errors": self._errors,
+            }
+
+
+class QueryCache(CacheBackend):
+    """
+    Потокобезопасный LRU кеш в памяти процесса с бюджетом памяти и TTL.
+
+    Example:
+        cache = QueryCache(max_bytes=64 * 1024 * 1024, default_ttl=300)
+        cache.set("key", result)
+        cache.get("key")
+    """
+
+    name = "memory"
+
+    def __init__(
+        self,
+        max_bytes: int = 128 * 1024 * 1024,
+        default_ttl: float = 300,
+        shards: int = 16,
+        sweep_interval: float = 60,
+        stale_grace: float = 0,
+    ):
+        """
+        Args:
+            max_bytes: Бюджет памяти кеша (приблизительно, в байтах)
+            default_ttl: Время жизни записи по умолчанию в секундах
+            shards: Количество шардов (независимых блокировок)
+            sweep_interval: Период фоновой очистки просроченных записей (0 - выкл.)
+            stale_grace: Сколько секунд после TTL запись еще можно отдать как
+                устаревшую (0 - записи истекают сразу)
+        """
+        super().__init__(max_bytes, default_ttl, sweep_interval, stale_grace)
+
+        shards = max(1, shards)
+        self._shards: List[_Shard] = [_Shard(max_bytes // shards) for _ in range(shards)]
+        # Записи больше доли шарда: свой LRU, место - из общего бюджета
+        self._overflow = _Shard(max_bytes)
+        self._all_shards = self._shards + [self._overflow]
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _total_bytes(self) -> int:
+        # Без блокировок: оценка для решения о вытеснении
+        return sum(shard.bytes for shard in self._all_shards)
+
+    # ==================== GET / SET ====================
+
+    def lookup(self, key: str, allow_stale: bool = False) -> Tuple[Optional[Any], bool]:
+        shard = self._shard(key)
+        if key not in shard.entries and key in self._overflow.entries:
+            shard = self._overflow
+        now = time.monotonic()
+        expired = stale = False
+
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                if entry.expires_at + self.stale_grace <= now:
+                    # Истек и период отдачи устаревшего значения
+                    del shard.entries[key]
+                    shard.bytes -= entry.size
+                    expired = True
+                    entry = None
+                elif allow_stale:
+                    stale = True
+                else:
+                    entry = None
+            if entry is not None:
+                shard.entries.move_to_end(key)
+
+        if entry is not None:
+            self._count(hits=1, stale_hits=int(stale))
+        else:
+            self._count(misses=1, expirations=int(expired))
+
+        return (entry.value, stale) if entry is not None else (None, False)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Сохранить значение.
+
+        Запись больше доли шарда сохраняется в overflow шард; место под нее
+        освобождается вытеснением давно использованных записей, сначала
+        крупных, затем из обычных шардов.
+
+        Returns:
+            bool: False если запись больше max_entry_bytes (всего бюджета) и
+                не была сохранена
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        size = estimate_size(value) + sys.getsizeof(key)
+
+        if size > self.max_entry_bytes:
+            self._count(rejected=1)
+            logger.warning(f"Cache REJECTED: {key} ({size} bytes > cache budget)")
+            return False
+
+        shard = self._shard(key)
+        other = self._overflow
+        if size > shard.max_bytes:
+            shard, other = self._overflow, shard
+
+        # Прежнее значение ключа могло лежать в другом шарде
+        self._remove(other, key)
+
+        evicted = 0
+        entry = _Entry(value, size, time.monotonic() + ttl)
+
+        with shard.lock:
+            old = shard.entries.pop(key, None)
+            if old is not None:
+                shard.bytes -= old.size
+            shard.entries[key] = entry
+            shard.bytes += size
+
+            # Вытеснить самые давно использованные записи
+            while shard.bytes > shard.max_bytes:
+                _, victim = shard.entries.popitem(last=False)
+                shard.bytes -= victim.size
+                evicted += 1
+
+        if self._total_bytes() > self.max_bytes:
+            evicted += self._fit(key)
+
+        if evicted:
+            self._count(evictions=evicted)
+            logger.debug(f"Cache EVICTED: {evicted} entries")
+        return True
+
+    @staticmethod
+    def _remove(shard: _Shard, key: str) -> None:
+        if key not in shard.entries:
+            return
+        with shard.lock:
+            entry = shard.entries.pop(key, None)
+            if entry is not None:
+                shard.bytes -= entry.size
+
+    def _fit(self, keep: str) -> int:
+        """
+        Вытеснять записи, пока кеш с overflow не уложится в общий бюджет:
+        сначала давно использованные крупные записи, затем - из обычных
+        шардов по очереди. Запись keep (только что сохраненная) остается.
+        """
+        evicted = 0
+        for shard in [self._overflow] + self._shards:
+            while self._total_bytes() > self.max_bytes:
+                with shard.lock:
+                    victim_key = next(iter(shard.entries), None)
+                    # Сохраненная запись - последняя в своем шарде: если она
+                    # самая давняя, других записей в шарде нет
+                    if victim_key is None or victim_key == keep:
+                        break
+                    shard.bytes -= shard.entries.pop(victim_key).size
+                evicted += 1
+        return evicted
+
+    def delete(self, key: str) -> None:
+        """Удалить запись"""
+        self._remove(self._shard(key), key)
+        self._remove(self._overflow, key)
+
+    def clear(self) -> int:
+        """Очистить кеш; возвращает количество удаленных записей"""
+        count = 0
+        for shard in self._all_shards:
+            with shard.lock:
+                count += len(shard.entries)
+                shard.entries.clear()
+                shard.bytes = 0
+        return count
+
+    def __len__(self) -> int:
+        return sum(len(shard.entries) for shard in self._all_shards)
+
+    # ==================== EXPIRATION ====================
+
+    def sweep(self) -> int:
+        """Удалить все просроченные записи (с учетом stale_grace); возвращает их количество"""
+        deadline = time.monotonic() - self.stale_grace
+        removed = 0
+        for shard in self._all_shards:
+            with shard.lock:
+                expired = [
+                    key for key, entry in shard.entries.items() if entry.expires_at <= deadline
+                ]
+                for key in expired:
+                    shard.bytes -= shard.entries.pop(key).size
+            removed += len(expired)
+
+        if removed:
+            self._count(expirations=removed)
+            logger.debug(f"Cache sweep: {removed} expired entries removed")
+        return removed
+
+    # ==================== STATS ====================
+
+    def _usage(self) -> Tuple[Optional[int], Optional[int]]:
+        entries = 0
+        size = 0
+        for shard in self._all_shards:
+            with shard.lock:
+                entries += len(shard.entries)
+                size += shard.bytes
+        return entries, size
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вызовов (single-flight).
+
+    Первый вызов по ключу выполняет функцию, остальные вызовы с тем же ключом,
+    пришедшие до ее завершения, ждут и получают тот же результат или то же
+    исключение. Рассчитан на вызовы из потоков executor'а БД.
+
+    Ожидающий вызов ограничен своим scope (CancelScope): он перестает ждать
+    по своему дедлайну или отмене, независимо от таймаута ведущего.
+
+    Example:
+        flights = SingleFlight()
+        result = flights.do(cache_key, lambda: run_query(...))
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key: str, func: Callable[[], T], scope: Any = None) -> T:
+        """
+        Выполнить func или дождаться уже выполняющегося вызова с тем же ключом.
+
+        Args:
+            key: Ключ вызова
+            func: Функция (выполняется только ведущим вызовом)
+            scope: Дедлайн и отмена ожидания (remaining(), interrupted, error())
+
+        Raises:
+            QueryInterruptedError: scope.error(), если ожидание прервано
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                future = self._calls[key] = Future()
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            logger.debug(f"Single-flight JOIN: {key}")
+            return self._wait(future, scope)
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    @staticmethod
+    def _wait(future: Future, scope: Any) -> Any:
+        """Результат ведущего вызова, пока не прерван scope ожидающего"""
+        if scope is None:
+            return future.result()
+        while True:
+            if scope.interrupted:
+                raise scope.error()
+            timeout = JOIN_POLL_INTERVAL
+            remaining = scope.remaining()
+            if remaining is not None:
+                timeout = max(0.0, min(timeout, remaining))
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeoutError:
+                continue
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики объединенных вызовов"""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executed": self._executed,
+                "coalesced": self._coalesced,
+            }
@@ -0,0 +1,643 @@
+"""
+Общие для нескольких worker-процессов бэкенды кеша результатов
+
+SqliteCacheBackend - файл SQLite (WAL) на локальном диске: все процессы
+gunicorn/uvicorn на хосте видят одни и те же записи, внешний сервис не нужен.
+RedisCacheBackend - сервер с протоколом Redis (RESP), минимальный клиент без
+внешних зависимостей.
+
+Значения хранятся в JSON с явными тегами типов (QueryResult, Decimal, даты,
+bytes, ...), а не pickle: чтение записи из хранилища не может выполнить код.
+Файл кеша по умолчанию создается в личной директории пользователя, чужой или
+доступный другим на запись файл отвергается (app/storage.py).
+"""
+
+import base64
+import json
+import logging
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from datetime import date, datetime, time as dtime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from app.cache import CacheBackend, QueryCache
+from app.results import QueryResult, ResultColumn
+from app.storage import open_private_file, state_path
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKENDS = ("memory", "sqlite", "redis")
+
+# Имя файла SQLite кеша по умолчанию (в директории из storage.state_path)
+DEFAULT_SQLITE_FILE = "cache.sqlite3"
+
+# Время последнего обращения (для LRU) обновляется не чаще раза в N секунд
+ACCESS_RESOLUTION = 1.0
+
+
+# ==================== SERIALIZATION ====================
+
+# Типы колонок (ResultColumn.python_type), которые можно восстановить по имени
+_PYTHON_TYPES = {
+    t.__name__: t for t in (str, int, float, bool, list, Decimal, datetime, date, dtime)
+}
+
+
+def _encode(value: Any) -> Any:
+    """
+    Значение в JSON-совместимый вид. Скаляры JSON остаются как есть, прочие
+    значения (и списки) - [тег, данные], поэтому _decode восстанавливает
+    типы однозначно.
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    encode = _ENCODERS.get(type(value))
+    if encode is None:
+        raise TypeError(f"Cannot store {type(value).__name__} in the cache")
+    return encode(value)
+
+
+def _encode_column(column: ResultColumn) -> list:
+    python_type = column.python_type.__name__ if column.python_type is not None else None
+    return [
+        "C",
+        [column.name, column.type, python_type]
+        + [column.length, column.precision, column.scale, column.nullable],
+    ]
+
+
+def _encode_result(result: QueryResult) -> list:
+    return [
+        "R",
+        [
+            [_encode_column(c)[1] for c in result.columns],
+            [[_encode(v) for v in row] for row in result.rows],
+            result.fetched_at,
+            result.truncated,
+        ],
+    ]
+
+
+_ENCODERS: Dict[type, Callable[[Any], Any]] = {
+    list: lambda v: ["L", [_encode(i) for i in v]],
+    tuple: lambda v: ["T", [_encode(i) for i in v]],
+    dict: lambda v: ["D", [[_encode(k), _encode(i)] for k, i in v.items()]],
+    bytes: lambda v: ["B", base64.b64encode(v).decode("ascii")],
+    Decimal: lambda v: ["N", str(v)],
+    datetime: lambda v: ["DT", v.isoformat()],
+    date: lambda v: ["DA", v.isoformat()],
+    dtime: lambda v: ["TM", v.isoformat()],
+    ResultColumn: _encode_column,
+    QueryResult: _encode_result,
+}
+
+
+def _decode_column(fields: list) -> ResultColumn:
+    name, type_name, python_type, length, precision, scale, nullable = fields
+    return ResultColumn(
+        name, type_name, _PYTHON_TYPES.get(python_type), length, precision, scale, nullable
+    )
+
+
+def _decode_result(data: list) -> QueryResult:
+    columns, rows, fetched_at, truncated = data
+    return QueryResult(
+        [_decode_column(c) for c in columns],
+        [tuple(_decode(v) for v in row) for row in rows],
+        fetched_at,
+        truncated,
+    )
+
+
+_DECODERS: Dict[str, Callable[[Any], Any]] = {
+    "L": lambda d: [_decode(i) for i in d],
+    "T": lambda d: tuple(_decode(i) for i in d),
+    "D": lambda d: {_decode(k): _decode(i) for k, i in d},
+    "B": lambda d: base64.b64decode(d),
+    "N": Decimal,
+    "DT": datetime.fromisoformat,
+    "DA": date.fromisoformat,
+    "TM": dtime.fromisoformat,
+    "C": _decode_column,
+    "R": _decode_result,
+}
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, list):
+        tag, data = value
+        return _DECODERS[tag](data)
+    return value
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(_encode(value), separators=(",", ":")).encode("utf-8")
+
+
+def _loads(blob: bytes) -> Any:
+    return _decode(json.loads(blob))
+
+
+# ==================== SQLITE ====================
+
+
+class SqliteCacheBackend(CacheBackend):
+    """
+    Кеш в файле SQLite, общий для всех процессов на хосте.
+
+    Каждая запись пишется одной транзакцией (INSERT OR REPLACE), поэтому
+    читатели в других процессах видят либо старое, либо новое значение.
+    Время жизни хранится как абсолютное время (time.time()); при превышении
+    max_bytes вытесняются записи с самым давним обращением.
+
+    Example:
+        cache = SqliteCacheBackend("/var/cache/proxy/cache.sqlite3", max_bytes=256 * 1024 * 1024)
+    """
+
+    name = "sqlite"
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_bytes: Optional[int] = 128 * 1024 * 1024,
+        default_ttl: float = 300,
+        sweep_interval: float = 60,
+        stale_grace: float = 0,
+        timeout: float = 5.0,
+    ):
+        """
+        Args:
+            path: Путь к файлу БД кеша (создается при необходимости; по
+                умолчанию - в личной директории пользователя)
+            max_bytes: Бюджет размера сериализованных записей в байтах
+            default_ttl: Время жизни записи по умолчанию в секундах
+            sweep_interval: Период фоновой очистки просроченных записей (0 - выкл.)
+            stale_grace: Сколько секунд после TTL запись еще можно отдать как устаревшую
+            timeout: Сколько секунд ждать блокировку файла другим процессом
+
+        Raises:
+            PermissionError: Файл или директория доступны другим пользователям
+        """
+        super().__init__(max_bytes, default_ttl, sweep_interval, stale_grace)
+        self.path = path or state_path(DEFAULT_SQLITE_FILE)
+        self.timeout = timeout
+        # Файл и директория - только этого пользователя (содержимое кеша
+        # отдается клиентам как результат запросов)
+        open_private_file(self.path)
+
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        logger.info(f"SQLite cache: {self.path}")
+
+    def _conn(self) -> sqlite3.Connection:
+        """Соединение SQLite текущего потока"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _failed(self, operation: str, error: Exception) -> None:
+        self._count(errors=1)
+        logger.warning(f"SQLite cache {operation} failed: {error}")
+
+    # ==================== GET / SET ====================
+
+    def lookup(self, key: str, allow_stale: bool = False) -> Tuple[Optional[Any], bool]:
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count(misses=1)
+                return None, False
+
+            blob, expires_at, accessed_at = row
+            stale = expires_at <= now
+            if stale and (expires_at + self.stale_grace <= now or not allow_stale):
+                if expires_at + self.stale_grace <= now:
+                    conn.execute(
+                        "DELETE FROM entries WHERE key = ? AND expires_at = ?", (key, expires_at)
+                    )
+                    self._count(expirations=1)
+                self._count(misses=1)
+                return None, False
+
+            if now - accessed_at > ACCESS_RESOLUTION:
+                conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            value = _loads(blob)
+        except Exception as e:
+            self._failed("lookup", e)
+            self._count(misses=1)
+            return None, False
+
+        self._count(hits=1, stale_hits=int(stale))
+        return value, stale
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        try:
+            blob = _dumps(value)
+        except TypeError as e:
+            self._failed("set", e)
+            return False
+        size = len(blob) + len(key)
+
+        if self.max_bytes is not None and size > self.max_bytes:
+            self._count(rejected=1)
+            logger.debug(f"Cache REJECTED: {key} ({size} bytes > budget)")
+            return False
+
+        evicted = 0
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, blob, size, now + ttl, now),
+                )
+                if self.max_bytes is not None:
+                    evicted = self._evict(conn, key)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            self._failed("set", e)
+            return False
+
+        if evicted:
+            self._count(evictions=evicted)
+            logger.debug(f"Cache EVICTED: {evicted} entries")
+        return True
+
+    def _evict(self, conn: sqlite3.Connection, keep: str) -> int:
+        """Вытеснить давно использованные записи сверх бюджета (внутри транзакции)"""
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return 0
+
+        victims = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM entries WHERE key != ? ORDER BY accessed_at", (keep,)
+        ):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        return len(victims)
+
+    def delete(self, key: str) -> None:
+        try:
+            self._conn().execute("DELETE FROM entries WHERE key = ?", (key,))
+        except Exception as e:
+            self._failed("delete", e)
+
+    def clear(self) -> int:
+        try:
+            return self._conn().execute("DELETE FROM entries").rowcount
+        except Exception as e:
+            self._failed("clear", e)
+            return 0
+
+    def __len__(self) -> int:
+        return self._usage()[0] or 0
+
+    # ==================== EXPIRATION ====================
+
+    def sweep(self) -> int:
+        deadline = time.time() - self.stale_grace
+        try:
+            removed = (
+                self._conn().execute("DELETE FROM entries WHERE expires_at <= ?", (deadline,))
+            ).rowcount
+        except Exception as e:
+            self._failed("sweep", e)
+            return 0
+
+        if removed:
+            self._count(expirations=removed)
+            logger.debug(f"Cache sweep: {removed} expired entries removed")
+        return removed
+
+    def stop(self) -> None:
+        super().stop()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    # ==================== STATS ====================
+
+    def _usage(self) -> Tuple[Optional[int], Optional[int]]:
+        try:
+            entries, size = (
+                self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries")
+            ).fetchone()
+            return entries, size
+        except Exception as e:
+            self._failed("stats", e)
+            return None, None
+
+
+# ==================== REDIS ====================
+
+
+class RedisError(Exception):
+    """Ошибка, которую вернул сервер Redis"""
+
+    pass
+
+
+class RespClient:
+    """
+    Минимальный потокобезопасный клиент протокола Redis (RESP2).
+
+    Одно соединение под lock; при сетевой ошибке соединение пересоздается
+    на следующей команде.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        username: Optional[str] = None,
+        timeout: float = 2.0,
+    ):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.username = username
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+
+    @classmethod
+    def from_url(cls, url: str, timeout: float = 2.0) -> "RespClient":
+        """Клиент по URL вида redis://[[user]:password@]host[:port][/db]"""
+        parts = urlsplit(url)
+        if parts.scheme != "redis":
+            raise ValueError(f"Unsupported Redis URL scheme: {parts.scheme!r}")
+        db = parts.path.lstrip("/")
+        return cls(
+            host=parts.hostname or "localhost",
+            port=parts.port or 6379,
+            db=int(db) if db else 0,
+            password=unquote(parts.password) if parts.password else None,
+            username=unquote(parts.username) if parts.username else None,
+            timeout=timeout,
+        )
+
+    def _connect(self) -> None:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+        if self.password:
+            auth = (self.username, self.password) if self.username else (self.password,)
+            self._call("AUTH", *auth)
+        if self.db:
+            self._call("SELECT", self.db)
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def execute(self, *args: Any) -> Any:
+        """Выполнить команду и вернуть ответ (bytes/int/list/None)"""
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                return self._call(*args)
+            except (OSError, ConnectionError):
+                self._disconnect()
+                raise
+
+    def _call(self, *args: Any) -> Any:
+        self._sock.sendall(self._encode(args))
+        return self._read()
+
+    @staticmethod
+    def _encode(args: Tuple) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, bytes):
+                data = arg
+            else:
+                data = str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    def _read(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by Redis server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RedisError(payload.decode("utf-8", errors="replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read() for _ in range(length)]
+        raise ConnectionError(f"Unexpected RESP reply: {line!r}")
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Кеш на сервере с протоколом Redis (Redis, Valkey, KeyDB, ...).
+
+    Запись хранится как [expires_at: double big-endian][JSON _dumps в UTF-8]
+    с PX = TTL + stale_grace, так что окончательное удаление выполняет сам
+    сервер. Бюджет памяти задается на стороне сервера (maxmemory + allkeys-lru).
+
+    Example:
+        cache = RedisCacheBackend("redis://localhost:6379/0", prefix="fdbproxy:")
+    """
+
+    name = "redis"
+
+    _HEADER = struct.Struct(">d")
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        prefix: str = "fdbproxy:",
+        default_ttl: float = 300,
+        stale_grace: float = 0,
+        timeout: float = 2.0,
+    ):
+        """
+        Args:
+            url: Адрес сервера redis://[[user]:password@]host[:port][/db]
+            prefix: Префикс ключей (отделяет кеш прокси от других данных)
+            default_ttl: Время жизни записи по умолчанию в секундах
+            stale_grace: Сколько секунд после TTL запись еще можно отдать как устаревшую
+            timeout: Таймаут сетевых операций в секундах
+        """
+        super().__init__(None, default_ttl, 0, stale_grace)
+        self.prefix = prefix
+        self.client = RespClient.from_url(url, timeout=timeout)
+        logger.info(f"Redis cache: {self.client.host}:{self.client.port}/{self.client.db}")
+
+    def _failed(self, operation: str, error: Exception) -> None:
+        self._count(errors=1)
+        logger.warning(f"Redis cache {operation} failed: {error}")
+
+    # ==================== GET / SET ====================
+
+    def lookup(self, key: str, allow_stale: bool = False) -> Tuple[Optional[Any], bool]:
+        try:
+            blob = self.client.execute("GET", self.prefix + key)
+            if blob is None:
+                self._count(misses=1)
+                return None, False
+
+            (expires_at,) = self._HEADER.unpack_from(blob)
+            stale = expires_at <= time.time()
+            if stale and not allow_stale:
+                self._count(misses=1)
+                return None, False
+            value = _loads(blob[self._HEADER.size :])
+        except Exception as e:
+            self._failed("lookup", e)
+            self._count(misses=1)
+            return None, False
+
+        self._count(hits=1, stale_hits=int(stale))
+        return value, stale
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        ttl = self.default_ttl if ttl is None else ttl
+        expire_ms = max(1, int((ttl + self.stale_grace) * 1000))
+        try:
+            blob = self._HEADER.pack(time.time() + ttl) + _dumps(value)
+            self.client.execute("SET", self.prefix + key, blob, "PX", expire_ms)
+        except Exception as e:
+            self._failed("set", e)
+            return False
+        return True
+
+    def delete(self, key: str) -> None:
+        try:
+            self.client.execute("DEL", self.prefix + key)
+        except Exception as e:
+            self._failed("delete", e)
+
+    def clear(self) -> int:
+        """Удалить все ключи с префиксом кеша (SCAN + DEL)"""
+        removed = 0
+        cursor = b"0"
+        try:
+            while True:
+                cursor, keys = self.client.execute(
+                    "SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 500
+                )
+                if keys:
+                    removed += self.client.execute("DEL", *keys)
+                if cursor == b"0":
+                    break
+        except Exception as e:
+            self._failed("clear", e)
+        return removed
+
+    def stop(self) -> None:
+        super().stop()
+        self.client.close()
+
+
+# ==================== FACTORY ====================
+
+
+def create_cache_backend(config) -> CacheBackend:
+    """
+    Создать бэкенд кеша по настройкам (settings.cache_backend).
+
+    Raises:
+        ValueError: Неизвестный бэкенд
+    """
+    backend = config.cache_backend.lower()
+
+    if backend == "memory":
+        return QueryCache(
+            max_bytes=config.cache_max_bytes,
+            default_ttl=config.cache_ttl,
+            shards=config.cache_shards,
+            sweep_interval=config.cache_sweep_interval,
+            stale_grace=config.cache_stale_grace,
+        )
+    if backend == "sqlite":
+        return SqliteCacheBackend(
+            path=config.cache_path or None,
+            max_bytes=config.cache_max_bytes,
+            default_ttl=config.cache_ttl,
+            sweep_interval=config.cache_sweep_interval,
+            stale_grace=config.cache_stale_grace,
+        )
+    if backend == "redis":
+        return RedisCacheBackend(
+            url=config.cache_redis_url,
+            prefix=config.cache_redis_prefix,
+            default_ttl=config.cache_ttl,
+            stale_grace=config.cache_stale_grace,
+        )
+
+    raise ValueError(f"Unknown cache backend {backend!r}, expected one of {CACHE_BACKENDS}")
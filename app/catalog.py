@@ -0,0 +1,362 @@
+"""
+Каталог схемы БД в памяти
+
+Схема всех пользовательских таблиц загружается за один проход по
+RDB$RELATIONS, RDB$RELATION_FIELDS, RDB$FIELDS и RDB$INDICES (в одной
+snapshot транзакции) и хранится с индексом по имени таблицы в верхнем
+регистре. /api/tables, /api/schema и /api/schema/{table} отвечают из
+каталога без запросов к БД.
+
+Каталог перечитывается в фоне, когда меняется версия метаданных. Общего
+счетчика версий в Firebird нет, поэтому версия - отпечаток системных таблиц:
+число таблиц и колонок, сумма RDB$FORMAT (растет при каждом ALTER TABLE),
+число индексов и ограничений. Проверка версии - один короткий запрос.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Отпечаток метаданных: меняется при CREATE/ALTER/DROP таблиц, колонок и индексов
+CATALOG_VERSION_QUERY = """
+    SELECT
+        (SELECT COUNT(*) FROM RDB$RELATIONS),
+        (SELECT MAX(RDB$RELATION_ID) FROM RDB$RELATIONS),
+        (SELECT SUM(RDB$FORMAT) FROM RDB$RELATIONS),
+        (SELECT COUNT(*) FROM RDB$RELATION_FIELDS),
+        (SELECT COUNT(*) FROM RDB$INDICES),
+        (SELECT COUNT(*) FROM RDB$INDICES WHERE RDB$INDEX_INACTIVE = 1),
+        (SELECT COUNT(*) FROM RDB$INDEX_SEGMENTS),
+        (SELECT COUNT(*) FROM RDB$RELATION_CONSTRAINTS)
+    FROM RDB$DATABASE
+"""
+
+# Колонки всех пользовательских таблиц (без представлений) с типами
+CATALOG_FIELDS_QUERY = """
+    SELECT
+        rf.RDB$RELATION_NAME,
+        rf.RDB$FIELD_NAME,
+        rf.RDB$NULL_FLAG,
+        f.RDB$NULL_FLAG,
+        f.RDB$FIELD_TYPE,
+        f.RDB$FIELD_SUB_TYPE,
+        f.RDB$FIELD_LENGTH,
+        f.RDB$CHARACTER_LENGTH,
+        f.RDB$FIELD_PRECISION,
+        f.RDB$FIELD_SCALE
+    FROM RDB$RELATIONS r
+    JOIN RDB$RELATION_FIELDS rf ON rf.RDB$RELATION_NAME = r.RDB$RELATION_NAME
+    JOIN RDB$FIELDS f ON f.RDB$FIELD_NAME = rf.RDB$FIELD_SOURCE
+    WHERE r.RDB$SYSTEM_FLAG = 0
+        AND r.RDB$VIEW_BLR IS NULL
+    ORDER BY rf.RDB$RELATION_NAME, rf.RDB$FIELD_POSITION
+"""
+
+# Колонки активных уникальных индексов (в том числе индексов PRIMARY KEY и UNIQUE)
+CATALOG_KEYS_QUERY = """
+    SELECT
+        i.RDB$RELATION_NAME,
+        i.RDB$INDEX_NAME,
+        rc.RDB$CONSTRAINT_TYPE,
+        s.RDB$FIELD_NAME
+    FROM RDB$INDICES i
+    JOIN RDB$INDEX_SEGMENTS s ON s.RDB$INDEX_NAME = i.RDB$INDEX_NAME
+    LEFT JOIN RDB$RELATION_CONSTRAINTS rc ON rc.RDB$INDEX_NAME = i.RDB$INDEX_NAME
+    WHERE i.RDB$UNIQUE_FLAG = 1
+        AND COALESCE(i.RDB$SYSTEM_FLAG, 0) = 0
+        AND COALESCE(i.RDB$INDEX_INACTIVE, 0) = 0
+    ORDER BY i.RDB$RELATION_NAME, i.RDB$INDEX_NAME, s.RDB$FIELD_POSITION
+"""
+
+CATALOG_QUERIES = (CATALOG_VERSION_QUERY, CATALOG_FIELDS_QUERY, CATALOG_KEYS_QUERY)
+
+# Запрос неизвестной таблицы сверяет версию метаданных не чаще раза в столько
+# секунд: новая таблица видна сразу, а поток 404 не нагружает БД
+MISS_REFRESH_INTERVAL = 1.0
+
+# RDB$FIELDS.RDB$FIELD_TYPE -> имя типа
+_TYPES = {
+    7: "SMALLINT",
+    8: "INTEGER",
+    9: "QUAD",
+    10: "FLOAT",
+    12: "DATE",
+    13: "TIME",
+    14: "CHAR",
+    16: "BIGINT",
+    23: "BOOLEAN",
+    24: "DECFLOAT",
+    25: "DECFLOAT",
+    26: "INT128",
+    27: "DOUBLE PRECISION",
+    28: "TIME WITH TIME ZONE",
+    29: "TIMESTAMP WITH TIME ZONE",
+    35: "TIMESTAMP",
+    37: "VARCHAR",
+    40: "CSTRING",
+    261: "BLOB",
+}
+_INTEGER_TYPES = {7: 4, 8: 9, 16: 18, 26: 38}
+_STRING_TYPES = {14, 37, 40}
+
+
+def _name(value: Optional[str]) -> str:
+    # Имена в системных таблицах - CHAR, дополненные пробелами
+    return value.strip() if value else ""
+
+
+def describe_field(
+    field_type: int,
+    sub_type: Optional[int],
+    length: Optional[int],
+    char_length: Optional[int],
+    precision: Optional[int],
+    scale: Optional[int],
+) -> Dict[str, Any]:
+    """
+    Тип колонки по RDB$FIELDS.
+
+    Returns:
+        Dict[str, Any]: type (имя типа), sql_type (объявление, например
+            VARCHAR(50) или NUMERIC(18,2)), length (символов - для строк),
+            precision и scale (для NUMERIC/DECIMAL и DECFLOAT)
+    """
+    type_name = _TYPES.get(field_type, "UNKNOWN")
+    info: Dict[str, Any] = {"type": type_name, "sql_type": type_name}
+    scale = -(scale or 0)
+
+    if field_type in _INTEGER_TYPES and (sub_type in (1, 2) or scale > 0):
+        # NUMERIC/DECIMAL хранятся как целые с отрицательным RDB$FIELD_SCALE
+        type_name = "DECIMAL" if sub_type == 2 else "NUMERIC"
+        precision = precision or _INTEGER_TYPES[field_type]
+        info.update(
+            type=type_name,
+            sql_type=f"{type_name}({precision},{scale})",
+            precision=precision,
+            scale=scale,
+        )
+    elif field_type in (24, 25):
+        precision = 16 if field_type == 24 else 34
+        info.update(sql_type=f"DECFLOAT({precision})", precision=precision)
+    elif field_type in _STRING_TYPES:
+        chars = char_length if char_length is not None else length
+        info.update(sql_type=f"{type_name}({chars})", length=chars)
+    elif field_type == 261:
+        subtype = {0: "BINARY", 1: "TEXT"}.get(sub_type or 0, str(sub_type))
+        info["sql_type"] = f"BLOB SUB_TYPE {subtype}"
+    return info
+
+
+def build_catalog(field_rows: List[Tuple], key_rows: List[Tuple]) -> Dict[str, Dict[str, Any]]:
+    """
+    Собрать каталог из строк CATALOG_FIELDS_QUERY и CATALOG_KEYS_QUERY.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: {ИМЯ ТАБЛИЦЫ: {"table", "columns",
+            "primary_key", "unique_keys"}} в порядке имен
+    """
+    tables: Dict[str, Dict[str, Any]] = {}
+    for relation, field, null_flag, domain_null_flag, *type_info in field_rows:
+        table = _name(relation)
+        entry = tables.get(table)
+        if entry is None:
+            entry = tables[table] = {
+                "table": table,
+                "columns": [],
+                "primary_key": None,
+                "unique_keys": [],
+            }
+        column = {"name": _name(field), "nullable": 1 not in (null_flag, domain_null_flag)}
+        column.update(describe_field(*type_info))
+        entry["columns"].append(column)
+
+    keys: Dict[Tuple[str, str], Tuple[Optional[str], List[str]]] = {}
+    for relation, index, constraint_type, field in key_rows:
+        key = (_name(relation), _name(index))
+        keys.setdefault(key, (_name(constraint_type), []))[1].append(_name(field))
+    for (table, _index), (constraint_type, columns) in keys.items():
+        entry = tables.get(table)
+        if entry is None:
+            continue
+        if constraint_type == "PRIMARY KEY":
+            entry["primary_key"] = columns
+        else:
+            entry["unique_keys"].append(columns)
+    return tables
+
+
+class CatalogSnapshot:
+    """Загруженная версия каталога; не изменяется после создания"""
+
+    __slots__ = ("version", "tables", "names", "etag", "loaded_at", "_body")
+
+    def __init__(self, version: Tuple, tables: Dict[str, Dict[str, Any]]):
+        self.version = version
+        self.tables = tables
+        self.names = sorted(tables)
+        # ETag зависит только от содержимого: перезагрузка без изменений
+        # схемы (например, после изменения представления) его не меняет
+        content = json.dumps([tables[name] for name in self.names], sort_keys=True)
+        self.etag = hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+        self.loaded_at = datetime.now()
+        self._body: Optional[bytes] = None
+
+    def body(self, encode: Callable[["CatalogSnapshot"], bytes]) -> bytes:
+        """Тело ответа /api/schema: кодируется один раз на версию каталога"""
+        if self._body is None:
+            self._body = encode(self)
+        return self._body
+
+
+class SchemaCatalog:
+    """
+    Каталог схемы с фоновым обновлением по версии метаданных.
+
+    Example:
+        catalog = SchemaCatalog(db.read_metadata, refresh_interval=30)
+        catalog.start()
+        catalog.table("goods")["primary_key"]   # ["ID"]
+    """
+
+    def __init__(
+        self,
+        read: Callable[[Tuple[str, ...]], List[List[Tuple]]],
+        refresh_interval: float = 30.0,
+        name: str = "database",
+    ):
+        """
+        Args:
+            read: Выполнить запросы в одной snapshot транзакции и вернуть
+                строки каждого
+            refresh_interval: Период проверки версии метаданных в секундах
+                (0 - без фоновых проверок)
+            name: Имя для логов и потока
+        """
+        self.read = read
+        self.refresh_interval = refresh_interval
+        self.name = name
+
+        self._snapshot: Optional[CatalogSnapshot] = None
+        # Одна загрузка за раз: параллельные запросы ждут ее результата
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._checked_at = 0.0
+
+        self._checks = 0
+        self._loads = 0
+        self._errors = 0
+
+    def start(self) -> None:
+        """Загрузить каталог и запустить фоновую проверку версии"""
+        try:
+            self.refresh(force=True)
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"Schema catalog: initial load failed: {e}")
+
+        if self.refresh_interval > 0 and self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name=f"{self.name}-schema-catalog", daemon=True
+            )
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                self._errors += 1
+                logger.warning(f"Schema catalog: refresh failed: {e}")
+
+    def close(self) -> None:
+        """Остановить фоновую проверку"""
+        self._stop_event.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Перечитать каталог, если изменилась версия метаданных.
+
+        Args:
+            force: Перечитать без проверки версии
+
+        Returns:
+            bool: Каталог перечитан
+
+        Raises:
+            fdb.Error: Ошибка чтения метаданных
+        """
+        with self._refresh_lock:
+            self._checked_at = time.monotonic()
+            current = self._snapshot
+            if not force and current is not None:
+                self._checks += 1
+                (version,) = self.read((CATALOG_VERSION_QUERY,))[0]
+                if tuple(version) == current.version:
+                    return False
+
+            started = time.perf_counter()
+            version_rows, field_rows, key_rows = self.read(CATALOG_QUERIES)
+            snapshot = CatalogSnapshot(tuple(version_rows[0]), build_catalog(field_rows, key_rows))
+            self._snapshot = snapshot
+            self._loads += 1
+
+        elapsed = time.perf_counter() - started
+        if current is None or snapshot.etag != current.etag:
+            logger.info(
+                f"Schema catalog loaded: {len(snapshot.tables)} tables in {elapsed:.3f}s "
+                f"(etag {snapshot.etag})"
+            )
+        return True
+
+    def snapshot(self) -> CatalogSnapshot:
+        """
+        Текущая версия каталога (если еще не загружен - загрузить).
+
+        Raises:
+            fdb.Error: Каталог не загружен и БД недоступна
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh(force=True)
+            snapshot = self._snapshot
+        return snapshot
+
+    def table(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Схема таблицы по имени (регистр не важен).
+
+        Если таблицы нет, версия метаданных проверяется сразу (не чаще раза
+        в MISS_REFRESH_INTERVAL): только что созданная таблица находится без
+        ожидания фоновой проверки.
+
+        Returns:
+            Optional[Dict[str, Any]]: Схема таблицы (None - таблицы нет)
+        """
+        entry = self.snapshot().tables.get(name.upper())
+        if entry is None and time.monotonic() - self._checked_at >= MISS_REFRESH_INTERVAL:
+            self.refresh()
+            entry = self.snapshot().tables.get(name.upper())
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "tables": len(snapshot.tables) if snapshot else 0,
+            "etag": snapshot.etag if snapshot else None,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+            "refresh_interval": self.refresh_interval,
+            "version_checks": self._checks,
+            "loads": self._loads,
+            "errors": self._errors,
+        }
@@ -2,7 +2,7 @@
 Конфигурация приложения с использованием pydantic-settings
 """
 
-from typing import List
+from typing import Dict, List, Tuple
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -16,22 +16,170 @@ class Settings(BaseSettings):
     db_name: str = Field(default="database.fdb", description="Database name/alias")
     db_user: str = Field(default="SYSDBA", description="Database user")
     db_password: str = Field(default="masterkey", description="Database password")
+    db_min_connections: int = Field(default=2, description="Min (warm) connections in pool")
     db_max_connections: int = Field(default=10, description="Max connections in pool")
+    db_pool_timeout: float = Field(
+        default=10.0, description="Seconds to wait for a free pooled connection"
+    )
+    db_pool_max_lifetime: float = Field(
+        default=1800.0, description="Recycle pooled connections after N seconds (0 = never)"
+    )
+    db_pool_ping_interval: float = Field(
+        default=60.0, description="Ping idle pooled connections after N seconds (0 = off)"
+    )
+    db_statement_cache_size: int = Field(
+        default=64, description="Prepared statements kept per pooled connection (0 = off)"
+    )
+    db_executor_queue_size: int = Field(
+        default=100, description="Max DB calls waiting for a worker thread before 503"
+    )
+    db_executor_retry_after: int = Field(
+        default=1, description="Retry-After seconds sent when the DB queue is full"
+    )
     db_connection_timeout: int = Field(default=10, description="Connection timeout in seconds")
-    db_query_timeout: int = Field(default=30, description="Query timeout in seconds")
+    db_query_timeout: int = Field(
+        default=30,
+        description=(
+            "Query timeout in seconds, cancelled on the server when exceeded (0 = no limit); "
+            "requests may ask for a lower one"
+        ),
+    )
+
+    # ==================== HEALTH CHECK ====================
+    health_check_interval: float = Field(
+        default=5.0, description="Seconds between background database probes for /api/health"
+    )
+    health_check_timeout: float = Field(default=3.0, description="Timeout of one probe in seconds")
+    health_failure_threshold: int = Field(
+        default=2, description="Consecutive failed probes before readiness turns 503"
+    )
+
+    # ==================== SCHEMA CATALOG ====================
+    schema_refresh_interval: float = Field(
+        default=30.0,
+        description=(
+            "Seconds between metadata version checks of the in-memory schema catalog "
+            "(0 - no background checks)"
+        ),
+    )
+
+    # ==================== STREAMING ====================
+    stream_batch_size: int = Field(
+        default=1000, description="Rows fetched per fetchmany() batch in streaming mode"
+    )
+
+    # ==================== RESULT LIMITS ====================
+    query_max_rows: int = Field(
+        default=100_000, description="Max rows returned per query; more are cut off (0 = no limit)"
+    )
+    query_max_bytes: int = Field(
+        default=256 * 1024 * 1024,
+        description="Max approximate in-memory size of a query result in bytes (0 = no limit)",
+    )
+    query_token_limits: str = Field(
+        default="",
+        description="Per-token limits 'token:max_rows:max_bytes' separated by comma (0 = default)",
+    )
+
+    # ==================== PAGINATION ====================
+    page_max_size: int = Field(default=10000, description="Max page_size accepted by /api/query")
+    page_session_ttl: float = Field(
+        default=600.0, description="Seconds a paginated result stays available for next_token"
+    )
+
+    # ==================== BATCH ====================
+    batch_max_queries: int = Field(
+        default=50, description="Max queries in one POST /api/query/batch request"
+    )
+    batch_parallelism: int = Field(
+        default=4, description="Queries of one batch executed concurrently (parallel mode)"
+    )
 
     # ==================== CACHE ====================
+    cache_backend: str = Field(
+        default="memory", description="Query cache backend: memory, sqlite (shared file), redis"
+    )
+    cache_path: str = Field(
+        default="",
+        description="SQLite cache file (sqlite backend; default: ~/.cache/firebird-db-proxy)",
+    )
+    cache_redis_url: str = Field(
+        default="redis://localhost:6379/0", description="Redis server URL (redis backend)"
+    )
+    cache_redis_prefix: str = Field(default="fdbproxy:", description="Redis key prefix")
     cache_ttl: int = Field(default=300, description="Cache TTL in seconds (default 5 min)")
+    cache_max_bytes: int = Field(
+        default=128 * 1024 * 1024,
+        description="Approximate memory budget of the query cache; also the largest cacheable entry",
+    )
+    cache_shards: int = Field(default=16, description="Number of independently locked cache shards")
+    cache_sweep_interval: float = Field(
+        default=60.0, description="Seconds between sweeps of expired cache entries (0 = off)"
+    )
+    cache_encoded_bodies: bool = Field(
+        default=True, description="Also cache encoded response bodies per output format"
+    )
+    cache_stale_grace: float = Field(
+        default=0.0,
+        description="Serve expired entries for N more seconds while refreshing them (0 = off)",
+    )
 
     # ==================== SECURITY ====================
     api_tokens: str = Field(
         default="default-token-change-me", description="API tokens separated by comma"
     )
+    api_tokens_file: str = Field(
+        default="", description="JSON file with tokens and per-token policies (reloaded on change)"
+    )
+    api_tokens_reload_interval: float = Field(
+        default=5.0, description="Seconds between checks of api_tokens_file for changes (0 = off)"
+    )
     allowed_origins: str = Field(default="*", description="CORS allowed origins separated by comma")
 
     # ==================== RATE LIMITING ====================
     rate_limit_per_minute: int = Field(default=60, description="Requests per minute")
     rate_limit_per_hour: int = Field(default=1000, description="Requests per hour")
+    rate_limit_concurrent: int = Field(
+        default=8, description="Queries of one token in flight at once (0 = off)"
+    )
+    rate_limit_rows_per_window: int = Field(
+        default=0, description="Rows one token may receive per cost window (0 = off)"
+    )
+    rate_limit_db_seconds_per_window: float = Field(
+        default=0.0,
+        description="Seconds of DB execution and fetch per token per cost window (0 = off)",
+    )
+    rate_limit_cost_window: float = Field(
+        default=3600.0, description="Window of the rows/DB time budgets in seconds"
+    )
+    rate_limit_backend: str = Field(
+        default="auto",
+        description=(
+            "Rate limit state: memory (per worker), sqlite (shared file), "
+            "auto (sqlite if WEB_CONCURRENCY > 1, else memory)"
+        ),
+    )
+    rate_limit_path: str = Field(
+        default="",
+        description="SQLite rate limit file (sqlite backend; default: ~/.cache/firebird-db-proxy)",
+    )
+
+    # ==================== METRICS ====================
+    metrics_enabled: bool = Field(
+        default=True, description="Collect metrics and serve them at /metrics (Prometheus format)"
+    )
+    metrics_max_fingerprints: int = Field(
+        default=200,
+        description="Distinct query fingerprints labelled in metrics; the rest count as 'other'",
+    )
+
+    # ==================== TRACING ====================
+    tracing_enabled: bool = Field(
+        default=True, description="Trace request phases and send them in the Server-Timing header"
+    )
+    trace_export_file: str = Field(
+        default="", description="Write traces to this file as OTLP JSON lines (empty - disabled)"
+    )
 
     # ==================== LOGGING ====================
     log_level: str = Field(default="INFO", description="Logging level")
@@ -55,6 +203,16 @@ class Settings(BaseSettings):
         """Получить список токенов"""
         return [token.strip() for token in self.api_tokens.split(",") if token.strip()]
 
+    def get_token_limits(self) -> Dict[str, Tuple[int, int]]:
+        """Лимиты результата по токенам: {token: (max_rows, max_bytes)}, 0 - общий лимит"""
+        limits = {}
+        for item in self.query_token_limits.split(","):
+            if not item.strip():
+                continue
+            token, max_rows, max_bytes = item.strip().rsplit(":", 2)
+            limits[token] = (int(max_rows), int(max_bytes))
+        return limits
+
     def get_allowed_origins(self) -> List[str]:
         """Получить список разрешенных origins для CORS"""
         if self.allowed_origins == "*":
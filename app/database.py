@@ -4,25 +4,63 @@ Firebird database connection и операции с БД (с кеширован
 
 import fdb
 import logging
-import hashlib
-import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Optional, List, Dict, Any, Tuple
-from datetime import datetime, date, time, timedelta
-import decimal
+from typing import Optional, List, Dict, Any, Callable, Sequence, Set, Tuple, Iterator, Union
+from datetime import datetime
 
+from app.cache import SingleFlight
+from app.cache_backends import create_cache_backend
+from app.catalog import SchemaCatalog
 from app.config import settings
+from app.metrics import observe_query
+from app.pagination import PageSessions
+from app.pool import PING_QUERY, ConnectionPool
+from app.prober import HealthProber
+from app.results import QueryResult, ResultLimits, describe_columns
+from app.sql import NormalizedQuery, normalize_query
+from app.statements import StatementCache, StatementStats
+from app.timeouts import (
+    SERVER_TIMEOUT_GRACE,
+    CancelScope,
+    QueryInterruptedError,
+    QueryWatchdog,
+    StatementTimeout,
+    cancel_operation,
+)
+from app.tracing import current_trace, record, span
 
 logger = logging.getLogger(__name__)
 
-# Простой in-memory кеш для запросов
-_query_cache: Dict[str, Dict[str, Any]] = {}
-CACHE_TTL_SECONDS = 300  # 5 минут по умолчанию
+# Кеш результатов запросов (общий для всех экземпляров БД; бэкенд - CACHE_BACKEND)
+query_cache = create_cache_backend(settings)
+
+# Объединение одновременных одинаковых запросов (ключ - ключ кеша)
+query_flights = SingleFlight()
+
+# Потоков для фонового обновления устаревших записей кеша
+REFRESH_WORKERS = 2
+
+# Строк на один fetchmany при чтении результата с лимитами
+FETCH_BATCH_SIZE = 1000
+
+# Транзакция пакета запросов с общим snapshot: только чтение, snapshot
+# (concurrency), без ожидания блокировок
+SNAPSHOT_READ_ONLY_TPB = bytes(
+    [
+        fdb.isc_tpb_version3,
+        fdb.isc_tpb_read,
+        fdb.isc_tpb_concurrency,
+        fdb.isc_tpb_nowait,
+    ]
+)
 
 
 class FirebirdDatabase:
     """
-    Firebird БД с подключением по требованию и кешированием.
+    Firebird БД с пулом соединений и кешированием.
     """
 
     def __init__(
@@ -33,7 +71,22 @@ class FirebirdDatabase:
         user: str,
         password: str,
         connection_timeout: int = 10,
+        query_timeout: float = 0.0,
         cache_ttl: int = 300,
+        cache_encoded_bodies: bool = True,
+        statement_cache_size: int = 64,
+        page_session_ttl: float = 600.0,
+        max_rows: int = 0,
+        max_bytes: int = 0,
+        min_connections: int = 1,
+        max_connections: int = 10,
+        pool_timeout: float = 10.0,
+        pool_max_lifetime: float = 1800.0,
+        pool_ping_interval: float = 60.0,
+        health_interval: float = 5.0,
+        health_timeout: float = 3.0,
+        health_failure_threshold: int = 2,
+        schema_refresh_interval: float = 30.0,
     ):
         """
         Инициализация параметров подключения.
@@ -45,7 +98,29 @@ class FirebirdDatabase:
             user: Пользователь БД
             password: Пароль пользователя
             connection_timeout: Таймаут подключения в секундах
+            query_timeout: Таймаут запроса по умолчанию в секундах (0 - без
+                таймаута); по истечении запрос прерывается на сервере
             cache_ttl: Время жизни кеша в секундах (по умолчанию 5 минут)
+            cache_encoded_bodies: Кешировать также закодированные тела ответов
+                (по формату), чтобы попадание в кеш не кодировало строки заново
+            statement_cache_size: Сколько подготовленных запросов держать на
+                каждом соединении пула (0 - не кешировать)
+            page_session_ttl: Время жизни сессии постраничной выдачи в секундах
+            max_rows: Максимум строк результата (0 - без ограничения); чтение
+                останавливается на лимите, результат помечается truncated
+            max_bytes: Максимальный приблизительный объем результата в байтах
+                (0 - без ограничения)
+            min_connections: Минимум соединений в пуле (прогреваются при старте)
+            max_connections: Максимум соединений в пуле
+            pool_timeout: Таймаут ожидания свободного соединения в секундах
+            pool_max_lifetime: Время жизни соединения до пересоздания в секундах
+            pool_ping_interval: Интервал keep-alive пингов простаивающих соединений
+            health_interval: Период фоновой проверки БД для health check в секундах
+            health_timeout: Таймаут одной проверки в секундах
+            health_failure_threshold: Сколько неудачных проверок подряд делают
+                БД неготовой (readiness)
+            schema_refresh_interval: Период проверки версии метаданных для
+                каталога схемы в секундах (0 - без фоновых проверок)
         """
         self.host = host
         self.port = port
@@ -53,84 +128,252 @@ class FirebirdDatabase:
         self.user = user
         self.password = password
         self.connection_timeout = connection_timeout
+        self.query_timeout = query_timeout
+        self.watchdog = QueryWatchdog(self._cancel_operation)
         self.cache_ttl = cache_ttl
+        self.cache_encoded_bodies = cache_encoded_bodies
+        self.statement_cache_size = statement_cache_size
+        self.statement_stats = StatementStats()
+        self.pages = PageSessions(query_cache, ttl=page_session_ttl)
+        # Лимиты результата по умолчанию (вызов может передать свои)
+        self.limits = ResultLimits(max_rows, max_bytes)
 
         self.dsn = f"{host}/{port}:{database}"
+
+        # Фоновое обновление устаревших записей кеша (stale-while-revalidate)
+        self._refresher: Optional[ThreadPoolExecutor] = None
+        self._refreshing: Set[str] = set()
+        self._refresh_lock = threading.Lock()
+
+        self.pool = ConnectionPool(
+            connect=self._connect,
+            min_size=min_connections,
+            max_size=max_connections,
+            acquire_timeout=pool_timeout,
+            max_lifetime=pool_max_lifetime,
+            ping_interval=pool_ping_interval,
+        )
+
+        self.health_timeout = health_timeout
+        self.health = HealthProber(
+            self._health_probe,
+            interval=health_interval,
+            failure_threshold=health_failure_threshold,
+            stale_after=3 * health_interval + health_timeout,
+        )
+        self.catalog = SchemaCatalog(self.read_metadata, refresh_interval=schema_refresh_interval)
+
         logger.info(f"Initialized Firebird database: {self.dsn}")
         logger.info(f"Cache TTL: {cache_ttl}s")
+        logger.info(f"Connection pool: min={min_connections}, max={max_connections}")
 
-    def _get_cache_key(self, query: str, params: Optional[Tuple] = None) -> str:
-        """Генерация ключа кеша для запроса"""
-        cache_data = {"query": query, "params": params if params else []}
-        cache_string = json.dumps(cache_data, sort_keys=True)
-        return hashlib.md5(cache_string.encode()).hexdigest()
+    def _connect(self):
+        """Открыть новое физическое соединение с БД (используется пулом)"""
+        logger.debug(f"Connecting to {self.dsn}")
+        return fdb.connect(dsn=self.dsn, user=self.user, password=self.password, charset="UTF8")
 
-    def _get_from_cache(self, cache_key: str) -> Optional[List[Dict[str, Any]]]:
+    def _cancel_operation(self, conn):
+        """Прервать запрос, выполняющийся на соединении (вызывается из другого потока)"""
+        cancel_operation(conn)
+
+    def open(self):
+        """
+        Прогреть пул соединений и запустить его фоновое обслуживание, а также
+        фоновую проверку БД (первая выполняется сразу) и загрузку каталога схемы.
+        """
+        self.pool.start()
+        self.health.start()
+        self.catalog.start()
+
+    def close(self):
+        """Остановить фоновые обновления кеша и закрыть пул соединений"""
+        with self._refresh_lock:
+            refresher, self._refresher = self._refresher, None
+        if refresher is not None:
+            refresher.shutdown(wait=True)
+        self.health.close()
+        self.catalog.close()
+        self.watchdog.close()
+        self.pool.close()
+
+    def _get_cache_key(
+        self,
+        query: str,
+        params: Optional[Tuple] = None,
+        normalized: Optional[NormalizedQuery] = None,
+        limits: Optional[ResultLimits] = None,
+    ) -> str:
+        """Ключ кеша: fingerprint нормализованного запроса + хеш параметров (+ лимиты)"""
+        if normalized is None:
+            normalized = normalize_query(query)
+        suffix = limits.cache_suffix() if limits is not None else ""
+        return normalized.cache_key(params) + suffix
+
+    def _get_from_cache(self, cache_key: str) -> Optional[QueryResult]:
         """Получить данные из кеша если актуальны"""
-        if cache_key in _query_cache:
-            cached = _query_cache[cache_key]
-            if datetime.now() < cached["expires_at"]:
-                logger.debug(f"Cache HIT: {cache_key}")
-                return cached["data"]
-            else:
-                # Кеш устарел, удаляем
-                logger.debug(f"Cache EXPIRED: {cache_key}")
-                del _query_cache[cache_key]
-        return None
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            logger.debug(f"Cache HIT: {cache_key}")
+        return cached
+
+    def _schedule_refresh(
+        self,
+        cache_key: str,
+        statement: NormalizedQuery,
+        params: Optional[Tuple],
+        limits: ResultLimits,
+    ):
+        """Запустить фоновое обновление устаревшей записи (не более одного на ключ)"""
+        with self._refresh_lock:
+            if cache_key in self._refreshing:
+                return
+            if self._refresher is None:
+                self._refresher = ThreadPoolExecutor(
+                    max_workers=REFRESH_WORKERS, thread_name_prefix="cache-refresh"
+                )
+            self._refreshing.add(cache_key)
+            self._refresher.submit(self._refresh, cache_key, statement, params, limits)
+        logger.debug(f"Cache STALE, refresh scheduled: {cache_key}")
+
+    def _refresh(
+        self,
+        cache_key: str,
+        statement: NormalizedQuery,
+        params: Optional[Tuple],
+        limits: ResultLimits,
+    ):
+        """Перечитать запрос и обновить кеш (в потоке фонового обновления)"""
+        try:
+            query_flights.do(
+                cache_key, lambda: self._run_cached(statement, params, cache_key, limits)
+            )
+        except Exception as e:
+            logger.warning(f"Cache refresh failed for {cache_key}: {e}")
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(cache_key)
 
-    def _save_to_cache(self, cache_key: str, data: List[Dict[str, Any]]):
+    def _cache_ttl(self, limits: Optional[ResultLimits]) -> float:
+        """TTL результата: свой у токена (limits.cache_ttl) или общий"""
+        if limits is not None and limits.cache_ttl:
+            return limits.cache_ttl
+        return self.cache_ttl
+
+    def _save_to_cache(
+        self, cache_key: str, data: QueryResult, limits: Optional[ResultLimits] = None
+    ):
         """Сохранить данные в кеш"""
-        _query_cache[cache_key] = {
-            "data": data,
-            "expires_at": datetime.now() + timedelta(seconds=self.cache_ttl),
-        }
-        logger.debug(f"Cache SAVED: {cache_key} ({len(data)} rows)")
+        if query_cache.set(cache_key, data, ttl=self._cache_ttl(limits)):
+            logger.debug(f"Cache SAVED: {cache_key} ({len(data)} rows)")
 
     @contextmanager
     def get_connection(self):
         """
-        Context manager для получения соединения с автоматической очисткой.
+        Context manager для получения соединения из пула.
+
+        Соединение возвращается в пул по выходу из блока; если во время работы
+        произошла ошибка, перед возвратом оно проверяется пингом и при
+        неисправности закрывается.
 
         Yields:
             fdb.Connection: Соединение с БД
 
         Raises:
             fdb.Error: Ошибки подключения или работы с БД
+            PoolTimeoutError: Нет свободного соединения за pool_timeout
 
         Example:
-            with db_pool.get_connection() as conn:
+            with db.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT * FROM TABLE")
         """
-        conn = None
-        try:
-            logger.debug(f"Connecting to {self.dsn}")
-            start_time = datetime.now()
-
-            conn = fdb.connect(dsn=self.dsn, user=self.user, password=self.password, charset="UTF8")
-
-            elapsed = (datetime.now() - start_time).total_seconds()
-            logger.debug(f"Connection established in {elapsed:.3f}s")
+        with self._lease() as pooled:
+            yield pooled.conn
 
-            yield conn
+    @contextmanager
+    def _lease(self):
+        """Взять соединение пула вместе с его состоянием (см. get_connection)"""
+        start_time = datetime.now()
+        acquiring = time.perf_counter_ns()
+        try:
+            with self.pool.lease() as pooled:
+                record("acquire", acquiring)
+                elapsed = (datetime.now() - start_time).total_seconds()
+                logger.debug(f"Connection acquired in {elapsed:.3f}s")
+                yield pooled
 
+        except QueryInterruptedError as e:
+            # Таймаут или отключение клиента - ожидаемое завершение, не сбой
+            logger.info(f"Query interrupted: {e}")
+            raise
         except fdb.Error as e:
             logger.error(f"Database connection error: {e}")
             raise
         except Exception as e:
             logger.error(f"Unexpected error in database connection: {e}")
             raise
-        finally:
-            if conn:
+
+    @contextmanager
+    def _execute_statement(
+        self,
+        statement: NormalizedQuery,
+        params: Optional[Tuple] = None,
+        scope: Optional[CancelScope] = None,
+    ):
+        """
+        Выполнить запрос (уже нормализованный вызывающим) на соединении из
+        пула и отдать курсор с результатом.
+
+        Запрос готовится один раз на соединение и берется из его кеша
+        подготовленных запросов (statement_cache_size > 0); иначе - обычный
+        cursor.execute. Курсор закрывается по выходу из блока.
+
+        Выполнение и чтение результата ограничены scope (по умолчанию -
+        query_timeout): на Firebird 4+ таймаут выставляется на сессии
+        соединения, и в любом случае по дедлайну или отмене запрос прерывается
+        через fb_cancel_operation.
+
+        Raises:
+            QueryTimeoutError: Запрос прерван по таймауту
+            QueryCancelledError: Запрос отменен (клиент отключился)
+        """
+        if scope is None:
+            scope = CancelScope(self.query_timeout)
+
+        with self._lease() as pooled:
+            if pooled.statement_timeout is None:
+                pooled.statement_timeout = StatementTimeout(pooled.conn)
+            server_side = pooled.statement_timeout.apply(scope)
+            grace = SERVER_TIMEOUT_GRACE if server_side else 0.0
+
+            with self.watchdog.guard(scope, pooled.conn, grace):
+                started = time.perf_counter()
                 try:
-                    conn.close()
-                    logger.debug("Connection closed")
-                except Exception as e:
-                    logger.warning(f"Error closing connection: {e}")
+                    with span("execute"):
+                        if self.statement_cache_size > 0:
+                            if pooled.statements is None:
+                                pooled.statements = StatementCache(
+                                    pooled.conn, self.statement_cache_size, self.statement_stats
+                                )
+                            cursor = pooled.statements.execute(statement, params)
+                        else:
+                            cursor = pooled.conn.cursor()
+                            if params:
+                                cursor.execute(statement.text, params)
+                            else:
+                                cursor.execute(statement.text)
+                finally:
+                    # Чтение результата учитывает вызывающий код
+                    scope.add_db_time(time.perf_counter() - started)
 
-    def execute_query(
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+
+    def execute(
         self, query: str, params: Optional[Tuple] = None, use_cache: bool = True
-    ) -> List[Dict[str, Any]]:
+    ) -> QueryResult:
         """
         Выполнение SELECT запроса с кешированием.
 
@@ -140,78 +383,526 @@ class FirebirdDatabase:
             use_cache: Использовать ли кеш (по умолчанию True)
 
         Returns:
-            List[Dict[str, Any]]: Список строк в виде словарей {column_name: value}
+            QueryResult: Описание колонок и строки в исходных типах fdb
+
+        Raises:
+            fdb.Error: Ошибки выполнения запроса
+        """
+        return self.fetch(query, params, use_cache)[0]
+
+    def fetch(
+        self,
+        query: str,
+        params: Optional[Tuple] = None,
+        use_cache: bool = True,
+        normalized: Optional[NormalizedQuery] = None,
+        limits: Optional[ResultLimits] = None,
+        scope: Optional[CancelScope] = None,
+    ) -> Tuple[QueryResult, bool]:
+        """
+        Выполнение SELECT запроса с кешированием; то же, что execute(), но
+        также сообщает, отдан ли устаревший результат.
+
+        Одинаковые (по ключу кеша) запросы, пришедшие одновременно, выполняются
+        в БД один раз: остальные вызовы ждут и получают тот же результат или
+        ту же ошибку. Если у кеша задан stale_grace, запись с истекшим TTL
+        в пределах этого окна отдается сразу, а кеш обновляется в фоне.
+
+        Args:
+            query: SQL запрос
+            params: Параметры запроса (tuple для позиционных параметров)
+            use_cache: Использовать ли кеш (по умолчанию True)
+            normalized: Уже посчитанная нормализованная форма запроса (иначе
+                считается здесь)
+            limits: Лимиты результата (по умолчанию - лимиты БД)
+            scope: Таймаут и отмена запроса (по умолчанию - query_timeout)
+
+        Returns:
+            Tuple[QueryResult, bool]: Результат и признак устаревшего значения
 
         Raises:
             fdb.Error: Ошибки выполнения запроса
+            QueryInterruptedError: Запрос прерван по таймауту или отменен
         """
+        if limits is None:
+            limits = self.limits
+        if scope is None:
+            scope = CancelScope(self.query_timeout)
+        # Нормализация - один раз на запрос: дальше передается готовая форма
+        if normalized is None:
+            normalized = normalize_query(query)
+        if not use_cache:
+            return self._run_query(normalized, params, limits, scope), False
+
         # Проверяем кеш
-        cache_key = self._get_cache_key(query, params) if use_cache else None
-        if cache_key:
-            cached_data = self._get_from_cache(cache_key)
-            if cached_data is not None:
-                return cached_data
+        cache_key = self._get_cache_key(query, params, normalized, limits)
+        cached_data, stale = query_cache.lookup(cache_key, allow_stale=True)
+        if cached_data is not None:
+            if stale:
+                self._schedule_refresh(cache_key, normalized, params, limits)
+            else:
+                logger.debug(f"Cache HIT: {cache_key}")
+            return cached_data, stale
+
+        while True:
+            try:
+                result = query_flights.do(
+                    cache_key,
+                    lambda: self._run_cached(normalized, params, cache_key, limits, scope),
+                    scope,
+                )
+                return result, False
+            except QueryInterruptedError:
+                if scope.interrupted:
+                    raise
+                # Прерван по таймауту или отмене запрос другого клиента, к
+                # которому присоединился этот вызов: свой дедлайн не прошел -
+                # выполнить заново
+                logger.debug(f"Single-flight leader interrupted, retrying: {cache_key}")
+
+    def fetch_encoded(
+        self,
+        query: str,
+        params: Optional[Tuple],
+        variant: str,
+        encode: Callable[[QueryResult], bytes],
+        normalized: Optional[NormalizedQuery] = None,
+        limits: Optional[ResultLimits] = None,
+        scope: Optional[CancelScope] = None,
+    ) -> Tuple[bytes, int, bool, bool]:
+        """
+        Выполнить запрос (через кеш) и закодировать результат, кешируя и сам
+        закодированный payload.
+
+        Payload хранится в кеше под ключом результата + variant (формат ответа)
+        и живет не дольше результата, из которого получен, так что попадание
+        в кеш не требует повторного кодирования строк.
+
+        Args:
+            query: SQL запрос
+            params: Параметры запроса
+            variant: Вариант кодирования (кодировщик, форма, layout)
+            encode: Функция кодирования QueryResult -> bytes
+            normalized: Уже посчитанная нормализованная форма запроса
+            limits: Лимиты результата (по умолчанию - лимиты БД)
+            scope: Таймаут и отмена запроса (по умолчанию - query_timeout)
+
+        Returns:
+            Tuple[bytes, int, bool, bool]: (payload, количество строк, устаревший
+                ли результат, обрезан ли результат по лимитам)
+
+        Raises:
+            fdb.Error: Ошибки выполнения запроса
+        """
+        if limits is None:
+            limits = self.limits
+        if not self.cache_encoded_bodies:
+            result, stale = self.fetch(
+                query, params, normalized=normalized, limits=limits, scope=scope
+            )
+            with span("encode"):
+                return encode(result), len(result), stale, result.truncated
+
+        body_key = f"{self._get_cache_key(query, params, normalized, limits)}|{variant}"
+        cached, body_stale = query_cache.lookup(body_key, allow_stale=True)
+        if cached is not None and not body_stale:
+            return cached[0], cached[1], False, cached[2]
+
+        result, stale = self.fetch(query, params, normalized=normalized, limits=limits, scope=scope)
+        if cached is not None and stale:
+            # Результат еще не обновлен - устаревший payload ему соответствует
+            return cached[0], cached[1], True, cached[2]
+
+        with span("encode"):
+            payload = encode(result)
+        remaining = self._cache_ttl(limits) - (time.time() - result.fetched_at)
+        if remaining > 0 and result.columns:
+            query_cache.set(body_key, (payload, len(result), result.truncated), ttl=remaining)
+        return payload, len(result), stale, result.truncated
+
+    def fetch_page(
+        self,
+        query: str,
+        params: Optional[Tuple],
+        page_size: Optional[int] = None,
+        next_token: Optional[str] = None,
+        normalized: Optional[NormalizedQuery] = None,
+        limits: Optional[ResultLimits] = None,
+        scope: Optional[CancelScope] = None,
+    ) -> Tuple[QueryResult, Optional[str], bool]:
+        """
+        Страница результата запроса.
+
+        Без next_token запрос выполняется (через кеш) и отдается первая
+        страница; остальные сохраняются в сессию постраничной выдачи. С
+        next_token страница читается из сессии без обращения к БД.
+
+        Args:
+            query: SQL запрос
+            params: Параметры запроса
+            page_size: Строк на странице (для первой страницы)
+            next_token: Токен следующей страницы из предыдущего ответа
+            normalized: Уже посчитанная нормализованная форма запроса
+            limits: Лимиты результата (по умолчанию - лимиты БД)
+            scope: Таймаут и отмена запроса (по умолчанию - query_timeout)
+
+        Returns:
+            Tuple[QueryResult, Optional[str], bool]: (страница, next_token,
+                устаревший ли результат)
+
+        Raises:
+            PageTokenError: next_token неверен или сессия истекла
+            PageSessionError: Результат не помещается в кеш страниц
+            fdb.Error: Ошибки выполнения запроса
+        """
+        if limits is None:
+            limits = self.limits
+        cache_key = self._get_cache_key(query, params, normalized, limits)
+        if next_token:
+            page, token = self.pages.read(next_token, cache_key)
+            return page, token, False
+
+        result, stale = self.fetch(query, params, normalized=normalized, limits=limits, scope=scope)
+        page, token = self.pages.open(cache_key, result, page_size)
+        return page, token, stale
+
+    def _run_cached(
+        self,
+        statement: NormalizedQuery,
+        params: Optional[Tuple],
+        cache_key: str,
+        limits: Optional[ResultLimits] = None,
+        scope: Optional[CancelScope] = None,
+    ) -> QueryResult:
+        """Выполнить запрос и сохранить результат в кеш (ведущий вызов single-flight)"""
+        # Кеш мог заполниться, пока мы ждали своей очереди
+        cached_data = self._get_from_cache(cache_key)
+        if cached_data is not None:
+            return cached_data
+
+        result = self._run_query(statement, params, limits, scope)
+        if result.columns:
+            self._save_to_cache(cache_key, result, limits)
+        return result
+
+    def _run_query(
+        self,
+        statement: NormalizedQuery,
+        params: Optional[Tuple] = None,
+        limits: Optional[ResultLimits] = None,
+        scope: Optional[CancelScope] = None,
+    ) -> QueryResult:
+        """
+        Выполнить SELECT запрос в БД без кеша.
 
+        Без лимитов строки читаются одним fetchall. С лимитами - порциями
+        fetchmany, и чтение прекращается, как только лимит достигнут: курсор
+        закрывается, не дочитывая результат, а QueryResult помечается truncated.
+        """
         start_time = datetime.now()
+        fingerprint = statement.fingerprint
+        logger.debug(f"Executing query with {len(params) if params else 0} parameters")
+
+        if scope is None:
+            scope = CancelScope(self.query_timeout)
+
+        try:
+            with self._execute_statement(statement, params, scope) as cursor:
+                reading = time.perf_counter()
+                try:
+                    result = self._read_result(cursor, limits)
+                finally:
+                    scope.add_db_time(time.perf_counter() - reading)
+
+        except fdb.Error as e:
+            elapsed = (datetime.now() - start_time).total_seconds()
+            observe_query(fingerprint, elapsed, 0, failed=True)
+            logger.error(f"Query execution failed after {elapsed:.3f}s: {e}")
+            raise
+
+        elapsed = (datetime.now() - start_time).total_seconds()
+        observe_query(fingerprint, elapsed, len(result))
+        if result.columns:
+            logger.info(
+                f"Query executed: {len(result)} rows in {elapsed:.3f}s"
+                + (f" (truncated by {limits})" if result.truncated else "")
+            )
+        return result
+
+    def fetch_snapshot(
+        self,
+        statements: List[Tuple[NormalizedQuery, Optional[Tuple]]],
+        limits: Optional[ResultLimits] = None,
+        scope: Optional[CancelScope] = None,
+    ) -> List[Union[QueryResult, fdb.Error]]:
+        """
+        Выполнить запросы последовательно в одной read-only snapshot
+        транзакции: все результаты видят одно и то же состояние БД.
+
+        Кеш не читается (его записи получены в разное время), но свежие
+        результаты в него сохраняются. Ошибка одного запроса не прерывает
+        транзакцию и возвращается на его месте.
 
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        Args:
+            statements: Нормализованные запросы и их параметры
+            limits: Лимиты результата каждого запроса (по умолчанию - лимиты БД)
+            scope: Таймаут и отмена всего пакета (по умолчанию - query_timeout)
 
+        Returns:
+            List[Union[QueryResult, fdb.Error]]: Результат или ошибка каждого
+                запроса, в исходном порядке
+
+        Raises:
+            QueryInterruptedError: Пакет прерван по таймауту или отменен
+            PoolTimeoutError: Нет свободного соединения за pool_timeout
+        """
+        if limits is None:
+            limits = self.limits
+        if scope is None:
+            scope = CancelScope(self.query_timeout)
+
+        results: List[Union[QueryResult, fdb.Error]] = []
+        with self._lease() as pooled:
+            if pooled.statement_timeout is None:
+                pooled.statement_timeout = StatementTimeout(pooled.conn)
+            grace = SERVER_TIMEOUT_GRACE if pooled.statement_timeout.apply(scope) else 0.0
+
+            # Отдельная транзакция: основная транзакция соединения и ее
+            # подготовленные запросы не затрагиваются
+            transaction = pooled.conn.trans(default_tpb=SNAPSHOT_READ_ONLY_TPB)
+            transaction.default_action = "rollback"
             try:
-                # Выполнение запроса
-                if params:
-                    logger.debug(f"Executing query with {len(params)} parameters")
-                    cursor.execute(query, params)
-                else:
-                    logger.debug("Executing query without parameters")
-                    cursor.execute(query)
-
-                # Получить названия колонок
-                if cursor.description:
-                    columns = [desc[0] for desc in cursor.description]
-
-                    # Получить данные
-                    rows = cursor.fetchall()
-
-                    # Преобразовать в список словарей
-                    results = []
-                    for row in rows:
-                        row_dict = {}
-                        for i, col_name in enumerate(columns):
-                            value = row[i]
-                            # Преобразовать типы данных для JSON сериализации
-                            if isinstance(value, datetime):
-                                value = value.isoformat()
-                            elif isinstance(value, date):
-                                value = value.isoformat()
-                            elif isinstance(value, time):
-                                value = value.isoformat()
-                            elif isinstance(value, decimal.Decimal):
-                                value = float(value)
-                            elif isinstance(value, bytes):
-                                value = value.decode("utf-8", errors="replace")
-                            row_dict[col_name] = value
-                        results.append(row_dict)
-
-                    elapsed = (datetime.now() - start_time).total_seconds()
-                    logger.info(f"Query executed: {len(results)} rows in {elapsed:.3f}s")
-
-                    # Сохраняем в кеш
-                    if cache_key:
-                        self._save_to_cache(cache_key, results)
-
-                    return results
-                else:
-                    # Нет результатов (не должно происходить для SELECT)
+                with self.watchdog.guard(scope, pooled.conn, grace):
+                    transaction.begin()
+                    cursor = transaction.cursor()
+                    for statement, params in statements:
+                        started = time.perf_counter()
+                        try:
+                            with span("execute", fingerprint=statement.fingerprint):
+                                if params:
+                                    cursor.execute(statement.text, params)
+                                else:
+                                    cursor.execute(statement.text)
+                            result = self._read_result(cursor, limits)
+                        except fdb.Error as e:
+                            elapsed = time.perf_counter() - started
+                            scope.add_db_time(elapsed)
+                            observe_query(statement.fingerprint, elapsed, 0, failed=True)
+                            if scope.interrupted:
+                                raise
+                            logger.warning(f"Snapshot query {statement.fingerprint} failed: {e}")
+                            results.append(e)
+                            continue
+
+                        elapsed = time.perf_counter() - started
+                        scope.add_db_time(elapsed)
+                        observe_query(statement.fingerprint, elapsed, len(result))
+                        results.append(result)
+                        if result.columns:
+                            cache_key = self._get_cache_key(
+                                statement.text, params, statement, limits
+                            )
+                            self._save_to_cache(cache_key, result, limits)
+                    cursor.close()
+            finally:
+                # Транзакция только читала: close() откатывает ее и освобождает snapshot
+                transaction.close()
+
+        logger.info(f"Snapshot batch executed: {len(statements)} queries")
+        return results
+
+    @classmethod
+    def _read_result(cls, cursor, limits: Optional[ResultLimits]) -> QueryResult:
+        """Прочитать результат выполненного запроса (с лимитами - порциями)"""
+        if not cursor.description:
+            # Нет результатов (не должно происходить для SELECT)
+            logger.warning("Query returned no description (no results)")
+            return QueryResult([], [])
+
+        with span("fetch") as attributes:
+            columns = describe_columns(cursor.description)
+            if limits:
+                result = cls._fetch_limited(cursor, columns, limits)
+            else:
+                result = QueryResult(columns, cursor.fetchall())
+            attributes["rows"] = len(result)
+        return result
+
+    @staticmethod
+    def _fetch_limited(cursor, columns, limits: ResultLimits) -> QueryResult:
+        """Читать курсор порциями, пока не кончатся строки или лимиты"""
+        budget = limits.budget()
+        rows: List[Tuple] = []
+        while not budget.exhausted:
+            batch = cursor.fetchmany(budget.next_size(FETCH_BATCH_SIZE))
+            if not batch:
+                break
+            rows.extend(budget.take(batch))
+        return QueryResult(columns, rows, truncated=budget.exhausted)
+
+    def execute_query(
+        self, query: str, params: Optional[Tuple] = None, use_cache: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Выполнение SELECT запроса с кешированием.
+
+        Args:
+            query: SQL запрос
+            params: Параметры запроса (tuple для позиционных параметров)
+            use_cache: Использовать ли кеш (по умолчанию True)
+
+        Returns:
+            List[Dict[str, Any]]: Список строк в виде словарей {column_name: value}
+
+        Raises:
+            fdb.Error: Ошибки выполнения запроса
+        """
+        return self.execute(query, params, use_cache).to_dicts()
+
+    def stream_query(
+        self,
+        query: str,
+        params: Optional[Tuple] = None,
+        batch_size: int = 1000,
+        limits: Optional[ResultLimits] = None,
+        scope: Optional[CancelScope] = None,
+        normalized: Optional[NormalizedQuery] = None,
+    ) -> Iterator[QueryResult]:
+        """
+        Потоковое выполнение SELECT запроса без кеширования.
+
+        Курсор читается через fetchmany порциями по batch_size строк, поэтому
+        в памяти одновременно находится только одна порция. Соединение
+        удерживается до исчерпания или закрытия генератора.
+
+        Args:
+            query: SQL запрос
+            params: Параметры запроса
+            batch_size: Размер порции строк
+            limits: Лимиты результата (по умолчанию - лимиты БД); на лимите
+                выдача прекращается, последняя порция помечена truncated
+            scope: Таймаут и отмена запроса (по умолчанию - query_timeout);
+                таймаут ограничивает всю выдачу, включая чтение клиентом
+            normalized: Уже посчитанная нормализованная форма запроса
+
+        Yields:
+            QueryResult: Очередная порция строк (с общим описанием колонок)
+
+        Raises:
+            fdb.Error: Ошибки выполнения запроса
+        """
+        if scope is None:
+            scope = CancelScope(self.query_timeout)
+        if normalized is None:
+            normalized = normalize_query(query)
+        start_time = datetime.now()
+        rows_count = 0
+        budget = (self.limits if limits is None else limits).budget()
+        # Время чтения порций - одной фазой fetch, а не span'ом на порцию
+        trace = current_trace()
+        fetching = 0
+
+        try:
+            with self._execute_statement(normalized, params, scope) as cursor:
+                if not cursor.description:
                     logger.warning("Query returned no description (no results)")
-                    return []
+                    return
+
+                columns = describe_columns(cursor.description)
+
+                while True:
+                    batch_started = time.perf_counter_ns()
+                    rows = cursor.fetchmany(budget.next_size(batch_size))
+                    batch_ns = time.perf_counter_ns() - batch_started
+                    fetching += batch_ns
+                    scope.add_db_time(batch_ns / 1e9)
+                    if not rows:
+                        break
+                    rows = budget.take(rows)
+                    rows_count += len(rows)
+                    if budget.exhausted:
+                        # Дальше не читаем: курсор закроется при выходе из блока
+                        yield QueryResult(columns, rows, truncated=True)
+                        break
+                    yield QueryResult(columns, rows)
+
+                if rows_count == 0 and not budget.exhausted:
+                    # Пустой результат: отдать хотя бы описание колонок
+                    yield QueryResult(columns, [])
 
-            except fdb.Error as e:
                 elapsed = (datetime.now() - start_time).total_seconds()
-                logger.error(f"Query execution failed after {elapsed:.3f}s: {e}")
-                raise
+                observe_query(normalized.fingerprint, elapsed, rows_count)
+                if trace is not None:
+                    ended = time.perf_counter_ns()
+                    trace.add("fetch", ended - fetching, ended, {"rows": rows_count})
+                logger.info(f"Query streamed: {rows_count} rows in {elapsed:.3f}s")
+
+        except fdb.Error as e:
+            elapsed = (datetime.now() - start_time).total_seconds()
+            observe_query(normalized.fingerprint, elapsed, rows_count, failed=True)
+            logger.error(f"Query streaming failed after {elapsed:.3f}s: {e}")
+            raise
+
+    def ping(self, timeout: float = 0.0) -> None:
+        """
+        Проверить БД коротким запросом на соединении пула.
+
+        Args:
+            timeout: Таймаут ожидания соединения и выполнения в секундах
+                (0 - таймауты пула и query_timeout)
+
+        Raises:
+            fdb.Error: БД недоступна или ответила неожиданно
+            PoolTimeoutError: Нет свободного соединения за timeout
+            QueryTimeoutError: Запрос не выполнился за timeout
+        """
+        scope = CancelScope(timeout or self.query_timeout)
+        with self.pool.lease(timeout=timeout or None) as pooled:
+            with self.watchdog.guard(scope, pooled.conn):
+                cursor = pooled.conn.cursor()
+                try:
+                    cursor.execute(PING_QUERY)
+                    row = cursor.fetchone()
+                finally:
+                    cursor.close()
+        if not row or row[0] != 1:
+            raise fdb.DatabaseError(f"Unexpected ping result: {row!r}")
+
+    def read_metadata(self, queries: Sequence[str]) -> List[List[Tuple]]:
+        """
+        Выполнить запросы к системным таблицам в одной read-only snapshot
+        транзакции (для каталога схемы) без кеша.
+
+        Args:
+            queries: Запросы без параметров
+
+        Returns:
+            List[List[Tuple]]: Строки каждого запроса, в исходном порядке
+
+        Raises:
+            fdb.Error: Ошибки выполнения запросов
+            QueryTimeoutError: Чтение не уложилось в query_timeout
+        """
+        scope = CancelScope(self.query_timeout)
+        results: List[List[Tuple]] = []
+        with self._lease() as pooled:
+            transaction = pooled.conn.trans(default_tpb=SNAPSHOT_READ_ONLY_TPB)
+            transaction.default_action = "rollback"
+            try:
+                with self.watchdog.guard(scope, pooled.conn):
+                    transaction.begin()
+                    cursor = transaction.cursor()
+                    for query in queries:
+                        cursor.execute(query)
+                        results.append(list(cursor.fetchall()))
+                    cursor.close()
             finally:
-                cursor.close()
+                transaction.close()
+        return results
+
+    def _health_probe(self) -> None:
+        """Проверка для фонового health check"""
+        self.ping(self.health_timeout)
 
     def test_connection(self) -> bool:
         """
@@ -240,62 +931,26 @@ class FirebirdDatabase:
 
     def get_tables(self) -> List[str]:
         """
-        Получить список пользовательских таблиц в БД.
+        Получить список пользовательских таблиц в БД (из каталога схемы).
 
         Returns:
             List[str]: Список имен таблиц
         """
-        query = """
-            SELECT RDB$RELATION_NAME
-            FROM RDB$RELATIONS
-            WHERE RDB$SYSTEM_FLAG = 0
-                AND RDB$VIEW_BLR IS NULL
-            ORDER BY RDB$RELATION_NAME
-        """
-
-        results = self.execute_query(query)
-        tables = [row["RDB$RELATION_NAME"].strip() for row in results]
-
-        logger.info(f"Found {len(tables)} tables in database")
-        return tables
+        return list(self.catalog.snapshot().names)
 
     def get_table_schema(self, table_name: str) -> List[Dict[str, Any]]:
         """
-        Получить схему таблицы (список колонок и их типы).
+        Получить схему таблицы (список колонок и их типы) из каталога схемы.
 
         Args:
             table_name: Имя таблицы
 
         Returns:
             List[Dict[str, Any]]: Список колонок с информацией о типах
+                (пустой, если таблицы нет)
         """
-        query = """
-            SELECT
-                f.RDB$FIELD_NAME as FIELD_NAME,
-                f.RDB$FIELD_TYPE as FIELD_TYPE,
-                f.RDB$NULL_FLAG as NULL_FLAG,
-                t.RDB$TYPE_NAME as TYPE_NAME
-            FROM RDB$RELATION_FIELDS f
-            LEFT JOIN RDB$TYPES t ON f.RDB$FIELD_TYPE = t.RDB$TYPE
-                AND t.RDB$FIELD_NAME = 'RDB$FIELD_TYPE'
-            WHERE f.RDB$RELATION_NAME = ?
-            ORDER BY f.RDB$FIELD_POSITION
-        """
-
-        results = self.execute_query(query, (table_name.upper(),))
-
-        schema = []
-        for row in results:
-            schema.append(
-                {
-                    "name": row["FIELD_NAME"].strip() if row["FIELD_NAME"] else "",
-                    "type": row["TYPE_NAME"].strip() if row["TYPE_NAME"] else "UNKNOWN",
-                    "nullable": row["NULL_FLAG"] != 1,
-                }
-            )
-
-        logger.info(f"Retrieved schema for table {table_name}: {len(schema)} columns")
-        return schema
+        table = self.catalog.table(table_name)
+        return table["columns"] if table else []
 
 
 # Глобальный экземпляр БД
@@ -318,7 +973,22 @@ def initialize_database() -> FirebirdDatabase:
         user=settings.db_user,
         password=settings.db_password,
         connection_timeout=settings.db_connection_timeout,
+        query_timeout=settings.db_query_timeout,
         cache_ttl=getattr(settings, "cache_ttl", 300),
+        cache_encoded_bodies=settings.cache_encoded_bodies,
+        statement_cache_size=settings.db_statement_cache_size,
+        page_session_ttl=settings.page_session_ttl,
+        max_rows=settings.query_max_rows,
+        max_bytes=settings.query_max_bytes,
+        min_connections=settings.db_min_connections,
+        max_connections=settings.db_max_connections,
+        pool_timeout=settings.db_pool_timeout,
+        pool_max_lifetime=settings.db_pool_max_lifetime,
+        pool_ping_interval=settings.db_pool_ping_interval,
+        health_interval=settings.health_check_interval,
+        health_timeout=settings.health_check_timeout,
+        health_failure_threshold=settings.health_failure_threshold,
+        schema_refresh_interval=settings.schema_refresh_interval,
     )
 
     logger.info("Database initialized successfully")
@@ -344,6 +1014,5 @@ def get_database() -> FirebirdDatabase:
 
 def clear_cache():
     """Очистить весь кеш запросов"""
-    count = len(_query_cache)
-    _query_cache.clear()
+    count = query_cache.clear()
     logger.info(f"Cache cleared: {count} entries removed")
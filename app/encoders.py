@@ -0,0 +1,589 @@
+"""
+Кодировщики результатов запроса
+
+Формат ответа /api/query выбирается по заголовку Accept. Каждый кодировщик
+работает и в буферизованном режиме (весь результат одним телом), и в
+потоковом (заголовок, порции строк, trailer). Типы Firebird передаются
+нативно для формата: без промежуточного преобразования дат в строки и
+Decimal во float там, где формат умеет их представлять.
+
+Буферизованный ответ собирается из двух частей: payload - закодированные
+данные результата (не зависят от времени запроса и кешируются) и метаданные
+ответа (success, rows_count, execution_time, timestamp, ...), которые
+подставляются при каждой выдаче методом assemble().
+
+Зависимости msgpack и pyarrow опциональны: если библиотека не установлена,
+соответствующий формат просто не предлагается при согласовании. JSON и NDJSON
+кодируются orjson, если он установлен (иначе стандартным json): строки
+передаются кодировщику в исходных типах fdb, без промежуточных словарей с
+преобразованными значениями.
+"""
+
+import csv
+import io
+import json
+import logging
+from datetime import datetime, date, time, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+from app.results import (
+    FORMAT_COLUMNAR,
+    LAYOUT_ROWS,
+    ConversionPlan,
+    QueryResult,
+    ResultColumn,
+    conversion_plan,
+    convert_rows,
+    decode_bytes,
+)
+from app.tracing import span
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - зависит от окружения
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - зависит от окружения
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # pragma: no cover - зависит от окружения
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+JSON_MEDIA_TYPE = "application/json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+CSV_MEDIA_TYPE = "text/csv"
+
+
+class StreamWriter:
+    """Состояние потоковой выдачи одного ответа"""
+
+    def __init__(self, encoder: "ResultEncoder", fmt: str):
+        self.encoder = encoder
+        self.fmt = fmt
+        self.started = False
+
+    def header(self, batch: QueryResult) -> bytes:
+        """Данные перед первой порцией строк"""
+        return b""
+
+    def batch(self, batch: QueryResult) -> bytes:
+        """Очередная порция строк"""
+        raise NotImplementedError
+
+    def trailer(self, meta: Dict[str, Any]) -> bytes:
+        """Завершение потока (meta: success, rows_count, execution_time, error, timestamp)"""
+        return b""
+
+    def write(self, batch: QueryResult) -> bytes:
+        if self.started:
+            return self.batch(batch)
+        self.started = True
+        return self.header(batch) + self.batch(batch)
+
+
+class ResultEncoder:
+    """
+    Базовый кодировщик результата.
+
+    Attributes:
+        name: Короткое имя формата
+        media_type: Content-Type ответа
+        aliases: Дополнительные media type, принимаемые в Accept
+        supports_errors: Формат может передать ошибку в теле/trailer; если нет,
+            ошибка в середине потока обрывает ответ
+    """
+
+    name = ""
+    media_type = ""
+    aliases: tuple = ()
+    supports_errors = True
+
+    @property
+    def available(self) -> bool:
+        """Установлены ли зависимости формата"""
+        return True
+
+    @property
+    def content_type(self) -> str:
+        return self.media_type
+
+    def encode(self, result: QueryResult, meta: Dict[str, Any], fmt: str, layout: str) -> bytes:
+        """Закодировать весь результат одним телом"""
+        return self.assemble(self.encode_payload(result, fmt, layout), meta)
+
+    def encode_payload(self, result: QueryResult, fmt: str, layout: str) -> bytes:
+        """Закодировать данные результата без метаданных ответа (пригодно для кеша)"""
+        raise NotImplementedError
+
+    def assemble(self, payload: bytes, meta: Dict[str, Any]) -> bytes:
+        """Собрать тело ответа из payload и метаданных ответа"""
+        raise NotImplementedError
+
+    def error(self, meta: Dict[str, Any]) -> Optional[bytes]:
+        """Тело ответа с ошибкой или None, если формат не умеет ошибки"""
+        return None
+
+    def stream(self, fmt: str) -> StreamWriter:
+        """Начать потоковую выдачу"""
+        raise NotImplementedError
+
+
+# ==================== JSON ====================
+
+
+def _json_default(value: Any) -> Any:
+    """Типы fdb, которых нет в JSON (те же правила, что у results.to_json_value)"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        # orjson сериализует их сам; нужно только для стандартного json
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"Cannot serialize {type(value).__name__} to JSON")
+
+
+if orjson is not None:
+
+    def _json_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_json_default)
+
+else:  # pragma: no cover - зависит от окружения
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(",", ":"), default=_json_default
+        ).encode("utf-8")
+
+
+def _json_line(obj: Any) -> bytes:
+    return _json_dumps(obj) + b"\n"
+
+
+class JsonEncoder(ResultEncoder):
+    """
+    JSON ответ /api/query (формат по умолчанию): объект с data и метаданными,
+    как QueryResponse / ColumnarQueryResponse, но без валидации строк pydantic.
+    """
+
+    name = "json"
+    media_type = JSON_MEDIA_TYPE
+
+    def encode_payload(self, result: QueryResult, fmt: str, layout: str) -> bytes:
+        # convert - сборка структуры ответа, входит в фазу encode
+        with span("convert"):
+            if fmt == FORMAT_COLUMNAR:
+                data = result.to_columnar(layout, convert_values=False)
+            else:
+                names = result.column_names
+                data = [dict(zip(names, row)) for row in result.rows]
+        if fmt == FORMAT_COLUMNAR:
+            return _json_dumps(data)
+        return b'{"data":' + _json_dumps(data) + b"}"
+
+    def assemble(self, payload: bytes, meta: Dict[str, Any]) -> bytes:
+        # {"data": ...} + {"success": ...} -> {"data": ..., "success": ...}
+        return payload[:-1] + b"," + _json_dumps(meta)[1:]
+
+    def error(self, meta: Dict[str, Any]) -> Optional[bytes]:
+        return _json_dumps(meta)
+
+    def batch(self, items: List[bytes], meta: Dict[str, Any]) -> bytes:
+        """Ответ пакета: готовые тела ответов на запросы + метаданные пакета"""
+        return b'{"results":[' + b",".join(items) + b"]," + _json_dumps(meta)[1:]
+
+    def stream(self, fmt: str) -> StreamWriter:
+        raise NotImplementedError("JSON is not streamed, use NDJSON")
+
+
+# ==================== NDJSON ====================
+
+
+class _NdjsonStream(StreamWriter):
+    def header(self, batch: QueryResult) -> bytes:
+        if self.fmt != FORMAT_COLUMNAR:
+            return b""
+        columns = [dict(column.to_dict(), dictionary=None) for column in batch.columns]
+        return _json_line({"_header": {"columns": columns}})
+
+    def batch(self, batch: QueryResult) -> bytes:
+        if self.fmt == FORMAT_COLUMNAR:
+            return b"".join(_json_line(row) for row in batch.rows)
+        names = batch.column_names
+        return b"".join(_json_line(dict(zip(names, row))) for row in batch.rows)
+
+    def trailer(self, meta: Dict[str, Any]) -> bytes:
+        return _json_line({"_trailer": meta})
+
+
+class NdjsonEncoder(ResultEncoder):
+    """NDJSON: по JSON-объекту на строку результата, последней строкой trailer"""
+
+    name = "ndjson"
+    media_type = NDJSON_MEDIA_TYPE
+
+    def encode_payload(self, result: QueryResult, fmt: str, layout: str) -> bytes:
+        return self.stream(fmt).write(result)
+
+    def assemble(self, payload: bytes, meta: Dict[str, Any]) -> bytes:
+        return payload + _json_line({"_trailer": meta})
+
+    def error(self, meta: Dict[str, Any]) -> Optional[bytes]:
+        return _json_line({"_trailer": meta})
+
+    def stream(self, fmt: str) -> StreamWriter:
+        return _NdjsonStream(self, fmt)
+
+
+# ==================== MESSAGEPACK ====================
+
+
+def _msgpack_default(value: Any) -> Any:
+    """Типы, которых нет в MessagePack"""
+    if isinstance(value, datetime):
+        # Нативный Timestamp extension (-1); время Firebird без пояса считаем UTC
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # Строка сохраняет точное значение NUMERIC/DECIMAL
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__} to MessagePack")
+
+
+def _msgpack_columns(columns: List[ResultColumn]) -> List[Dict[str, Any]]:
+    return [column.to_dict() for column in columns]
+
+
+class _MsgpackStream(StreamWriter):
+    def __init__(self, encoder: "MsgpackEncoder", fmt: str):
+        super().__init__(encoder, fmt)
+        self.packer = msgpack.Packer(default=_msgpack_default, use_bin_type=True)
+
+    def header(self, batch: QueryResult) -> bytes:
+        if self.fmt != FORMAT_COLUMNAR:
+            return b""
+        return self.packer.pack({"_header": {"columns": _msgpack_columns(batch.columns)}})
+
+    def batch(self, batch: QueryResult) -> bytes:
+        pack = self.packer.pack
+        if self.fmt == FORMAT_COLUMNAR:
+            return b"".join(pack(row) for row in batch.rows)
+        names = batch.column_names
+        return b"".join(pack(dict(zip(names, row))) for row in batch.rows)
+
+    def trailer(self, meta: Dict[str, Any]) -> bytes:
+        return self.packer.pack({"_trailer": meta})
+
+
+class MsgpackEncoder(ResultEncoder):
+    """MessagePack: бинарные строки, bin для BLOB, Timestamp для TIMESTAMP"""
+
+    name = "msgpack"
+    media_type = MSGPACK_MEDIA_TYPE
+    aliases = ("application/x-msgpack", "application/vnd.msgpack")
+
+    @property
+    def available(self) -> bool:
+        return msgpack is not None
+
+    def encode_payload(self, result: QueryResult, fmt: str, layout: str) -> bytes:
+        body: Dict[str, Any] = {}
+        if fmt == FORMAT_COLUMNAR:
+            body["columns"] = _msgpack_columns(result.columns)
+            body["layout"] = layout
+            if layout == LAYOUT_ROWS:
+                body["data"] = result.rows
+            else:
+                body["data"] = [list(values) for values in zip(*result.rows)] if result.rows else []
+        else:
+            names = result.column_names
+            body["data"] = [dict(zip(names, row)) for row in result.rows]
+
+        # Первый байт - число пар key/value, дальше сами пары без заголовка map
+        packer = msgpack.Packer(default=_msgpack_default, use_bin_type=True)
+        pairs = b"".join(packer.pack(key) + packer.pack(value) for key, value in body.items())
+        return bytes([len(body)]) + pairs
+
+    def assemble(self, payload: bytes, meta: Dict[str, Any]) -> bytes:
+        packer = msgpack.Packer(default=_msgpack_default, use_bin_type=True)
+        header = packer.pack_map_header(len(meta) + payload[0])
+        pairs = b"".join(packer.pack(key) + packer.pack(value) for key, value in meta.items())
+        return header + pairs + payload[1:]
+
+    def error(self, meta: Dict[str, Any]) -> Optional[bytes]:
+        return msgpack.packb(meta, default=_msgpack_default, use_bin_type=True)
+
+    def stream(self, fmt: str) -> StreamWriter:
+        return _MsgpackStream(self, fmt)
+
+
+# ==================== APACHE ARROW ====================
+
+
+def _arrow_type(column: ResultColumn):
+    """Тип Arrow для колонки Firebird"""
+    pa = pyarrow
+    column_type = column.type
+    if column_type == "SMALLINT":
+        return pa.int16()
+    if column_type == "INTEGER":
+        return pa.int32()
+    if column_type == "BIGINT":
+        return pa.int64()
+    if column_type == "DECIMAL":
+        scale = column.scale or 0
+        precision = max(column.precision or 18, scale + 1)
+        return pa.decimal128(precision, scale)
+    if column_type == "FLOAT":
+        return pa.float32()
+    if column_type == "DOUBLE PRECISION":
+        return pa.float64()
+    if column_type == "DATE":
+        return pa.date32()
+    if column_type == "TIME":
+        return pa.time64("us")
+    if column_type == "TIMESTAMP":
+        return pa.timestamp("us")
+    if column_type == "BOOLEAN":
+        return pa.bool_()
+    if column_type == "BLOB":
+        return pa.binary()
+    return pa.string()
+
+
+def _arrow_schema(columns: List[ResultColumn]):
+    fields = [
+        pyarrow.field(column.name, _arrow_type(column), nullable=column.nullable)
+        for column in columns
+    ]
+    return pyarrow.schema(fields)
+
+
+def _arrow_batch(result: QueryResult, schema):
+    if result.rows:
+        arrays = [
+            pyarrow.array(values, type=field.type)
+            for values, field in zip(zip(*result.rows), schema)
+        ]
+    else:
+        arrays = [pyarrow.array([], type=field.type) for field in schema]
+    return pyarrow.record_batch(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """Файлоподобный приемник: собирает записанные байты для отдачи порциями"""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class _ArrowStream(StreamWriter):
+    def __init__(self, encoder: "ArrowEncoder", fmt: str):
+        super().__init__(encoder, fmt)
+        self.sink = _ChunkSink()
+        self.writer = None
+        self.schema = None
+
+    def header(self, batch: QueryResult) -> bytes:
+        self.schema = _arrow_schema(batch.columns)
+        self.writer = pyarrow.ipc.new_stream(self.sink, self.schema)
+        return b""
+
+    def batch(self, batch: QueryResult) -> bytes:
+        self.writer.write_batch(_arrow_batch(batch, self.schema))
+        return self.sink.take()
+
+    def trailer(self, meta: Dict[str, Any]) -> bytes:
+        if self.writer is not None:
+            self.writer.close()
+        return self.sink.take()
+
+
+class ArrowEncoder(ResultEncoder):
+    """Apache Arrow IPC stream: типизированные колонки для загрузки в dataframe"""
+
+    name = "arrow"
+    media_type = ARROW_MEDIA_TYPE
+    # В IPC stream нет места для ошибки после схемы - поток обрывается
+    supports_errors = False
+
+    @property
+    def available(self) -> bool:
+        return pyarrow is not None
+
+    def encode_payload(self, result: QueryResult, fmt: str, layout: str) -> bytes:
+        schema = _arrow_schema(result.columns)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, schema) as writer:
+            writer.write_batch(_arrow_batch(result, schema))
+        return sink.getvalue().to_pybytes()
+
+    def assemble(self, payload: bytes, meta: Dict[str, Any]) -> bytes:
+        # Метаданные живут в первом сообщении потока (схеме): заменяем только его
+        schema = pyarrow.ipc.read_schema(pyarrow.py_buffer(payload))
+        schema_size = schema.serialize().size
+        metadata = {key: json.dumps(value) for key, value in meta.items()}
+        return schema.with_metadata(metadata).serialize().to_pybytes() + payload[schema_size:]
+
+    def stream(self, fmt: str) -> StreamWriter:
+        return _ArrowStream(self, fmt)
+
+
+# ==================== CSV ====================
+
+
+def _csv_converter(column: ResultColumn) -> Optional[Callable[[Any], Any]]:
+    # csv сам пишет None пустым полем, str(Decimal) сохраняет точность,
+    # str(datetime) - "YYYY-MM-DD HH:MM:SS"; преобразовать нужно только bytes
+    if column.type == "BLOB" or column.python_type is bytes:
+        return decode_bytes
+    return None
+
+
+class _CsvStream(StreamWriter):
+    def __init__(self, encoder: "CsvEncoder", fmt: str):
+        super().__init__(encoder, fmt)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator="\r\n")
+        self.plan: Optional[ConversionPlan] = None
+
+    def _take(self) -> bytes:
+        data = self.buffer.getvalue().encode("utf-8")
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    def header(self, batch: QueryResult) -> bytes:
+        # BOM - чтобы Excel распознал UTF-8 (кириллица, грузинский)
+        self.buffer.write("\ufeff")
+        self.writer.writerow(batch.column_names)
+        return self._take()
+
+    def batch(self, batch: QueryResult) -> bytes:
+        if self.plan is None:
+            self.plan = conversion_plan(batch.columns, _csv_converter)
+        self.writer.writerows(convert_rows(batch.rows, self.plan))
+        return self._take()
+
+
+class CsvEncoder(ResultEncoder):
+    """CSV для выгрузки в таблицы: строка заголовков и строки значений"""
+
+    name = "csv"
+    media_type = CSV_MEDIA_TYPE
+    supports_errors = False
+
+    @property
+    def content_type(self) -> str:
+        return f"{self.media_type}; charset=utf-8"
+
+    def encode_payload(self, result: QueryResult, fmt: str, layout: str) -> bytes:
+        return self.stream(fmt).write(result)
+
+    def assemble(self, payload: bytes, meta: Dict[str, Any]) -> bytes:
+        # В CSV нет места для метаданных
+        return payload
+
+    def stream(self, fmt: str) -> StreamWriter:
+        return _CsvStream(self, fmt)
+
+
+# ==================== REGISTRY ====================
+
+_encoders: Dict[str, ResultEncoder] = {}
+
+
+def register_encoder(encoder: ResultEncoder) -> None:
+    """Зарегистрировать кодировщик для его media type и алиасов"""
+    for media_type in (encoder.media_type,) + tuple(encoder.aliases):
+        _encoders[media_type] = encoder
+
+
+for _encoder in (NdjsonEncoder(), MsgpackEncoder(), ArrowEncoder(), CsvEncoder()):
+    register_encoder(_encoder)
+
+
+def available_media_types() -> List[str]:
+    """Media type всех доступных форматов (JSON - по умолчанию)"""
+    types = [JSON_MEDIA_TYPE]
+    for encoder in _encoders.values():
+        if encoder.available and encoder.media_type not in types:
+            types.append(encoder.media_type)
+    return types
+
+
+def select_encoder(accept: Optional[str]) -> Optional[ResultEncoder]:
+    """
+    Выбрать кодировщик по заголовку Accept.
+
+    Returns:
+        ResultEncoder или None, если подходит обычный JSON (в том числе когда
+        ни один из запрошенных форматов не поддерживается)
+    """
+    if not accept:
+        return None
+
+    candidates = []
+    for position, item in enumerate(accept.split(",")):
+        parts = item.strip().split(";")
+        media_type = parts[0].strip().lower()
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, media_type))
+
+    for _, _, media_type in sorted(candidates):
+        if media_type in (JSON_MEDIA_TYPE, "*/*", "application/*"):
+            return None
+        encoder = _encoders.get(media_type)
+        if encoder is not None and encoder.available:
+            return encoder
+
+    return None
+
+
+# Кодировщик JSON ответа по умолчанию (не участвует в согласовании по Accept:
+# select_encoder возвращает для JSON None)
+JSON_ENCODER = JsonEncoder()
+
+
+def get_encoder(media_type: str) -> Optional[ResultEncoder]:
+    """Кодировщик по media type (None если неизвестен или недоступен)"""
+    encoder = _encoders.get(media_type)
+    return encoder if encoder is not None and encoder.available else None
@@ -0,0 +1,162 @@
+"""
+Ограниченный executor для блокирующих вызовов fdb
+
+Все обращения к БД выполняются в выделенном пуле потоков, размер которого
+равен размеру пула соединений, чтобы медленный запрос не блокировал event
+loop. Очередь ожидания ограничена: при переполнении сразу отдается
+ExecutorBusyError (503 + Retry-After) вместо бесконечного накопления запросов.
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.tracing import record
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusyError(Exception):
+    """Очередь executor'а переполнена - запрос отклонен"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DBExecutor:
+    """
+    Пул потоков для работы с БД с ограниченной очередью ожидания.
+
+    Одновременно выполняется не более max_workers задач, еще не более
+    max_queue ждут свободного потока; остальные отклоняются.
+    """
+
+    def __init__(self, max_workers: int = 10, max_queue: int = 100, retry_after: int = 1):
+        """
+        Args:
+            max_workers: Количество потоков (обычно = размер пула соединений)
+            max_queue: Максимум задач, ожидающих свободный поток
+            retry_after: Значение Retry-After (секунды) при переполнении
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be >= 1")
+
+        self.max_workers = max_workers
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self._pending = 0  # выполняются + ждут в очереди
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Выполнить блокирующую функцию в пуле потоков БД.
+
+        Функция выполняется в копии контекста (contextvars) вызывающего:
+        фазы, отмеченные в потоке, попадают в трассу запроса.
+
+        Raises:
+            ExecutorBusyError: Очередь ожидания переполнена
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorBusyError(
+                    f"Database executor is busy ({self._pending} queries pending)",
+                    retry_after=self.retry_after,
+                )
+            self._pending += 1
+
+        context = contextvars.copy_context()
+        call = functools.partial(self._call, time.perf_counter_ns(), func, *args, **kwargs)
+        try:
+            future = self._executor.submit(context.run, call)
+        except Exception:
+            self._done(None)
+            raise
+        # Слот освобождается когда задача реально завершилась (или отменена до
+        # старта), а не когда ожидающий ее запрос ушел
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _call(self, submitted: int, func: Callable[..., Any], *args, **kwargs) -> Any:
+        record("queue", submitted)
+        with self._lock:
+            self._active += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущее состояние executor'а"""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": max(0, self._pending - self._active),
+                "completed_total": self._completed,
+                "rejected_total": self._rejected,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Остановить пул потоков"""
+        self._executor.shutdown(wait=wait)
+
+
+# Глобальный экземпляр executor'а
+executor: Optional[DBExecutor] = None
+
+
+def initialize_executor(max_workers: int, max_queue: int, retry_after: int = 1) -> DBExecutor:
+    """
+    Инициализация глобального executor'а.
+
+    Returns:
+        DBExecutor: Инициализированный экземпляр
+    """
+    global executor
+
+    executor = DBExecutor(max_workers=max_workers, max_queue=max_queue, retry_after=retry_after)
+    logger.info(f"DB executor initialized: workers={max_workers}, queue={max_queue}")
+    return executor
+
+
+def get_executor() -> DBExecutor:
+    """
+    Dependency для FastAPI - получение executor'а БД.
+
+    Raises:
+        RuntimeError: Если executor не инициализирован
+    """
+    if executor is None:
+        raise RuntimeError(
+            "DB executor not initialized. " "Call initialize_executor() on application startup."
+        )
+    return executor
+
+
+def shutdown_executor() -> None:
+    """Остановить глобальный executor"""
+    global executor
+
+    if executor is not None:
+        executor.shutdown(wait=False)
+        executor = None
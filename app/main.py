@@ -11,8 +11,17 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.config import settings
-from app.database import initialize_database
-from app.routers import query, health, info
+from app.database import initialize_database, query_cache
+from app.executor import initialize_executor, shutdown_executor, ExecutorBusyError
+from app.metrics import MetricsMiddleware
+from app.ratelimit import (
+    MemoryRateLimitStore,
+    RateLimitExceeded,
+    RateLimitHeadersMiddleware,
+    rate_limiter,
+)
+from app.tracing import TracingMiddleware, span_exporter
+from app.routers import query, health, info, metrics
 
 # ==================== LOGGING ====================
 
@@ -39,14 +48,40 @@ async def lifespan(app: FastAPI):
     logger.info(f"Log level: {settings.log_level}")
     logger.info("=" * 60)
 
+    # Executor для блокирующих вызовов БД (по потоку на соединение пула)
+    initialize_executor(
+        max_workers=settings.db_max_connections,
+        max_queue=settings.db_executor_queue_size,
+        retry_after=settings.db_executor_retry_after,
+    )
+
+    # Фоновая очистка просроченных записей кеша
+    query_cache.start()
+
+    # Лимиты в памяти считаются в каждом worker-процессе отдельно
+    if isinstance(rate_limiter.store, MemoryRateLimitStore):
+        logger.warning(
+            "Rate limits are enforced per worker process (memory backend): "
+            "with N workers a token gets N times its limits, "
+            "set RATE_LIMIT_BACKEND=sqlite to share them"
+        )
+
+    # Запись трасс в TRACE_EXPORT_FILE
+    if span_exporter is not None:
+        span_exporter.start()
+        logger.info(f"Trace export: {span_exporter.path}")
+
     # Инициализация БД
+    db = None
     try:
         db = initialize_database()
         logger.info(f"Database: {settings.db_dsn}")
         logger.info(f"Cache TTL: {settings.cache_ttl}s")
 
-        # Тест подключения
-        if db.test_connection():
+        # Прогрев пула соединений и первая проверка БД (дальше - в фоне)
+        db.open()
+
+        if db.health.ready:
             logger.info("Database connection test: SUCCESS ✓")
         else:
             logger.warning("Database connection test: FAILED ✗")
@@ -63,6 +98,13 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("=" * 60)
     logger.info("Shutting down gracefully...")
+    shutdown_executor()
+    query_cache.stop()
+    rate_limiter.store.close()
+    if span_exporter is not None:
+        span_exporter.close()
+    if db is not None:
+        db.close()
     logger.info(f"{settings.app_name} stopped")
     logger.info("=" * 60)
 
@@ -132,6 +174,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Заголовки X-RateLimit-* в ответах
+app.add_middleware(RateLimitHeadersMiddleware)
+
+# Метрики HTTP запросов (внешний слой: время и статус всех ответов)
+app.add_middleware(MetricsMiddleware)
+
+# Трасса фаз запроса и заголовок Server-Timing
+app.add_middleware(TracingMiddleware, exporter=span_exporter)
+
 
 # Request logging middleware
 @app.middleware("http")
@@ -184,6 +235,9 @@ app.include_router(query.router)
 # Info endpoints (с rate limiting)
 app.include_router(info.router)
 
+# Метрики Prometheus (без rate limiting)
+app.include_router(metrics.router)
+
 # ==================== ERROR HANDLERS ====================
 
 
@@ -201,6 +255,35 @@ async def internal_error_handler(request: Request, exc: Exception):
     )
 
 
+@app.exception_handler(ExecutorBusyError)
+async def executor_busy_handler(request: Request, exc: ExecutorBusyError):
+    """Очередь запросов к БД переполнена - 503 с Retry-After"""
+    logger.warning(f"Service busy: {exc}")
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+        content={
+            "success": False,
+            "error": "Server is busy, retry later",
+            "timestamp": datetime.now().isoformat(),
+        },
+    )
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
+    """Токен исчерпал лимит - 429 с Retry-After и X-RateLimit-*"""
+    return JSONResponse(
+        status_code=429,
+        headers=exc.headers,
+        content={
+            "success": False,
+            "error": str(exc),
+            "timestamp": datetime.now().isoformat(),
+        },
+    )
+
+
 # ==================== MAIN ====================
 
 if __name__ == "__main__":
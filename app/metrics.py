@@ -0,0 +1,371 @@
+"""
+Метрики в формате Prometheus (text exposition format 0.0.4)
+
+Запись метрик не берет общих блокировок: у каждого потока свой набор
+значений (threading.local), а /metrics складывает наборы всех потоков.
+Запись - поиск в dict и сложение; блокировка берется только при первой
+записи нового потока и при первом появлении нового fingerprint запроса.
+
+Состояние пула соединений, кеша и executor'а на горячем пути не пишется
+вовсе: оно читается из их stats() в момент запроса /metrics.
+
+Example:
+    REQUESTS = registry.counter("requests_total", "Requests", ("endpoint",))
+    REQUESTS.inc(("/api/query",))
+    registry.render()
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Префикс имен всех метрик
+PREFIX = "fdbproxy_"
+
+# Границы корзин гистограмм времени, секунд
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# Значение метки fingerprint сверх лимита METRICS_MAX_FINGERPRINTS
+OVERFLOW_LABEL = "other"
+
+Labels = Tuple[str, ...]
+# Значение метрики: (суффикс имени, метки, значение)
+Sample = Tuple[str, Dict[str, str], float]
+# Семейство метрик для вывода: (имя, тип, описание, значения)
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def render_family(name: str, kind: str, help_text: str, samples: Iterable[Sample]) -> List[str]:
+    """Строки одного семейства метрик"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for suffix, labels, value in samples:
+        lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+
+class _ThreadValues:
+    """Значения метрики по потокам: каждый поток пишет только в свой dict"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: List[Dict[Labels, Any]] = []
+
+    def own(self) -> Dict[Labels, Any]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values: Dict[Labels, Any] = {}
+            with self._lock:
+                self._all.append(values)
+            self._local.values = values
+            return values
+
+    def snapshots(self) -> List[Dict[Labels, Any]]:
+        # dict.copy() выполняется целиком под GIL - пишущий поток не мешает
+        with self._lock:
+            return [values.copy() for values in self._all]
+
+    def clear(self) -> None:
+        with self._lock:
+            for values in self._all:
+                values.clear()
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    kind = "counter"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, labels=()):
+        self.registry = registry
+        self.name = PREFIX + name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = _ThreadValues()
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        if not self.registry.enabled:
+            return
+        values = self._values.own()
+        values[labels] = values.get(labels, 0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return sum(values.get(labels, 0) for values in self._values.snapshots())
+
+    def collect(self) -> List[str]:
+        totals: Dict[Labels, float] = {}
+        for values in self._values.snapshots():
+            for key, value in values.items():
+                totals[key] = totals.get(key, 0) + value
+        samples = [("", dict(zip(self.labels, key)), totals[key]) for key in sorted(totals)]
+        return render_family(self.name, self.kind, self.help, samples)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        help_text: str,
+        labels=(),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.registry = registry
+        self.name = PREFIX + name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = _ThreadValues()
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        if not self.registry.enabled:
+            return
+        values = self._values.own()
+        slots = values.get(labels)
+        if slots is None:
+            # Счетчики корзин (последняя - +Inf) и сумма наблюдений
+            slots = values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        slots[bisect_left(self.buckets, value)] += 1
+        slots[-1] += value
+
+    def count(self, labels: Labels = ()) -> int:
+        return sum(sum(v[labels][:-1]) for v in self._values.snapshots() if labels in v)
+
+    def collect(self) -> List[str]:
+        totals: Dict[Labels, List[float]] = {}
+        for values in self._values.snapshots():
+            for key, slots in values.items():
+                slots = list(slots)
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = slots
+                else:
+                    totals[key] = [a + b for a, b in zip(total, slots)]
+
+        samples = []
+        for key in sorted(totals):
+            slots = totals[key]
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (math.inf,), slots):
+                cumulative += hits
+                samples.append(
+                    ("_bucket", dict(labels, le=_format_value(float(bound))), cumulative)
+                )
+            samples.append(("_sum", labels, slots[-1]))
+            # _count равен +Inf корзине даже при чтении во время записи
+            samples.append(("_count", labels, cumulative))
+        return render_family(self.name, self.kind, self.help, samples)
+
+
+class BoundedLabel:
+    """
+    Ограничение числа значений метки: сверх max_values все новые значения
+    заменяются на "other", чтобы число временных рядов не росло без предела.
+    """
+
+    def __init__(self, max_values: int):
+        self.max_values = max_values
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, value: str) -> str:
+        if value in self._seen:
+            return value
+        with self._lock:
+            if value in self._seen or len(self._seen) < self.max_values:
+                self._seen.add(value)
+                return value
+        return OVERFLOW_LABEL
+
+    def clear(self) -> None:
+        with self._lock:
+            self._seen = set()
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(self, name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(self, name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, families: Iterable[Family] = ()) -> str:
+        """
+        Текст для Prometheus.
+
+        Args:
+            families: Метрики, снятые в момент запроса (состояние пула,
+                кеша, executor'а)
+        """
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for name, kind, help_text, samples in families:
+            lines.extend(render_family(PREFIX + name, kind, help_text, samples))
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        """Сбросить значения (для тестов)"""
+        for metric in self._metrics:
+            metric._values.clear()
+
+
+# Глобальный набор метрик процесса
+registry = MetricsRegistry(enabled=settings.metrics_enabled)
+fingerprints = BoundedLabel(settings.metrics_max_fingerprints)
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests by endpoint and status", ("method", "endpoint", "status")
+)
+HTTP_DURATION = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the last body byte",
+    ("method", "endpoint"),
+)
+HTTP_RESPONSE_BYTES = registry.counter(
+    "http_response_bytes_total", "Response body bytes sent", ("endpoint",)
+)
+QUERY_DURATION = registry.histogram(
+    "query_duration_seconds",
+    "Database execution time per query fingerprint (cache misses only)",
+    ("fingerprint",),
+)
+DB_EXECUTION_SECONDS = registry.counter(
+    "db_execution_seconds_total", "Time spent executing queries and fetching rows"
+)
+DB_ROWS_FETCHED = registry.counter("db_rows_fetched_total", "Rows fetched from the database")
+DB_ERRORS = registry.counter("db_errors_total", "Queries that failed in the database")
+VALIDATION_REJECTIONS = registry.counter(
+    "validation_rejections_total", "Queries rejected by SQL validation", ("endpoint",)
+)
+
+
+def observe_query(fingerprint: str, seconds: float, rows: int, failed: bool = False) -> None:
+    """Учесть выполнение запроса в БД (вызывается из потока executor'а)"""
+    if not registry.enabled:
+        return
+    QUERY_DURATION.observe(seconds, (fingerprints(fingerprint),))
+    DB_EXECUTION_SECONDS.inc(amount=seconds)
+    if rows:
+        DB_ROWS_FETCHED.inc(amount=rows)
+    if failed:
+        DB_ERRORS.inc()
+
+
+class MetricsMiddleware:
+    """
+    Время, статус и объем ответа каждого HTTP запроса.
+
+    Endpoint в метках - шаблон пути маршрута (/api/schema/{table_name}), а
+    не сам путь: число временных рядов не зависит от запросов клиентов.
+    Время потоковых ответов измеряется до отправки последней порции.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        sent = 0
+
+        async def send_counted(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_counted)
+        finally:
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_DURATION.observe(time.perf_counter() - started, (method, endpoint))
+            HTTP_REQUESTS.inc((method, endpoint, str(status)))
+            if sent:
+                HTTP_RESPONSE_BYTES.inc((endpoint,), sent)
+
+
+def family(
+    name: str, kind: str, help_text: str, values: Dict[Optional[Labels], Optional[float]]
+) -> Family:
+    """
+    Семейство для render() из значений stats().
+
+    Args:
+        kind: gauge или counter
+        values: {метки в виде ((имя, значение), ...) или None: значение};
+            None вместо значения - неизвестно, не выводится
+    """
+    samples = [("", dict(labels or ()), value) for labels, value in values.items()]
+    return name, kind, help_text, [sample for sample in samples if sample[2] is not None]
@@ -2,7 +2,7 @@
 Pydantic модели для API requests и responses
 """
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Optional, Union
 from datetime import datetime
 from pydantic import BaseModel, Field, validator
 
@@ -17,6 +17,41 @@ class QueryRequest(BaseModel):
         ..., description="SQL запрос (только SELECT или WITH)", min_length=1, max_length=10000
     )
     params: Optional[List[Any]] = Field(default=None, description="Параметры запроса (позиционные)")
+    stream: bool = Field(
+        default=False,
+        description="Потоковая выдача результата в формате NDJSON (application/x-ndjson)",
+    )
+    format: Literal["objects", "columnar"] = Field(
+        default="objects",
+        description=(
+            "Форма результата: objects - массив объектов, "
+            "columnar - описание колонок один раз + массивы значений"
+        ),
+    )
+    layout: Literal["rows", "columns"] = Field(
+        default="rows",
+        description="Для format=columnar: data как массив строк (rows) или массив колонок (columns)",
+    )
+    page_size: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description=(
+            "Постраничная выдача: строк на странице; следующая страница - по next_token из ответа"
+        ),
+    )
+    next_token: Optional[str] = Field(
+        default=None,
+        max_length=200,
+        description="Токен следующей страницы из предыдущего ответа (вместе с тем же query/params)",
+    )
+    timeout: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description=(
+            "Таймаут запроса в секундах; больше DB_QUERY_TIMEOUT не бывает. "
+            "По истечении запрос прерывается на сервере"
+        ),
+    )
 
     @validator("query")
     def query_not_empty(cls, v):
@@ -30,6 +65,40 @@ class QueryRequest(BaseModel):
         }
 
 
+class BatchQueryRequest(BaseModel):
+    """Пакет SQL запросов, выполняемых за один HTTP запрос"""
+
+    queries: List[QueryRequest] = Field(
+        ..., min_length=1, description="Запросы пакета (stream не поддерживается)"
+    )
+    consistent: bool = Field(
+        default=False,
+        description=(
+            "Выполнить запросы последовательно в одной read-only транзакции "
+            "(общий snapshot, без чтения кеша); по умолчанию - параллельно"
+        ),
+    )
+    timeout: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description=(
+            "Таймаут в секундах: всего пакета (consistent) или каждого запроса без своего "
+            "timeout; больше DB_QUERY_TIMEOUT не бывает"
+        ),
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "queries": [
+                    {"query": "SELECT COUNT(*) FROM STORGRP"},
+                    {"query": "SELECT ID, NAME FROM STORGRP WHERE ID = ?", "params": [1]},
+                ],
+                "consistent": False,
+            }
+        }
+
+
 # ==================== RESPONSE MODELS ====================
 
 
@@ -45,6 +114,17 @@ class QueryResponse(BaseModel):
         default=None, description="Время выполнения запроса в секундах"
     )
     error: Optional[str] = Field(default=None, description="Сообщение об ошибке")
+    stale: bool = Field(
+        default=False,
+        description="Результат взят из кеша после истечения TTL и обновляется в фоне",
+    )
+    truncated: bool = Field(
+        default=False,
+        description="Результат обрезан по лимиту строк/объема (QUERY_MAX_ROWS, QUERY_MAX_BYTES)",
+    )
+    next_token: Optional[str] = Field(
+        default=None, description="Токен следующей страницы (page_size); null - страница последняя"
+    )
     timestamp: datetime = Field(default_factory=datetime.now, description="Время ответа")
 
     class Config:
@@ -59,6 +139,86 @@ class QueryResponse(BaseModel):
         }
 
 
+class ResultColumnInfo(BaseModel):
+    """Описание колонки результата запроса (format=columnar)"""
+
+    name: str = Field(..., description="Имя колонки")
+    type: str = Field(..., description="Тип Firebird (по cursor.description)")
+    length: Optional[int] = Field(default=None, description="Длина строкового типа")
+    precision: Optional[int] = Field(default=None, description="Точность DECIMAL/NUMERIC")
+    scale: Optional[int] = Field(default=None, description="Масштаб DECIMAL/NUMERIC")
+    nullable: bool = Field(..., description="Допускает NULL")
+    dictionary: Optional[List[Any]] = Field(
+        default=None,
+        description="Словарь значений; если задан, в data вместо значений их индексы",
+    )
+
+
+class ColumnarQueryResponse(BaseModel):
+    """Ответ на выполнение SQL запроса в колоночном формате (format=columnar)"""
+
+    success: bool = Field(..., description="Успешность выполнения")
+    columns: List[ResultColumnInfo] = Field(..., description="Описание колонок")
+    layout: Literal["rows", "columns"] = Field(..., description="Расположение данных в data")
+    data: List[List[Any]] = Field(
+        ..., description="Массив строк (layout=rows) или массив колонок (layout=columns)"
+    )
+    rows_count: int = Field(..., description="Количество возвращенных строк")
+    execution_time: Optional[float] = Field(
+        default=None, description="Время выполнения запроса в секундах"
+    )
+    error: Optional[str] = Field(default=None, description="Сообщение об ошибке")
+    stale: bool = Field(
+        default=False,
+        description="Результат взят из кеша после истечения TTL и обновляется в фоне",
+    )
+    truncated: bool = Field(
+        default=False,
+        description="Результат обрезан по лимиту строк/объема (QUERY_MAX_ROWS, QUERY_MAX_BYTES)",
+    )
+    next_token: Optional[str] = Field(
+        default=None, description="Токен следующей страницы (page_size); null - страница последняя"
+    )
+    timestamp: datetime = Field(default_factory=datetime.now, description="Время ответа")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "success": True,
+                "columns": [
+                    {"name": "ID", "type": "INTEGER", "nullable": False, "dictionary": None},
+                    {
+                        "name": "CITY",
+                        "type": "VARCHAR",
+                        "length": 50,
+                        "nullable": True,
+                        "dictionary": ["Тбилиси", "Батуми"],
+                    },
+                ],
+                "layout": "rows",
+                "data": [[1, 0], [2, 1], [3, 0]],
+                "rows_count": 3,
+                "execution_time": 0.234,
+                "timestamp": "2025-10-21T12:34:56.789Z",
+            }
+        }
+
+
+class BatchQueryResponse(BaseModel):
+    """Ответ на пакет SQL запросов"""
+
+    success: bool = Field(..., description="Все запросы пакета выполнены успешно")
+    results: List[Union[QueryResponse, ColumnarQueryResponse]] = Field(
+        default_factory=list, description="Ответы на запросы в исходном порядке"
+    )
+    failed: int = Field(default=0, description="Количество запросов с ошибкой")
+    execution_time: Optional[float] = Field(
+        default=None, description="Время выполнения пакета в секундах"
+    )
+    error: Optional[str] = Field(default=None, description="Ошибка пакета целиком")
+    timestamp: datetime = Field(default_factory=datetime.now, description="Время ответа")
+
+
 class ErrorResponse(BaseModel):
     """Ответ с ошибкой"""
 
@@ -81,6 +241,13 @@ class HealthResponse(BaseModel):
 
     status: str = Field(..., description="Статус: healthy или unhealthy")
     database_connected: bool = Field(..., description="Подключение к БД работает")
+    database_latency_ms: Optional[float] = Field(
+        default=None, description="Время последней проверки БД в миллисекундах"
+    )
+    consecutive_failures: int = Field(default=0, description="Неудачных проверок БД подряд")
+    last_check: Optional[datetime] = Field(
+        default=None, description="Время последней фоновой проверки БД"
+    )
     uptime_seconds: Optional[float] = Field(
         default=None, description="Время работы сервера в секундах"
     )
@@ -92,6 +259,9 @@ class HealthResponse(BaseModel):
             "example": {
                 "status": "healthy",
                 "database_connected": True,
+                "database_latency_ms": 1.8,
+                "consecutive_failures": 0,
+                "last_check": "2025-10-21T12:34:54.120Z",
                 "uptime_seconds": 3600,
                 "version": "1.0.0",
                 "timestamp": "2025-10-21T12:34:56.789Z",
@@ -124,9 +294,17 @@ class ColumnInfo(BaseModel):
     name: str = Field(..., description="Имя колонки")
     type: str = Field(..., description="Тип данных")
     nullable: bool = Field(..., description="Допускает NULL")
+    sql_type: Optional[str] = Field(
+        default=None, description="Объявление типа, например VARCHAR(50) или NUMERIC(18,2)"
+    )
+    length: Optional[int] = Field(default=None, description="Длина строки в символах")
+    precision: Optional[int] = Field(default=None, description="Точность NUMERIC/DECIMAL")
+    scale: Optional[int] = Field(default=None, description="Знаков после запятой NUMERIC/DECIMAL")
 
     class Config:
-        json_schema_extra = {"example": {"name": "ID", "type": "INTEGER", "nullable": False}}
+        json_schema_extra = {
+            "example": {"name": "ID", "type": "INTEGER", "nullable": False, "sql_type": "INTEGER"}
+        }
 
 
 class SchemaResponse(BaseModel):
@@ -135,6 +313,10 @@ class SchemaResponse(BaseModel):
     success: bool = Field(default=True, description="Успешность выполнения")
     table: str = Field(..., description="Имя таблицы")
     columns: List[ColumnInfo] = Field(..., description="Список колонок")
+    primary_key: Optional[List[str]] = Field(default=None, description="Колонки первичного ключа")
+    unique_keys: List[List[str]] = Field(
+        default_factory=list, description="Колонки уникальных ключей и индексов"
+    )
     timestamp: datetime = Field(default_factory=datetime.now, description="Время ответа")
 
     class Config:
@@ -146,6 +328,60 @@ class SchemaResponse(BaseModel):
                     {"name": "ID", "type": "INTEGER", "nullable": False},
                     {"name": "NAME", "type": "VARCHAR", "nullable": True},
                 ],
+                "primary_key": ["ID"],
+                "unique_keys": [],
                 "timestamp": "2025-10-21T12:34:56.789Z",
             }
         }
+
+
+class TableSchema(BaseModel):
+    """Схема таблицы в каталоге"""
+
+    table: str = Field(..., description="Имя таблицы")
+    columns: List[ColumnInfo] = Field(..., description="Список колонок")
+    primary_key: Optional[List[str]] = Field(default=None, description="Колонки первичного ключа")
+    unique_keys: List[List[str]] = Field(
+        default_factory=list, description="Колонки уникальных ключей и индексов"
+    )
+
+
+class CatalogResponse(BaseModel):
+    """Ответ со схемой всех таблиц"""
+
+    success: bool = Field(default=True, description="Успешность выполнения")
+    version: str = Field(..., description="Версия каталога (совпадает с ETag)")
+    count: int = Field(..., description="Количество таблиц")
+    tables: List[TableSchema] = Field(..., description="Схемы таблиц в порядке имен")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "success": True,
+                "version": "5c1f0e9a7b3d42e8a1c6f0d2b4e8a9c3",
+                "count": 1,
+                "tables": [
+                    {
+                        "table": "GOODS",
+                        "columns": [
+                            {
+                                "name": "ID",
+                                "type": "INTEGER",
+                                "nullable": False,
+                                "sql_type": "INTEGER",
+                            },
+                            {
+                                "name": "PRICE",
+                                "type": "NUMERIC",
+                                "nullable": True,
+                                "sql_type": "NUMERIC(18,2)",
+                                "precision": 18,
+                                "scale": 2,
+                            },
+                        ],
+                        "primary_key": ["ID"],
+                        "unique_keys": [],
+                    }
+                ],
+            }
+        }
@@ -0,0 +1,200 @@
+"""
+Постраничная выдача результатов запроса (page_size / next_token)
+
+Первый запрос с page_size выполняется один раз, результат режется на
+страницы и сохраняется в кеш запросов как сессия с ограниченным временем
+жизни. next_token - непрозрачная ссылка на сессию и номер следующей
+страницы: чтение страницы - одно обращение к кешу за page_size строк, без
+повторного выполнения запроса и без FIRST/SKIP на сервере.
+
+Каждая страница - отдельная запись кеша, поэтому с общими бэкендами
+(SQLite, Redis) токен, выданный одним процессом, читается любым другим и
+десериализуется только сама страница.
+"""
+
+import base64
+import binascii
+import logging
+import secrets
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.cache import CacheBackend
+from app.results import QueryResult
+
+logger = logging.getLogger(__name__)
+
+# Префикс ключей сессий в кеше запросов
+PAGE_KEY_PREFIX = "page:"
+
+
+class PageTokenError(ValueError):
+    """next_token неверен, сессия истекла или токен выдан для другого запроса"""
+
+
+class PageSessionError(Exception):
+    """Сессию страниц не удалось сохранить в кеш (например, результат слишком велик)"""
+
+
+def encode_token(session_id: str, page: int) -> str:
+    """Непрозрачный токен следующей страницы"""
+    raw = f"{session_id}:{page}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_token(token: str) -> Tuple[str, int]:
+    """
+    Разобрать токен страницы.
+
+    Raises:
+        PageTokenError: Токен поврежден
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        session_id, page = base64.urlsafe_b64decode(padded).decode("ascii").split(":")
+        page_no = int(page)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise PageTokenError("Malformed next_token")
+    if not session_id or page_no < 1:
+        raise PageTokenError("Malformed next_token")
+    return session_id, page_no
+
+
+class PageSessions:
+    """
+    Сессии постраничной выдачи поверх кеша запросов.
+
+    В кеше хранятся заголовок сессии (ключ запроса, размер страницы, колонки,
+    число строк) и каждая страница, кроме первой, отдельной записью.
+    """
+
+    def __init__(self, cache: CacheBackend, ttl: float = 600.0):
+        """
+        Args:
+            cache: Кеш, в котором живут сессии
+            ttl: Время жизни сессии в секундах с момента первого запроса
+        """
+        self.cache = cache
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._pages_served = 0
+        self._expired = 0
+        self._rejected = 0
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, f"_{name}", getattr(self, f"_{name}") + delta)
+
+    def open(
+        self, cache_key: str, result: QueryResult, page_size: int
+    ) -> Tuple[QueryResult, Optional[str]]:
+        """
+        Отдать первую страницу результата и, если страниц больше одной,
+        сохранить остальные в сессию.
+
+        Args:
+            cache_key: Ключ кеша запроса (запрос + параметры)
+            result: Полный результат запроса
+            page_size: Строк на странице
+
+        Returns:
+            Tuple[QueryResult, Optional[str]]: Первая страница и next_token
+                (None, если страница единственная)
+
+        Raises:
+            PageSessionError: Страницы не удалось сохранить в кеш
+        """
+        rows = result.rows
+        first = QueryResult(result.columns, rows[:page_size], result.fetched_at, result.truncated)
+        if len(rows) <= page_size:
+            self._count(pages_served=1)
+            return first, None
+
+        session_id = secrets.token_urlsafe(16)
+        prefix = f"{PAGE_KEY_PREFIX}{session_id}"
+        pages = (len(rows) + page_size - 1) // page_size
+        header: Dict[str, Any] = {
+            "cache_key": cache_key,
+            "page_size": page_size,
+            "pages": pages,
+            "rows": len(rows),
+            "columns": result.columns,
+            "fetched_at": result.fetched_at,
+            "truncated": result.truncated,
+        }
+
+        # Токен выдается, только если сохранены все страницы и заголовок:
+        # иначе клиент получил бы next_token, который нельзя прочитать
+        stored: Optional[List[str]] = []
+        for page in range(1, pages):
+            start = page * page_size
+            key = f"{prefix}:{page}"
+            if not self.cache.set(key, rows[start : start + page_size], self.ttl):
+                break
+            stored.append(key)
+        else:
+            if self.cache.set(prefix, header, self.ttl):
+                stored = None
+        if stored is not None:
+            for key in stored:
+                self.cache.delete(key)
+            self._count(rejected=1)
+            logger.warning(f"Page session {session_id}: {len(rows)} rows could not be cached")
+            raise PageSessionError(
+                f"Result too large to paginate ({len(rows)} rows), "
+                "narrow the query or use a smaller page_size"
+            )
+        self._count(opened=1, pages_served=1)
+
+        logger.debug(f"Page session {session_id}: {len(rows)} rows, {pages} pages")
+        return first, encode_token(session_id, 1)
+
+    def read(self, token: str, cache_key: str) -> Tuple[QueryResult, Optional[str]]:
+        """
+        Прочитать страницу по next_token.
+
+        Args:
+            token: next_token из предыдущего ответа
+            cache_key: Ключ кеша текущего запроса (должен совпасть с сессией)
+
+        Returns:
+            Tuple[QueryResult, Optional[str]]: Страница и токен следующей
+
+        Raises:
+            PageTokenError: Токен поврежден, сессия истекла или принадлежит
+                другому запросу
+        """
+        session_id, page = decode_token(token)
+        prefix = f"{PAGE_KEY_PREFIX}{session_id}"
+
+        header = self.cache.get(prefix)
+        if header is not None and header["cache_key"] != cache_key:
+            raise PageTokenError("next_token was issued for a different query or params")
+        if header is not None and page >= header["pages"]:
+            raise PageTokenError("Malformed next_token")
+
+        rows: Optional[List[Tuple]] = None
+        if header is not None:
+            rows = self.cache.get(f"{prefix}:{page}")
+        if rows is None:
+            self._count(expired=1)
+            raise PageTokenError("Pagination session expired, request the first page again")
+
+        self._count(pages_served=1)
+        next_token = encode_token(session_id, page + 1) if page + 1 < header["pages"] else None
+        page_result = QueryResult(
+            header["columns"], rows, header["fetched_at"], header["truncated"]
+        )
+        return page_result, next_token
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ttl": self.ttl,
+                "opened": self._opened,
+                "pages_served": self._pages_served,
+                "expired": self._expired,
+                "rejected": self._rejected,
+            }
@@ -0,0 +1,467 @@
+"""
+Пул соединений с Firebird БД
+
+Ограниченный пул (min/max), прогрев при старте, таймаут ожидания свободного
+соединения, keep-alive пинги простаивающих соединений, пересоздание по
+max lifetime и вытеснение сломанных соединений.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PING_QUERY = "SELECT 1 FROM RDB$DATABASE"
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class PoolClosedError(Exception):
+    """Пул закрыт, новые соединения не выдаются"""
+
+
+class PooledConnection:
+    """
+    Соединение, принадлежащее пулу.
+
+    Хранит метаданные, необходимые для keep-alive и max lifetime.
+    """
+
+    __slots__ = (
+        "conn",
+        "created_at",
+        "last_used_at",
+        "needs_check",
+        "statements",
+        "statement_timeout",
+    )
+
+    def __init__(self, conn: Any):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used_at = now
+        # Выставляется если во время использования была ошибка БД:
+        # перед возвратом в пул соединение нужно проверить пингом
+        self.needs_check = False
+        # Кеш подготовленных запросов соединения (заполняет владелец пула);
+        # живет и закрывается вместе с соединением
+        self.statements: Any = None
+        # Таймаут запросов, выставленный на сессии соединения (Firebird 4+)
+        self.statement_timeout: Any = None
+
+    def age(self, now: Optional[float] = None) -> float:
+        """Возраст соединения в секундах"""
+        return (now if now is not None else time.monotonic()) - self.created_at
+
+    def idle_for(self, now: Optional[float] = None) -> float:
+        """Сколько секунд соединение простаивает"""
+        return (now if now is not None else time.monotonic()) - self.last_used_at
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный ограниченный пул соединений.
+
+    Пул не зависит от fdb напрямую: соединения создаются функцией ``connect``,
+    а от объекта соединения требуются только ``cursor()``, ``rollback()`` и
+    ``close()``.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        acquire_timeout: float = 10.0,
+        max_lifetime: float = 1800.0,
+        ping_interval: float = 60.0,
+        name: str = "firebird",
+    ):
+        """
+        Args:
+            connect: Функция, открывающая новое соединение с БД
+            min_size: Сколько соединений держать открытыми постоянно
+            max_size: Максимум одновременно открытых соединений
+            acquire_timeout: Сколько секунд ждать свободное соединение
+            max_lifetime: Через сколько секунд соединение пересоздается (0 - никогда)
+            ping_interval: Простаивающие дольше этого соединения пингуются (0 - выкл.)
+            name: Имя пула для логов
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        # LIFO: последним возвращенное соединение выдается первым (оно "теплее")
+        self._idle: Deque[PooledConnection] = deque()
+        self._size = 0  # открытые + открываемые прямо сейчас
+        self._in_use = 0
+        self._waiters = 0
+        self._closed = False
+
+        self._stop_event = threading.Event()
+        self._maintenance_thread: Optional[threading.Thread] = None
+
+        # Статистика
+        self._acquire_count = 0
+        self._acquire_wait_total = 0.0
+        self._acquire_wait_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._closed_count = 0
+        self._evicted = 0
+
+    # ==================== LIFECYCLE ====================
+
+    def start(self) -> None:
+        """Прогреть min_size соединений и запустить фоновое обслуживание"""
+        self._fill_to_min()
+
+        if self.ping_interval > 0 or self.max_lifetime > 0:
+            self._maintenance_thread = threading.Thread(
+                target=self._maintenance_loop, name=f"{self.name}-pool-maintenance", daemon=True
+            )
+            self._maintenance_thread.start()
+
+        logger.info(
+            f"Connection pool '{self.name}' started: "
+            f"min={self.min_size}, max={self.max_size}, idle={len(self._idle)}"
+        )
+
+    def close(self) -> None:
+        """Закрыть все простаивающие соединения; занятые закроются при возврате"""
+        self._stop_event.set()
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._available.notify_all()
+
+        for pooled in idle:
+            self._close_connection(pooled)
+
+        if self._maintenance_thread is not None:
+            self._maintenance_thread.join(timeout=5)
+            self._maintenance_thread = None
+
+        logger.info(f"Connection pool '{self.name}' closed")
+
+    # ==================== ACQUIRE / RELEASE ====================
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """
+        Получить соединение из пула.
+
+        Args:
+            timeout: Таймаут ожидания (по умолчанию acquire_timeout)
+
+        Returns:
+            PooledConnection: Соединение; обязательно вернуть через release()
+
+        Raises:
+            PoolTimeoutError: Свободное соединение не появилось за timeout
+            PoolClosedError: Пул закрыт
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            create = False
+            pooled = None
+
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise PoolClosedError(f"Connection pool '{self.name}' is closed")
+                    if self._idle:
+                        pooled = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self._size < self.max_size:
+                        # Резервируем слот, само соединение открываем вне lock
+                        self._size += 1
+                        self._in_use += 1
+                        create = True
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {timeout:.1f}s waiting for a database connection "
+                            f"(pool '{self.name}': {self._in_use}/{self.max_size} in use)"
+                        )
+                    self._waiters += 1
+                    try:
+                        self._available.wait(remaining)
+                    finally:
+                        self._waiters -= 1
+
+            if create:
+                try:
+                    pooled = self._open_connection()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._available.notify()
+                    raise
+            elif self.max_lifetime > 0 and pooled.age() >= self.max_lifetime:
+                # Соединение отслужило свое - заменить и попробовать снова
+                with self._lock:
+                    self._in_use -= 1
+                self._discard(pooled, reason="max lifetime reached")
+                continue
+
+            waited = time.monotonic() - start
+            with self._lock:
+                self._acquire_count += 1
+                self._acquire_wait_total += waited
+                if waited > self._acquire_wait_max:
+                    self._acquire_wait_max = waited
+
+            pooled.last_used_at = time.monotonic()
+            return pooled
+
+    def release(self, pooled: PooledConnection, broken: bool = False) -> None:
+        """
+        Вернуть соединение в пул.
+
+        Перед возвратом активная транзакция откатывается, чтобы следующий
+        пользователь получил чистое соединение и не держал старый snapshot.
+
+        Args:
+            pooled: Соединение, полученное через acquire()
+            broken: Соединение заведомо неисправно - закрыть его
+        """
+        reason = "marked broken" if broken else None
+
+        if reason is None:
+            try:
+                pooled.conn.rollback()
+            except Exception as e:
+                reason = f"rollback failed: {e}"
+
+        if reason is None and pooled.needs_check and not self._ping(pooled):
+            reason = "ping failed after error"
+
+        if reason is None and self.max_lifetime > 0 and pooled.age() >= self.max_lifetime:
+            reason = "max lifetime reached"
+
+        if reason is not None:
+            with self._lock:
+                self._in_use -= 1
+            self._discard(pooled, reason=reason)
+            return
+
+        pooled.needs_check = False
+        pooled.last_used_at = time.monotonic()
+        close_it = False
+        with self._lock:
+            self._in_use -= 1
+            if self._closed:
+                self._size -= 1
+                close_it = True
+            else:
+                self._idle.append(pooled)
+            self._available.notify()
+
+        if close_it:
+            self._close_connection(pooled)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None):
+        """
+        Context manager: взять PooledConnection и гарантированно вернуть его.
+
+        В отличие от connection() отдает обертку пула, а не само соединение -
+        для состояния, привязанного к соединению (подготовленные запросы).
+        """
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled
+        except Exception:
+            pooled.needs_check = True
+            raise
+        finally:
+            self.release(pooled)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        Context manager: взять соединение и гарантированно вернуть его.
+
+        Example:
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+        """
+        with self.lease(timeout) as pooled:
+            yield pooled.conn
+
+    # ==================== STATS ====================
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущее состояние пула"""
+        with self._lock:
+            avg_wait = (
+                self._acquire_wait_total / self._acquire_count if self._acquire_count else 0.0
+            )
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiters": self._waiters,
+                "acquired_total": self._acquire_count,
+                "acquire_timeouts": self._timeouts,
+                "acquire_wait_avg_ms": round(avg_wait * 1000, 3),
+                "acquire_wait_max_ms": round(self._acquire_wait_max * 1000, 3),
+                "acquire_wait_total_ms": round(self._acquire_wait_total * 1000, 3),
+                "created_total": self._created,
+                "closed_total": self._closed_count,
+                "evicted_total": self._evicted,
+            }
+
+    # ==================== INTERNALS ====================
+
+    def _open_connection(self) -> PooledConnection:
+        start = time.monotonic()
+        conn = self._connect()
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self._created += 1
+        logger.debug(f"Pool '{self.name}': connection opened in {elapsed:.3f}s")
+        return PooledConnection(conn)
+
+    def _close_connection(self, pooled: PooledConnection) -> None:
+        try:
+            pooled.conn.close()
+        except Exception as e:
+            logger.warning(f"Pool '{self.name}': error closing connection: {e}")
+        with self._lock:
+            self._closed_count += 1
+
+    def _discard(self, pooled: PooledConnection, reason: str) -> None:
+        """Закрыть соединение и освободить его слот в пуле"""
+        logger.info(f"Pool '{self.name}': evicting connection ({reason})")
+        with self._lock:
+            self._size -= 1
+            self._evicted += 1
+            self._available.notify()
+        self._close_connection(pooled)
+
+    def _ping(self, pooled: PooledConnection) -> bool:
+        try:
+            cursor = pooled.conn.cursor()
+            try:
+                cursor.execute(PING_QUERY)
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            pooled.conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Pool '{self.name}': ping failed: {e}")
+            return False
+
+    def _fill_to_min(self) -> None:
+        """Открыть соединения, пока в пуле меньше min_size"""
+        while True:
+            with self._lock:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+
+            try:
+                pooled = self._open_connection()
+            except Exception as e:
+                with self._lock:
+                    self._size -= 1
+                    self._available.notify()
+                logger.warning(f"Pool '{self.name}': failed to open warm connection: {e}")
+                return
+
+            with self._lock:
+                if self._closed:
+                    self._size -= 1
+                else:
+                    self._idle.appendleft(pooled)
+                    self._available.notify()
+                    continue
+            self._close_connection(pooled)
+            return
+
+    def _maintenance_loop(self) -> None:
+        intervals = [i for i in (self.ping_interval, self.max_lifetime) if i > 0]
+        period = max(1.0, min(intervals) / 2)
+
+        while not self._stop_event.wait(period):
+            try:
+                self.maintain()
+            except Exception as e:
+                logger.error(f"Pool '{self.name}': maintenance error: {e}")
+
+    def maintain(self) -> None:
+        """
+        Один проход обслуживания: пинг давно простаивающих соединений,
+        вытеснение сломанных и устаревших, добор до min_size.
+        """
+        now = time.monotonic()
+        to_check = []
+
+        with self._lock:
+            if self._closed:
+                return
+            keep: Deque[PooledConnection] = deque()
+            for pooled in self._idle:
+                expired = self.max_lifetime > 0 and pooled.age(now) >= self.max_lifetime
+                stale = self.ping_interval > 0 and pooled.idle_for(now) >= self.ping_interval
+                if expired or stale:
+                    to_check.append((pooled, expired))
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+            # Проверяемые соединения временно считаются занятыми
+            self._in_use += len(to_check)
+
+        for pooled, expired in to_check:
+            if expired:
+                with self._lock:
+                    self._in_use -= 1
+                self._discard(pooled, reason="max lifetime reached")
+            elif self._ping(pooled):
+                pooled.last_used_at = time.monotonic()
+                with self._lock:
+                    self._in_use -= 1
+                    closed = self._closed
+                    if closed:
+                        self._size -= 1
+                    else:
+                        self._idle.appendleft(pooled)
+                        self._available.notify()
+                if closed:
+                    self._close_connection(pooled)
+            else:
+                with self._lock:
+                    self._in_use -= 1
+                self._discard(pooled, reason="keep-alive ping failed")
+
+        self._fill_to_min()
@@ -0,0 +1,166 @@
+"""
+Фоновая проверка доступности БД для health check
+
+Проверка выполняется в отдельном потоке раз в interval секунд на соединении
+пула; /api/health, /api/health/ready и /api/stats только читают последнее
+состояние и не обращаются к БД на пути запроса - сколько бы мониторов и
+балансировщиков их ни опрашивали.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class HealthProber:
+    """
+    Периодическая проверка БД с хранением последнего результата.
+
+    БД считается готовой (ready), пока подряд идущих неудачных проверок
+    меньше failure_threshold и последняя проверка не старше stale_after
+    (поток проверок мог зависнуть или остановиться).
+
+    Example:
+        prober = HealthProber(lambda: db.ping(timeout=3), interval=5)
+        prober.start()
+        prober.state()["ready"]
+    """
+
+    def __init__(
+        self,
+        probe: Callable[[], None],
+        interval: float = 5.0,
+        failure_threshold: int = 2,
+        stale_after: Optional[float] = None,
+        name: str = "database",
+    ):
+        """
+        Args:
+            probe: Проверка; успешна, если не выбросила исключение
+            interval: Период проверок в секундах
+            failure_threshold: Сколько неудач подряд делают БД неготовой
+            stale_after: Через сколько секунд без проверок состояние
+                считается устаревшим (по умолчанию 3 x interval)
+            name: Имя для логов и потока
+        """
+        self.probe = probe
+        self.interval = max(0.1, interval)
+        self.failure_threshold = max(1, failure_threshold)
+        self.stale_after = stale_after if stale_after is not None else 3 * self.interval
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._ok: Optional[bool] = None
+        self._checked_at: Optional[float] = None
+        self._checked_wall: Optional[datetime] = None
+        self._last_success: Optional[datetime] = None
+        self._latency_ms: Optional[float] = None
+        self._error: Optional[str] = None
+        self._consecutive_failures = 0
+        self._consecutive_successes = 0
+        self._checks = 0
+        self._failures = 0
+
+    def start(self) -> bool:
+        """
+        Выполнить первую проверку сразу и запустить фоновые.
+
+        Returns:
+            bool: Результат первой проверки
+        """
+        ok = self.check()
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name=f"{self.name}-health", daemon=True
+            )
+            self._thread.start()
+        return ok
+
+    def _loop(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def close(self) -> None:
+        """Остановить фоновые проверки"""
+        self._stop_event.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def check(self) -> bool:
+        """
+        Выполнить проверку и запомнить результат.
+
+        Returns:
+            bool: Проверка успешна
+        """
+        started = time.perf_counter()
+        error = None
+        try:
+            self.probe()
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            was_ok = self._ok
+            self._ok = error is None
+            self._checked_at = time.monotonic()
+            self._checked_wall = datetime.now()
+            self._latency_ms = latency_ms
+            self._error = error
+            self._checks += 1
+            if error is None:
+                self._last_success = self._checked_wall
+                self._consecutive_successes += 1
+                self._consecutive_failures = 0
+            else:
+                self._failures += 1
+                self._consecutive_failures += 1
+                self._consecutive_successes = 0
+            failures = self._consecutive_failures
+
+        # В лог - только смена состояния, а не каждая проверка
+        if error is not None and (was_ok is not False or failures == self.failure_threshold):
+            logger.warning(f"Health check: {self.name} probe failed ({failures} in a row): {error}")
+        elif error is None and was_ok is not True:
+            logger.info(f"Health check: {self.name} is reachable ({latency_ms:.1f} ms)")
+        return error is None
+
+    def _ready(self) -> bool:
+        return (
+            self._last_success is not None
+            and self._consecutive_failures < self.failure_threshold
+            and time.monotonic() - self._checked_at <= self.stale_after
+        )
+
+    @property
+    def ready(self) -> bool:
+        """БД доступна по последним проверкам"""
+        with self._lock:
+            return self._ready()
+
+    def state(self) -> Dict[str, Any]:
+        """Последнее состояние проверок"""
+        with self._lock:
+            return {
+                "ready": self._ready(),
+                "connected": bool(self._ok),
+                "latency_ms": round(self._latency_ms, 3) if self._latency_ms is not None else None,
+                "last_check": self._checked_wall,
+                "last_success": self._last_success,
+                "last_error": self._error,
+                "consecutive_failures": self._consecutive_failures,
+                "consecutive_successes": self._consecutive_successes,
+                "checks_total": self._checks,
+                "failures_total": self._failures,
+                "interval": self.interval,
+            }
@@ -0,0 +1,645 @@
+"""
+Лимиты запросов на токен: частота, одновременные запросы и стоимость
+
+- Частота (в минуту и в час) считается GCRA: на токен хранится одно число -
+  теоретическое время прихода следующего запроса (TAT). Оба окна проверяются
+  и сдвигаются вместе, отклоненный запрос лимит не расходует.
+- Одновременные запросы - аренды с временем истечения: аренда, не
+  возвращенная упавшим процессом, освобождается сама через LEASE_TTL.
+- Стоимость - строки, отданные клиенту, и время выполнения запросов за окно
+  rate_limit_cost_window. Учитывается тем же GCRA после выполнения запроса
+  (стоимость заранее неизвестна): токен, исчерпавший бюджет, получает 429,
+  пока долг не погасится.
+
+Лимиты по умолчанию задаются настройками RATE_LIMIT_*, политика токена
+(TokenPolicy) может переопределить любой из них.
+
+Состояние хранится в памяти процесса (memory) или в файле SQLite (sqlite),
+общем для всех worker-процессов на хосте: каждая проверка - одна транзакция
+BEGIN IMMEDIATE, поэтому лимит один на все процессы. Сами токены в хранилище
+не попадают - ключом служит их SHA-256 из реестра токенов.
+"""
+
+import json
+import logging
+import math
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import anyio
+from fastapi import Depends, Request
+from starlette.datastructures import MutableHeaders
+
+from app.auth import authenticate
+from app.config import settings
+from app.storage import open_private_file, state_path
+from app.tokens import AuthenticatedToken, TokenPolicy
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKENDS = ("auto", "memory", "sqlite")
+
+# Имя файла SQLite состояния лимитов по умолчанию (в директории из storage.state_path)
+DEFAULT_SQLITE_FILE = "ratelimit.sqlite3"
+
+# Через сколько секунд аренда одновременного запроса истекает сама
+# (процесс, взявший ее, упал, не вернув)
+LEASE_TTL = 600.0
+
+# Ключ request.state с заголовками X-RateLimit-* для ответа
+STATE_KEY = "rate_limit_headers"
+
+
+class RateLimitExceeded(Exception):
+    """Токен превысил лимит - ответ 429 с Retry-After"""
+
+    def __init__(self, message: str, retry_after: int, headers: Dict[str, str]):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.headers = headers
+
+
+class RateLimitStoreError(Exception):
+    """Хранилище состояния лимитов недоступно"""
+
+
+# ==================== STORES ====================
+
+
+class RateLimitStore:
+    """
+    Хранилище состояния лимитов.
+
+    Единственная операция - атомарно прочитать и изменить значения
+    нескольких ключей одного токена.
+    """
+
+    name = "base"
+    # Операции блокируют поток (файл, сеть) - вызываются не из event loop
+    blocking = False
+
+    def transact(
+        self, keys: Sequence[str], update: Callable[[List[Any]], Tuple[List[Any], Any]]
+    ) -> Any:
+        """
+        Атомарно обновить значения ключей.
+
+        Args:
+            keys: Ключи
+            update: Получает текущие значения (None - ключа нет) и возвращает
+                новые значения (None - удалить ключ) и результат операции
+
+        Returns:
+            Any: Результат update
+
+        Raises:
+            RateLimitStoreError: Хранилище недоступно
+        """
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Состояние лимитов в памяти процесса (лимит - на каждый worker)"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._values: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def transact(self, keys, update):
+        with self._lock:
+            values, result = update([self._values.get(key) for key in keys])
+            for key, value in zip(keys, values):
+                if value is None:
+                    self._values.pop(key, None)
+                else:
+                    self._values[key] = value
+            return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class SqliteRateLimitStore(RateLimitStore):
+    """
+    Состояние лимитов в файле SQLite, общее для всех процессов на хосте.
+
+    Значения хранятся в JSON; транзакция BEGIN IMMEDIATE сериализует
+    проверки одного и того же лимита из разных процессов.
+    """
+
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: Optional[str] = None, timeout: float = 5.0):
+        """
+        Args:
+            path: Путь к файлу состояния (создается при необходимости; по
+                умолчанию - в личной директории пользователя)
+            timeout: Сколько секунд ждать блокировку файла другим процессом
+
+        Raises:
+            PermissionError: Файл или директория доступны другим пользователям
+        """
+        self.path = path or state_path(DEFAULT_SQLITE_FILE)
+        self.timeout = timeout
+        # Кто может писать в файл, может сбросить или исчерпать лимиты любого токена
+        open_private_file(self.path)
+
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS limits (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        logger.info(f"SQLite rate limit state: {self.path}")
+
+    def _conn(self) -> sqlite3.Connection:
+        """Соединение SQLite текущего потока"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def transact(self, keys, update):
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                stored = dict(
+                    conn.execute(
+                        f"SELECT key, value FROM limits WHERE key IN ({','.join('?' * len(keys))})",
+                        list(keys),
+                    ).fetchall()
+                )
+                values, result = update(
+                    [json.loads(stored[key]) if key in stored else None for key in keys]
+                )
+                for key, value in zip(keys, values):
+                    if value is None:
+                        if key in stored:
+                            conn.execute("DELETE FROM limits WHERE key = ?", (key,))
+                    else:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO limits (key, value) VALUES (?, ?)",
+                            (key, json.dumps(value)),
+                        )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return result
+        except sqlite3.Error as e:
+            raise RateLimitStoreError(str(e)) from e
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM limits")
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
+
+# ==================== LIMITER ====================
+
+
+class RateLimits:
+    """Лимиты одного токена (0 - без лимита)"""
+
+    __slots__ = ("windows", "budgets", "concurrent")
+
+    def __init__(
+        self,
+        per_minute: int = 0,
+        per_hour: int = 0,
+        concurrent: int = 0,
+        rows_per_window: int = 0,
+        db_seconds_per_window: float = 0,
+    ):
+        # (название, лимит, период)
+        self.windows = [
+            (name, limit, period)
+            for name, limit, period in (("minute", per_minute, 60.0), ("hour", per_hour, 3600.0))
+            if limit > 0
+        ]
+        # (название, бюджет за окно стоимости)
+        self.budgets = [
+            (name, budget)
+            for name, budget in (("rows", rows_per_window), ("db_seconds", db_seconds_per_window))
+            if budget > 0
+        ]
+        self.concurrent = max(0, concurrent)
+
+    def __bool__(self) -> bool:
+        return bool(self.windows or self.budgets or self.concurrent)
+
+    def keys(self, key: str, windows: bool = True) -> List[str]:
+        """Ключи хранилища для состояния токена key"""
+        names = [name for name, _, _ in self.windows] if windows else []
+        names += [name for name, _ in self.budgets]
+        if self.concurrent:
+            names.append("inflight")
+        return [f"{key}:{name}" for name in names]
+
+
+class QueryLease:
+    """
+    Допуск одного запроса: заголовки X-RateLimit-* для ответа и стоимость,
+    которая спишется с бюджета токена по завершении.
+
+    Время БД берется из CancelScope запросов, выполненных по допуску
+    (track): в нем копится время выполнения и чтения на сервере, поэтому
+    ответы из кеша и ожидание в очереди бюджет не расходуют.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        limits: RateLimits,
+        lease_id: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.key = key
+        self.limits = limits
+        self.lease_id = lease_id
+        self.headers = headers or {}
+        self.rows = 0
+        self._scopes: List[Any] = []
+
+    def charge(self, rows: int) -> None:
+        """Учесть строки, отданные клиенту"""
+        self.rows += rows
+
+    def track(self, scope: Any) -> Any:
+        """Списать с бюджета время БД запроса scope (CancelScope); возвращает scope"""
+        self._scopes.append(scope)
+        return scope
+
+    @property
+    def db_seconds(self) -> float:
+        """Время выполнения и чтения на сервере по всем запросам допуска"""
+        return sum(scope.db_seconds for scope in self._scopes)
+
+
+class RateLimiter:
+    """
+    Лимиты запросов на токен поверх RateLimitStore.
+
+    Лимиты по умолчанию задаются здесь; политика токена (TokenPolicy) может
+    переопределить любой из них.
+
+    Example:
+        limiter = RateLimiter(MemoryRateLimitStore(), per_minute=60, concurrent=4)
+        lease = limiter.acquire(auth.key, auth.policy)   # RateLimitExceeded - ответить 429
+        try:
+            ...
+            scope = lease.track(CancelScope(timeout))
+            ...
+            lease.charge(rows_count)
+        finally:
+            limiter.release(lease)
+    """
+
+    def __init__(
+        self,
+        store: RateLimitStore,
+        per_minute: int = 60,
+        per_hour: int = 1000,
+        concurrent: int = 0,
+        rows_per_window: int = 0,
+        db_seconds_per_window: float = 0,
+        cost_window: float = 3600.0,
+    ):
+        """
+        Args:
+            store: Хранилище состояния
+            per_minute: Запросов в минуту (0 - без лимита)
+            per_hour: Запросов в час (0 - без лимита)
+            concurrent: Одновременных запросов токена (0 - без лимита)
+            rows_per_window: Строк за окно стоимости (0 - без лимита)
+            db_seconds_per_window: Секунд выполнения запросов за окно (0 - без лимита)
+            cost_window: Окно бюджета стоимости в секундах
+        """
+        self.store = store
+        self.cost_window = cost_window
+        self._defaults = (per_minute, per_hour, concurrent, rows_per_window, db_seconds_per_window)
+        self.limits = RateLimits(*self._defaults)
+
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._rejected: Dict[str, int] = {"rate": 0, "concurrency": 0, "cost": 0}
+        self._errors = 0
+
+    def limits_for(self, policy: Optional[TokenPolicy]) -> RateLimits:
+        """Лимиты токена: свои из политики или общие"""
+        if policy is None:
+            return self.limits
+        overrides = (
+            policy.rate_limit_per_minute,
+            policy.rate_limit_per_hour,
+            policy.rate_limit_concurrent,
+            policy.rate_limit_rows_per_window,
+            policy.rate_limit_db_seconds_per_window,
+        )
+        if all(value is None for value in overrides):
+            return self.limits
+        return RateLimits(
+            *(
+                default if value is None else value
+                for value, default in zip(overrides, self._defaults)
+            )
+        )
+
+    def _count(self, rejected: Optional[str] = None, error: bool = False) -> None:
+        with self._lock:
+            if error:
+                self._errors += 1
+            elif rejected is None:
+                self._allowed += 1
+            else:
+                self._rejected[rejected] += 1
+
+    # ==================== ACQUIRE / RELEASE ====================
+
+    def acquire(self, key: str, policy: Optional[TokenPolicy] = None) -> QueryLease:
+        """
+        Допустить запрос токена.
+
+        Если хранилище недоступно, запрос допускается без лимита.
+
+        Args:
+            key: Ключ токена (SHA-256, сам токен не хранится)
+            policy: Политика токена (переопределения лимитов)
+
+        Returns:
+            QueryLease: Допуск (вернуть через release)
+
+        Raises:
+            RateLimitExceeded: Лимит исчерпан
+        """
+        limits = self.limits_for(policy)
+        if not limits:
+            return QueryLease(key, limits)
+
+        lease_id = secrets.token_hex(8) if limits.concurrent else None
+        now = time.time()
+        try:
+            verdict = self.store.transact(
+                limits.keys(key), lambda values: self._admit(limits, values, now, lease_id)
+            )
+        except RateLimitStoreError as e:
+            self._count(error=True)
+            logger.warning(f"Rate limit store failed, request allowed: {e}")
+            return QueryLease(key, RateLimits())
+
+        rejected, reason, retry_after, headers = verdict
+        if rejected is not None:
+            self._count(rejected=rejected)
+            retry = max(1, math.ceil(retry_after))
+            headers["Retry-After"] = str(retry)
+            label = policy.name if policy is not None and policy.name else key[:10]
+            logger.warning(f"Rate limit exceeded for token {label}: {reason}")
+            raise RateLimitExceeded(f"Rate limit exceeded: {reason}", retry, headers)
+
+        self._count()
+        return QueryLease(key, limits, lease_id, headers)
+
+    def _admit(
+        self, limits: RateLimits, values: List[Any], now: float, lease_id: Optional[str]
+    ) -> Tuple[List[Any], Tuple[Optional[str], str, float, Dict[str, str]]]:
+        """Решение по текущему состоянию токена (внутри транзакции хранилища)"""
+        updated = list(values)
+        rejected: Optional[str] = None
+        reason = ""
+        retry_after = 0.0
+
+        def reject(kind: str, why: str, wait: float) -> None:
+            nonlocal rejected, reason, retry_after
+            if rejected is None or wait > retry_after:
+                rejected, reason, retry_after = kind, why, wait
+
+        # Частота: GCRA по каждому окну
+        headers: Dict[str, str] = {}
+        tightest: Optional[Tuple[int, int, float]] = None
+        for index, (name, limit, period) in enumerate(limits.windows):
+            interval = period / limit
+            tat = max(values[index] or now, now)
+            if tat + interval - now > period:
+                reject("rate", f"{limit} requests per {name}", tat + interval - now - period)
+            else:
+                tat += interval
+                updated[index] = tat
+            # Запросов до исчерпания и момент полного восстановления окна
+            remaining = max(0, int((period - (tat - now)) / interval))
+            if tightest is None or remaining < tightest[1]:
+                tightest = (limit, remaining, tat)
+        if tightest is not None:
+            limit, remaining, reset = tightest
+            headers = {
+                "X-RateLimit-Limit": str(limit),
+                "X-RateLimit-Remaining": str(remaining),
+                "X-RateLimit-Reset": str(math.ceil(reset)),
+            }
+
+        # Стоимость: долг, списанный прошлыми запросами
+        offset = len(limits.windows)
+        for index, (name, budget) in enumerate(limits.budgets, start=offset):
+            debt = (values[index] or now) - now
+            if debt >= self.cost_window:
+                budget_text = f"{budget:g} {name} per {self.cost_window:g}s"
+                reject("cost", f"{budget_text} budget exhausted", debt - self.cost_window)
+
+        # Одновременные запросы: аренды, не истекшие к этому моменту
+        if limits.concurrent:
+            leases = {lid: until for lid, until in (values[-1] or {}).items() if until > now}
+            if len(leases) >= limits.concurrent:
+                reject("concurrency", f"{limits.concurrent} concurrent queries", 1.0)
+            else:
+                leases[lease_id] = now + LEASE_TTL
+            updated[-1] = leases or None
+
+        if rejected is not None:
+            # Отклоненный запрос не расходует лимит
+            return values, (rejected, reason, retry_after, headers)
+        return updated, (None, "", 0.0, headers)
+
+    def release(self, lease: QueryLease) -> None:
+        """
+        Завершить запрос: вернуть аренду и списать стоимость (строки и время
+        выполнения на сервере) с бюджета токена.
+        """
+        limits = lease.limits
+        if not (limits.budgets or lease.lease_id):
+            return
+        costs = {"rows": lease.rows, "db_seconds": lease.db_seconds}
+        now = time.time()
+
+        def settle(values: List[Any]) -> Tuple[List[Any], None]:
+            updated = list(values)
+            for index, (name, budget) in enumerate(limits.budgets):
+                if costs[name] > 0:
+                    debt = max(values[index] or now, now)
+                    updated[index] = debt + costs[name] * self.cost_window / budget
+            if lease.lease_id is not None:
+                leases = dict(values[-1] or {})
+                leases.pop(lease.lease_id, None)
+                updated[-1] = {lid: until for lid, until in leases.items() if until > now} or None
+            return updated, None
+
+        try:
+            self.store.transact(limits.keys(lease.key, windows=False), settle)
+        except RateLimitStoreError as e:
+            self._count(error=True)
+            logger.warning(f"Rate limit store failed on release: {e}")
+
+    def clear(self) -> None:
+        """Сбросить состояние всех токенов"""
+        self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.store.name,
+                "windows": {name: limit for name, limit, _ in self.limits.windows},
+                "concurrent": self.limits.concurrent,
+                "budgets": {name: budget for name, budget in self.limits.budgets},
+                "cost_window": self.cost_window,
+                "allowed": self._allowed,
+                "rejected": dict(self._rejected),
+                "errors": self._errors,
+            }
+
+
+def worker_count() -> int:
+    """
+    Число worker-процессов сервера из WEB_CONCURRENCY (по нему число
+    процессов выбирают uvicorn и gunicorn); 1, если не задано.
+    """
+    try:
+        return max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+    except ValueError:
+        return 1
+
+
+def create_rate_limiter(config) -> RateLimiter:
+    """
+    Создать лимитер по настройкам (rate_limit_*).
+
+    auto - общий для процессов sqlite, если процессов несколько
+    (WEB_CONCURRENCY > 1), иначе memory.
+
+    Raises:
+        ValueError: Неизвестный rate_limit_backend
+    """
+    backend = config.rate_limit_backend.lower()
+    if backend == "auto":
+        backend = "sqlite" if worker_count() > 1 else "memory"
+    if backend == "memory":
+        store: RateLimitStore = MemoryRateLimitStore()
+    elif backend == "sqlite":
+        store = SqliteRateLimitStore(config.rate_limit_path or None)
+    else:
+        raise ValueError(
+            f"Unknown rate limit backend '{config.rate_limit_backend}', "
+            f"expected one of: {', '.join(RATE_LIMIT_BACKENDS)}"
+        )
+    return RateLimiter(
+        store,
+        per_minute=config.rate_limit_per_minute,
+        per_hour=config.rate_limit_per_hour,
+        concurrent=config.rate_limit_concurrent,
+        rows_per_window=config.rate_limit_rows_per_window,
+        db_seconds_per_window=config.rate_limit_db_seconds_per_window,
+        cost_window=config.rate_limit_cost_window,
+    )
+
+
+# ==================== FASTAPI ====================
+
+
+async def _call(func: Callable[..., Any], *args) -> Any:
+    """Операция лимитера: блокирующие хранилища - в пуле потоков"""
+    if rate_limiter.store.blocking:
+        return await anyio.to_thread.run_sync(func, *args)
+    return func(*args)
+
+
+async def rate_limited(
+    http_request: Request, auth: AuthenticatedToken = Depends(authenticate)
+) -> AsyncIterator[QueryLease]:
+    """
+    Dependency для FastAPI - допуск запроса токена по лимитам.
+
+    Подключается с scope="request": аренда одновременного запроса
+    возвращается, когда ответ (в том числе потоковый) отправлен полностью.
+
+    Raises:
+        RateLimitExceeded: Лимит исчерпан (429)
+    """
+    limiter = rate_limiter
+    lease = await _call(limiter.acquire, auth.key, auth.policy)
+    setattr(http_request.state, STATE_KEY, lease.headers)
+    try:
+        yield lease
+    finally:
+        # Клиент мог отключиться - аренду вернуть все равно
+        with anyio.CancelScope(shield=True):
+            await _call(limiter.release, lease)
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Добавляет заголовки X-RateLimit-* к ответам допущенных запросов.
+
+    Endpoint'ы возвращают готовые Response, поэтому заголовки, выставленные
+    dependency в request.state, подставляются при отправке ответа.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                limit_headers = state.get(STATE_KEY)
+                if limit_headers:
+                    headers = MutableHeaders(scope=message)
+                    for name, value in limit_headers.items():
+                        headers.setdefault(name, value)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+# Глобальный лимитер (состояние sqlite бэкенда общее для процессов)
+rate_limiter = create_rate_limiter(settings)
@@ -0,0 +1,400 @@
+"""
+Представление результата запроса и его преобразования
+
+QueryResult хранит описание колонок (из cursor.description) и строки в
+исходных типах fdb; преобразование в JSON-совместимые значения выполняется
+только при выдаче, в нужном клиенту формате.
+"""
+
+import decimal
+import sys
+import time as _time
+from datetime import datetime, date, time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Формы ответа /api/query
+FORMAT_OBJECTS = "objects"  # массив объектов {column: value}
+FORMAT_COLUMNAR = "columnar"  # описание колонок один раз + массивы значений
+
+LAYOUT_ROWS = "rows"  # data = [[row1...], [row2...]]
+LAYOUT_COLUMNS = "columns"  # data = [[col1...], [col2...]]
+
+# Dictionary encoding строковых колонок: только для выборок не меньше
+# DICTIONARY_MIN_ROWS строк, где уникальных значений не больше доли
+# DICTIONARY_MAX_RATIO от числа строк
+DICTIONARY_MIN_ROWS = 32
+DICTIONARY_MAX_RATIO = 0.5
+
+
+class ResultColumn:
+    """Описание колонки результата"""
+
+    __slots__ = ("name", "type", "python_type", "length", "precision", "scale", "nullable")
+
+    def __init__(
+        self,
+        name: str,
+        type: str,
+        python_type: Optional[type] = None,
+        length: Optional[int] = None,
+        precision: Optional[int] = None,
+        scale: Optional[int] = None,
+        nullable: bool = True,
+    ):
+        self.name = name
+        self.type = type
+        self.python_type = python_type
+        self.length = length
+        self.precision = precision
+        self.scale = scale
+        self.nullable = nullable
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "type": self.type,
+            "length": self.length,
+            "precision": self.precision,
+            "scale": self.scale,
+            "nullable": self.nullable,
+        }
+
+
+def _firebird_type(
+    python_type: Optional[type], display_size: int, internal_size: int, scale: int
+) -> str:
+    """Имя типа Firebird по элементу fdb cursor.description"""
+    if python_type is str:
+        if display_size == 0:
+            # Для BLOB fdb кладет sub_type в scale
+            return "BLOB SUB_TYPE TEXT" if scale == 1 else "BLOB"
+        return "VARCHAR"
+    if python_type is int:
+        if display_size == 6:
+            return "SMALLINT"
+        if display_size == 11:
+            return "INTEGER"
+        return "BIGINT"
+    if python_type is decimal.Decimal:
+        return "DECIMAL"
+    if python_type is float:
+        return "FLOAT" if internal_size == 4 else "DOUBLE PRECISION"
+    if python_type is datetime:
+        return "TIMESTAMP"
+    if python_type is date:
+        return "DATE"
+    if python_type is time:
+        return "TIME"
+    if python_type is bool:
+        return "BOOLEAN"
+    if python_type is list:
+        return "ARRAY"
+    return "UNKNOWN"
+
+
+def describe_columns(description: Sequence[Tuple]) -> List[ResultColumn]:
+    """
+    Построить описание колонок из fdb cursor.description.
+
+    Элемент description: (name, type_code, display_size, internal_size,
+    precision, scale, null_ok).
+    """
+    columns = []
+    for desc in description:
+        name, python_type, display_size, internal_size, precision, scale, null_ok = desc[:7]
+        type_name = _firebird_type(python_type, display_size, internal_size, scale)
+        is_blob = type_name.startswith("BLOB")
+        columns.append(
+            ResultColumn(
+                name=name,
+                type=type_name,
+                python_type=python_type,
+                length=display_size if type_name == "VARCHAR" else None,
+                precision=precision if python_type is decimal.Decimal else None,
+                scale=-scale if python_type is decimal.Decimal and scale else None,
+                nullable=bool(null_ok) if not is_blob else True,
+            )
+        )
+    return columns
+
+
+def to_json_value(value: Any) -> Any:
+    """Преобразовать значение fdb в JSON-совместимое"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    elif isinstance(value, date):
+        return value.isoformat()
+    elif isinstance(value, time):
+        return value.isoformat()
+    elif isinstance(value, decimal.Decimal):
+        return float(value)
+    elif isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return value
+
+
+def _isoformat(value: Any) -> Any:
+    return None if value is None else value.isoformat()
+
+
+def _decimal_to_float(value: Any) -> Any:
+    return None if value is None else float(value)
+
+
+def decode_bytes(value: Any) -> Any:
+    """bytes -> str (UTF-8 с заменой ошибок), остальные значения без изменений"""
+    # BLOB SUB_TYPE 0 и CHAR ... OCTETS приходят как bytes, остальные BLOB - str
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return value
+
+
+# Преобразователи значений в JSON-совместимые по python-типу колонки
+_JSON_CONVERTERS: Dict[type, Callable[[Any], Any]] = {
+    datetime: _isoformat,
+    date: _isoformat,
+    time: _isoformat,
+    decimal.Decimal: _decimal_to_float,
+    bytes: decode_bytes,
+}
+
+# Типы, значения которых уже JSON-совместимы и копируются как есть
+_JSON_NATIVE_TYPES = (int, float, bool)
+
+ConversionPlan = List[Tuple[int, Callable[[Any], Any]]]
+
+
+def json_converter(column: ResultColumn) -> Optional[Callable[[Any], Any]]:
+    """
+    Преобразователь значений колонки в JSON-совместимые или None, если
+    значения передаются без изменений. Для неизвестных типов - to_json_value.
+    """
+    if column.type == "BLOB":
+        return decode_bytes
+    python_type = column.python_type
+    if python_type is str or python_type in _JSON_NATIVE_TYPES:
+        return None
+    return _JSON_CONVERTERS.get(python_type, to_json_value)
+
+
+def conversion_plan(
+    columns: Sequence[ResultColumn],
+    converter: Callable[[ResultColumn], Optional[Callable[[Any], Any]]] = json_converter,
+) -> ConversionPlan:
+    """
+    План преобразования строк: [(индекс колонки, преобразователь)] только для
+    колонок, которым преобразование нужно. Строится один раз на результат по
+    cursor.description, вместо проверки типа каждого значения.
+    """
+    plan = []
+    for i, column in enumerate(columns):
+        convert = converter(column)
+        if convert is not None:
+            plan.append((i, convert))
+    return plan
+
+
+def convert_rows(rows: Sequence[Tuple], plan: ConversionPlan) -> Sequence[Tuple]:
+    """Применить план к строкам; без плана строки возвращаются как есть"""
+    if not plan or not rows:
+        return rows
+    columns = list(zip(*rows))
+    for i, convert in plan:
+        columns[i] = list(map(convert, columns[i]))
+    return list(zip(*columns))
+
+
+def _dictionary_encode(values: Sequence[Any]) -> Optional[Tuple[List[Any], List[Optional[int]]]]:
+    """
+    Dictionary encoding колонки: (словарь, индексы) или None, если
+    уникальных значений слишком много и кодирование невыгодно.
+    """
+    limit = int(len(values) * DICTIONARY_MAX_RATIO)
+    index: Dict[Any, int] = {}
+    codes: List[Optional[int]] = []
+    append = codes.append
+
+    for value in values:
+        if value is None:
+            append(None)
+            continue
+        code = index.get(value)
+        if code is None:
+            if len(index) >= limit:
+                return None
+            code = index[value] = len(index)
+        append(code)
+
+    return list(index), codes
+
+
+def row_size(rows: Sequence[Tuple], sample: int = 64) -> float:
+    """Средний объем памяти строки в байтах (оценка по первым sample строкам)"""
+    if not rows:
+        return 0.0
+    head = rows[:sample]
+    return sum(
+        sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in head
+    ) / len(head)
+
+
+class ResultLimits:
+    """
+    Предельный размер результата запроса: число строк и приблизительный объем
+    данных в байтах (0 - без ограничения); также время жизни результата в
+    кеше, если у токена оно свое (0 - общее).
+    """
+
+    __slots__ = ("max_rows", "max_bytes", "cache_ttl")
+
+    def __init__(self, max_rows: int = 0, max_bytes: int = 0, cache_ttl: float = 0):
+        self.max_rows = max(0, max_rows)
+        self.max_bytes = max(0, max_bytes)
+        self.cache_ttl = max(0, cache_ttl)
+
+    def __bool__(self) -> bool:
+        return bool(self.max_rows or self.max_bytes)
+
+    def __repr__(self) -> str:
+        return (
+            f"ResultLimits(max_rows={self.max_rows}, max_bytes={self.max_bytes}, "
+            f"cache_ttl={self.cache_ttl:g})"
+        )
+
+    def cache_suffix(self) -> str:
+        """
+        Часть ключа кеша: результат, обрезанный по одним лимитам, не годится
+        для других; результаты со своим TTL живут отдельно от общих.
+        """
+        suffix = f"#limit:{self.max_rows}:{self.max_bytes}" if self else ""
+        if self.cache_ttl:
+            suffix += f"#ttl:{self.cache_ttl:g}"
+        return suffix
+
+    def budget(self) -> "ResultBudget":
+        """Счетчик для одного выполнения запроса"""
+        return ResultBudget(self)
+
+
+class ResultBudget:
+    """Остаток лимитов при чтении результата порциями (fetchmany)"""
+
+    __slots__ = ("limits", "rows", "bytes", "exhausted")
+
+    def __init__(self, limits: ResultLimits):
+        self.limits = limits
+        self.rows = 0
+        self.bytes = 0
+        # Лимит достигнут: дальше читать не нужно, результат обрезан
+        self.exhausted = False
+
+    def next_size(self, batch_size: int) -> int:
+        """
+        Сколько строк запросить следующим fetchmany: по лимиту строк + одна,
+        чтобы отличить "ровно max_rows" от обрезанного результата.
+        """
+        if self.limits.max_rows:
+            return max(1, min(batch_size, self.limits.max_rows + 1 - self.rows))
+        return batch_size
+
+    def take(self, rows: List[Tuple]) -> List[Tuple]:
+        """Принять порцию строк; вернуть часть, укладывающуюся в лимиты"""
+        limits = self.limits
+        keep = len(rows)
+        if limits.max_rows and self.rows + keep > limits.max_rows:
+            keep = limits.max_rows - self.rows
+            self.exhausted = True
+
+        if limits.max_bytes and keep:
+            per_row = row_size(rows)
+            room = limits.max_bytes - self.bytes
+            if per_row * keep > room:
+                keep = max(0, min(keep, int(room // per_row)))
+                self.exhausted = True
+            self.bytes += int(per_row * keep)
+
+        self.rows += keep
+        return rows if keep == len(rows) else rows[:keep]
+
+
+class QueryResult:
+    """Результат SELECT запроса: колонки + строки в исходных типах fdb"""
+
+    __slots__ = ("columns", "rows", "fetched_at", "truncated")
+
+    def __init__(
+        self,
+        columns: List[ResultColumn],
+        rows: List[Tuple],
+        fetched_at: Optional[float] = None,
+        truncated: bool = False,
+    ):
+        self.columns = columns
+        self.rows = rows
+        # Когда строки прочитаны из БД (time.time()) - для согласования TTL
+        # производных записей кеша
+        self.fetched_at = _time.time() if fetched_at is None else fetched_at
+        # Чтение остановлено по ResultLimits: в БД есть еще строки
+        self.truncated = truncated
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def approx_size(self, sample: int = 64) -> int:
+        """Приблизительный объем памяти строк в байтах (оценка по первым sample строкам)"""
+        size = sys.getsizeof(self.rows) + 200 * len(self.columns)
+        return size + int(row_size(self.rows, sample) * len(self.rows))
+
+    @property
+    def column_names(self) -> List[str]:
+        return [column.name for column in self.columns]
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Строки в виде списка словарей {column_name: value} с JSON-совместимыми значениями"""
+        names = self.column_names
+        rows = convert_rows(self.rows, conversion_plan(self.columns))
+        return [dict(zip(names, row)) for row in rows]
+
+    def to_columnar(
+        self, layout: str = LAYOUT_ROWS, dictionary_encode: bool = True, convert_values: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Колоночное представление: описание колонок один раз и данные без
+        повторения имен.
+
+        Args:
+            layout: "rows" - массив строк-массивов, "columns" - массив колонок
+            dictionary_encode: Кодировать строковые колонки с малым числом
+                уникальных значений словарем (значения заменяются индексами,
+                словарь - в поле "dictionary" описания колонки)
+            convert_values: Преобразовать значения в JSON-совместимые; False -
+                оставить типы fdb для кодировщика, который умеет их сам
+
+        Returns:
+            Dict: {"columns": [...], "layout": ..., "data": [...]}
+        """
+        columns_info = [column.to_dict() for column in self.columns]
+
+        if self.rows:
+            column_values = [list(values) for values in zip(*self.rows)]
+        else:
+            column_values = [[] for _ in self.columns]
+        if convert_values:
+            for i, convert in conversion_plan(self.columns):
+                column_values[i] = list(map(convert, column_values[i]))
+
+        encode = dictionary_encode and len(self.rows) >= DICTIONARY_MIN_ROWS
+        for i, column in enumerate(self.columns):
+            info = columns_info[i]
+            info["dictionary"] = None
+            if encode and column.python_type is str:
+                encoded = _dictionary_encode(column_values[i])
+                if encoded is not None:
+                    info["dictionary"], column_values[i] = encoded
+
+        if layout == LAYOUT_COLUMNS:
+            data = column_values
+        else:
+            data = [list(row) for row in zip(*column_values)] if self.rows else []
+
+        return {"columns": columns_info, "layout": layout, "data": data}
@@ -1,6 +1,8 @@
 """
 Router для health check
-GET /api/health - проверка работоспособности API и БД
+GET /api/health - проверка работоспособности API и БД (по фоновой проверке)
+GET /api/health/live - процесс жив (liveness)
+GET /api/health/ready - БД готова (readiness)
 """
 
 import logging
@@ -8,9 +10,11 @@ from datetime import datetime
 from fastapi import APIRouter, Depends
 from fastapi.responses import JSONResponse
 
-from app.auth import verify_token
-from app.database import get_database, FirebirdDatabase, clear_cache
+from app.auth import token_registry, verify_token
+from app.database import get_database, FirebirdDatabase, clear_cache, query_cache, query_flights
+from app.executor import get_executor, DBExecutor
 from app.models import HealthResponse
+from app.ratelimit import rate_limiter
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -21,51 +25,75 @@ router = APIRouter(prefix="/api", tags=["health"])
 startup_time = datetime.now()
 
 
+def _health_response(db: FirebirdDatabase) -> JSONResponse:
+    """Ответ по последнему состоянию фоновой проверки БД: 200 или 503"""
+    state = db.health.state()
+    ready = state["ready"]
+    response = HealthResponse(
+        status="healthy" if ready else "unhealthy",
+        database_connected=ready,
+        database_latency_ms=state["latency_ms"],
+        consecutive_failures=state["consecutive_failures"],
+        last_check=state["last_check"],
+        uptime_seconds=(datetime.now() - startup_time).total_seconds(),
+        version=settings.app_version,
+        timestamp=datetime.now(),
+    )
+    return JSONResponse(status_code=200 if ready else 503, content=response.model_dump(mode="json"))
+
+
 @router.get(
     "/health",
     response_model=HealthResponse,
     summary="Health Check",
-    description="Проверка работоспособности API и подключения к БД. Не требует аутентификации.",
+    description=(
+        "Проверка работоспособности API и подключения к БД по результату фоновой проверки. "
+        "Не требует аутентификации."
+    ),
+    responses={503: {"description": "БД недоступна по последним проверкам"}},
 )
 async def health_check(db: FirebirdDatabase = Depends(get_database)) -> HealthResponse:
     """
     Health check endpoint для мониторинга.
 
-    Проверяет:
-    - Работоспособность API
-    - Подключение к БД
-    - Время работы сервера
+    Не обращается к БД: БД проверяется в фоне раз в HEALTH_CHECK_INTERVAL
+    секунд, здесь отдается последнее состояние. Сколько бы мониторов ни
+    опрашивали endpoint, нагрузки на пул соединений он не создает.
 
-    Возвращает 200 если все работает, 503 если есть проблемы с БД.
+    Возвращает 200 если все работает, 503 если БД недоступна
+    HEALTH_FAILURE_THRESHOLD проверок подряд.
     """
-    # Проверка подключения к БД
-    db_connected = False
-    try:
-        db_connected = db.test_connection()
-    except Exception as e:
-        logger.error(f"Health check: database connection failed - {e}")
-
-    # Время работы
-    uptime = (datetime.now() - startup_time).total_seconds()
+    return _health_response(db)
 
-    # Статус
-    status_str = "healthy" if db_connected else "unhealthy"
 
-    response = HealthResponse(
-        status=status_str,
-        database_connected=db_connected,
-        uptime_seconds=uptime,
-        version=settings.app_version,
-        timestamp=datetime.now(),
-    )
+@router.get(
+    "/health/live",
+    summary="Liveness probe",
+    description="Процесс API жив и обрабатывает запросы. Не проверяет БД, не требует аутентификации.",
+)
+async def liveness():
+    """Liveness: всегда 200, пока event loop отвечает"""
+    return {
+        "status": "alive",
+        "uptime_seconds": (datetime.now() - startup_time).total_seconds(),
+        "version": settings.app_version,
+        "timestamp": datetime.now().isoformat(),
+    }
 
-    # Если БД недоступна, возвращаем 503
-    if not db_connected:
-        logger.warning("Health check: UNHEALTHY (database disconnected)")
-        return JSONResponse(status_code=503, content=response.model_dump(mode="json"))
 
-    logger.debug(f"Health check: HEALTHY (uptime: {uptime:.0f}s)")
-    return response
+@router.get(
+    "/health/ready",
+    response_model=HealthResponse,
+    summary="Readiness probe",
+    description=(
+        "Готовность принимать запросы к БД (по фоновой проверке): 200 или 503. "
+        "Не требует аутентификации."
+    ),
+    responses={503: {"description": "БД недоступна по последним проверкам"}},
+)
+async def readiness(db: FirebirdDatabase = Depends(get_database)) -> HealthResponse:
+    """Readiness: 503, пока фоновая проверка БД не проходит"""
+    return _health_response(db)
 
 
 @router.get("/", include_in_schema=False)
@@ -79,6 +107,34 @@ async def root():
     }
 
 
+@router.get(
+    "/stats",
+    summary="Статистика сервера",
+    description="Текущее состояние пула соединений, executor'а БД и кеша. Требует Bearer Token аутентификацию.",
+)
+async def get_stats(
+    token: str = Depends(verify_token),
+    db: FirebirdDatabase = Depends(get_database),
+    executor: DBExecutor = Depends(get_executor),
+):
+    """Статистика пула соединений, executor'а и кеша"""
+    return {
+        "success": True,
+        "health": db.health.state(),
+        "pool": db.pool.stats(),
+        "pages": db.pages.stats(),
+        "schema": db.catalog.stats(),
+        "statements": db.statement_stats.stats(),
+        "timeouts": {"query_timeout": db.query_timeout, **db.watchdog.stats()},
+        "executor": executor.stats(),
+        "cache": query_cache.stats(),
+        "single_flight": query_flights.stats(),
+        "tokens": token_registry.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
 @router.post(
     "/cache/clear",
     summary="Очистить кеш",
@@ -1,17 +1,31 @@
 """
 Router для получения информации о БД
 GET /api/tables - список таблиц
+GET /api/schema - схема всех таблиц (с ETag)
 GET /api/schema/{table_name} - схема таблицы
+
+Все ответы строятся из каталога схемы в памяти (app.catalog) без запросов к БД.
 """
 
 import logging
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status, Path
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Path
 import fdb
 
-from app.auth import verify_token
+from app.auth import authenticate
 from app.database import get_database, FirebirdDatabase
-from app.models import TablesResponse, SchemaResponse, ColumnInfo, ErrorResponse
+from app.executor import get_executor, DBExecutor, ExecutorBusyError
+from app.ratelimit import rate_limited
+from app.tokens import AuthenticatedToken
+from app.catalog import CatalogSnapshot
+from app.models import (
+    TablesResponse,
+    SchemaResponse,
+    CatalogResponse,
+    ColumnInfo,
+    TableSchema,
+    ErrorResponse,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,15 +35,20 @@ router = APIRouter(prefix="/api", tags=["info"])
 @router.get(
     "/tables",
     response_model=TablesResponse,
+    dependencies=[Depends(rate_limited, scope="request")],
     responses={
         401: {"description": "Unauthorized - invalid token"},
+        429: {"model": ErrorResponse, "description": "Rate limit exceeded - retry later"},
         500: {"model": ErrorResponse, "description": "Database error"},
+        503: {"model": ErrorResponse, "description": "Server busy - retry later"},
     },
     summary="Получить список таблиц",
     description="Возвращает список всех пользовательских таблиц в БД. Требует Bearer Token аутентификацию.",
 )
 async def get_tables(
-    token: str = Depends(verify_token), db: FirebirdDatabase = Depends(get_database)
+    auth: AuthenticatedToken = Depends(authenticate),
+    db: FirebirdDatabase = Depends(get_database),
+    executor: DBExecutor = Depends(get_executor),
 ) -> TablesResponse:
     """
     Получить список таблиц в БД.
@@ -37,9 +56,9 @@ async def get_tables(
     Возвращает только пользовательские таблицы (не системные).
     """
     try:
-        logger.info(f"Getting tables list (token: {token[:10]}...)")
+        logger.info(f"Getting tables list (token: {auth.label})")
 
-        tables = db.get_tables()
+        tables = await executor.run(db.get_tables)
 
         logger.info(f"Tables list retrieved: {len(tables)} tables")
 
@@ -47,6 +66,9 @@ async def get_tables(
             success=True, tables=tables, count=len(tables), timestamp=datetime.now()
         )
 
+    except ExecutorBusyError:
+        raise
+
     except fdb.Error as e:
         error_msg = str(e)
         logger.error(f"Database error getting tables: {error_msg}")
@@ -62,21 +84,111 @@ async def get_tables(
         )
 
 
+def _encode_catalog(snapshot: CatalogSnapshot) -> bytes:
+    """Тело ответа /api/schema для версии каталога"""
+    response = CatalogResponse(
+        success=True,
+        version=snapshot.etag,
+        count=len(snapshot.names),
+        tables=[TableSchema(**snapshot.tables[name]) for name in snapshot.names],
+    )
+    return response.model_dump_json(exclude_none=True).encode("utf-8")
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match: список ETag через запятую (слабые сравниваются по значению) или *"""
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in ("*", f'"{etag}"'):
+            return True
+    return False
+
+
+@router.get(
+    "/schema",
+    response_model=CatalogResponse,
+    dependencies=[Depends(rate_limited, scope="request")],
+    responses={
+        304: {"description": "Not Modified - schema matches If-None-Match"},
+        401: {"description": "Unauthorized - invalid token"},
+        429: {"model": ErrorResponse, "description": "Rate limit exceeded - retry later"},
+        500: {"model": ErrorResponse, "description": "Database error"},
+        503: {"model": ErrorResponse, "description": "Server busy - retry later"},
+    },
+    summary="Получить схему всех таблиц",
+    description=(
+        "Возвращает колонки, типы и ключи всех пользовательских таблиц одним ответом. "
+        "Ответ несет ETag; с If-None-Match неизменившаяся схема отдается как 304. "
+        "Требует Bearer Token аутентификацию."
+    ),
+)
+async def get_catalog(
+    request: Request,
+    auth: AuthenticatedToken = Depends(authenticate),
+    db: FirebirdDatabase = Depends(get_database),
+    executor: DBExecutor = Depends(get_executor),
+) -> Response:
+    """
+    Получить схему всех таблиц БД.
+
+    Тело ответа кодируется один раз на версию каталога; клиент, приславший
+    ETag текущей версии в If-None-Match, получает 304 без тела.
+    """
+    try:
+        snapshot = await executor.run(db.catalog.snapshot)
+        headers = {"ETag": f'"{snapshot.etag}"', "Cache-Control": "private, no-cache"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, snapshot.etag):
+            logger.info(f"Schema catalog not modified (token: {auth.label})")
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        logger.info(f"Schema catalog: {len(snapshot.names)} tables (token: {auth.label})")
+        return Response(
+            content=snapshot.body(_encode_catalog),
+            media_type="application/json",
+            headers=headers,
+        )
+
+    except ExecutorBusyError:
+        raise
+
+    except fdb.Error as e:
+        error_msg = str(e)
+        logger.error(f"Database error loading schema catalog: {error_msg}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Database error: {error_msg}"
+        )
+
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"Unexpected error loading schema catalog: {error_msg}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal error: {error_msg}"
+        )
+
+
 @router.get(
     "/schema/{table_name}",
     response_model=SchemaResponse,
+    dependencies=[Depends(rate_limited, scope="request")],
     responses={
         401: {"description": "Unauthorized - invalid token"},
+        429: {"model": ErrorResponse, "description": "Rate limit exceeded - retry later"},
         404: {"model": ErrorResponse, "description": "Table not found"},
         500: {"model": ErrorResponse, "description": "Database error"},
+        503: {"model": ErrorResponse, "description": "Server busy - retry later"},
     },
     summary="Получить схему таблицы",
     description="Возвращает список колонок и их типы для указанной таблицы. Требует Bearer Token аутентификацию.",
 )
 async def get_table_schema(
     table_name: str = Path(..., description="Имя таблицы"),
-    token: str = Depends(verify_token),
+    auth: AuthenticatedToken = Depends(authenticate),
     db: FirebirdDatabase = Depends(get_database),
+    executor: DBExecutor = Depends(get_executor),
 ) -> SchemaResponse:
     """
     Получить схему таблицы.
@@ -86,32 +198,31 @@ async def get_table_schema(
     Возвращает список колонок с типами данных и информацией о NULL.
     """
     try:
-        logger.info(f"Getting schema for table {table_name} (token: {token[:10]}...)")
+        logger.info(f"Getting schema for table {table_name} (token: {auth.label})")
 
-        # Проверить что таблица существует
-        all_tables = db.get_tables()
-        if table_name.upper() not in [t.upper() for t in all_tables]:
+        # Из каталога схемы; на промахе каталог сверяет версию метаданных
+        table = await executor.run(db.catalog.table, table_name)
+        if table is None:
             logger.warning(f"Table not found: {table_name}")
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail=f"Table '{table_name}' not found"
             )
 
-        schema = db.get_table_schema(table_name)
-
-        # Преобразовать в Pydantic модели
-        columns = [
-            ColumnInfo(name=col["name"], type=col["type"], nullable=col["nullable"])
-            for col in schema
-        ]
+        columns = [ColumnInfo(**col) for col in table["columns"]]
 
         logger.info(f"Schema retrieved for {table_name}: {len(columns)} columns")
 
         return SchemaResponse(
-            success=True, table=table_name.upper(), columns=columns, timestamp=datetime.now()
+            success=True,
+            table=table["table"],
+            columns=columns,
+            primary_key=table["primary_key"],
+            unique_keys=table["unique_keys"],
+            timestamp=datetime.now(),
         )
 
-    except HTTPException:
-        # Re-raise HTTPException как есть
+    except (HTTPException, ExecutorBusyError):
+        # Re-raise HTTPException и 503 от executor'а как есть
         raise
 
     except fdb.Error as e:
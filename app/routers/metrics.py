@@ -0,0 +1,146 @@
+"""
+Router для метрик
+GET /metrics - метрики в формате Prometheus
+"""
+
+import logging
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+
+from app.auth import verify_token
+from app.database import get_database, FirebirdDatabase, query_cache, query_flights
+from app.executor import get_executor, DBExecutor
+from app.metrics import CONTENT_TYPE, Family, family, registry
+from app.ratelimit import rate_limiter
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["metrics"])
+
+
+def _state_families(db: FirebirdDatabase, executor: DBExecutor) -> List[Family]:
+    """Состояние пула, кеша, executor'а и лимитов на момент запроса /metrics"""
+    pool = db.pool.stats()
+    cache = query_cache.stats()
+    backend = (("backend", cache["backend"]),)
+    work = executor.stats()
+    flights = query_flights.stats()
+    rejected = rate_limiter.stats()["rejected"]
+
+    return [
+        family(
+            "database_up",
+            "gauge",
+            "Database is reachable by the health prober",
+            {None: int(db.health.ready)},
+        ),
+        family(
+            "pool_connections",
+            "gauge",
+            "Pooled connections by state",
+            {(("state", "in_use"),): pool["in_use"], (("state", "idle"),): pool["idle"]},
+        ),
+        family("pool_max_connections", "gauge", "Pool size limit", {None: pool["max_size"]}),
+        family(
+            "pool_waiters", "gauge", "Requests waiting for a connection", {None: pool["waiters"]}
+        ),
+        family(
+            "pool_acquired_total",
+            "counter",
+            "Connections handed out",
+            {None: pool["acquired_total"]},
+        ),
+        family(
+            "pool_acquire_timeouts_total",
+            "counter",
+            "Requests that timed out waiting for a connection",
+            {None: pool["acquire_timeouts"]},
+        ),
+        family(
+            "pool_acquire_wait_seconds_total",
+            "counter",
+            "Total time spent waiting for a connection",
+            {None: pool["acquire_wait_total_ms"] / 1000},
+        ),
+        family(
+            "pool_acquire_wait_max_seconds",
+            "gauge",
+            "Longest wait for a connection",
+            {None: pool["acquire_wait_max_ms"] / 1000},
+        ),
+        family("cache_hits_total", "counter", "Query cache hits", {backend: cache["hits"]}),
+        family(
+            "cache_stale_hits_total",
+            "counter",
+            "Stale results served while refreshing",
+            {backend: cache["stale_hits"]},
+        ),
+        family("cache_misses_total", "counter", "Query cache misses", {backend: cache["misses"]}),
+        family(
+            "cache_evictions_total",
+            "counter",
+            "Entries evicted to fit the memory budget",
+            {backend: cache["evictions"]},
+        ),
+        family("cache_entries", "gauge", "Entries in the query cache", {backend: cache["entries"]}),
+        family("cache_bytes", "gauge", "Approximate query cache size", {backend: cache["bytes"]}),
+        family(
+            "single_flight_coalesced_total",
+            "counter",
+            "Identical concurrent queries served by one execution",
+            {None: flights["coalesced"]},
+        ),
+        family(
+            "executor_queue_depth",
+            "gauge",
+            "Database calls waiting for a worker",
+            {None: work["queued"]},
+        ),
+        family("executor_active", "gauge", "Database calls running", {None: work["active"]}),
+        family("executor_workers", "gauge", "Database worker threads", {None: work["workers"]}),
+        family(
+            "executor_rejected_total",
+            "counter",
+            "Database calls rejected with 503 (queue full)",
+            {None: work["rejected_total"]},
+        ),
+        family(
+            "rate_limit_rejections_total",
+            "counter",
+            "Requests rejected with 429 by reason",
+            {(("reason", reason),): count for reason, count in sorted(rejected.items())},
+        ),
+    ]
+
+
+@router.get(
+    "/metrics",
+    response_class=Response,
+    responses={
+        200: {"content": {CONTENT_TYPE: {}}, "description": "Metrics in Prometheus text format"},
+        401: {"description": "Unauthorized - invalid token"},
+        404: {"description": "Metrics are disabled (METRICS_ENABLED=false)"},
+    },
+    summary="Метрики Prometheus",
+    description=(
+        "Метрики сервера в формате Prometheus: задержки по endpoint'ам и fingerprint "
+        "запросов, время БД, строки, объем ответов, кеш, пул соединений, executor. "
+        "Требует Bearer Token аутентификацию."
+    ),
+)
+async def get_metrics(
+    token: str = Depends(verify_token),
+    db: FirebirdDatabase = Depends(get_database),
+    executor: DBExecutor = Depends(get_executor),
+) -> Response:
+    """Метрики в формате Prometheus text exposition"""
+    if not registry.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+
+    families = _state_families(db, executor)
+    families.append(
+        family("info", "gauge", "Proxy version", {(("version", settings.app_version),): 1})
+    )
+    return Response(content=registry.render(families), media_type=CONTENT_TYPE)
@@ -1,84 +1,494 @@
 """
 Router для выполнения SQL запросов
 POST /api/query - выполнение SELECT запросов
+POST /api/query/batch - пакет SELECT запросов за один HTTP запрос
 """
 
+import asyncio
 import logging
+import threading
 from datetime import datetime
-from fastapi import APIRouter, Depends
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import Response, StreamingResponse
+import anyio
 import fdb
 
-from app.auth import verify_token
+from app.auth import authenticate
+from app.config import settings
 from app.database import get_database, FirebirdDatabase
-from app.models import QueryRequest, QueryResponse, ErrorResponse
+from app.encoders import (
+    ResultEncoder,
+    available_media_types,
+    get_encoder,
+    select_encoder,
+    JSON_ENCODER,
+    NDJSON_MEDIA_TYPE,
+)
+from app.executor import get_executor, DBExecutor, ExecutorBusyError
+from app.models import (
+    BatchQueryRequest,
+    BatchQueryResponse,
+    QueryRequest,
+    QueryResponse,
+    ColumnarQueryResponse,
+    ErrorResponse,
+)
+from app.metrics import VALIDATION_REJECTIONS
+from app.pagination import PageSessionError, PageTokenError
+from app.ratelimit import QueryLease, rate_limited
+from app.results import ResultLimits
+from app.sql import NormalizedQuery, normalize_query
+from app.timeouts import (
+    DISCONNECT,
+    CancelScope,
+    QueryCancelledError,
+    QueryInterruptedError,
+    QueryTimeoutError,
+)
+from app.tokens import AuthenticatedToken, TokenPolicy
+from app.tracing import span
 from app.validators import validate_sql
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["query"])
 
+# Заголовок ответа с устаревшим (stale-while-revalidate) результатом из кеша
+STALE_HEADER = "X-Cache-Stale"
+
+# Как часто проверять, не отключился ли клиент, пока выполняется запрос (сек)
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+def _negotiate(request: QueryRequest, http_request: Request) -> Optional[ResultEncoder]:
+    """
+    Выбрать кодировщик ответа по Accept.
+
+    None - обычный JSON ответ. С "stream": true без явного потокового формата
+    в Accept используется NDJSON.
+    """
+    encoder = select_encoder(http_request.headers.get("accept"))
+    if encoder is None and request.stream:
+        encoder = get_encoder(NDJSON_MEDIA_TYPE)
+    return encoder
+
+
+def _meta(
+    success: bool,
+    rows_count: int,
+    start_time: datetime,
+    error: Optional[str] = None,
+    stale: bool = False,
+    truncated: bool = False,
+) -> Dict[str, Any]:
+    """Итог выполнения: тело ошибки / trailer потока / метаданные бинарных форматов"""
+    return {
+        "success": success,
+        "rows_count": rows_count,
+        "execution_time": (datetime.now() - start_time).total_seconds(),
+        "error": error,
+        "stale": stale,
+        "truncated": truncated,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+def _result_limits(policy: TokenPolicy) -> ResultLimits:
+    """Лимиты результата и TTL кеша для токена: свои из его политики или общие"""
+    return ResultLimits(
+        policy.max_rows or settings.query_max_rows,
+        policy.max_bytes or settings.query_max_bytes,
+        policy.cache_ttl or 0,
+    )
+
+
+def _query_scope(requested: Optional[float]) -> CancelScope:
+    """Таймаут запроса: DB_QUERY_TIMEOUT или меньший, запрошенный клиентом"""
+    timeout = settings.db_query_timeout
+    if requested is not None and (timeout <= 0 or requested < timeout):
+        timeout = requested
+    return CancelScope(timeout)
+
+
+async def _watch_disconnect(http_request: Request, *scopes: CancelScope) -> None:
+    """Отменить запросы на сервере, если клиент отключился, не дождавшись ответа"""
+    while True:
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+        if await http_request.is_disconnected():
+            for scope in scopes:
+                scope.cancel(DISCONNECT)
+            return
+
+
+async def _run_cancellable(
+    http_request: Request, scope: CancelScope, executor: DBExecutor, func, *args
+) -> Any:
+    """executor.run, пока клиент на связи; при его отключении запрос отменяется"""
+    watcher = asyncio.create_task(_watch_disconnect(http_request, scope))
+    try:
+        return await executor.run(func, *args)
+    finally:
+        watcher.cancel()
+
+
+def _cache_headers(stale: bool) -> Optional[Dict[str, str]]:
+    """Заголовки ответа, отданного из кеша после истечения TTL"""
+    return {STALE_HEADER: "true"} if stale else None
+
+
+def _error_response(
+    encoder: Optional[ResultEncoder], error: str, start_time: datetime
+) -> Union[QueryResponse, Response]:
+    """Ответ с ошибкой в формате клиента (JSON, если формат не умеет ошибки)"""
+    if encoder is not None and encoder.supports_errors:
+        body = encoder.error(_meta(False, 0, start_time, error))
+        return Response(content=body, media_type=encoder.content_type)
+
+    return QueryResponse(
+        success=False,
+        error=error,
+        execution_time=(datetime.now() - start_time).total_seconds(),
+        timestamp=datetime.now(),
+    )
+
+
+async def _stream_rows(
+    db: FirebirdDatabase,
+    executor: DBExecutor,
+    encoder: ResultEncoder,
+    statement: NormalizedQuery,
+    params: Optional[Tuple],
+    fmt: str,
+    start_time: datetime,
+    limits: Optional[ResultLimits] = None,
+    scope: Optional[CancelScope] = None,
+    lease: Optional[QueryLease] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Потоковая выдача результатов выбранным кодировщиком.
+
+    Каждая порция строк читается из курсора и кодируется в executor'е БД и
+    сразу отправляется клиенту; в конце идет trailer с количеством строк,
+    временем выполнения и ошибкой (если была). Форматы без места для ошибки
+    (Arrow, CSV) при ошибке обрывают ответ. Выдача, остановленная по лимитам,
+    завершается trailer с "truncated": true.
+
+    Если клиент отключился до конца выдачи, запрос прерывается на сервере
+    (scope), а генератор закрывается и возвращает соединение в пул.
+    """
+    if scope is None:
+        scope = CancelScope(db.query_timeout)
+    batches = db.stream_query(
+        statement.text,
+        params,
+        batch_size=settings.stream_batch_size,
+        limits=limits,
+        scope=scope,
+        normalized=statement,
+    )
+    writer = encoder.stream(fmt)
+    rows_count = 0
+    truncated = False
+    error = None
+    finished = False
+    # Чтение порции и закрытие генератора идут в разных потоках executor'а
+    batches_lock = threading.Lock()
+
+    def next_chunk():
+        with batches_lock:
+            batch = next(batches, None)
+        if batch is None:
+            return None, 0, False
+        return writer.write(batch), len(batch), batch.truncated
+
+    def close_batches():
+        with batches_lock:
+            batches.close()
+
+    try:
+        while True:
+            chunk, count, batch_truncated = await executor.run(next_chunk)
+            if chunk is None:
+                break
+            rows_count += count
+            truncated = truncated or batch_truncated
+            if lease is not None:
+                lease.charge(count)
+            if chunk:
+                yield chunk
+        finished = True
+
+    except ExecutorBusyError as e:
+        error = f"Server is busy, retry later: {e}"
+    except QueryTimeoutError as e:
+        error = str(e)
+    except fdb.Error as e:
+        error = f"Database error: {e}"
+    except Exception as e:
+        error = f"Internal error: {e}"
+    finally:
+        if not finished and error is None:
+            # Клиент отключился: прервать запрос, который, возможно, еще читается
+            scope.cancel(DISCONNECT)
+        # Закрыть генератор (и вернуть соединение в пул) также при обрыве клиента;
+        # отмена ответа не должна прервать само закрытие
+        with anyio.CancelScope(shield=True):
+            await executor.run(close_batches)
+
+    if error:
+        logger.error(f"Streaming query failed after {rows_count} rows: {error}")
+        if not encoder.supports_errors:
+            raise RuntimeError(f"{encoder.name} stream aborted: {error}")
+    else:
+        execution_time = (datetime.now() - start_time).total_seconds()
+        logger.info(f"Query streamed: {rows_count} rows, {execution_time:.3f}s")
+
+    yield writer.trailer(_meta(error is None, rows_count, start_time, error, truncated=truncated))
+
+
+def _fetch_body(
+    db: FirebirdDatabase,
+    encoder: ResultEncoder,
+    statement: NormalizedQuery,
+    params: Optional[Tuple],
+    fmt: str,
+    layout: str,
+    start_time: datetime,
+    limits: Optional[ResultLimits] = None,
+    scope: Optional[CancelScope] = None,
+) -> Tuple[int, bytes, bool]:
+    """
+    Выполнить запрос и собрать тело ответа (в потоке executor'а).
+
+    Закодированные данные берутся из кеша, если есть; в них подставляются
+    только метаданные ответа (execution_time, timestamp, ...).
+    """
+    payload, rows_count, stale, truncated = db.fetch_encoded(
+        statement.text,
+        params,
+        f"{encoder.name}:{fmt}:{layout}",
+        lambda result: encoder.encode_payload(result, fmt, layout),
+        normalized=statement,
+        limits=limits,
+        scope=scope,
+    )
+    meta = _meta(True, rows_count, start_time, stale=stale, truncated=truncated)
+    return rows_count, encoder.assemble(payload, meta), stale
+
+
+def _fetch_page_body(
+    db: FirebirdDatabase,
+    encoder: ResultEncoder,
+    statement: NormalizedQuery,
+    params: Optional[Tuple],
+    request: QueryRequest,
+    start_time: datetime,
+    limits: Optional[ResultLimits] = None,
+    scope: Optional[CancelScope] = None,
+) -> Tuple[int, bytes, bool]:
+    """
+    Страница результата (page_size / next_token), в потоке executor'а.
+
+    Страница кодируется целиком на каждый запрос: она и так мала, а
+    следующая читается из сессии страниц, а не из БД.
+    """
+    page, next_token, stale = db.fetch_page(
+        statement.text,
+        params,
+        request.page_size,
+        request.next_token,
+        normalized=statement,
+        limits=limits,
+        scope=scope,
+    )
+    meta = _meta(True, len(page), start_time, stale=stale, truncated=page.truncated)
+    meta["next_token"] = next_token
+    with span("encode"):
+        body = encoder.encode(page, meta, request.format, request.layout)
+    return len(page), body, stale
+
 
 @router.post(
     "/query",
-    response_model=QueryResponse,
+    response_model=Union[QueryResponse, ColumnarQueryResponse],
     responses={
+        200: {
+            "content": {
+                media_type: {}
+                for media_type in available_media_types()
+                if media_type != "application/json"
+            },
+            "description": "Результат запроса; формат выбирается заголовком Accept",
+        },
         400: {"model": ErrorResponse, "description": "SQL validation failed"},
         401: {"description": "Unauthorized - invalid token"},
+        429: {"model": ErrorResponse, "description": "Rate limit exceeded - retry later"},
         500: {"model": ErrorResponse, "description": "Database error"},
+        503: {"model": ErrorResponse, "description": "Server busy - retry later"},
     },
     summary="Выполнить SQL запрос",
-    description="Выполняет SELECT или WITH запрос к Firebird БД. Требует Bearer Token аутентификацию.",
+    description=(
+        "Выполняет SELECT или WITH запрос к Firebird БД. "
+        "С `stream: true` или `Accept: application/x-ndjson` результат отдается потоком NDJSON. "
+        "С `format: columnar` колонки описываются один раз, а строки идут массивами значений. "
+        "С `page_size` отдается первая страница и `next_token` для следующей. "
+        "Запрос дольше `timeout` (не больше DB_QUERY_TIMEOUT) прерывается на сервере. "
+        "Заголовок Accept выбирает кодировку: application/json (по умолчанию), "
+        "application/x-ndjson, application/msgpack, application/vnd.apache.arrow.stream, text/csv. "
+        "Требует Bearer Token аутентификацию."
+    ),
 )
 async def execute_query(
     request: QueryRequest,
-    token: str = Depends(verify_token),
+    http_request: Request,
+    auth: AuthenticatedToken = Depends(authenticate),
+    lease: QueryLease = Depends(rate_limited, scope="request"),
     db: FirebirdDatabase = Depends(get_database),
+    executor: DBExecutor = Depends(get_executor),
 ) -> QueryResponse:
     """
     Выполнение SELECT запроса к БД.
 
     - **query**: SQL запрос (только SELECT или WITH)
     - **params**: Опциональные параметры запроса
+    - **stream**: Потоковая выдача NDJSON (по строке на запись + trailer)
+    - **format**: objects (по умолчанию) или columnar
+    - **layout**: Для columnar - data по строкам (rows) или по колонкам (columns)
+    - **page_size** / **next_token**: Постраничная выдача
+    - **timeout**: Таймаут запроса в секундах (не больше DB_QUERY_TIMEOUT)
 
     Возвращает результаты в виде массива объектов.
     """
     start_time = datetime.now()
+    encoder = _negotiate(request, http_request)
+    # NDJSON по своей природе потоковый
+    stream = request.stream or (encoder is not None and encoder.media_type == NDJSON_MEDIA_TYPE)
 
     # Валидация SQL
-    is_valid, error_message = validate_sql(request.query)
+    with span("validate"):
+        is_valid, error_message = validate_sql(request.query)
     if not is_valid:
+        VALIDATION_REJECTIONS.inc(("query",))
         logger.warning(f"SQL validation failed: {error_message}")
+        if encoder is not None:
+            return _error_response(encoder, f"SQL validation failed: {error_message}", start_time)
         return QueryResponse(
             success=False, error=f"SQL validation failed: {error_message}", timestamp=datetime.now()
         )
 
+    paginate = request.page_size is not None or request.next_token is not None
+    if paginate and stream:
+        return _error_response(encoder, "Pagination is not supported in streaming mode", start_time)
+    if request.page_size is not None and request.page_size > settings.page_max_size:
+        return _error_response(
+            encoder, f"page_size must not exceed {settings.page_max_size}", start_time
+        )
+
+    # Нормализация и fingerprint - один раз на запрос (ключ кеша, логи)
+    statement = normalize_query(request.query)
+    fingerprint = statement.fingerprint
+    limits = _result_limits(auth.policy)
+    scope = lease.track(_query_scope(request.timeout))
+
     # Выполнение запроса
     try:
         # Преобразовать params из List в Tuple если есть
         params = tuple(request.params) if request.params else None
 
-        logger.info(f"Executing query (token: {token[:10]}...)")
-        logger.debug(f"Query: {request.query[:200]}...")
+        logger.info(f"Executing query {fingerprint} (token: {auth.label})")
+        logger.debug(f"Query {fingerprint}: {request.query[:200]}...")
+
+        if stream:
+            return StreamingResponse(
+                _stream_rows(
+                    db,
+                    executor,
+                    encoder,
+                    statement,
+                    params,
+                    request.format,
+                    start_time,
+                    limits,
+                    scope,
+                    lease,
+                ),
+                media_type=encoder.content_type,
+            )
 
-        results = db.execute_query(request.query, params)
+        # JSON по умолчанию собирается тем же путем, без валидации строк pydantic
+        body_encoder = encoder or JSON_ENCODER
+        if paginate:
+            rows_count, body, stale = await _run_cancellable(
+                http_request,
+                scope,
+                executor,
+                _fetch_page_body,
+                db,
+                body_encoder,
+                statement,
+                params,
+                request,
+                start_time,
+                limits,
+                scope,
+            )
+        else:
+            rows_count, body, stale = await _run_cancellable(
+                http_request,
+                scope,
+                executor,
+                _fetch_body,
+                db,
+                body_encoder,
+                statement,
+                params,
+                request.format,
+                request.layout,
+                start_time,
+                limits,
+                scope,
+            )
 
+        lease.charge(rows_count)
         execution_time = (datetime.now() - start_time).total_seconds()
+        logger.info(
+            f"Query {fingerprint} successful: {rows_count} rows, {execution_time:.3f}s "
+            f"({body_encoder.name})"
+        )
+        return Response(
+            content=body, media_type=body_encoder.content_type, headers=_cache_headers(stale)
+        )
 
-        logger.info(f"Query successful: {len(results)} rows, {execution_time:.3f}s")
+    except ExecutorBusyError:
+        logger.warning("Query rejected: database executor queue is full")
+        raise
 
-        return QueryResponse(
-            success=True,
-            data=results,
-            rows_count=len(results),
-            execution_time=execution_time,
-            timestamp=datetime.now(),
-        )
+    except QueryTimeoutError as e:
+        logger.warning(f"Query {fingerprint} cancelled on server: {e}")
+        return _error_response(encoder, str(e), start_time)
+
+    except QueryCancelledError as e:
+        # Ответ уже некому читать
+        logger.info(f"Query {fingerprint}: {e}")
+        return _error_response(encoder, str(e), start_time)
+
+    except PageTokenError as e:
+        logger.warning(f"Query {fingerprint}: invalid next_token: {e}")
+        return _error_response(encoder, f"Invalid next_token: {e}", start_time)
+
+    except PageSessionError as e:
+        logger.warning(f"Query {fingerprint}: {e}")
+        return _error_response(encoder, str(e), start_time)
 
     except fdb.Error as e:
         execution_time = (datetime.now() - start_time).total_seconds()
         error_msg = str(e)
 
-        logger.error(f"Database error after {execution_time:.3f}s: {error_msg}")
+        logger.error(f"Query {fingerprint} database error after {execution_time:.3f}s: {error_msg}")
+
+        if encoder is not None:
+            return _error_response(encoder, f"Database error: {error_msg}", start_time)
 
         return QueryResponse(
             success=False,
@@ -91,7 +501,12 @@ async def execute_query(
         execution_time = (datetime.now() - start_time).total_seconds()
         error_msg = str(e)
 
-        logger.error(f"Unexpected error after {execution_time:.3f}s: {error_msg}")
+        logger.error(
+            f"Query {fingerprint} unexpected error after {execution_time:.3f}s: {error_msg}"
+        )
+
+        if encoder is not None:
+            return _error_response(encoder, f"Internal error: {error_msg}", start_time)
 
         return QueryResponse(
             success=False,
@@ -99,3 +514,222 @@ async def execute_query(
             execution_time=execution_time,
             timestamp=datetime.now(),
         )
+
+
+# ==================== BATCH ====================
+
+
+def _batch_item_error(item: QueryRequest, consistent: bool) -> Optional[str]:
+    """Почему запрос пакета не выполняется (None - выполнять)"""
+    with span("validate"):
+        is_valid, error_message = validate_sql(item.query)
+    if not is_valid:
+        VALIDATION_REJECTIONS.inc(("batch",))
+        return f"SQL validation failed: {error_message}"
+    if item.stream:
+        return "Streaming is not supported in batch"
+    paginate = item.page_size is not None or item.next_token is not None
+    if paginate and consistent:
+        return "Pagination is not supported in consistent batch"
+    if item.page_size is not None and item.page_size > settings.page_max_size:
+        return f"page_size must not exceed {settings.page_max_size}"
+    return None
+
+
+def _batch_error_text(e: Exception) -> str:
+    """Текст ошибки запроса пакета (как в ответе /api/query)"""
+    if isinstance(e, QueryInterruptedError):
+        return str(e)
+    if isinstance(e, PageTokenError):
+        return f"Invalid next_token: {e}"
+    if isinstance(e, PageSessionError):
+        return str(e)
+    if isinstance(e, ExecutorBusyError):
+        return f"Server is busy, retry later: {e}"
+    if isinstance(e, fdb.Error):
+        return f"Database error: {e}"
+    return f"Internal error: {e}"
+
+
+def _batch_error_body(error: str, start_time: datetime) -> bytes:
+    return JSON_ENCODER.error(_meta(False, 0, start_time, error))
+
+
+def _fetch_snapshot_bodies(
+    db: FirebirdDatabase,
+    items: List[QueryRequest],
+    start_time: datetime,
+    limits: ResultLimits,
+    scope: CancelScope,
+) -> Tuple[List[Tuple[bool, bytes]], int]:
+    """
+    Пакет в одной snapshot транзакции (в потоке executor'а): тело ответа и
+    успешность каждого запроса, а также общее число строк.
+    """
+    statements = [
+        (normalize_query(item.query), tuple(item.params) if item.params else None) for item in items
+    ]
+    results = db.fetch_snapshot(statements, limits, scope)
+
+    bodies = []
+    rows_count = 0
+    for item, result in zip(items, results):
+        if isinstance(result, Exception):
+            bodies.append((False, _batch_error_body(_batch_error_text(result), start_time)))
+            continue
+        rows_count += len(result)
+        meta = _meta(True, len(result), start_time, truncated=result.truncated)
+        with span("encode"):
+            bodies.append((True, JSON_ENCODER.encode(result, meta, item.format, item.layout)))
+    return bodies, rows_count
+
+
+@router.post(
+    "/query/batch",
+    response_model=BatchQueryResponse,
+    responses={
+        401: {"description": "Unauthorized - invalid token"},
+        429: {"model": ErrorResponse, "description": "Rate limit exceeded - retry later"},
+        503: {"model": ErrorResponse, "description": "Server busy - retry later"},
+    },
+    summary="Выполнить пакет SQL запросов",
+    description=(
+        "Выполняет несколько SELECT/WITH запросов за один HTTP запрос. "
+        "Каждый запрос проходит валидацию и использует кеш, как в `/api/query`; "
+        "запросы выполняются параллельно на соединениях пула. "
+        "С `consistent: true` - последовательно в одной read-only транзакции "
+        "(общий snapshot БД). Ответы и ошибки возвращаются по каждому запросу "
+        "в исходном порядке, всегда в JSON. Требует Bearer Token аутентификацию."
+    ),
+)
+async def execute_batch(
+    request: BatchQueryRequest,
+    http_request: Request,
+    auth: AuthenticatedToken = Depends(authenticate),
+    lease: QueryLease = Depends(rate_limited, scope="request"),
+    db: FirebirdDatabase = Depends(get_database),
+    executor: DBExecutor = Depends(get_executor),
+):
+    """
+    Выполнение пакета SELECT запросов.
+
+    - **queries**: Запросы в формате `/api/query` (без stream)
+    - **consistent**: Последовательно в одной snapshot транзакции
+    - **timeout**: Таймаут пакета (consistent) или запросов без своего timeout
+    """
+    start_time = datetime.now()
+    items = request.queries
+
+    if len(items) > settings.batch_max_queries:
+        return BatchQueryResponse(
+            success=False,
+            error=f"Batch must not contain more than {settings.batch_max_queries} queries",
+            execution_time=(datetime.now() - start_time).total_seconds(),
+        )
+
+    limits = _result_limits(auth.policy)
+    results: List[Optional[Tuple[bool, bytes]]] = [None] * len(items)
+    runnable = []
+    for index, item in enumerate(items):
+        error = _batch_item_error(item, request.consistent)
+        if error is not None:
+            logger.warning(f"Batch query #{index} rejected: {error}")
+            results[index] = (False, _batch_error_body(error, start_time))
+        else:
+            runnable.append(index)
+
+    logger.info(
+        f"Executing batch of {len(items)} queries "
+        f"({'consistent' if request.consistent else 'parallel'}, token: {auth.label})"
+    )
+
+    if request.consistent and runnable:
+        scope = lease.track(_query_scope(request.timeout))
+        try:
+            bodies, rows_count = await _run_cancellable(
+                http_request,
+                scope,
+                executor,
+                _fetch_snapshot_bodies,
+                db,
+                [items[index] for index in runnable],
+                start_time,
+                limits,
+                scope,
+            )
+            lease.charge(rows_count)
+        except ExecutorBusyError:
+            logger.warning("Batch rejected: database executor queue is full")
+            raise
+        except Exception as e:
+            logger.error(f"Consistent batch failed: {e}")
+            bodies = [(False, _batch_error_body(_batch_error_text(e), start_time))] * len(runnable)
+        for index, body in zip(runnable, bodies):
+            results[index] = body
+
+    elif runnable:
+        scopes = {
+            index: lease.track(_query_scope(items[index].timeout or request.timeout))
+            for index in runnable
+        }
+        # Пакет занимает не больше batch_parallelism соединений одновременно
+        semaphore = asyncio.Semaphore(max(1, settings.batch_parallelism))
+
+        async def run_item(index: int) -> None:
+            item = items[index]
+            async with semaphore:
+                item_start = datetime.now()
+                statement = normalize_query(item.query)
+                params = tuple(item.params) if item.params else None
+                try:
+                    if item.page_size is not None or item.next_token is not None:
+                        rows_count, body, _ = await executor.run(
+                            _fetch_page_body,
+                            db,
+                            JSON_ENCODER,
+                            statement,
+                            params,
+                            item,
+                            item_start,
+                            limits,
+                            scopes[index],
+                        )
+                    else:
+                        rows_count, body, _ = await executor.run(
+                            _fetch_body,
+                            db,
+                            JSON_ENCODER,
+                            statement,
+                            params,
+                            item.format,
+                            item.layout,
+                            item_start,
+                            limits,
+                            scopes[index],
+                        )
+                except Exception as e:
+                    logger.warning(f"Batch query #{index} ({statement.fingerprint}) failed: {e}")
+                    results[index] = (False, _batch_error_body(_batch_error_text(e), item_start))
+                else:
+                    lease.charge(rows_count)
+                    results[index] = (True, body)
+
+        watcher = asyncio.create_task(_watch_disconnect(http_request, *scopes.values()))
+        try:
+            await asyncio.gather(*(run_item(index) for index in runnable))
+        finally:
+            watcher.cancel()
+
+    failed = sum(1 for ok, _ in results if not ok)
+    execution_time = (datetime.now() - start_time).total_seconds()
+    logger.info(f"Batch finished: {len(items)} queries, {failed} failed, {execution_time:.3f}s")
+
+    meta = {
+        "success": failed == 0,
+        "failed": failed,
+        "execution_time": execution_time,
+        "error": None,
+        "timestamp": datetime.now().isoformat(),
+    }
+    body = JSON_ENCODER.batch([body for _, body in results], meta)
+    return Response(content=body, media_type=JSON_ENCODER.content_type)
@@ -0,0 +1,104 @@
+"""
+Нормализация и fingerprint SQL запросов
+
+Запросы, отличающиеся только пробелами, комментариями или регистром ключевых
+слов и идентификаторов без кавычек, приводятся к одной канонической форме.
+Fingerprint канонической формы считается один раз на запрос и используется
+как часть ключа кеша, в логах и статистике.
+"""
+
+import hashlib
+import re
+from functools import lru_cache
+from typing import Any, Optional, Sequence
+
+# Один проход по тексту: литералы и идентификаторы в кавычках сохраняются как
+# есть, комментарии и пробелы схлопываются, остальное приводится к верхнему
+# регистру (идентификаторы без кавычек в Firebird регистронезависимы)
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<string>'(?:[^']|'')*')
+    | (?P<quoted>"(?:[^"]|"")*")
+    | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<space>\s+)
+    | (?P<word>[^'"\s/-]+)
+    | (?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Сколько различных текстов запросов помнить (повторная нормализация не нужна)
+NORMALIZE_CACHE_SIZE = 1024
+
+# Размер fingerprint в байтах (16 hex символов)
+FINGERPRINT_SIZE = 8
+
+
+def strip_comments(query: str) -> str:
+    """
+    Удалить SQL комментарии (-- и /* */), не трогая строковые литералы и
+    идентификаторы в кавычках. Комментарий заменяется пробелом.
+    """
+    parts = []
+    for match in _TOKEN_RE.finditer(query):
+        parts.append(" " if match.lastgroup == "comment" else match.group())
+    return "".join(parts)
+
+
+def _normalize(query: str) -> str:
+    parts = []
+    append = parts.append
+    pending_space = False
+
+    for match in _TOKEN_RE.finditer(query):
+        kind = match.lastgroup
+        if kind == "space" or kind == "comment":
+            pending_space = True
+            continue
+        if pending_space and parts:
+            append(" ")
+        pending_space = False
+        token = match.group()
+        append(token.upper() if kind == "word" else token)
+
+    # Завершающие ";" (и пробелы между ними) - одним срезом, без копирования
+    # строки на каждый символ
+    return "".join(parts).rstrip("; ")
+
+
+class NormalizedQuery:
+    """Запрос в канонической форме и ее fingerprint"""
+
+    __slots__ = ("text", "normalized", "fingerprint")
+
+    def __init__(self, text: str, normalized: str, fingerprint: str):
+        self.text = text
+        self.normalized = normalized
+        self.fingerprint = fingerprint
+
+    def cache_key(self, params: Optional[Sequence[Any]] = None) -> str:
+        """Ключ кеша: fingerprint запроса + хеш параметров"""
+        if not params:
+            return self.fingerprint
+        digest = hashlib.blake2b(repr(tuple(params)).encode("utf-8"), digest_size=FINGERPRINT_SIZE)
+        return f"{self.fingerprint}:{digest.hexdigest()}"
+
+    def __repr__(self) -> str:
+        return f"NormalizedQuery({self.fingerprint}, {self.normalized[:60]!r})"
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_query(query: str) -> NormalizedQuery:
+    """
+    Привести запрос к канонической форме и посчитать fingerprint.
+
+    Результат запоминается по тексту запроса, так что повторные запросы
+    дашбордов не сканируются заново.
+
+    Example:
+        >>> normalize_query("select *  from T -- x").normalized
+        'SELECT * FROM T'
+    """
+    normalized = _normalize(query)
+    digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=FINGERPRINT_SIZE)
+    return NormalizedQuery(query, normalized, digest.hexdigest())
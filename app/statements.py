@@ -0,0 +1,150 @@
+"""
+Кеш подготовленных запросов на соединении
+
+Firebird разбирает и оптимизирует запрос при каждом prepare. Для запросов,
+которые повторяются с разными параметрами, подготовленный запрос (fdb
+cursor.prep) хранится на долгоживущем соединении пула и выполняется повторно
+без разбора на сервере. Ключ - нормализованный текст запроса.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+from app.sql import NormalizedQuery
+
+logger = logging.getLogger(__name__)
+
+
+class StatementStats:
+    """Счетчики кешей подготовленных запросов всех соединений (потокобезопасно)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidated = 0
+        self.prepare_time = 0.0
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def record_prepare(self, elapsed: float, evicted: bool) -> None:
+        with self._lock:
+            self.misses += 1
+            self.prepare_time += elapsed
+            if evicted:
+                self.evictions += 1
+
+    def record_invalidated(self) -> None:
+        with self._lock:
+            self.invalidated += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            avg_prepare = self.prepare_time / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidated": self.invalidated,
+                "prepare_avg_ms": round(avg_prepare * 1000, 3),
+                # Оценка: каждое попадание экономит один prepare средней длительности
+                "prepare_saved_ms": round(avg_prepare * self.hits * 1000, 3),
+            }
+
+
+class StatementCache:
+    """
+    LRU подготовленных запросов одного соединения.
+
+    Все запросы готовятся на одном курсоре соединения: fdb выполняет
+    PreparedStatement только тем курсором, которым он создан. Закрытие курсора
+    и откат транзакции при возврате соединения в пул освобождают только
+    открытый результат, сам запрос остается подготовленным.
+
+    Соединение в каждый момент используется одним потоком, поэтому
+    собственной блокировки у кеша нет.
+    """
+
+    def __init__(self, conn: Any, capacity: int, stats: Optional[StatementStats] = None):
+        """
+        Args:
+            conn: Соединение fdb
+            capacity: Сколько подготовленных запросов держать на соединении
+            stats: Общие счетчики (по умолчанию - свои)
+        """
+        self.conn = conn
+        self.capacity = capacity
+        self.stats = stats if stats is not None else StatementStats()
+        self._cursor = None
+        self._statements: "OrderedDict[str, Any]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    def execute(self, statement: NormalizedQuery, params: Optional[Sequence] = None):
+        """
+        Выполнить запрос подготовленным (из кеша или подготовив заново).
+
+        Returns:
+            Курсор с результатом; его нужно закрыть (close) после чтения
+
+        Raises:
+            fdb.Error: Ошибка подготовки или выполнения; запрос удаляется из
+                кеша (например, после изменения метаданных)
+        """
+        if self._cursor is None:
+            self._cursor = self.conn.cursor()
+        cursor = self._cursor
+        key = statement.normalized
+
+        prepared = self._statements.get(key)
+        if prepared is not None:
+            self._statements.move_to_end(key)
+            self.stats.record_hit()
+        else:
+            start = time.perf_counter()
+            prepared = cursor.prep(statement.text)
+            elapsed = time.perf_counter() - start
+
+            self._statements[key] = prepared
+            evicted = len(self._statements) > self.capacity
+            if evicted:
+                _, old = self._statements.popitem(last=False)
+                self._drop(old)
+            self.stats.record_prepare(elapsed, evicted)
+
+        try:
+            if params:
+                cursor.execute(prepared, params)
+            else:
+                cursor.execute(prepared)
+        except Exception:
+            if self._statements.pop(key, None) is not None:
+                self._drop(prepared)
+                self.stats.record_invalidated()
+            raise
+        return cursor
+
+    def clear(self) -> None:
+        """Освободить все подготовленные запросы соединения"""
+        statements = list(self._statements.values())
+        self._statements.clear()
+        for prepared in statements:
+            self._drop(prepared)
+
+    @staticmethod
+    def _drop(prepared: Any) -> None:
+        # fdb освобождает handle запроса при сборке PreparedStatement;
+        # close() здесь закрывает открытый результат, если он есть
+        try:
+            prepared.close()
+        except Exception as e:
+            logger.debug(f"Error closing prepared statement: {e}")
@@ -0,0 +1,71 @@
+"""
+Локальные файлы состояния (SQLite кеш, лимиты запросов)
+
+Файлы, общие для worker-процессов прокси, должны быть доступны только
+пользователю прокси: иначе другой локальный пользователь может подменить
+содержимое кеша или сбросить лимиты. По умолчанию файлы создаются в личной
+директории пользователя ($XDG_CACHE_HOME или ~/.cache); файл или директория,
+которыми владеет другой пользователь или в которые могут писать другие,
+отвергаются.
+"""
+
+import os
+import stat
+import tempfile
+
+APP_DIR = "firebird-db-proxy"
+
+
+def _check_owner(path: str, st: os.stat_result, kind: str) -> None:
+    """Владелец - этот пользователь (для директорий - или root), запись - только ему"""
+    if not hasattr(os, "getuid"):  # pragma: no cover - Windows: права не POSIX
+        return
+    uid = os.getuid()
+    owners = (uid, 0) if kind == "directory" else (uid,)
+    if st.st_uid not in owners:
+        raise PermissionError(f"State {kind} {path} is owned by another user (uid {st.st_uid})")
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"State {kind} {path} is writable by other users")
+
+
+def state_path(filename: str) -> str:
+    """
+    Путь к файлу состояния по умолчанию: в личной директории кеша
+    пользователя, если ее нельзя создать - в директории пользователя внутри
+    временной.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    directory = os.path.join(base, APP_DIR)
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    except OSError:
+        suffix = f"-{os.getuid()}" if hasattr(os, "getuid") else ""
+        directory = os.path.join(tempfile.gettempdir(), APP_DIR + suffix)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def open_private_file(path: str) -> None:
+    """
+    Создать файл состояния с правами владельца или проверить существующий.
+
+    Raises:
+        PermissionError: Файл или его директория принадлежат другому
+            пользователю или доступны другим на запись; файл - не обычный
+            файл (например, символическая ссылка)
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    _check_owner(directory, os.stat(directory), "directory")
+
+    flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0)
+    try:
+        fd = os.open(path, flags, 0o600)
+    except OSError as e:
+        raise PermissionError(f"Cannot open state file {path}: {e}") from e
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            raise PermissionError(f"State file {path} is not a regular file")
+        _check_owner(path, st, "file")
+    finally:
+        os.close(fd)
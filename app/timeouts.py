@@ -0,0 +1,314 @@
+"""
+Таймауты запросов с отменой на сервере
+
+Запрос, превысивший таймаут или брошенный клиентом, прерывается на сервере
+Firebird, а не только перестает ожидаться: иначе он держит соединение пула
+и поток executor'а, пока сервер его не досчитает.
+
+- Firebird 4+: перед выполнением на соединении выставляется
+  SET STATEMENT TIMEOUT, и сервер прерывает запрос сам.
+- Любая версия: сторожевой поток по дедлайну вызывает fb_cancel_operation
+  для соединения, на котором выполняется запрос (для Firebird 4+ - с запасом,
+  как страховка).
+
+Отключение клиента отменяет запрос тем же fb_cancel_operation. Прерванный
+запрос завершается ошибкой fdb, которая превращается в QueryTimeoutError
+или QueryCancelledError; соединение после ошибки возвращается в пул через
+rollback и проверку пингом.
+"""
+
+import ctypes
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import fdb
+from fdb import ibase
+
+logger = logging.getLogger(__name__)
+
+# Причины прерывания запроса
+TIMEOUT = "timeout"
+DISCONNECT = "client disconnected"
+
+# Насколько позже дедлайна сторож страхует серверный STATEMENT TIMEOUT
+# (таймаут на сервере выставляется с округлением до секунды вверх)
+SERVER_TIMEOUT_GRACE = 2.0
+
+
+class QueryInterruptedError(Exception):
+    """Запрос прерван до завершения"""
+
+
+class QueryTimeoutError(QueryInterruptedError):
+    """Запрос прерван по таймауту"""
+
+
+class QueryCancelledError(QueryInterruptedError):
+    """Запрос отменен: клиент отключился"""
+
+
+def cancel_operation(conn: Any) -> None:
+    """
+    Прервать операцию, выполняющуюся на соединении fdb (из другого потока).
+
+    fb_cancel_operation(fb_cancel_raise): выполняющийся запрос завершается
+    ошибкой, соединение остается рабочим. fdb 2.0 не оборачивает эту функцию
+    клиентской библиотеки, поэтому она вызывается через ctypes.
+    """
+    api = fdb.fbcore.api
+    func = api.client_library.fb_cancel_operation
+    func.restype = ibase.ISC_STATUS
+    func.argtypes = [
+        ctypes.POINTER(ibase.ISC_STATUS),
+        ctypes.POINTER(ibase.isc_db_handle),
+        ctypes.c_ushort,
+    ]
+    status = ibase.ISC_STATUS_ARRAY()
+    func(status, conn._db_handle, ibase.fb_cancel_raise)
+    if fdb.fbcore.db_api_error(status):
+        raise fdb.fbcore.exception_from_status(
+            fdb.DatabaseError, status, "Error while cancelling operation:"
+        )
+
+
+class CancelScope:
+    """
+    Дедлайн и отмена одного запроса.
+
+    Создается на запрос (в том числе до того, как он получил соединение);
+    на время выполнения к нему привязывается соединение, чтобы отмену можно
+    было передать серверу из другого потока. Заодно в нем копится время,
+    которое запрос провел на сервере (db_seconds, для лимитов токена).
+    """
+
+    def __init__(self, timeout: float = 0.0):
+        """
+        Args:
+            timeout: Таймаут в секундах от создания (0 - без таймаута)
+        """
+        self.timeout = timeout
+        self.deadline: Optional[float] = time.monotonic() + timeout if timeout > 0 else None
+        self.reason: Optional[str] = None
+        self.db_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn: Any = None
+        self._cancel: Optional[Callable[[Any], None]] = None
+
+    def remaining(self) -> Optional[float]:
+        """Секунд до дедлайна (None - без таймаута)"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        """Запрос выполняется на соединении"""
+        return self._conn is not None
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    @property
+    def interrupted(self) -> bool:
+        """Запрос отменен или вышел за дедлайн"""
+        return self.reason is not None or self.expired()
+
+    def cancel(self, reason: str = DISCONNECT) -> None:
+        """
+        Отменить запрос: если он уже выполняется - прервать на сервере,
+        иначе он не начнется.
+        """
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            if self._conn is None:
+                return
+            try:
+                self._cancel(self._conn)
+            except Exception as e:
+                # Например, запрос успел завершиться ("nothing to cancel")
+                logger.debug(f"Cancel operation failed: {e}")
+        logger.info(f"Query cancelled on server: {reason}")
+
+    def attach(self, conn: Any, cancel: Callable[[Any], None]) -> None:
+        """
+        Привязать соединение, на котором начинается выполнение.
+
+        Raises:
+            QueryInterruptedError: Запрос уже отменен или дедлайн прошел
+        """
+        with self._lock:
+            if self.interrupted:
+                raise self.error()
+            self._conn = conn
+            self._cancel = cancel
+
+    def detach(self) -> None:
+        with self._lock:
+            self._conn = None
+            self._cancel = None
+
+    def add_db_time(self, seconds: float) -> None:
+        """Учесть время выполнения и чтения результата на сервере"""
+        with self._lock:
+            self.db_seconds += seconds
+
+    def error(self) -> QueryInterruptedError:
+        """Исключение, соответствующее причине прерывания"""
+        if self.reason == DISCONNECT:
+            return QueryCancelledError("Query cancelled: client disconnected")
+        return QueryTimeoutError(f"Query timed out after {self.timeout:g}s")
+
+
+class StatementTimeout:
+    """
+    SET STATEMENT TIMEOUT на соединении Firebird 4+.
+
+    Таймаут - свойство сессии, поэтому выставленное значение запоминается и
+    команда отправляется, только когда оно меняется.
+    """
+
+    def __init__(self, conn: Any):
+        self.conn = conn
+        self.supported = getattr(conn, "engine_version", 0.0) >= 4.0
+        self.current = 0
+
+    def apply(self, scope: CancelScope) -> bool:
+        """
+        Выставить таймаут по оставшемуся времени запроса.
+
+        Returns:
+            bool: Таймаут соблюдает сервер
+        """
+        if not self.supported:
+            return False
+        remaining = scope.remaining()
+        seconds = max(1, math.ceil(remaining)) if remaining is not None else 0
+        if seconds == self.current:
+            return seconds > 0
+        try:
+            self.conn.execute_immediate(f"SET STATEMENT TIMEOUT {seconds} SECOND")
+        except fdb.Error as e:
+            logger.warning(f"SET STATEMENT TIMEOUT failed, falling back to watchdog: {e}")
+            self.supported = False
+            return False
+        self.current = seconds
+        return seconds > 0
+
+
+class QueryWatchdog:
+    """
+    Сторож дедлайнов: один фоновый поток отменяет запросы, вышедшие за
+    таймаут. Поток запускается при первом запросе с таймаутом.
+    """
+
+    def __init__(self, cancel: Callable[[Any], None] = cancel_operation):
+        """
+        Args:
+            cancel: Функция, прерывающая операцию на соединении
+        """
+        self.cancel = cancel
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._heap: List[Tuple[float, int, CancelScope]] = []
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        self._watched = 0
+        self._fired = 0
+        self._timed_out = 0
+        self._cancelled = 0
+
+    @contextmanager
+    def guard(self, scope: CancelScope, conn: Any, grace: float = 0.0):
+        """
+        Выполнение запроса на conn под scope.
+
+        По дедлайну (+ grace) запрос прерывается на сервере. Ошибка fdb
+        прерванного запроса пробрасывается как QueryTimeoutError или
+        QueryCancelledError.
+
+        Args:
+            scope: Дедлайн и отмена запроса
+            conn: Соединение, на котором выполняется запрос
+            grace: Запас после дедлайна (если таймаут соблюдает сервер)
+        """
+        scope.attach(conn, self.cancel)
+        if scope.deadline is not None:
+            self._schedule(scope.deadline + grace, scope)
+        try:
+            yield
+        except Exception as e:
+            if not scope.interrupted:
+                raise
+            with self._lock:
+                if scope.reason == DISCONNECT:
+                    self._cancelled += 1
+                else:
+                    self._timed_out += 1
+            raise scope.error() from e
+        finally:
+            scope.detach()
+
+    def _schedule(self, when: float, scope: CancelScope) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            heapq.heappush(self._heap, (when, next(self._seq), scope))
+            self._watched += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="query-watchdog", daemon=True
+                )
+                self._thread.start()
+            elif self._heap[0][2] is scope:
+                self._wakeup.notify()
+
+    def _loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._closed:
+                    if self._heap:
+                        delay = self._heap[0][0] - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._wakeup.wait(delay)
+                    else:
+                        self._wakeup.wait()
+                if self._closed:
+                    return
+                _, _, scope = heapq.heappop(self._heap)
+
+            # Записи завершившихся запросов просто отбрасываются
+            if scope.running and scope.reason is None:
+                scope.cancel(TIMEOUT)
+                with self._lock:
+                    self._fired += 1
+
+    def close(self) -> None:
+        """Остановить поток сторожа"""
+        with self._lock:
+            self._closed = True
+            self._heap.clear()
+            thread, self._thread = self._thread, None
+            self._wakeup.notify()
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "watched": self._watched,
+                "pending": len(self._heap),
+                "fired": self._fired,
+                "timed_out": self._timed_out,
+                "cancelled": self._cancelled,
+            }
@@ -0,0 +1,326 @@
+"""
+Реестр API токенов с политиками
+
+Реестр строится один раз при старте из API_TOKENS (с лимитами из
+QUERY_TOKEN_LIMITS) и файла API_TOKENS_FILE. Токены хранятся только в виде
+SHA-256: проверка - хеш предъявленного токена и поиск в dict, поэтому время
+не зависит ни от числа токенов, ни от того, сколько символов совпало.
+
+Файл токенов перечитывается без перезапуска: не чаще раза в
+reload_interval секунд проверяется время его изменения. Записи проверяются
+моделью TokenEntry (типы и диапазоны значений); файл с ошибкой не
+применяется - продолжает действовать прежний набор токенов.
+
+Формат файла (JSON):
+
+    {
+      "tokens": [
+        {"token": "pos-001-secret", "name": "pos-001", "max_rows": 5000},
+        {"sha256": "9f86d081884c7d65...", "name": "reports",
+         "rate_limit_per_minute": 600, "cache_ttl": 30, "databases": ["shop.fdb"]}
+      ]
+    }
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator
+
+logger = logging.getLogger(__name__)
+
+# Поля политики, которые можно задать в файле токенов
+POLICY_FIELDS = (
+    "name",
+    "max_rows",
+    "max_bytes",
+    "cache_ttl",
+    "databases",
+    "rate_limit_per_minute",
+    "rate_limit_per_hour",
+    "rate_limit_concurrent",
+    "rate_limit_rows_per_window",
+    "rate_limit_db_seconds_per_window",
+)
+
+
+class TokenRegistryError(ValueError):
+    """Файл токенов не разобран"""
+
+
+def hash_token(token: str) -> str:
+    """SHA-256 токена (hex) - ключ реестра и лимитов"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenPolicy:
+    """
+    Настройки одного токена. None (0 для лимитов результата) - общее
+    значение из настроек сервера.
+    """
+
+    __slots__ = POLICY_FIELDS
+
+    def __init__(
+        self,
+        name: str = "",
+        max_rows: int = 0,
+        max_bytes: int = 0,
+        cache_ttl: Optional[float] = None,
+        databases: Optional[Iterable[str]] = None,
+        rate_limit_per_minute: Optional[int] = None,
+        rate_limit_per_hour: Optional[int] = None,
+        rate_limit_concurrent: Optional[int] = None,
+        rate_limit_rows_per_window: Optional[int] = None,
+        rate_limit_db_seconds_per_window: Optional[float] = None,
+    ):
+        """
+        Args:
+            name: Имя токена для логов
+            max_rows / max_bytes: Лимиты результата
+            cache_ttl: Время жизни результатов этого токена в кеше
+            databases: Базы, к которым токен допущен (None - любые)
+            rate_limit_*: Лимиты запросов (см. RATE_LIMIT_*)
+        """
+        self.name = name
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.cache_ttl = cache_ttl
+        self.databases = frozenset(databases) if databases is not None else None
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self.rate_limit_per_hour = rate_limit_per_hour
+        self.rate_limit_concurrent = rate_limit_concurrent
+        self.rate_limit_rows_per_window = rate_limit_rows_per_window
+        self.rate_limit_db_seconds_per_window = rate_limit_db_seconds_per_window
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{field}={getattr(self, field)!r}"
+            for field in POLICY_FIELDS
+            if getattr(self, field) not in (None, 0, "")
+        )
+        return f"TokenPolicy({fields})"
+
+    def allows_database(self, database: str) -> bool:
+        return self.databases is None or database in self.databases
+
+
+class TokenEntry(BaseModel):
+    """Запись файла токенов: токен (или его SHA-256) и поля политики"""
+
+    # Без приведения типов: "100" или true вместо числа - ошибка файла
+    model_config = ConfigDict(extra="forbid", strict=True)
+
+    token: Optional[str] = None
+    sha256: Optional[str] = Field(default=None, pattern=r"^[0-9a-fA-F]{64}$")
+    name: str = ""
+    max_rows: int = Field(default=0, ge=0)
+    max_bytes: int = Field(default=0, ge=0)
+    cache_ttl: Optional[float] = Field(default=None, ge=0)
+    databases: Optional[List[str]] = None
+    rate_limit_per_minute: Optional[int] = Field(default=None, ge=0)
+    rate_limit_per_hour: Optional[int] = Field(default=None, ge=0)
+    rate_limit_concurrent: Optional[int] = Field(default=None, ge=0)
+    rate_limit_rows_per_window: Optional[int] = Field(default=None, ge=0)
+    rate_limit_db_seconds_per_window: Optional[float] = Field(default=None, ge=0)
+
+    @model_validator(mode="after")
+    def _one_token(self) -> "TokenEntry":
+        if bool(self.token) == bool(self.sha256):
+            raise ValueError("needs exactly one of 'token', 'sha256'")
+        return self
+
+    @property
+    def key(self) -> str:
+        """Ключ реестра - SHA-256 токена"""
+        return hash_token(self.token) if self.token else self.sha256.lower()
+
+    def policy(self) -> TokenPolicy:
+        return TokenPolicy(**self.model_dump(include=set(POLICY_FIELDS)))
+
+
+def _describe(error: ValidationError) -> str:
+    """Ошибки записи одной строкой: "max_rows: Input should be ..." """
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'entry'}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+class AuthenticatedToken:
+    """Проверенный токен запроса вместе с его политикой"""
+
+    __slots__ = ("token", "key", "policy")
+
+    def __init__(self, token: str, key: str, policy: TokenPolicy):
+        self.token = token
+        # SHA-256 токена - ключ состояния лимитов
+        self.key = key
+        self.policy = policy
+
+    @property
+    def label(self) -> str:
+        """Токен в логах: имя из политики или первые 10 символов"""
+        return self.policy.name or f"{self.token[:10]}..."
+
+
+def _parse_file(path: str) -> Dict[str, TokenPolicy]:
+    """
+    Разобрать файл токенов.
+
+    Raises:
+        TokenRegistryError: Файл не читается или записи неверны
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise TokenRegistryError(f"Cannot read token file {path}: {e}")
+
+    entries = data.get("tokens") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        raise TokenRegistryError(f'Token file {path}: expected {{"tokens": [...]}}')
+
+    policies: Dict[str, TokenPolicy] = {}
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise TokenRegistryError(f"Token file {path}: entry #{index} is not an object")
+        try:
+            parsed = TokenEntry.model_validate(entry)
+        except ValidationError as e:
+            label = f" ({entry['name']})" if isinstance(entry.get("name"), str) else ""
+            raise TokenRegistryError(f"Token file {path}: entry #{index}{label}: {_describe(e)}")
+        policies[parsed.key] = parsed.policy()
+    return policies
+
+
+class TokenRegistry:
+    """
+    Допущенные токены: {SHA-256 токена: TokenPolicy}.
+
+    Example:
+        registry = TokenRegistry(["token-1"], path="/etc/proxy/tokens.json")
+        auth = registry.lookup("token-1")   # None - токен неизвестен
+    """
+
+    def __init__(
+        self,
+        tokens: Iterable[str] = (),
+        limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        path: str = "",
+        reload_interval: float = 5.0,
+    ):
+        """
+        Args:
+            tokens: Токены из настроек (политика по умолчанию)
+            limits: Лимиты результата токенов из настроек {token: (max_rows, max_bytes)}
+            path: Файл токенов (пусто - только tokens)
+            reload_interval: Как часто проверять изменение файла, секунд (0 - не перечитывать)
+        """
+        limits = limits or {}
+        self._static: Dict[str, TokenPolicy] = {}
+        for token in tokens:
+            max_rows, max_bytes = limits.get(token, (0, 0))
+            self._static[hash_token(token)] = TokenPolicy(max_rows=max_rows, max_bytes=max_bytes)
+        self.path = path
+        self.reload_interval = reload_interval
+
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._reloads = 0
+        self._errors = 0
+        self._entries: Dict[str, TokenPolicy] = dict(self._static)
+        if path:
+            self.reload()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self) -> bool:
+        """
+        Перечитать файл токенов.
+
+        Returns:
+            bool: Набор токенов обновлен (False - файл с ошибкой, действует прежний)
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._file_signature()
+            try:
+                policies = _parse_file(self.path)
+            except TokenRegistryError as e:
+                self._errors += 1
+                self._signature = signature
+                logger.error(f"{e}; keeping {len(self._entries)} previously loaded tokens")
+                return False
+            entries = dict(self._static)
+            entries.update(policies)
+            # Замена ссылки атомарна: lookup без блокировки видит старый или новый dict
+            self._entries = entries
+            self._signature = signature
+            self._reloads += 1
+        logger.info(f"Token registry loaded: {len(entries)} tokens ({self.path})")
+        return True
+
+    def _maybe_reload(self) -> None:
+        if not self.path or self.reload_interval <= 0:
+            return
+        if time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = time.monotonic()
+            changed = self._file_signature() != self._signature
+        if changed:
+            self.reload()
+
+    def lookup(self, token: str) -> Optional[AuthenticatedToken]:
+        """
+        Найти токен.
+
+        Returns:
+            Optional[AuthenticatedToken]: Токен с политикой (None - не допущен)
+        """
+        if not token:
+            return None
+        self._maybe_reload()
+        key = hash_token(token)
+        policy = self._entries.get(key)
+        if policy is None:
+            return None
+        return AuthenticatedToken(token, key, policy)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tokens": len(self._entries),
+                "file": self.path or None,
+                "reloads": self._reloads,
+                "errors": self._errors,
+            }
+
+
+def create_token_registry(config) -> TokenRegistry:
+    """Реестр токенов по настройкам (api_tokens, query_token_limits, api_tokens_file)"""
+    registry = TokenRegistry(
+        config.get_api_tokens(),
+        limits=config.get_token_limits(),
+        path=config.api_tokens_file,
+        reload_interval=config.api_tokens_reload_interval,
+    )
+    logger.info(f"Token registry: {len(registry)} tokens")
+    return registry
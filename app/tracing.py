@@ -0,0 +1,356 @@
+"""
+Трассировка запросов по фазам и заголовок Server-Timing
+
+TracingMiddleware заводит на каждый HTTP запрос трассу (Trace) в contextvar;
+код по пути запроса отмечает фазы через span("execute") или record(...):
+проверка токена, валидация SQL, ожидание потока executor'а, получение
+соединения, выполнение, чтение строк, преобразование и кодирование.
+Контекст переносится в потоки executor'а (DBExecutor.run), поэтому фазы,
+выполненные в них, попадают в ту же трассу.
+
+Итог по фазам отдается в заголовке Server-Timing каждого ответа (время
+в миллисекундах). Для потоковых ответов заголовок содержит только фазы до
+начала выдачи. С TRACE_EXPORT_FILE трассы пишутся в файл в формате
+OpenTelemetry (OTLP JSON, по объекту ExportTraceServiceRequest на строку) -
+его читает, например, filelog/otlpjsonfile receiver OpenTelemetry Collector.
+
+Без трассы (вне HTTP запроса, TRACING_ENABLED=false) span() ничего не делает.
+
+Example:
+    with span("fetch") as attributes:
+        rows = cursor.fetchall()
+        attributes["rows"] = len(rows)
+"""
+
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING_HEADER = "server-timing"
+
+# Имя итоговой фазы в Server-Timing: весь запрос до отправки заголовков
+TOTAL_PHASE = "total"
+
+# Трасс, ожидающих записи в файл; сверх - отбрасываются
+EXPORT_QUEUE_SIZE = 10000
+
+# W3C traceparent: версия-trace_id-parent_id-флаги
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# OTLP: SPAN_KIND_INTERNAL / SPAN_KIND_SERVER, STATUS_CODE_ERROR
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_CODE_ERROR = 2
+
+# Фаза: (имя, начало и конец в perf_counter_ns, атрибуты, с ошибкой ли)
+Span = Tuple[str, int, int, Dict[str, Any], bool]
+
+
+class Trace:
+    """Фазы одного HTTP запроса"""
+
+    __slots__ = ("trace_id", "parent_id", "started", "started_unix", "spans")
+
+    def __init__(self, trace_id: Optional[str] = None, parent_id: Optional[str] = None):
+        self.trace_id = trace_id or f"{random.getrandbits(128):032x}"
+        self.parent_id = parent_id
+        self.started = time.perf_counter_ns()
+        self.started_unix = time.time_ns()
+        self.spans: List[Span] = []
+
+    def add(
+        self,
+        name: str,
+        started: int,
+        ended: int,
+        attributes: Optional[Dict[str, Any]] = None,
+        failed: bool = False,
+    ) -> None:
+        # list.append атомарен: фазы пишутся из разных потоков без блокировки
+        self.spans.append((name, started, ended, attributes or {}, failed))
+
+    def phases(self) -> Dict[str, float]:
+        """Длительность фаз в мс (повторы одной фазы складываются) в порядке начала"""
+        totals: Dict[str, float] = {}
+        for name, started, ended, _, _ in sorted(list(self.spans), key=lambda s: s[1]):
+            totals[name] = totals.get(name, 0.0) + (ended - started) / 1e6
+        return totals
+
+    def server_timing(self, ended: Optional[int] = None) -> str:
+        """Значение заголовка Server-Timing"""
+        if ended is None:
+            ended = time.perf_counter_ns()
+        phases = self.phases()
+        phases[TOTAL_PHASE] = (ended - self.started) / 1e6
+        return ", ".join(f"{name};dur={ms:.2f}" for name, ms in phases.items())
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    """Трасса текущего HTTP запроса (None вне запроса или без трассировки)"""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Отметить фазу запроса.
+
+    Yields:
+        Dict: Атрибуты фазы (можно дополнить внутри блока)
+    """
+    trace = _current.get()
+    if trace is None:
+        yield attributes
+        return
+    started = time.perf_counter_ns()
+    try:
+        yield attributes
+    except BaseException:
+        trace.add(name, started, time.perf_counter_ns(), attributes, failed=True)
+        raise
+    trace.add(name, started, time.perf_counter_ns(), attributes)
+
+
+def record(name: str, started: int, **attributes: Any) -> None:
+    """
+    Отметить фазу, начатую в started (perf_counter_ns) и закончившуюся сейчас.
+
+    Для фаз, которые нельзя обернуть в span(): например, получение соединения
+    внутри context manager'а, который затем отдает его через yield.
+    """
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, started, time.perf_counter_ns(), attributes)
+
+
+# ==================== EXPORT ====================
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _span_id() -> str:
+    return f"{random.getrandbits(64) or 1:016x}"
+
+
+def otlp_spans(trace: Trace, name: str, ended: int, attributes: Dict[str, Any], failed: bool):
+    """
+    Трасса в виде span'ов OTLP JSON: корневой span запроса (SERVER) и по
+    span'у на каждую фазу (INTERNAL) с корневым в качестве родителя.
+    """
+
+    def unix(moment: int) -> str:
+        return str(trace.started_unix + moment - trace.started)
+
+    root_id = _span_id()
+    root = {
+        "traceId": trace.trace_id,
+        "spanId": root_id,
+        "name": name,
+        "kind": SPAN_KIND_SERVER,
+        "startTimeUnixNano": unix(trace.started),
+        "endTimeUnixNano": unix(ended),
+        "attributes": [_attribute(key, value) for key, value in attributes.items()],
+        "status": {"code": STATUS_CODE_ERROR} if failed else {},
+    }
+    if trace.parent_id:
+        root["parentSpanId"] = trace.parent_id
+
+    spans = [root]
+    for phase, started, finished, phase_attributes, phase_failed in list(trace.spans):
+        spans.append(
+            {
+                "traceId": trace.trace_id,
+                "spanId": _span_id(),
+                "parentSpanId": root_id,
+                "name": phase,
+                "kind": SPAN_KIND_INTERNAL,
+                "startTimeUnixNano": unix(started),
+                "endTimeUnixNano": unix(finished),
+                "attributes": [_attribute(key, value) for key, value in phase_attributes.items()],
+                "status": {"code": STATUS_CODE_ERROR} if phase_failed else {},
+            }
+        )
+    return spans
+
+
+class FileSpanExporter:
+    """
+    Запись трасс в файл в формате OTLP JSON (JSON Lines).
+
+    Трассы ставятся в очередь на пути запроса, а сериализуются и пишутся
+    фоновым потоком; при переполнении очереди новые трассы отбрасываются.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        service_name: str = "firebird-db-proxy",
+        service_version: str = "",
+        queue_size: int = EXPORT_QUEUE_SIZE,
+    ):
+        self.path = path
+        self.resource = {
+            "attributes": [
+                _attribute("service.name", service_name),
+                _attribute("service.version", service_version),
+            ]
+        }
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._exported = 0
+        self._dropped = 0
+
+    def export(self, trace: Trace, name: str, ended: int, attributes: Dict[str, Any], failed: bool):
+        """Поставить трассу в очередь на запись"""
+        try:
+            self._queue.put_nowait((trace, name, ended, attributes, failed))
+        except queue.Full:
+            self._dropped += 1
+
+    def start(self) -> None:
+        """Запустить поток записи"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="trace-export", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        """Дописать очередь и остановить поток записи"""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=5)
+
+    def encode(self, items: List[tuple]) -> bytes:
+        """Строка файла: ExportTraceServiceRequest с трассами items"""
+        spans = [span for item in items for span in otlp_spans(*item)]
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": self.resource,
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+                }
+            ]
+        }
+        return json.dumps(request, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    def _loop(self) -> None:
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            # Все, что накопилось, - одной строкой и одной записью в файл
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = None in items
+            items = [item for item in items if item is not None]
+            if not items:
+                continue
+            try:
+                with open(self.path, "ab") as f:
+                    f.write(self.encode(items))
+                self._exported += len(items)
+            except OSError as e:
+                self._dropped += len(items)
+                logger.error(f"Trace export to {self.path} failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "queued": self._queue.qsize(),
+            "exported": self._exported,
+            "dropped": self._dropped,
+        }
+
+
+def create_span_exporter(config) -> Optional[FileSpanExporter]:
+    """Экспорт трасс по настройкам (None - TRACE_EXPORT_FILE не задан)"""
+    if not config.tracing_enabled or not config.trace_export_file:
+        return None
+    return FileSpanExporter(config.trace_export_file, service_version=config.app_version)
+
+
+# Глобальный экспорт трасс (запускается в lifespan приложения)
+span_exporter = create_span_exporter(settings)
+
+
+class TracingMiddleware:
+    """
+    Трасса на каждый HTTP запрос и заголовок Server-Timing в ответе.
+
+    Имя корневого span'а - метод и шаблон пути маршрута (POST /api/query).
+    Входящий W3C traceparent продолжает трассу клиента.
+    """
+
+    def __init__(self, app, exporter: Optional[FileSpanExporter] = None):
+        self.app = app
+        self.exporter = exporter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.tracing_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = parent_id = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                match = TRACEPARENT.match(value.decode("latin-1").strip().lower())
+                if match:
+                    trace_id, parent_id = match.groups()
+                break
+
+        trace = Trace(trace_id, parent_id)
+        token = _current.set(trace)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((SERVER_TIMING_HEADER.encode(), trace.server_timing().encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if self.exporter is not None:
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                attributes = {
+                    "http.request.method": scope["method"],
+                    "http.route": route,
+                    "url.path": scope["path"],
+                    "http.response.status_code": status,
+                }
+                self.exporter.export(
+                    trace,
+                    f"{scope['method']} {route}",
+                    time.perf_counter_ns(),
+                    attributes,
+                    status >= 500,
+                )
@@ -5,23 +5,97 @@
 
 import re
 import logging
+from functools import lru_cache
 from typing import Tuple
 
+from app.sql import normalize_query
+
 logger = logging.getLogger(__name__)
 
-# Запрещенные SQL операции (регулярные выражения)
-FORBIDDEN_PATTERNS = [
-    r"\b(INSERT|UPDATE|DELETE|DROP|ALTER|TRUNCATE|CREATE|GRANT|REVOKE)\b",
-    r"\b(EXECUTE\s+BLOCK)\b",
-    r"\b(EXECUTE\s+PROCEDURE)\b",
-    r";.*;\s*",  # Множественные запросы через точку с запятой
-]
+# Запрещенные SQL операции (ключевые слова вне литералов и комментариев)
+FORBIDDEN_KEYWORDS = frozenset(
+    {"INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "TRUNCATE", "CREATE", "GRANT", "REVOKE"}
+)
+
+# Запрещенные продолжения EXECUTE (EXECUTE BLOCK, EXECUTE PROCEDURE)
+FORBIDDEN_EXECUTE = frozenset({"BLOCK", "PROCEDURE"})
+
+# Разрешенное первое ключевое слово запроса
+ALLOWED_STATEMENTS = frozenset({"SELECT", "WITH"})
+
+# Сколько вердиктов по различным запросам помнить
+VALIDATION_CACHE_SIZE = 1024
+
+# Один линейный проход: строковые литералы, идентификаторы в кавычках и
+# комментарии пропускаются целиком, классифицируются только слова и ";".
+# Альтернативы внутри литералов не пересекаются, поэтому откатов нет:
+# незакрытая кавычка стоит не больше одного прохода до конца текста.
+_TOKEN_RE = re.compile(
+    r"""
+      '(?:[^']|'')*'
+    | "(?:[^"]|"")*"
+    | --[^\n]*
+    | /\*.*?(?:\*/|\Z)
+    | (?P<word>[\w$]+)
+    | (?P<semicolon>;)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def _classify(normalized: str) -> Tuple[bool, str]:
+    """Вердикт по нормализованному тексту запроса (см. app.sql.normalize_query)"""
+    if not normalized:
+        return False, "Empty query not allowed"
+
+    # Запрещенные операции важнее типа запроса: "EXECUTE BLOCK" - это
+    # "Forbidden operation", а не "Only SELECT", поэтому тип проверяется в конце
+    first = True
+    allowed_statement = False
+    previous = None
+    terminated = False
+
+    for match in _TOKEN_RE.finditer(normalized):
+        kind = match.lastgroup
+        if kind is None:
+            # Литерал или комментарий
+            if terminated:
+                return False, "Forbidden operation detected: multiple statements"
+            first = False
+            continue
+
+        if kind == "semicolon":
+            terminated = True
+            continue
+        if terminated:
+            return False, "Forbidden operation detected: multiple statements"
+
+        # Нормализованный текст уже в верхнем регистре
+        word = match.group()
+        if word in FORBIDDEN_KEYWORDS:
+            return False, f"Forbidden operation detected: {word}"
+        if previous == "EXECUTE" and word in FORBIDDEN_EXECUTE:
+            return False, f"Forbidden operation detected: EXECUTE {word}"
+        if first:
+            allowed_statement = match.start() == 0 and word in ALLOWED_STATEMENTS
+            first = False
+        previous = word
+
+    if not allowed_statement:
+        return False, "Only SELECT and WITH queries are allowed"
+    return True, "OK"
 
 
 def validate_sql(query: str) -> Tuple[bool, str]:
     """
     Валидация SQL запроса на безопасность.
 
+    Запрос разбирается одним проходом по нормализованному тексту: ключевые
+    слова внутри строковых литералов, идентификаторов в кавычках и
+    комментариев не учитываются. Вердикт запоминается по нормализованному
+    тексту, так что повторный запрос не разбирается заново.
+
     Args:
         query: SQL запрос для валидации
 
@@ -36,30 +110,15 @@ def validate_sql(query: str) -> Tuple[bool, str]:
 
         >>> validate_sql("UPDATE STORGRP SET NAME = 'Test'")
         (False, "Forbidden operation detected: UPDATE")
+
+        >>> validate_sql("SELECT * FROM STORGRP WHERE NAME = 'DELETE'")
+        (True, "OK")
     """
     if not query or not query.strip():
         return False, "Empty query not allowed"
 
-    # Удалить SQL комментарии
-    # Однострочные комментарии: -- комментарий
-    query_clean = re.sub(r"--.*$", "", query, flags=re.MULTILINE)
-    # Многострочные комментарии: /* комментарий */
-    query_clean = re.sub(r"/\*.*?\*/", "", query_clean, flags=re.DOTALL)
-
-    # Проверка на запрещенные паттерны
-    for pattern in FORBIDDEN_PATTERNS:
-        match = re.search(pattern, query_clean, re.IGNORECASE)
-        if match:
-            forbidden_op = match.group(0)
-            error_msg = f"Forbidden operation detected: {forbidden_op}"
-            logger.warning(f"SQL validation failed: {error_msg}")
-            logger.debug(f"Blocked query: {query[:100]}...")
-            return False, error_msg
-
-    # Проверка что это SELECT или WITH запрос
-    query_stripped = query_clean.strip().upper()
-    if not (query_stripped.startswith("SELECT") or query_stripped.startswith("WITH")):
-        error_msg = "Only SELECT and WITH queries are allowed"
+    is_valid, error_msg = _classify(normalize_query(query).normalized)
+    if not is_valid:
         logger.warning(f"SQL validation failed: {error_msg}")
         logger.debug(f"Blocked query: {query[:100]}...")
         return False, error_msg
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк сериализации JSON ответа /api/query
+
+Сравнивает прежний путь (QueryResponse: валидация каждой строки pydantic +
+json.dumps, как делает FastAPI для response_model) с прямым кодированием
+JsonEncoder (orjson, если установлен) и с попаданием в кеш готового тела.
+Результаты синтетические, БД не нужна.
+
+Использование:
+    python scripts/benchmark_serialization.py
+    python scripts/benchmark_serialization.py --rows 10000 100000 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+# Добавить родительскую директорию в путь для импорта app модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.encoders import JSON_ENCODER, orjson
+from app.models import QueryResponse
+from app.results import QueryResult, describe_columns
+
+DESCRIPTION = [
+    ("ID", int, 11, 4, 0, 0, False),
+    ("NAME", str, 50, 200, 0, 0, True),
+    ("CITY", str, 30, 120, 0, 0, True),
+    ("PRICE", Decimal, 20, 8, 18, -2, True),
+    ("QTY", int, 11, 4, 0, 0, True),
+    ("CREATED", datetime, 22, 8, 0, 0, True),
+    ("DAY", date, 10, 4, 0, 0, True),
+]
+
+CITIES = ["Тбилиси", "Батуми", "Кутаиси", "Рустави", None]
+
+
+def make_result(rows: int) -> QueryResult:
+    """Синтетический результат из rows строк"""
+    start = datetime(2025, 1, 1, 8, 0, 0)
+    data = [
+        (
+            i,
+            f"Товар {i}",
+            CITIES[i % len(CITIES)],
+            Decimal(i % 1000) / 100,
+            i % 17,
+            start + timedelta(minutes=i),
+            (start + timedelta(days=i % 365)).date(),
+        )
+        for i in range(rows)
+    ]
+    return QueryResult(describe_columns(DESCRIPTION), data)
+
+
+def meta(rows: int) -> dict:
+    return {
+        "success": True,
+        "rows_count": rows,
+        "execution_time": 0.0,
+        "error": None,
+        "stale": False,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+def before(result: QueryResult) -> bytes:
+    """Прежний путь: dict-строки -> QueryResponse -> model_dump -> json.dumps"""
+    data = result.to_dicts()
+    response = QueryResponse(
+        success=True, data=data, rows_count=len(data), execution_time=0.0, timestamp=datetime.now()
+    )
+    content = response.model_dump(mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode(
+        "utf-8"
+    )
+
+
+def after(result: QueryResult) -> bytes:
+    """Новый путь без кеша: JsonEncoder по исходным строкам"""
+    return JSON_ENCODER.encode(result, meta(len(result)), "objects", "rows")
+
+
+def cached_hit(payload: bytes, rows: int) -> bytes:
+    """Попадание в кеш тела: только подстановка метаданных"""
+    return JSON_ENCODER.assemble(payload, meta(rows))
+
+
+def measure(func, *args, repeat: int) -> float:
+    """Лучшее время из repeat запусков, в миллисекундах"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сериализации JSON ответа /api/query")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"JSON encoder: {'orjson ' + orjson.__version__ if orjson else 'json (stdlib)'}")
+    print(
+        f"{'rows':>8}  {'before, ms':>11}  {'after, ms':>10}  {'cache hit, ms':>14}  {'speedup':>8}"
+    )
+
+    for rows in args.rows:
+        result = make_result(rows)
+        payload = JSON_ENCODER.encode_payload(result, "objects", "rows")
+
+        # Оба пути должны давать одинаковые данные
+        assert json.loads(before(result))["data"] == json.loads(after(result))["data"]
+
+        t_before = measure(before, result, repeat=args.repeat)
+        t_after = measure(after, result, repeat=args.repeat)
+        t_hit = measure(cached_hit, payload, rows, repeat=args.repeat)
+        print(
+            f"{rows:>8}  {t_before:>11.1f}  {t_after:>10.1f}  {t_hit:>14.2f}  "
+            f"{t_before / t_after:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
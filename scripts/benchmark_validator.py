@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк валидации SQL (app.validators.validate_sql)
+
+Сравнивает прежний валидатор (удаление комментариев + четыре re.search с
+IGNORECASE) с однопроходным токенизатором на обычных и патологических
+запросах длиной ~10 000 символов. Для нового валидатора показаны холодный
+разбор (кеш вердиктов и нормализации очищен) и повторный запрос.
+
+Использование:
+    python scripts/benchmark_validator.py
+    python scripts/benchmark_validator.py --size 100000
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+
+# Добавить родительскую директорию в путь для импорта app модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.sql import normalize_query, strip_comments
+from app.validators import _classify, validate_sql
+
+# Прежняя реализация - для сравнения
+OLD_PATTERNS = [
+    r"\b(INSERT|UPDATE|DELETE|DROP|ALTER|TRUNCATE|CREATE|GRANT|REVOKE)\b",
+    r"\b(EXECUTE\s+BLOCK)\b",
+    r"\b(EXECUTE\s+PROCEDURE)\b",
+    r";.*;\s*",
+]
+
+
+def old_validate_sql(query: str):
+    if not query or not query.strip():
+        return False, "Empty query not allowed"
+    query_clean = strip_comments(query)
+    for pattern in OLD_PATTERNS:
+        match = re.search(pattern, query_clean, re.IGNORECASE)
+        if match:
+            return False, f"Forbidden operation detected: {match.group(0)}"
+    query_stripped = query_clean.strip().upper()
+    if not (query_stripped.startswith("SELECT") or query_stripped.startswith("WITH")):
+        return False, "Only SELECT and WITH queries are allowed"
+    return True, "OK"
+
+
+def make_inputs(size: int):
+    """Запросы примерно из size символов: обычный и патологические"""
+    columns = ", ".join(f"T.COLUMN_{i}" for i in range(size // 12))
+    return {
+        "typical select": f"SELECT {columns} FROM T WHERE NAME = ? -- report",
+        "long literal": "SELECT * FROM T WHERE NOTE = '" + "x" * size + "'",
+        "unterminated quote": "SELECT " + "'" * (size | 1),
+        "semicolons": "SELECT 1 FROM T " + "; " * (size // 2),
+        "semicolon + spaces": "SELECT 1; " + " " * size + "x",
+        "open comments": "SELECT " + "/*" * (size // 2),
+        "many keywords in literals": "SELECT " + "'DELETE', " * (size // 10) + "1 FROM T",
+    }
+
+
+def measure(func, *args, repeat: int, reset=None) -> float:
+    """Лучшее время из repeat запусков, в миллисекундах"""
+    best = float("inf")
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def reset_memo():
+    normalize_query.cache_clear()
+    _classify.cache_clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк валидации SQL")
+    parser.add_argument("--size", type=int, default=10_000, help="Длина запроса в символах")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Отклоненные запросы пишут warning в лог - здесь это шум
+    logging.disable(logging.WARNING)
+
+    print(f"{'input':<28} {'chars':>7}  {'old, ms':>9}  {'new, ms':>9}  {'repeat, ms':>10}")
+    for name, query in make_inputs(args.size).items():
+        old = measure(old_validate_sql, query, repeat=args.repeat)
+        new = measure(validate_sql, query, repeat=args.repeat, reset=reset_memo)
+        validate_sql(query)
+        hit = measure(validate_sql, query, repeat=args.repeat)
+        print(f"{name:<28} {len(query):>7}  {old:>9.3f}  {new:>9.3f}  {hit:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@
     python scripts/generate_token.py --length 64
 """
 
+import hashlib
+import json
 import secrets
 import argparse
 
@@ -56,6 +58,12 @@ def main():
         print(f"{'='*60}")
         print(f"API_TOKENS={tokens[0]}")
 
+    print(f"\n{'='*60}")
+    print("Для API_TOKENS_FILE (в файле хранится только SHA-256 токена):")
+    print(f"{'='*60}")
+    for token in tokens:
+        print(json.dumps({"sha256": hashlib.sha256(token.encode("utf-8")).hexdigest()}))
+
     print(f"\n{'='*60}")
     print("⚠️  ВАЖНО: Сохраните токен в безопасном месте!")
     print("⚠️  Никогда не коммитьте токены в Git!")
@@ -14,9 +14,15 @@ os.environ["DB_USER"] = "SYSDBA"
 os.environ["DB_PASSWORD"] = "masterkey"
 os.environ["API_TOKENS"] = "test-token-1,test-token-2"
 os.environ["RATE_LIMIT_PER_MINUTE"] = "1000"  # Большой лимит для тестов
+os.environ["RATE_LIMIT_PER_HOUR"] = "100000"
+os.environ["RATE_LIMIT_BACKEND"] = "memory"
 os.environ["LOG_LEVEL"] = "WARNING"  # Меньше логов в тестах
 
 from app.main import app
+from app.database import FirebirdDatabase, get_database, clear_cache
+from app.executor import DBExecutor, get_executor
+from app.ratelimit import rate_limiter
+from tests.fakes import FakeServer
 
 
 @pytest.fixture
@@ -35,3 +41,42 @@ def auth_headers():
 def invalid_auth_headers():
     """Headers с невалидным токеном"""
     return {"Authorization": "Bearer invalid-token"}
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    """
+    FirebirdDatabase поверх fake-соединений, подставленный в приложение
+    вместе с executor'ом. Возвращает FakeServer для настройки результатов.
+    """
+    server = FakeServer()
+    monkeypatch.setattr(FirebirdDatabase, "_connect", lambda self: server.connect())
+    monkeypatch.setattr(
+        FirebirdDatabase, "_cancel_operation", lambda self, conn: conn.cancel_operation()
+    )
+
+    db = FirebirdDatabase(
+        host="localhost",
+        port=3050,
+        database="test.fdb",
+        user="SYSDBA",
+        password="masterkey",
+        min_connections=0,
+        max_connections=2,
+        pool_max_lifetime=0,
+        pool_ping_interval=0,
+    )
+    executor = DBExecutor(max_workers=2, max_queue=10)
+    server.db = db
+
+    app.dependency_overrides[get_database] = lambda: db
+    app.dependency_overrides[get_executor] = lambda: executor
+    clear_cache()
+    rate_limiter.clear()
+
+    yield server
+
+    app.dependency_overrides.clear()
+    clear_cache()
+    executor.shutdown()
+    db.close()
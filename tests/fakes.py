@@ -0,0 +1,290 @@
+"""
+Заглушки fdb-соединений для тестов без Firebird сервера
+"""
+
+import decimal
+import fnmatch
+import re
+import socketserver
+import threading
+import time as _time
+from datetime import date, datetime, time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import fdb
+
+# Размеры (display_size, internal_size), которые fdb отдает для типов
+_SIZES = {
+    str: (50, 200),
+    int: (11, 4),
+    float: (17, 8),
+    decimal.Decimal: (20, 8),
+    date: (10, 4),
+    time: (11, 4),
+    datetime: (22, 8),
+    bool: (5, 1),
+}
+
+
+def column(
+    name: str, type_code: type = str, precision: int = 0, scale: int = 0, nullable: bool = True
+):
+    """Описание колонки в формате fdb cursor.description"""
+    display_size, internal_size = _SIZES.get(type_code, (0, 0))
+    return (name, type_code, display_size, internal_size, precision, scale, nullable)
+
+
+class FakePreparedStatement:
+    def __init__(self, sql: str, cursor: "FakeCursor"):
+        self.sql = sql
+        self.cursor = cursor
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, server: "FakeServer", conn: "FakeConnection"):
+        self.server = server
+        self.conn = conn
+        self.description = None
+        self._rows: List[Tuple] = []
+        self._pos = 0
+
+    def prep(self, query: str) -> FakePreparedStatement:
+        self.server.prepared.append(query)
+        return FakePreparedStatement(query, self)
+
+    def execute(self, query: Any, params: Optional[Sequence] = None):
+        if isinstance(query, FakePreparedStatement):
+            assert query.cursor is self, "PreparedStatement was created by different Cursor."
+            query = query.sql
+        self.server.executed.append((query, params))
+        if self.server.error is not None:
+            raise self.server.error
+        if self.server.delay and "RDB$DATABASE" not in query:
+            self.conn.work(self.server.delay)
+        self.description, self._rows = self.server.lookup(query)
+        self._pos = 0
+
+    def fetchall(self):
+        rows = self._rows[self._pos :]
+        self._pos = len(self._rows)
+        return rows
+
+    def fetchmany(self, size: int = 1):
+        rows = self._rows[self._pos : self._pos + size]
+        self._pos += len(rows)
+        self.server.fetch_calls += 1
+        return rows
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def close(self):
+        pass
+
+
+class FakeTransaction:
+    def __init__(self, conn: "FakeConnection", default_tpb: Any = None):
+        self.conn = conn
+        self.default_tpb = default_tpb
+        self.default_action = "commit"
+        self.active = False
+        self.closed = False
+
+    def begin(self):
+        self.active = True
+
+    def cursor(self):
+        return FakeCursor(self.conn.server, self.conn)
+
+    def close(self):
+        self.active = False
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, server: "FakeServer"):
+        self.server = server
+        self.closed = False
+        self.engine_version = server.engine_version
+        self.statement_timeout = 0
+        self._cancelled = threading.Event()
+
+    def cursor(self):
+        return FakeCursor(self.server, self)
+
+    def trans(self, default_tpb: Any = None) -> FakeTransaction:
+        transaction = FakeTransaction(self, default_tpb)
+        self.server.transactions.append(transaction)
+        return transaction
+
+    def execute_immediate(self, sql: str):
+        self.server.immediate.append(sql)
+        match = re.fullmatch(r"SET STATEMENT TIMEOUT (\d+) SECOND", sql)
+        if match:
+            self.statement_timeout = int(match.group(1))
+
+    def cancel_operation(self):
+        self.server.cancels += 1
+        self._cancelled.set()
+
+    def work(self, seconds: float):
+        """Долгая операция на сервере: прерывается cancel_operation и STATEMENT TIMEOUT"""
+        limit = self.statement_timeout
+        wait = min(seconds, limit) if limit else seconds
+        if self._cancelled.wait(wait):
+            self._cancelled.clear()
+            raise fdb.DatabaseError("operation was cancelled")
+        if wait < seconds:
+            raise fdb.DatabaseError("Statement level timeout expired.")
+
+    def rollback(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeServer:
+    """
+    Имитация Firebird сервера: на любой запрос отдает заданный результат.
+
+    Запрос "SELECT 1 FROM RDB$DATABASE" всегда возвращает одну строку (1,).
+    """
+
+    def __init__(self):
+        self.description = [column("ID", int)]
+        self.rows: List[Tuple] = []
+        self.executed: List[Tuple[Any, Any]] = []
+        self.prepared: List[str] = []
+        # Исключение, которое выбросит следующий execute
+        self.error: Optional[Exception] = None
+        self.connections: List[FakeConnection] = []
+        self.fetch_calls = 0
+        # Задержка выполнения запроса в секундах (для тестов конкуренции);
+        # пинг пула выполняется без задержки
+        self.delay = 0.0
+        # Версия сервера на новых соединениях (4.0+ - SET STATEMENT TIMEOUT)
+        self.engine_version = 3.0
+        self.immediate: List[str] = []
+        self.transactions: List[FakeTransaction] = []
+        self.cancels = 0
+        # Свои результаты для запросов, содержащих подстроку
+        self.results: Dict[str, Tuple[List[Tuple], List[Tuple]]] = {}
+
+    def set_result(self, description: List[Tuple], rows: List[Tuple]):
+        self.description = description
+        self.rows = rows
+
+    def set_result_for(self, marker: str, rows: List[Tuple], description: List[Tuple] = ()):
+        """Результат запросов, текст которых содержит marker"""
+        self.results[marker] = (list(description), rows)
+
+    def lookup(self, query: Any):
+        for marker, result in self.results.items():
+            if isinstance(query, str) and marker in query:
+                return result
+        if isinstance(query, str) and "RDB$DATABASE" in query:
+            return [column("CONSTANT", int)], [(1,)]
+        return self.description, self.rows
+
+    def connect(self) -> FakeConnection:
+        conn = FakeConnection(self)
+        self.connections.append(conn)
+        return conn
+
+
+class FakeRedisServer:
+    """
+    Локальная замена сервера Redis для тестов: GET, SET (PX), DEL, SCAN,
+    PING, SELECT, AUTH по протоколу RESP на 127.0.0.1 и случайном порту.
+    """
+
+    def __init__(self, password: Optional[str] = None):
+        self.password = password
+        self.data: dict = {}
+        self.expires: dict = {}
+        self.commands: List[List[bytes]] = []
+        self.lock = threading.Lock()
+
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    args = [self._bulk() for _ in range(int(line[1:-2]))]
+                    self.wfile.write(fake.dispatch(args))
+
+            def _bulk(self):
+                length = int(self.rfile.readline()[1:-2])
+                return self.rfile.read(length + 2)[:-2]
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.url = f"redis://127.0.0.1:{self.port}/0"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self) -> "FakeRedisServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _alive(self, key: bytes) -> bool:
+        expires = self.expires.get(key)
+        if expires is not None and expires <= _time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def dispatch(self, args: List[bytes]) -> bytes:
+        command = args[0].upper()
+        with self.lock:
+            self.commands.append(args)
+            if command == b"PING":
+                return b"+PONG\r\n"
+            if command == b"AUTH":
+                if args[-1].decode() != self.password:
+                    return b"-WRONGPASS invalid password\r\n"
+                return b"+OK\r\n"
+            if command == b"SELECT":
+                return b"+OK\r\n"
+            if command == b"GET":
+                if not self._alive(args[1]):
+                    return b"$-1\r\n"
+                value = self.data[args[1]]
+                return b"$%d\r\n%s\r\n" % (len(value), value)
+            if command == b"SET":
+                self.data[args[1]] = args[2]
+                self.expires.pop(args[1], None)
+                if len(args) >= 5 and args[3].upper() == b"PX":
+                    self.expires[args[1]] = _time.monotonic() + int(args[4]) / 1000
+                return b"+OK\r\n"
+            if command == b"DEL":
+                removed = 0
+                for key in args[1:]:
+                    if self._alive(key):
+                        del self.data[key]
+                        removed += 1
+                return b":%d\r\n" % removed
+            if command == b"SCAN":
+                pattern = args[3].decode() if len(args) > 3 else "*"
+                keys = [k for k in list(self.data) if fnmatch.fnmatchcase(k.decode(), pattern)]
+                reply = [b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(keys)]
+                reply += [b"$%d\r\n%s\r\n" % (len(k), k) for k in keys]
+                return b"".join(reply)
+        return b"-ERR unknown command\r\n"
@@ -2,8 +2,22 @@
 Интеграционные тесты API endpoints
 """
 
+import json
+import time
+from datetime import date
+from decimal import Decimal
+
+import fdb
 import pytest
 
+from app import auth, ratelimit
+from app.config import settings
+from app.database import SNAPSHOT_READ_ONLY_TPB
+from app.ratelimit import MemoryRateLimitStore, RateLimiter
+from app.sql import normalize_query
+from app.tokens import TokenRegistry, create_token_registry
+from tests.fakes import column
+
 
 class TestHealthEndpoint:
     """Тесты /api/health endpoint"""
@@ -29,6 +43,51 @@ class TestHealthEndpoint:
         assert isinstance(data["version"], str)
         assert "uptime_seconds" in data
 
+    def test_health_from_background_state(self, client, fake_server):
+        """Health check отдает состояние фоновой проверки и не выполняет запросов"""
+        fake_server.db.health.check()
+        executed = len(fake_server.executed)
+
+        for _ in range(5):
+            response = client.get("/api/health")
+            assert response.status_code == 200
+
+        data = response.json()
+        assert data["status"] == "healthy"
+        assert data["consecutive_failures"] == 0
+        assert data["database_latency_ms"] is not None
+        assert data["last_check"] is not None
+        assert len(fake_server.executed) == executed
+
+    def test_not_ready_before_first_check(self, client, fake_server):
+        """До первой проверки БД считается неготовой"""
+        response = client.get("/api/health/ready")
+
+        assert response.status_code == 503
+        assert response.json()["database_connected"] is False
+
+    def test_ready_after_failure_threshold(self, client, fake_server):
+        """503 только после HEALTH_FAILURE_THRESHOLD неудач подряд; liveness всегда 200"""
+        health = fake_server.db.health
+        health.check()
+
+        fake_server.error = Exception("connection lost")
+        health.check()
+        assert client.get("/api/health/ready").status_code == 200
+
+        health.check()
+        response = client.get("/api/health/ready")
+        assert response.status_code == 503
+        assert response.json()["consecutive_failures"] == 2
+
+        live = client.get("/api/health/live")
+        assert live.status_code == 200
+        assert live.json()["status"] == "alive"
+
+        fake_server.error = None
+        health.check()
+        assert client.get("/api/health").status_code == 200
+
 
 class TestQueryEndpoint:
     """Тесты /api/query endpoint"""
@@ -74,6 +133,190 @@ class TestQueryEndpoint:
         assert response.status_code == 422
 
 
+class TestQueryStreaming:
+    """Тесты потокового режима /api/query"""
+
+    def _parse(self, response):
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    def test_stream_flag(self, client, auth_headers, fake_server):
+        """С "stream": true результат должен отдаваться построчно в NDJSON"""
+        fake_server.set_result(
+            [column("ID", int), column("DAY", date), column("PRICE", Decimal, 18, -2)],
+            [(i, date(2025, 1, 1), Decimal("1.50")) for i in range(2500)],
+        )
+
+        response = client.post(
+            "/api/query",
+            json={"query": "SELECT * FROM GOODS", "stream": True},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = self._parse(response)
+        assert len(lines) == 2501
+        assert lines[0] == {"ID": 0, "DAY": "2025-01-01", "PRICE": 1.5}
+
+        trailer = lines[-1]["_trailer"]
+        assert trailer["success"] is True
+        assert trailer["rows_count"] == 2500
+        assert trailer["error"] is None
+        # Курсор читается порциями, а не fetchall
+        assert fake_server.fetch_calls >= 3
+
+    def test_stream_accept_header(self, client, auth_headers, fake_server):
+        """Accept: application/x-ndjson должен включать потоковый режим"""
+        fake_server.set_result([column("ID", int)], [(1,), (2,)])
+        headers = dict(auth_headers, Accept="application/x-ndjson")
+
+        response = client.post("/api/query", json={"query": "SELECT ID FROM T"}, headers=headers)
+
+        lines = self._parse(response)
+        assert lines[:2] == [{"ID": 1}, {"ID": 2}]
+        assert lines[-1]["_trailer"]["rows_count"] == 2
+
+    def test_stream_validation_error(self, client, auth_headers, fake_server):
+        """Ошибка валидации в потоковом режиме приходит в trailer"""
+        response = client.post(
+            "/api/query", json={"query": "DELETE FROM T", "stream": True}, headers=auth_headers
+        )
+
+        lines = self._parse(response)
+        assert len(lines) == 1
+        assert lines[0]["_trailer"]["success"] is False
+        assert "validation" in lines[0]["_trailer"]["error"]
+
+    def test_stream_returns_connection(self, client, auth_headers, fake_server):
+        """После потоковой выдачи соединение должно вернуться в пул"""
+        fake_server.set_result([column("ID", int)], [(1,)])
+        client.post(
+            "/api/query", json={"query": "SELECT ID FROM T", "stream": True}, headers=auth_headers
+        )
+
+        stats = fake_server.db.pool.stats()
+        assert stats["in_use"] == 0
+        assert stats["idle"] == 1
+
+
+class TestQueryColumnar:
+    """Тесты колоночного формата /api/query"""
+
+    def test_columnar_format(self, client, auth_headers, fake_server):
+        """format=columnar должен отдавать колонки один раз и строки массивами"""
+        fake_server.set_result([column("ID", int), column("NAME", str)], [(1, "A"), (2, "B")])
+
+        response = client.post(
+            "/api/query",
+            json={"query": "SELECT ID, NAME FROM T", "format": "columnar"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert [c["name"] for c in data["columns"]] == ["ID", "NAME"]
+        assert data["columns"][0]["type"] == "INTEGER"
+        assert data["layout"] == "rows"
+        assert data["data"] == [[1, "A"], [2, "B"]]
+        assert data["rows_count"] == 2
+
+    def test_columnar_stream(self, client, auth_headers, fake_server):
+        """В потоковом режиме columnar сначала идет заголовок с колонками"""
+        fake_server.set_result([column("ID", int)], [(1,), (2,)])
+
+        response = client.post(
+            "/api/query",
+            json={"query": "SELECT ID FROM T", "format": "columnar", "stream": True},
+            headers=auth_headers,
+        )
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[0]["_header"]["columns"][0]["name"] == "ID"
+        assert lines[1:3] == [[1], [2]]
+        assert lines[3]["_trailer"]["rows_count"] == 2
+
+
+class TestQueryEncodings:
+    """Тесты выбора кодировки ответа /api/query по Accept"""
+
+    def test_msgpack_accept(self, client, auth_headers, fake_server):
+        """Accept: application/msgpack должен отдавать MessagePack"""
+        msgpack = pytest.importorskip("msgpack")
+        fake_server.set_result([column("ID", int)], [(1,), (2,)])
+        headers = dict(auth_headers, Accept="application/msgpack")
+
+        response = client.post("/api/query", json={"query": "SELECT ID FROM T"}, headers=headers)
+
+        assert response.headers["content-type"] == "application/msgpack"
+        data = msgpack.unpackb(response.content)
+        assert data["data"] == [{"ID": 1}, {"ID": 2}]
+
+    def test_csv_stream(self, client, auth_headers, fake_server):
+        """CSV в потоковом режиме"""
+        fake_server.set_result([column("ID", int), column("NAME", str)], [(1, "A"), (2, "B")])
+        headers = dict(auth_headers, Accept="text/csv")
+
+        response = client.post(
+            "/api/query", json={"query": "SELECT * FROM T", "stream": True}, headers=headers
+        )
+
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.text.lstrip("\ufeff").splitlines() == ["ID,NAME", "1,A", "2,B"]
+
+    def test_csv_validation_error_is_json(self, client, auth_headers, fake_server):
+        """Формат без поддержки ошибок отдает ошибку валидации в JSON"""
+        headers = dict(auth_headers, Accept="text/csv")
+
+        response = client.post("/api/query", json={"query": "DROP TABLE T"}, headers=headers)
+
+        assert response.json()["success"] is False
+
+
+class TestEncodedBodyCache:
+    """Тесты кеширования закодированных тел ответов /api/query"""
+
+    def test_hit_skips_encoding(self, client, auth_headers, fake_server, monkeypatch):
+        """Повторный запрос берет готовое тело из кеша, меняются только метаданные"""
+        from app.encoders import JsonEncoder
+
+        fake_server.set_result([column("ID", int), column("PRICE", Decimal)], [(1, Decimal("2.5"))])
+        calls = []
+        original = JsonEncoder.encode_payload
+        monkeypatch.setattr(
+            JsonEncoder,
+            "encode_payload",
+            lambda self, *args: calls.append(args) or original(self, *args),
+        )
+        body = {"query": "SELECT ID, PRICE FROM T"}
+
+        first = client.post("/api/query", json=body, headers=auth_headers).json()
+        second = client.post("/api/query", json=body, headers=auth_headers).json()
+
+        assert len(calls) == 1
+        assert first["data"] == second["data"] == [{"ID": 1, "PRICE": 2.5}]
+        assert second["success"] is True
+        assert second["rows_count"] == 1
+        assert second["timestamp"] != first["timestamp"]
+
+    def test_formats_cached_separately(self, client, auth_headers, fake_server):
+        """Разные формы ответа одного запроса кешируются отдельно"""
+        fake_server.set_result([column("ID", int)], [(1,), (2,)])
+
+        objects = client.post(
+            "/api/query", json={"query": "SELECT ID FROM T"}, headers=auth_headers
+        )
+        columnar = client.post(
+            "/api/query",
+            json={"query": "SELECT ID FROM T", "format": "columnar", "layout": "columns"},
+            headers=auth_headers,
+        )
+
+        assert objects.json()["data"] == [{"ID": 1}, {"ID": 2}]
+        assert columnar.json()["data"] == [[1, 2]]
+        assert len([q for q in fake_server.executed if q[0] == "SELECT ID FROM T"]) == 1
+
+
 class TestInfoEndpoints:
     """Тесты /api/tables и /api/schema endpoints"""
 
@@ -98,6 +341,76 @@ class TestInfoEndpoints:
         assert response.status_code == 401
 
 
+class TestSchemaCatalog:
+    """Тесты /api/tables и /api/schema поверх каталога схемы"""
+
+    @pytest.fixture
+    def catalog_server(self, fake_server):
+        fake_server.set_result_for("RDB$FORMAT", [(2, 129, 4, 60, 12, 0, 14, 9)])
+        fake_server.set_result_for(
+            "RDB$CHARACTER_LENGTH",
+            [
+                ("GOODS", "ID", 1, None, 8, 0, 4, None, 0, 0),
+                ("GOODS", "PRICE", None, None, 16, 1, 8, None, 18, -2),
+                ("STORGRP", "ID", 1, None, 8, 0, 4, None, 0, 0),
+                ("STORGRP", "NAME", None, None, 37, 0, 400, 100, None, 0),
+            ],
+        )
+        fake_server.set_result_for(
+            "RDB$UNIQUE_FLAG",
+            [
+                ("GOODS", "RDB$PRIMARY1", "PRIMARY KEY", "ID"),
+                ("STORGRP", "RDB$PRIMARY2", "PRIMARY KEY", "ID"),
+                ("STORGRP", "UQ_STORGRP_NAME", "UNIQUE", "NAME"),
+            ],
+        )
+        return fake_server
+
+    def test_table_schema_without_extra_queries(self, client, auth_headers, catalog_server):
+        """Схема таблицы отдается из каталога: повторные запросы не обращаются к БД"""
+        response = client.get("/api/schema/storgrp", headers=auth_headers)
+        executed = len(catalog_server.executed)
+        client.get("/api/schema/GOODS", headers=auth_headers)
+        tables = client.get("/api/tables", headers=auth_headers).json()
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["table"] == "STORGRP"
+        assert data["primary_key"] == ["ID"]
+        assert data["unique_keys"] == [["NAME"]]
+        assert data["columns"][1]["sql_type"] == "VARCHAR(100)"
+        assert data["columns"][1]["length"] == 100
+        assert tables["tables"] == ["GOODS", "STORGRP"]
+        assert len(catalog_server.executed) == executed
+
+    def test_unknown_table(self, client, auth_headers, catalog_server):
+        """Неизвестная таблица - 404"""
+        response = client.get("/api/schema/MISSING", headers=auth_headers)
+
+        assert response.status_code == 404
+
+    def test_bulk_schema_etag(self, client, auth_headers, catalog_server):
+        """GET /api/schema отдает все таблицы с ETag; If-None-Match - 304"""
+        response = client.get("/api/schema", headers=auth_headers)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 2
+        assert [t["table"] for t in data["tables"]] == ["GOODS", "STORGRP"]
+        price = data["tables"][0]["columns"][1]
+        assert (price["sql_type"], price["precision"], price["scale"]) == ("NUMERIC(18,2)", 18, 2)
+        etag = response.headers["etag"]
+        assert etag == f'"{data["version"]}"'
+
+        cached = client.get("/api/schema", headers=dict(auth_headers, **{"If-None-Match": etag}))
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+
+        stale = client.get("/api/schema", headers=dict(auth_headers, **{"If-None-Match": '"x"'}))
+        assert stale.status_code == 200
+
+
 class TestRootEndpoint:
     """Тесты корневого endpoint"""
 
@@ -125,3 +438,457 @@ class TestDocumentation:
         """ReDoc должен быть доступен"""
         response = client.get("/redoc")
         assert response.status_code == 200
+
+
+class TestPagination:
+    """Тесты постраничной выдачи /api/query (page_size / next_token)"""
+
+    def test_pages_without_reexecution(self, client, auth_headers, fake_server):
+        """Страницы читаются по next_token, запрос выполняется в БД один раз"""
+        fake_server.set_result([column("ID", int)], [(i,) for i in range(5)])
+        body = {"query": "SELECT ID FROM T", "page_size": 2}
+
+        pages = []
+        while True:
+            response = client.post("/api/query", json=body, headers=auth_headers).json()
+            assert response["success"] is True, response
+            pages.append([row["ID"] for row in response["data"]])
+            if response["next_token"] is None:
+                break
+            body = {"query": "SELECT ID FROM T", "next_token": response["next_token"]}
+
+        assert pages == [[0, 1], [2, 3], [4]]
+        assert len(fake_server.executed) == 1
+
+    def test_single_page(self, client, auth_headers, fake_server):
+        """Результат не больше страницы - next_token null"""
+        fake_server.set_result([column("ID", int)], [(1,)])
+        response = client.post(
+            "/api/query", json={"query": "SELECT ID FROM T", "page_size": 10}, headers=auth_headers
+        ).json()
+
+        assert response["data"] == [{"ID": 1}]
+        assert response["next_token"] is None
+
+    def test_token_bound_to_query(self, client, auth_headers, fake_server):
+        """Токен другого запроса или поврежденный токен отклоняются"""
+        fake_server.set_result([column("ID", int)], [(i,) for i in range(3)])
+        first = client.post(
+            "/api/query", json={"query": "SELECT ID FROM T", "page_size": 1}, headers=auth_headers
+        ).json()
+
+        other = client.post(
+            "/api/query",
+            json={"query": "SELECT ID FROM G", "next_token": first["next_token"]},
+            headers=auth_headers,
+        ).json()
+        broken = client.post(
+            "/api/query",
+            json={"query": "SELECT ID FROM T", "next_token": "garbage"},
+            headers=auth_headers,
+        ).json()
+
+        assert other["success"] is False
+        assert "different query" in other["error"]
+        assert broken["success"] is False
+        assert "next_token" in broken["error"]
+
+    def test_columnar_page(self, client, auth_headers, fake_server):
+        """Страница в колоночном формате содержит описание колонок и next_token"""
+        fake_server.set_result([column("ID", int)], [(i,) for i in range(3)])
+        response = client.post(
+            "/api/query",
+            json={"query": "SELECT ID FROM T", "page_size": 2, "format": "columnar"},
+            headers=auth_headers,
+        ).json()
+
+        assert response["columns"][0]["name"] == "ID"
+        assert response["data"] == [[0], [1]]
+        assert response["next_token"]
+
+    def test_not_with_stream(self, client, auth_headers, fake_server):
+        """Постраничная выдача не сочетается с потоковой"""
+        response = client.post(
+            "/api/query",
+            json={"query": "SELECT ID FROM T", "page_size": 2, "stream": True},
+            headers=auth_headers,
+        )
+
+        assert "Pagination is not supported" in response.text
+
+
+class TestResultLimits:
+    """Тесты лимитов результата /api/query"""
+
+    def test_rows_limit(self, client, auth_headers, fake_server, monkeypatch):
+        """Чтение останавливается на лимите, ответ помечен truncated"""
+        monkeypatch.setattr(settings, "query_max_rows", 3)
+        fake_server.set_result([column("ID", int)], [(i,) for i in range(10)])
+
+        response = client.post(
+            "/api/query", json={"query": "SELECT ID FROM T"}, headers=auth_headers
+        ).json()
+
+        assert response["rows_count"] == 3
+        assert response["truncated"] is True
+        # Прочитано max_rows + 1 строк, не весь результат
+        assert fake_server.fetch_calls <= 2
+
+    def test_not_truncated(self, client, auth_headers, fake_server, monkeypatch):
+        """Результат в пределах лимита не помечается"""
+        monkeypatch.setattr(settings, "query_max_rows", 3)
+        fake_server.set_result([column("ID", int)], [(1,), (2,), (3,)])
+
+        response = client.post(
+            "/api/query", json={"query": "SELECT ID FROM T"}, headers=auth_headers
+        ).json()
+
+        assert (response["rows_count"], response["truncated"]) == (3, False)
+
+    def test_token_limit(self, client, auth_headers, fake_server, monkeypatch):
+        """Лимит токена из QUERY_TOKEN_LIMITS заменяет общий"""
+        monkeypatch.setattr(settings, "query_max_rows", 3)
+        monkeypatch.setattr(settings, "query_token_limits", "test-token-1:5:0")
+        # Реестр токенов строится при старте - пересобрать с новыми лимитами
+        monkeypatch.setattr(auth, "token_registry", create_token_registry(settings))
+        fake_server.set_result([column("ID", int)], [(i,) for i in range(10)])
+
+        response = client.post(
+            "/api/query", json={"query": "SELECT ID FROM T"}, headers=auth_headers
+        ).json()
+
+        assert response["rows_count"] == 5
+
+    def test_stream_truncated(self, client, auth_headers, fake_server, monkeypatch):
+        """Поток останавливается на лимите, trailer содержит truncated"""
+        monkeypatch.setattr(settings, "query_max_rows", 2)
+        fake_server.set_result([column("ID", int)], [(i,) for i in range(10)])
+
+        response = client.post(
+            "/api/query", json={"query": "SELECT ID FROM T", "stream": True}, headers=auth_headers
+        )
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        assert lines[:-1] == [{"ID": 0}, {"ID": 1}]
+        assert lines[-1]["_trailer"]["truncated"] is True
+        assert lines[-1]["_trailer"]["rows_count"] == 2
+
+
+class TestBatchEndpoint:
+    """Тесты пакета запросов /api/query/batch"""
+
+    def test_results_in_order(self, client, auth_headers, fake_server):
+        """Ответы и ошибки - по каждому запросу в исходном порядке"""
+        fake_server.set_result([column("ID", int)], [(1,), (2,)])
+
+        response = client.post(
+            "/api/query/batch",
+            json={
+                "queries": [
+                    {"query": "SELECT ID FROM A"},
+                    {"query": "DELETE FROM A"},
+                    {"query": "SELECT ID FROM B", "format": "columnar"},
+                    {"query": "SELECT ID FROM C", "stream": True},
+                ]
+            },
+            headers=auth_headers,
+        ).json()
+
+        results = response["results"]
+        assert (response["success"], response["failed"]) == (False, 2)
+        assert results[0]["data"] == [{"ID": 1}, {"ID": 2}]
+        assert results[1]["error"].startswith("SQL validation failed")
+        assert results[2]["data"] == [[1], [2]]
+        assert results[3]["error"] == "Streaming is not supported in batch"
+
+    def test_uses_cache(self, client, auth_headers, fake_server):
+        """Одинаковые запросы пакета и повторные пакеты читают кеш"""
+        batch = {"queries": [{"query": "SELECT ID FROM A"}, {"query": "select id from a"}]}
+
+        client.post("/api/query/batch", json=batch, headers=auth_headers)
+        response = client.post("/api/query/batch", json=batch, headers=auth_headers).json()
+
+        assert response["success"] is True
+        assert len(fake_server.executed) == 1
+
+    def test_parallel(self, client, auth_headers, fake_server):
+        """Запросы выполняются одновременно на разных соединениях пула"""
+        fake_server.delay = 0.3
+        batch = {"queries": [{"query": f"SELECT ID FROM T{i}"} for i in range(4)]}
+
+        started = time.monotonic()
+        response = client.post("/api/query/batch", json=batch, headers=auth_headers).json()
+
+        assert response["success"] is True
+        # Пул и executor фикстуры - по 2 соединения/потока: 2 волны по 0.3с
+        assert time.monotonic() - started < 1.0
+        assert len(fake_server.connections) == 2
+
+    def test_consistent_snapshot(self, client, auth_headers, fake_server):
+        """consistent: одна read-only транзакция, запросы по порядку, кеш не читается"""
+        client.post("/api/query", json={"query": "SELECT ID FROM A"}, headers=auth_headers)
+        fake_server.executed.clear()
+
+        response = client.post(
+            "/api/query/batch",
+            json={
+                "consistent": True,
+                "queries": [{"query": "SELECT ID FROM A"}, {"query": "SELECT ID FROM B"}],
+            },
+            headers=auth_headers,
+        ).json()
+
+        assert response["success"] is True
+        assert [query for query, _ in fake_server.executed] == [
+            "SELECT ID FROM A",
+            "SELECT ID FROM B",
+        ]
+        (transaction,) = fake_server.transactions
+        assert transaction.default_tpb == SNAPSHOT_READ_ONLY_TPB
+        assert transaction.default_action == "rollback"
+        assert transaction.closed
+
+    def test_consistent_errors_per_item(self, client, auth_headers, fake_server):
+        """Ошибка БД в consistent пакете - на месте каждого запроса"""
+        fake_server.error = fdb.DatabaseError("table unknown")
+
+        response = client.post(
+            "/api/query/batch",
+            json={"consistent": True, "queries": [{"query": "SELECT ID FROM A"}]},
+            headers=auth_headers,
+        ).json()
+
+        assert response["failed"] == 1
+        assert response["results"][0]["error"] == "Database error: table unknown"
+
+    def test_too_many_queries(self, client, auth_headers, fake_server, monkeypatch):
+        """Пакет больше BATCH_MAX_QUERIES отклоняется целиком"""
+        monkeypatch.setattr(settings, "batch_max_queries", 2)
+
+        response = client.post(
+            "/api/query/batch",
+            json={"queries": [{"query": "SELECT 1 FROM RDB$DATABASE"}] * 3},
+            headers=auth_headers,
+        ).json()
+
+        assert response["success"] is False
+        assert response["results"] == []
+        assert fake_server.executed == []
+
+
+class TestRateLimit:
+    """Тесты лимитов запросов на токен"""
+
+    @pytest.fixture
+    def limiter(self, monkeypatch):
+        def install(**limits):
+            limiter = RateLimiter(MemoryRateLimitStore(), **limits)
+            monkeypatch.setattr(ratelimit, "rate_limiter", limiter)
+            return limiter
+
+        return install
+
+    def test_headers_and_429(self, client, auth_headers, fake_server, limiter):
+        """Ответы несут X-RateLimit-*, сверх лимита - 429 с Retry-After"""
+        limiter(per_minute=2, per_hour=0)
+        query = {"query": "SELECT * FROM T"}
+
+        first = client.post("/api/query", json=query, headers=auth_headers)
+        client.post("/api/query", json=query, headers=auth_headers)
+        rejected = client.post("/api/query", json=query, headers=auth_headers)
+
+        assert first.headers["X-RateLimit-Limit"] == "2"
+        assert first.headers["X-RateLimit-Remaining"] == "1"
+        assert rejected.status_code == 429
+        assert rejected.headers["Retry-After"] == "30"
+        assert rejected.headers["X-RateLimit-Remaining"] == "0"
+        assert rejected.json()["error"] == "Rate limit exceeded: 2 requests per minute"
+
+        # Другой токен - свой лимит
+        other = client.post(
+            "/api/query", json=query, headers={"Authorization": "Bearer test-token-2"}
+        )
+        assert other.status_code == 200
+
+    def test_rows_charged(self, client, auth_headers, fake_server, limiter):
+        """Строки ответа, потока и пакета списываются с бюджета токена"""
+        fake_server.set_result([column("ID", int)], [(i,) for i in range(5)])
+        rate_limiter = limiter(per_minute=0, per_hour=0, rows_per_window=14, cost_window=60)
+
+        client.post("/api/query", json={"query": "SELECT ID FROM A"}, headers=auth_headers)
+        client.post(
+            "/api/query", json={"query": "SELECT ID FROM B", "stream": True}, headers=auth_headers
+        )
+        client.post(
+            "/api/query/batch",
+            json={"queries": [{"query": "SELECT ID FROM C"}]},
+            headers=auth_headers,
+        )
+        rejected = client.post("/api/query", json={"query": "SELECT 1"}, headers=auth_headers)
+
+        assert rejected.status_code == 429
+        assert rate_limiter.stats()["rejected"]["cost"] == 1
+
+    def test_concurrent_released(self, client, auth_headers, fake_server, limiter):
+        """Место одновременного запроса освобождается после ответа, в том числе потокового"""
+        rate_limiter = limiter(per_minute=0, per_hour=0, concurrent=1)
+
+        for stream in (False, True, False):
+            response = client.post(
+                "/api/query",
+                json={"query": "SELECT * FROM T", "stream": stream},
+                headers=auth_headers,
+            )
+            assert response.status_code == 200
+        assert rate_limiter.stats()["rejected"]["concurrency"] == 0
+
+    def test_info_endpoints_limited(self, client, auth_headers, fake_server, limiter):
+        """/api/tables считается в тот же лимит"""
+        limiter(per_minute=1, per_hour=0)
+
+        client.get("/api/tables", headers=auth_headers)
+        response = client.get("/api/tables", headers=auth_headers)
+
+        assert response.status_code == 429
+
+
+class TestTokenPolicies:
+    """Политики токенов из файла API_TOKENS_FILE"""
+
+    @pytest.fixture
+    def registry(self, tmp_path, monkeypatch):
+        def install(*entries):
+            path = tmp_path / "tokens.json"
+            path.write_text(json.dumps({"tokens": list(entries)}), encoding="utf-8")
+            registry = TokenRegistry(path=str(path))
+            monkeypatch.setattr(auth, "token_registry", registry)
+            return registry
+
+        return install
+
+    def test_database_not_allowed(self, client, fake_server, registry):
+        """Токен, которому закрыта база сервера, получает 403"""
+        registry(
+            {"token": "shop", "databases": [settings.db_name]},
+            {"token": "other", "databases": ["other.fdb"]},
+        )
+        query = {"query": "SELECT * FROM T"}
+
+        allowed = client.post("/api/query", json=query, headers={"Authorization": "Bearer shop"})
+        denied = client.post("/api/query", json=query, headers={"Authorization": "Bearer other"})
+
+        assert allowed.status_code == 200
+        assert denied.status_code == 403
+
+    def test_rate_limit_override(self, client, fake_server, registry, monkeypatch):
+        """Лимит запросов из политики токена вместо общего"""
+        monkeypatch.setattr(
+            ratelimit, "rate_limiter", RateLimiter(MemoryRateLimitStore(), per_minute=100)
+        )
+        registry({"token": "slow", "rate_limit_per_minute": 1}, {"token": "fast"})
+        query = {"query": "SELECT * FROM T"}
+
+        for token, expected in (("slow", 200), ("slow", 429), ("fast", 200), ("fast", 200)):
+            response = client.post(
+                "/api/query", json=query, headers={"Authorization": f"Bearer {token}"}
+            )
+            assert response.status_code == expected
+
+    def test_cache_ttl_override(self, client, fake_server, registry):
+        """Результаты токена со своим TTL кешируются отдельно от общих"""
+        registry({"token": "short", "cache_ttl": 1}, {"token": "default"})
+        query = {"query": "SELECT * FROM T"}
+
+        for token in ("short", "default", "short", "default"):
+            client.post("/api/query", json=query, headers={"Authorization": f"Bearer {token}"})
+
+        assert len(fake_server.executed) == 2
+
+
+class TestMetricsEndpoint:
+    """Тесты GET /metrics"""
+
+    def _metrics(self, client, auth_headers):
+        response = client.get("/metrics", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        return response.text
+
+    def _value(self, text, sample):
+        for line in text.splitlines():
+            if line.startswith(sample + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+    def test_metrics_without_auth(self, client):
+        """Метрики требуют токен"""
+        response = client.get("/metrics")
+        assert response.status_code in [401, 403]
+
+    def test_query_metrics(self, client, auth_headers, fake_server):
+        """Запрос учитывается по endpoint'у, fingerprint, строкам и объему ответа"""
+        fake_server.set_result([column("ID", int)], [(1,), (2,), (3,)])
+        query = "SELECT ID FROM METRICS_TEST"
+        fingerprint = normalize_query(query).fingerprint
+        before = self._metrics(client, auth_headers)
+
+        client.post("/api/query", json={"query": query}, headers=auth_headers)
+        client.post("/api/query", json={"query": query}, headers=auth_headers)
+        text = self._metrics(client, auth_headers)
+
+        requests = 'fdbproxy_http_requests_total{method="POST",endpoint="/api/query",status="200"}'
+        assert self._value(text, requests) - self._value(before, requests) == 2
+        duration = f'fdbproxy_query_duration_seconds_count{{fingerprint="{fingerprint}"}}'
+        # Второй запрос - из кеша: в БД выполнен один раз
+        assert self._value(text, duration) == 1
+        rows = "fdbproxy_db_rows_fetched_total"
+        assert self._value(text, rows) - self._value(before, rows) == 3
+        bytes_sample = 'fdbproxy_http_response_bytes_total{endpoint="/api/query"}'
+        assert self._value(text, bytes_sample) > self._value(before, bytes_sample)
+        hits = 'fdbproxy_cache_hits_total{backend="memory"}'
+        assert self._value(text, hits) - self._value(before, hits) == 1
+
+    def test_state_metrics(self, client, auth_headers, fake_server):
+        """Пул, executor и отклонения валидации"""
+        before = self._metrics(client, auth_headers)
+        client.post("/api/query", json={"query": "DELETE FROM T"}, headers=auth_headers)
+        text = self._metrics(client, auth_headers)
+
+        rejections = 'fdbproxy_validation_rejections_total{endpoint="query"}'
+        assert self._value(text, rejections) - self._value(before, rejections) == 1
+        assert 'fdbproxy_pool_connections{state="in_use"} 0' in text
+        assert "fdbproxy_pool_max_connections 2" in text
+        assert "fdbproxy_executor_queue_depth 0" in text
+        assert "fdbproxy_executor_workers 2" in text
+
+
+class TestServerTiming:
+    """Тесты заголовка Server-Timing"""
+
+    def _phases(self, response):
+        phases = {}
+        for item in response.headers["server-timing"].split(", "):
+            name, duration = item.split(";dur=")
+            phases[name] = float(duration)
+        return phases
+
+    def test_query_phases(self, client, auth_headers, fake_server):
+        """Ответ /api/query содержит время фаз от проверки токена до кодирования"""
+        fake_server.set_result([column("ID", int)], [(1,), (2,)])
+
+        response = client.post(
+            "/api/query", json={"query": "SELECT ID FROM TIMING_TEST"}, headers=auth_headers
+        )
+
+        phases = self._phases(response)
+        for phase in ("auth", "validate", "queue", "acquire", "execute", "fetch", "convert"):
+            assert phase in phases
+        assert list(phases)[-1] == "total"
+        assert phases["total"] >= phases["execute"]
+
+    def test_every_response(self, client):
+        """Заголовок есть и у ответов без фаз БД (в т.ч. ошибок)"""
+        response = client.get("/api/tables")
+
+        assert response.status_code in [401, 403]
+        assert "total;dur=" in response.headers["server-timing"]
@@ -0,0 +1,326 @@
+"""
+Тесты кеша результатов запросов
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.cache import QueryCache, SingleFlight, estimate_size
+from app.database import query_cache
+from app.results import QueryResult
+from tests.fakes import column
+
+
+class Sized:
+    """Значение с заданным размером"""
+
+    def __init__(self, size):
+        self.size = size
+
+    def approx_size(self):
+        return self.size
+
+
+class TestQueryCache:
+    """Тесты QueryCache"""
+
+    def test_get_set(self):
+        """Сохраненное значение возвращается, отсутствующее - None"""
+        cache = QueryCache(max_bytes=1024 * 1024, shards=1)
+
+        assert cache.set("a", [1, 2, 3]) is True
+        assert cache.get("a") == [1, 2, 3]
+        assert cache.get("missing") is None
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+        assert stats["entries"] == 1
+        assert stats["bytes"] > 0
+
+    def test_ttl_expiry(self):
+        """Просроченная запись не возвращается"""
+        cache = QueryCache(max_bytes=1024 * 1024, shards=1)
+        cache.set("a", "value", ttl=0.01)
+
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
+        assert len(cache) == 0
+        assert cache.stats()["expirations"] == 1
+
+    def test_lru_eviction_by_bytes(self):
+        """При превышении бюджета вытесняются давно использованные записи"""
+        cache = QueryCache(max_bytes=3000, shards=1)
+        cache.set("a", Sized(900))
+        cache.set("b", Sized(900))
+        cache.set("c", Sized(900))
+
+        # "a" использована недавно, поэтому вытеснена будет "b"
+        cache.get("a")
+        cache.set("d", Sized(900))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("d") is not None
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] <= 3000
+
+    def test_oversized_entry_rejected(self):
+        """Запись больше бюджета не сохраняется и не вытесняет остальные"""
+        cache = QueryCache(max_bytes=2000, shards=1)
+        cache.set("small", Sized(100))
+
+        assert cache.set("huge", Sized(5000)) is False
+        assert cache.get("small") is not None
+        assert cache.stats()["rejected"] == 1
+
+    def test_entry_larger_than_shard(self):
+        """Запись больше доли шарда сохраняется, общий бюджет не превышается"""
+        cache = QueryCache(max_bytes=10000, shards=4)
+        for key in ("a", "b", "c"):
+            cache.set(key, Sized(500))
+
+        assert cache.set("large", Sized(6000)) is True
+        assert cache.get("large") is not None
+        assert cache.stats()["max_entry_bytes"] == 10000
+
+        # Вторая крупная запись вытесняет первую, а не обычные
+        assert cache.set("larger", Sized(7000)) is True
+        assert cache.get("large") is None
+        assert cache.get("larger") is not None
+        assert cache.stats()["bytes"] <= 10000
+
+        # Тот же ключ с небольшим значением переезжает в обычный шард
+        cache.set("larger", Sized(100))
+        assert len(cache) == 4
+        cache.delete("larger")
+        assert cache.get("larger") is None
+
+    def test_large_entry_evicts_small(self):
+        """Без крупных записей место освобождается в обычных шардах"""
+        cache = QueryCache(max_bytes=4000, shards=2)
+        for i in range(6):
+            cache.set(f"k{i}", Sized(600))
+
+        assert cache.set("large", Sized(3000)) is True
+        assert cache.get("large") is not None
+        assert cache.stats()["bytes"] <= 4000
+
+    def test_overwrite_updates_size(self):
+        """Перезапись ключа не увеличивает учтенный размер дважды"""
+        cache = QueryCache(max_bytes=10000, shards=1)
+        cache.set("a", Sized(1000))
+        cache.set("a", Sized(2000))
+
+        assert len(cache) == 1
+        assert 2000 <= cache.stats()["bytes"] < 3000
+
+    def test_sweep_and_clear(self):
+        """sweep удаляет только просроченные записи, clear - все"""
+        cache = QueryCache(max_bytes=1024 * 1024, shards=4)
+        cache.set("old", 1, ttl=0.01)
+        cache.set("new", 2, ttl=60)
+        time.sleep(0.02)
+
+        assert cache.sweep() == 1
+        assert cache.get("new") == 2
+        assert cache.clear() == 1
+        assert cache.stats()["bytes"] == 0
+
+    def test_background_sweeper(self):
+        """Фоновая очистка удаляет просроченные записи без обращений к ним"""
+        cache = QueryCache(max_bytes=1024 * 1024, sweep_interval=0.01)
+        cache.set("a", 1, ttl=0.01)
+        cache.start()
+        try:
+            deadline = time.monotonic() + 2
+            while len(cache) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            cache.stop()
+
+        assert len(cache) == 0
+
+    def test_concurrent_access(self):
+        """Параллельные get/set из многих потоков сохраняют согласованный учет памяти"""
+        cache = QueryCache(max_bytes=50000, shards=4)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(500):
+                    key = f"k{(n * 7 + i) % 100}"
+                    cache.set(key, Sized(500))
+                    cache.get(key)
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert errors == []
+        stats = cache.stats()
+        assert stats["bytes"] <= 50000
+        assert stats["bytes"] == sum(
+            entry.size for shard in cache._shards for entry in shard.entries.values()
+        )
+
+    def test_stale_within_grace(self):
+        """В пределах stale_grace просроченная запись доступна только как устаревшая"""
+        cache = QueryCache(max_bytes=1024 * 1024, shards=1, stale_grace=60)
+        cache.set("a", "value", ttl=0.01)
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
+        assert cache.lookup("a", allow_stale=True) == ("value", True)
+        assert cache.sweep() == 0
+        assert cache.stats()["stale_hits"] == 1
+
+    def test_stale_after_grace(self):
+        """После stale_grace запись истекает окончательно"""
+        cache = QueryCache(max_bytes=1024 * 1024, shards=1, stale_grace=0.01)
+        cache.set("a", "value", ttl=0.01)
+        time.sleep(0.03)
+
+        assert cache.lookup("a", allow_stale=True) == (None, False)
+        assert len(cache) == 0
+
+
+class TestEstimateSize:
+    """Тесты оценки размера значений"""
+
+    def test_query_result_grows_with_rows(self):
+        """Размер QueryResult пропорционален числу строк"""
+        small = QueryResult([], [(i, f"name-{i}") for i in range(10)])
+        large = QueryResult([], [(i, f"name-{i}") for i in range(1000)])
+
+        assert estimate_size(large) > 50 * estimate_size(small) / 2
+        assert estimate_size(QueryResult([], [])) > 0
+
+    def test_list_estimate(self):
+        """Список оценивается по выборке элементов"""
+        assert estimate_size(["x" * 100] * 1000) > 100 * 1000
+
+
+class TestSingleFlight:
+    """Тесты объединения одновременных вызовов"""
+
+    def test_concurrent_calls_share_result(self):
+        """Одновременные вызовы с одним ключом выполняют функцию один раз"""
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(2)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            leader = pool.submit(flights.do, "key", slow)
+            started.wait(2)
+            followers = [pool.submit(flights.do, "key", slow) for _ in range(4)]
+            while flights.stats()["coalesced"] < 4:
+                time.sleep(0.001)
+            release.set()
+            results = [leader.result()] + [f.result() for f in followers]
+
+        assert results == ["result"] * 5
+        assert len(calls) == 1
+        assert flights.stats() == {"in_flight": 0, "executed": 1, "coalesced": 4}
+
+    def test_error_is_shared(self):
+        """Ошибка ведущего вызова получают все ожидающие"""
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing():
+            started.set()
+            release.wait(2)
+            raise ValueError("boom")
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flights.do, "key", failing)
+            started.wait(2)
+            follower = pool.submit(flights.do, "key", failing)
+            while flights.stats()["coalesced"] < 1:
+                time.sleep(0.001)
+            release.set()
+
+            with pytest.raises(ValueError):
+                leader.result()
+            with pytest.raises(ValueError):
+                follower.result()
+
+        # После завершения ключ снова выполняется заново
+        assert flights.do("key", lambda: 42) == 42
+
+    def test_identical_queries_hit_database_once(self, fake_server):
+        """Одинаковые одновременные запросы к БД выполняются один раз"""
+        fake_server.set_result([column("ID", int)], [(1,), (2,)])
+        fake_server.delay = 0.1
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [
+                pool.submit(fake_server.db.execute, "SELECT ID FROM T", (1,)) for _ in range(4)
+            ]
+            results = [f.result() for f in futures]
+
+        assert all(len(result) == 2 for result in results)
+        assert len([q for q in fake_server.executed if q[0] == "SELECT ID FROM T"]) == 1
+
+
+class TestStaleWhileRevalidate:
+    """Тесты отдачи устаревших результатов с фоновым обновлением"""
+
+    def test_stale_served_and_refreshed(self, fake_server, monkeypatch):
+        """Устаревший результат отдается сразу, а кеш обновляется одним фоновым запросом"""
+        monkeypatch.setattr(query_cache, "stale_grace", 60)
+        db = fake_server.db
+        db.cache_ttl = 0.05
+        fake_server.set_result([column("ID", int)], [(1,)])
+
+        result, stale = db.fetch("SELECT ID FROM T")
+        assert (result.rows, stale) == ([(1,)], False)
+
+        time.sleep(0.06)
+        fake_server.set_result([column("ID", int)], [(2,)])
+        fake_server.delay = 0.05
+
+        # Оба вызова получают старое значение, обновление запускается один раз
+        assert db.fetch("SELECT ID FROM T") == (result, True)
+        assert db.fetch("SELECT ID FROM T")[1] is True
+
+        deadline = time.monotonic() + 2
+        while db.fetch("SELECT ID FROM T")[1] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        fresh, stale = db.fetch("SELECT ID FROM T")
+        assert (fresh.rows, stale) == ([(2,)], False)
+        assert len([q for q in fake_server.executed if q[0] == "SELECT ID FROM T"]) == 2
+
+    def test_stale_flag_in_response(self, client, auth_headers, fake_server, monkeypatch):
+        """Ответ с устаревшим результатом помечен в теле и заголовке"""
+        monkeypatch.setattr(query_cache, "stale_grace", 60)
+        fake_server.db.cache_ttl = 0.01
+        fake_server.set_result([column("ID", int)], [(1,)])
+        body = {"query": "SELECT ID FROM T"}
+
+        first = client.post("/api/query", json=body, headers=auth_headers)
+        assert first.json()["stale"] is False
+        assert "x-cache-stale" not in first.headers
+
+        time.sleep(0.02)
+        fake_server.delay = 0.2
+        second = client.post("/api/query", json=body, headers=auth_headers)
+        assert second.json()["stale"] is True
+        assert second.headers["x-cache-stale"] == "true"
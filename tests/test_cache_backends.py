@@ -0,0 +1,278 @@
+"""
+Тесты общих для нескольких процессов бэкендов кеша (SQLite, Redis)
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import date, datetime, time as dtime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from app.cache import QueryCache
+from app.cache_backends import (
+    RedisCacheBackend,
+    SqliteCacheBackend,
+    create_cache_backend,
+)
+from app.results import QueryResult, describe_columns
+from tests.fakes import FakeRedisServer, column
+
+
+def make_result():
+    description = [column("ID", int), column("PRICE", Decimal, precision=18, scale=-2)]
+    return QueryResult(describe_columns(description), [(1, Decimal("1.50")), (2, None)])
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    cache = SqliteCacheBackend(str(tmp_path / "cache.sqlite3"), max_bytes=1024 * 1024)
+    yield cache
+    cache.stop()
+
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer().start()
+    yield server
+    server.stop()
+
+
+class TestSqliteCacheBackend:
+    """Тесты кеша в файле SQLite"""
+
+    def test_roundtrip_query_result(self, sqlite_cache):
+        """QueryResult сохраняется и читается с исходными типами"""
+        assert sqlite_cache.set("key", make_result()) is True
+
+        result = sqlite_cache.get("key")
+
+        assert result.rows == [(1, Decimal("1.50")), (2, None)]
+        assert result.columns[1].type == "DECIMAL"
+        assert sqlite_cache.stats()["entries"] == 1
+
+    def test_roundtrip_types(self, sqlite_cache):
+        """Типы fdb, кортежи и словари восстанавливаются без pickle"""
+        description = [column("NAME", str), column("CREATED", datetime)]
+        columns = describe_columns(description)
+        value = {
+            "columns": columns,
+            "rows": [
+                ("a", datetime(2025, 1, 2, 3, 4, 5)),
+                (b"\x00\xff", date(2025, 1, 2), dtime(3, 4, 5), [1, (2, 3)], True, 1.5, None),
+            ],
+            "body": (b'{"data":[]}', 0, False),
+        }
+
+        assert sqlite_cache.set("key", value) is True
+        restored = sqlite_cache.get("key")
+
+        assert restored["rows"] == value["rows"]
+        assert restored["body"] == value["body"]
+        assert [c.python_type for c in restored["columns"]] == [str, datetime]
+        (blob,) = sqlite3.connect(sqlite_cache.path).execute("SELECT value FROM entries").fetchone()
+        assert blob.startswith(b"[")
+
+    def test_unsupported_value_not_stored(self, sqlite_cache):
+        """Значение неизвестного типа не сохраняется, а не ломает запрос"""
+        assert sqlite_cache.set("key", object()) is False
+        assert sqlite_cache.get("key") is None
+
+    def test_rejects_shared_directory(self, tmp_path):
+        """Файл в директории, куда могут писать другие, не открывается"""
+        shared = tmp_path / "shared"
+        shared.mkdir()
+        os.chmod(shared, 0o777)
+
+        with pytest.raises(PermissionError):
+            SqliteCacheBackend(str(shared / "cache.sqlite3"))
+
+    def test_rejects_writable_file(self, tmp_path):
+        """Существующий файл, доступный другим на запись, не открывается"""
+        path = tmp_path / "cache.sqlite3"
+        path.touch()
+        os.chmod(path, 0o666)
+
+        with pytest.raises(PermissionError):
+            SqliteCacheBackend(str(path))
+
+    def test_default_path_is_private(self, tmp_path, monkeypatch):
+        """По умолчанию файл создается в личной директории пользователя"""
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+        cache = SqliteCacheBackend()
+        try:
+            assert cache.path == str(tmp_path / "firebird-db-proxy" / "cache.sqlite3")
+            assert os.stat(cache.path).st_mode & 0o077 == 0
+        finally:
+            cache.stop()
+
+    def test_shared_between_instances(self, sqlite_cache, tmp_path):
+        """Второй экземпляр на том же файле видит записи первого"""
+        sqlite_cache.set("key", [1, 2, 3])
+        other = SqliteCacheBackend(str(tmp_path / "cache.sqlite3"))
+        try:
+            assert other.get("key") == [1, 2, 3]
+            other.delete("key")
+            assert sqlite_cache.get("key") is None
+        finally:
+            other.stop()
+
+    def test_shared_between_processes(self, sqlite_cache):
+        """Запись, сделанная другим процессом, видна в текущем"""
+        code = (
+            "from app.cache_backends import SqliteCacheBackend;"
+            f"SqliteCacheBackend({sqlite_cache.path!r}).set('key', {{'from': 'child'}})"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True, timeout=30)
+
+        assert sqlite_cache.get("key") == {"from": "child"}
+
+    def test_ttl_and_stale(self, tmp_path):
+        """Просроченная запись доступна как устаревшая только в пределах stale_grace"""
+        cache = SqliteCacheBackend(str(tmp_path / "c.sqlite3"), stale_grace=0.2)
+        try:
+            cache.set("key", "value", ttl=0.01)
+            time.sleep(0.02)
+
+            assert cache.get("key") is None
+            assert cache.lookup("key", allow_stale=True) == ("value", True)
+
+            time.sleep(0.2)
+            assert cache.lookup("key", allow_stale=True) == (None, False)
+            assert len(cache) == 0
+        finally:
+            cache.stop()
+
+    def test_eviction_by_budget(self, tmp_path):
+        """При превышении бюджета вытесняются записи с самым давним обращением"""
+        cache = SqliteCacheBackend(str(tmp_path / "c.sqlite3"), max_bytes=3000)
+        try:
+            for key in ("a", "b", "c"):
+                cache.set(key, "x" * 800)
+                time.sleep(0.01)
+            cache.set("d", "x" * 800)
+
+            assert cache.get("a") is None
+            assert cache.get("d") is not None
+            assert cache.stats()["bytes"] <= 3000
+            assert cache.stats()["evictions"] >= 1
+            assert cache.set("huge", "x" * 5000) is False
+        finally:
+            cache.stop()
+
+    def test_sweep_and_clear(self, sqlite_cache):
+        """sweep удаляет просроченные записи, clear - все"""
+        sqlite_cache.set("old", 1, ttl=0.01)
+        sqlite_cache.set("new", 2)
+        time.sleep(0.02)
+
+        assert sqlite_cache.sweep() == 1
+        assert sqlite_cache.clear() == 1
+
+
+class TestRedisCacheBackend:
+    """Тесты кеша на сервере Redis (локальная замена сервера)"""
+
+    def test_roundtrip_with_expiry(self, redis_server):
+        """Запись сохраняется с PX = TTL + stale_grace и читается обратно"""
+        cache = RedisCacheBackend(redis_server.url, prefix="t:", stale_grace=5)
+        try:
+            assert cache.set("key", make_result(), ttl=10) is True
+            assert cache.get("key").rows[0] == (1, Decimal("1.50"))
+
+            command = redis_server.commands[-2]
+            assert command[:2] == [b"SET", b"t:key"]
+            assert command[3:] == [b"PX", b"15000"]
+        finally:
+            cache.stop()
+
+    def test_stale_lookup(self, redis_server):
+        """После TTL запись отдается только как устаревшая"""
+        cache = RedisCacheBackend(redis_server.url, stale_grace=5)
+        try:
+            cache.set("key", "value", ttl=0.01)
+            time.sleep(0.02)
+
+            assert cache.get("key") is None
+            assert cache.lookup("key", allow_stale=True) == ("value", True)
+        finally:
+            cache.stop()
+
+    def test_clear_only_own_prefix(self, redis_server):
+        """clear удаляет только ключи с префиксом кеша"""
+        redis_server.data[b"other"] = b"keep"
+        cache = RedisCacheBackend(redis_server.url, prefix="t:")
+        try:
+            cache.set("a", 1)
+            cache.set("b", 2)
+
+            assert cache.clear() == 2
+            assert b"other" in redis_server.data
+        finally:
+            cache.stop()
+
+    def test_server_down_is_a_miss(self, redis_server):
+        """Недоступный сервер не ломает запросы: промах и счетчик ошибок"""
+        cache = RedisCacheBackend(redis_server.url, timeout=0.5)
+        redis_server.stop()
+
+        assert cache.set("key", 1) is False
+        assert cache.lookup("key") == (None, False)
+        assert cache.stats()["errors"] == 2
+        cache.stop()
+
+    def test_auth(self):
+        """Пароль из URL передается командой AUTH"""
+        server = FakeRedisServer(password="secret").start()
+        try:
+            good = RedisCacheBackend(f"redis://:secret@127.0.0.1:{server.port}/0")
+            bad = RedisCacheBackend(f"redis://:wrong@127.0.0.1:{server.port}/0")
+
+            assert good.set("key", 1) is True
+            assert bad.set("key", 1) is False
+            good.stop()
+            bad.stop()
+        finally:
+            server.stop()
+
+
+class TestCreateCacheBackend:
+    """Тесты выбора бэкенда по настройкам"""
+
+    def config(self, **overrides):
+        values = dict(
+            cache_backend="memory",
+            cache_max_bytes=1024 * 1024,
+            cache_ttl=60,
+            cache_shards=4,
+            cache_sweep_interval=0,
+            cache_stale_grace=0,
+            cache_path="",
+            cache_redis_url="redis://localhost:6379/0",
+            cache_redis_prefix="p:",
+        )
+        values.update(overrides)
+        return SimpleNamespace(**values)
+
+    def test_backends(self, tmp_path):
+        """Бэкенд выбирается по cache_backend"""
+        assert isinstance(create_cache_backend(self.config()), QueryCache)
+
+        cache = create_cache_backend(
+            self.config(cache_backend="SQLite", cache_path=str(tmp_path / "c.sqlite3"))
+        )
+        assert isinstance(cache, SqliteCacheBackend)
+        cache.stop()
+
+        assert isinstance(
+            create_cache_backend(self.config(cache_backend="redis")), RedisCacheBackend
+        )
+
+    def test_unknown_backend(self):
+        """Неизвестный бэкенд - ValueError"""
+        with pytest.raises(ValueError):
+            create_cache_backend(self.config(cache_backend="memcached"))
@@ -0,0 +1,160 @@
+"""
+Тесты каталога схемы
+"""
+
+import pytest
+
+from app.catalog import (
+    CATALOG_FIELDS_QUERY,
+    CATALOG_KEYS_QUERY,
+    CATALOG_VERSION_QUERY,
+    SchemaCatalog,
+    build_catalog,
+    describe_field,
+)
+
+# Строки RDB$ в том виде, как их отдает Firebird: имена дополнены пробелами
+FIELD_ROWS = [
+    ("GOODS" + " " * 26, "ID" + " " * 29, 1, None, 8, 0, 4, None, 0, 0),
+    ("GOODS", "NAME", None, None, 37, 0, 400, 100, None, 0),
+    ("GOODS", "PRICE", None, None, 16, 1, 8, None, 18, -2),
+    ("STORGRP", "ID", None, 1, 8, 0, 4, None, 0, 0),
+]
+KEY_ROWS = [
+    ("GOODS", "RDB$PRIMARY1", "PRIMARY KEY", "ID"),
+    ("GOODS", "UQ_GOODS_NAME", "UNIQUE", "NAME"),
+    ("GOODS", "UQ_GOODS_NAME", "UNIQUE", "PRICE"),
+    ("STORGRP", "IDX_STORGRP_ID", None, "ID"),
+]
+
+
+class FakeMetadata:
+    """Системные таблицы БД: версия метаданных и строки каталога"""
+
+    def __init__(self):
+        self.version = (10, 140, 25, 300, 40, 0, 45, 30)
+        self.fields = list(FIELD_ROWS)
+        self.keys = list(KEY_ROWS)
+        self.queries = []
+
+    def __call__(self, queries):
+        self.queries.extend(queries)
+        results = {
+            CATALOG_VERSION_QUERY: [self.version],
+            CATALOG_FIELDS_QUERY: self.fields,
+            CATALOG_KEYS_QUERY: self.keys,
+        }
+        return [results[query] for query in queries]
+
+
+class TestCatalogBuild:
+    """Тесты разбора RDB$ строк"""
+
+    @pytest.mark.parametrize(
+        "field, expected",
+        [
+            ((8, 0, 4, None, 0, 0), {"type": "INTEGER", "sql_type": "INTEGER"}),
+            (
+                (16, 2, 8, None, 15, -4),
+                {"type": "DECIMAL", "sql_type": "DECIMAL(15,4)", "precision": 15, "scale": 4},
+            ),
+            # Диалект 1: NUMERIC без подтипа и точности
+            (
+                (8, 0, 4, None, None, -2),
+                {"type": "NUMERIC", "sql_type": "NUMERIC(9,2)", "precision": 9, "scale": 2},
+            ),
+            ((14, 0, 12, 3, None, 0), {"type": "CHAR", "sql_type": "CHAR(3)", "length": 3}),
+            ((261, 1, 8, None, None, 0), {"type": "BLOB", "sql_type": "BLOB SUB_TYPE TEXT"}),
+            ((35, 0, 8, None, None, 0), {"type": "TIMESTAMP", "sql_type": "TIMESTAMP"}),
+        ],
+    )
+    def test_describe_field(self, field, expected):
+        """Типы, длина строк, точность и масштаб NUMERIC/DECIMAL"""
+        assert describe_field(*field) == expected
+
+    def test_build_catalog(self):
+        """Таблицы по имени в верхнем регистре, колонки по порядку, ключи"""
+        tables = build_catalog(FIELD_ROWS, KEY_ROWS)
+
+        assert list(tables) == ["GOODS", "STORGRP"]
+        goods = tables["GOODS"]
+        assert [c["name"] for c in goods["columns"]] == ["ID", "NAME", "PRICE"]
+        assert goods["columns"][1]["sql_type"] == "VARCHAR(100)"
+        assert goods["columns"][2]["sql_type"] == "NUMERIC(18,2)"
+        assert goods["primary_key"] == ["ID"]
+        assert goods["unique_keys"] == [["NAME", "PRICE"]]
+        # NOT NULL колонки или ее домена
+        assert [c["nullable"] for c in goods["columns"]] == [False, True, True]
+        assert tables["STORGRP"]["columns"][0]["nullable"] is False
+        # Уникальный индекс без ограничения - тоже уникальный ключ
+        assert tables["STORGRP"]["primary_key"] is None
+        assert tables["STORGRP"]["unique_keys"] == [["ID"]]
+
+
+class TestSchemaCatalog:
+    """Тесты загрузки и обновления каталога по версии метаданных"""
+
+    def test_lazy_load(self):
+        """Каталог загружается при первом обращении, если start() не вызывался"""
+        metadata = FakeMetadata()
+        catalog = SchemaCatalog(metadata, refresh_interval=0)
+
+        assert catalog.table("goods")["table"] == "GOODS"
+        assert metadata.queries.count(CATALOG_FIELDS_QUERY) == 1
+        assert catalog.snapshot().names == ["GOODS", "STORGRP"]
+
+    def test_refresh_on_version_change(self):
+        """Без изменения версии - только запрос версии; после ALTER - перечитывание"""
+        metadata = FakeMetadata()
+        catalog = SchemaCatalog(metadata, refresh_interval=0)
+        catalog.refresh(force=True)
+        etag = catalog.snapshot().etag
+
+        assert catalog.refresh() is False
+        assert metadata.queries.count(CATALOG_FIELDS_QUERY) == 1
+
+        metadata.fields.append(("GOODS", "CODE", None, None, 37, 0, 80, 20, None, 0))
+        metadata.version = (10, 140, 26, 301, 40, 0, 45, 30)
+
+        assert catalog.refresh() is True
+        assert catalog.snapshot().etag != etag
+        assert catalog.table("GOODS")["columns"][-1]["name"] == "CODE"
+        assert catalog.stats()["loads"] == 2
+
+    def test_same_content_keeps_etag(self):
+        """Новая версия метаданных без изменения таблиц не меняет ETag"""
+        metadata = FakeMetadata()
+        catalog = SchemaCatalog(metadata, refresh_interval=0)
+        etag = catalog.snapshot().etag
+
+        metadata.version = (11, 141, 25, 303, 40, 0, 45, 30)
+        catalog.refresh()
+
+        assert catalog.snapshot().etag == etag
+
+    def test_missing_table_checks_version(self, monkeypatch):
+        """Запрос неизвестной таблицы сверяет версию и находит новую таблицу"""
+        metadata = FakeMetadata()
+        catalog = SchemaCatalog(metadata, refresh_interval=60)
+        catalog.refresh(force=True)
+        monkeypatch.setattr("app.catalog.MISS_REFRESH_INTERVAL", 0)
+
+        metadata.fields.append(("ORDERS", "ID", 1, None, 8, 0, 4, None, 0, 0))
+        metadata.version = (11, 141, 26, 301, 40, 0, 45, 30)
+
+        assert catalog.table("orders")["table"] == "ORDERS"
+
+    def test_start_survives_database_error(self):
+        """Недоступная при старте БД не мешает запуску: каталог загрузится позже"""
+
+        def unavailable(queries):
+            raise ConnectionError("connection refused")
+
+        metadata = FakeMetadata()
+        catalog = SchemaCatalog(unavailable, refresh_interval=0)
+
+        catalog.start()
+        assert catalog.stats()["errors"] == 1
+
+        catalog.read = metadata
+        assert catalog.table("GOODS") is not None
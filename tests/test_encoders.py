@@ -0,0 +1,186 @@
+"""
+Тесты кодировщиков результатов (MessagePack, Arrow, CSV, NDJSON)
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from app.encoders import (
+    ArrowEncoder,
+    CsvEncoder,
+    JsonEncoder,
+    MsgpackEncoder,
+    NdjsonEncoder,
+    select_encoder,
+)
+from app.results import QueryResult, describe_columns
+from tests.fakes import column
+
+msgpack = pytest.importorskip("msgpack")
+
+META = {"success": True, "rows_count": 2, "execution_time": 0.1, "error": None, "timestamp": "t"}
+
+
+def make_result():
+    description = [
+        column("ID", int, nullable=False),
+        column("NAME", str),
+        column("PRICE", Decimal, precision=18, scale=-2),
+        column("DAY", date),
+        column("CREATED", datetime),
+    ]
+    rows = [
+        (1, "Тбилиси", Decimal("10.50"), date(2025, 1, 2), datetime(2025, 1, 2, 3, 4, 5)),
+        (2, None, None, None, None),
+    ]
+    return QueryResult(describe_columns(description), rows)
+
+
+class TestSelectEncoder:
+    """Тесты согласования формата по Accept"""
+
+    def test_default_json(self):
+        """Без Accept или с */* используется JSON"""
+        assert select_encoder(None) is None
+        assert select_encoder("*/*") is None
+        assert select_encoder("application/json") is None
+
+    def test_known_types(self):
+        """Поддерживаемые media type выбирают свой кодировщик"""
+        assert isinstance(select_encoder("application/msgpack"), MsgpackEncoder)
+        assert isinstance(select_encoder("application/x-msgpack"), MsgpackEncoder)
+        assert isinstance(select_encoder("text/csv"), CsvEncoder)
+        assert isinstance(select_encoder("application/x-ndjson"), NdjsonEncoder)
+
+    def test_quality_order(self):
+        """Учитывается q-фактор"""
+        encoder = select_encoder("text/csv;q=0.5, application/msgpack;q=0.9")
+        assert isinstance(encoder, MsgpackEncoder)
+
+    def test_unknown_falls_back_to_json(self):
+        """Неизвестный формат - обычный JSON"""
+        assert select_encoder("text/html, application/xml") is None
+        # Arrow IPC file не поддерживается: поток под этим типом не прочитать
+        assert select_encoder("application/vnd.apache.arrow.file") is None
+
+
+class TestEncoders:
+    """Тесты буферизованного и потокового кодирования"""
+
+    def test_msgpack_native_types(self):
+        """MessagePack сохраняет Decimal точно и передает TIMESTAMP как Timestamp"""
+        body = MsgpackEncoder().encode(make_result(), META, "objects", "rows")
+        data = msgpack.unpackb(body, timestamp=3)
+
+        row = data["data"][0]
+        assert row["PRICE"] == "10.50"
+        assert row["DAY"] == "2025-01-02"
+        assert row["CREATED"].replace(tzinfo=None) == datetime(2025, 1, 2, 3, 4, 5)
+        assert data["rows_count"] == 2
+
+    def test_msgpack_stream(self):
+        """Потоковый MessagePack: заголовок, строки-массивы, trailer"""
+        writer = MsgpackEncoder().stream("columnar")
+        body = writer.write(make_result()) + writer.trailer(META)
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(body)
+        items = list(unpacker)
+        assert items[0]["_header"]["columns"][0]["name"] == "ID"
+        assert items[1][0] == 1
+        assert items[-1]["_trailer"]["success"] is True
+
+    def test_csv(self):
+        """CSV: BOM, заголовок, точные значения, пустые NULL"""
+        body = CsvEncoder().encode(make_result(), META, "objects", "rows").decode("utf-8")
+        lines = body.lstrip("\ufeff").splitlines()
+
+        assert lines[0] == "ID,NAME,PRICE,DAY,CREATED"
+        assert lines[1] == "1,Тбилиси,10.50,2025-01-02,2025-01-02 03:04:05"
+        assert lines[2] == "2,,,,"
+
+    def test_ndjson_buffered(self):
+        """NDJSON без потока: строки и trailer"""
+        body = NdjsonEncoder().encode(make_result(), META, "objects", "rows")
+        lines = [json.loads(line) for line in body.splitlines()]
+
+        assert lines[0]["ID"] == 1
+        assert lines[-1]["_trailer"]["rows_count"] == 2
+
+    def test_arrow_roundtrip(self):
+        """Arrow IPC: типизированные колонки, одинаково в буфере и потоке"""
+        pa = pytest.importorskip("pyarrow")
+        encoder = ArrowEncoder()
+
+        table = pa.ipc.open_stream(
+            encoder.encode(make_result(), META, "objects", "rows")
+        ).read_all()
+        assert str(table.schema.field("ID").type) == "int32"
+        assert str(table.schema.field("PRICE").type) == "decimal128(18, 2)"
+        assert str(table.schema.field("DAY").type) == "date32[day]"
+        assert table.column("PRICE")[0].as_py() == Decimal("10.50")
+        assert json.loads(table.schema.metadata[b"rows_count"]) == 2
+
+        writer = encoder.stream("objects")
+        body = writer.write(make_result()) + writer.write(make_result()) + writer.trailer(META)
+        streamed = pa.ipc.open_stream(body).read_all()
+        assert streamed.num_rows == 4
+
+
+class TestAssemble:
+    """Тесты сборки тела ответа из закешированного payload и метаданных"""
+
+    def test_json_objects(self):
+        """JSON: data из payload, метаданные подставляются в тот же объект"""
+        encoder = JsonEncoder()
+        payload = encoder.encode_payload(make_result(), "objects", "rows")
+
+        body = json.loads(encoder.assemble(payload, META))
+
+        assert body["data"][0]["NAME"] == "Тбилиси"
+        assert body["data"][0]["PRICE"] == 10.5
+        assert body["rows_count"] == 2
+        assert body["timestamp"] == "t"
+
+    def test_json_columnar(self):
+        """JSON columnar: columns/layout/data из payload"""
+        encoder = JsonEncoder()
+        body = json.loads(encoder.encode(make_result(), META, "columnar", "columns"))
+
+        assert body["layout"] == "columns"
+        assert body["data"][0] == [1, 2]
+        assert body["success"] is True
+
+    def test_msgpack_same_payload_new_meta(self):
+        """MessagePack: один payload с разными метаданными"""
+        encoder = MsgpackEncoder()
+        payload = encoder.encode_payload(make_result(), "columnar", "rows")
+
+        first = msgpack.unpackb(encoder.assemble(payload, META), timestamp=3)
+        second = msgpack.unpackb(encoder.assemble(payload, dict(META, timestamp="u")), timestamp=3)
+
+        assert first["data"] == second["data"]
+        assert first["columns"][0]["name"] == "ID"
+        assert (first["timestamp"], second["timestamp"]) == ("t", "u")
+
+    def test_arrow_metadata_replaced(self):
+        """Arrow: метаданные схемы подставляются в закешированный поток"""
+        pa = pytest.importorskip("pyarrow")
+        encoder = ArrowEncoder()
+        payload = encoder.encode_payload(make_result(), "objects", "rows")
+
+        table = pa.ipc.open_stream(encoder.assemble(payload, META)).read_all()
+
+        assert table.num_rows == 2
+        assert json.loads(table.schema.metadata[b"timestamp"]) == "t"
+
+    def test_json_matches_to_dicts(self):
+        """JSON из исходных строк совпадает с прежней сериализацией to_dicts()"""
+        result = make_result()
+        body = json.loads(JsonEncoder().encode(result, META, "objects", "rows"))
+
+        assert body["data"] == json.loads(json.dumps(result.to_dicts(), default=str))
+        assert body["data"][0]["CREATED"] == "2025-01-02T03:04:05"
+        assert body["data"][0]["DAY"] == "2025-01-02"
@@ -0,0 +1,69 @@
+"""
+Тесты executor'а для блокирующих вызовов БД
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.executor import DBExecutor, ExecutorBusyError
+
+
+class TestDBExecutor:
+    """Тесты DBExecutor"""
+
+    def test_runs_in_worker_thread(self):
+        """Функция должна выполняться вне потока event loop"""
+        executor = DBExecutor(max_workers=2, max_queue=2)
+
+        async def main():
+            return await executor.run(threading.current_thread)
+
+        thread = asyncio.run(main())
+        assert thread is not threading.current_thread()
+        assert thread.name.startswith("db")
+        executor.shutdown()
+
+    def test_passes_arguments_and_errors(self):
+        """Аргументы и исключения должны пробрасываться"""
+        executor = DBExecutor(max_workers=1, max_queue=0)
+
+        def divide(a, b=1):
+            return a / b
+
+        async def main():
+            assert await executor.run(divide, 6, b=3) == 2
+            with pytest.raises(ZeroDivisionError):
+                await executor.run(divide, 1, b=0)
+
+        asyncio.run(main())
+        assert executor.stats()["completed_total"] == 2
+        executor.shutdown()
+
+    def test_rejects_when_queue_full(self):
+        """При переполнении очереди должен отдаваться ExecutorBusyError"""
+        executor = DBExecutor(max_workers=1, max_queue=1, retry_after=3)
+        gate = threading.Event()
+
+        async def main():
+            running = asyncio.ensure_future(executor.run(gate.wait, 5))
+            queued = asyncio.ensure_future(executor.run(gate.wait, 5))
+            await asyncio.sleep(0.05)
+
+            stats = executor.stats()
+            assert stats["active"] == 1
+            assert stats["queued"] == 1
+
+            with pytest.raises(ExecutorBusyError) as exc_info:
+                await executor.run(gate.wait, 5)
+            assert exc_info.value.retry_after == 3
+
+            gate.set()
+            await asyncio.gather(running, queued)
+
+        asyncio.run(main())
+        stats = executor.stats()
+        assert stats["rejected_total"] == 1
+        assert stats["queued"] == 0
+        executor.shutdown()
@@ -0,0 +1,93 @@
+"""
+Тесты метрик в формате Prometheus
+"""
+
+import threading
+
+from app.metrics import BoundedLabel, MetricsRegistry, family
+
+
+class TestMetricsRegistry:
+    """Тесты счетчиков, гистограмм и вывода в text format"""
+
+    def test_counter_render(self):
+        """Счетчик с метками выводится с HELP, TYPE и экранированными значениями"""
+        registry = MetricsRegistry()
+        requests = registry.counter("requests_total", "Requests", ("endpoint",))
+
+        requests.inc(("/api/query",))
+        requests.inc(("/api/query",), 2)
+        requests.inc(('say "hi"\n',))
+
+        lines = registry.render().splitlines()
+        assert lines[:2] == [
+            "# HELP fdbproxy_requests_total Requests",
+            "# TYPE fdbproxy_requests_total counter",
+        ]
+        assert 'fdbproxy_requests_total{endpoint="/api/query"} 3' in lines
+        assert 'fdbproxy_requests_total{endpoint="say \\"hi\\"\\n"} 1' in lines
+
+    def test_histogram_render(self):
+        """Корзины накопительные, +Inf и _count совпадают с числом наблюдений"""
+        registry = MetricsRegistry()
+        latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.observe(value)
+
+        text = registry.render()
+        assert 'fdbproxy_latency_seconds_bucket{le="0.1"} 2' in text
+        assert 'fdbproxy_latency_seconds_bucket{le="1"} 3' in text
+        assert 'fdbproxy_latency_seconds_bucket{le="+Inf"} 4' in text
+        assert "fdbproxy_latency_seconds_sum 3.65" in text
+        assert "fdbproxy_latency_seconds_count 4" in text
+
+    def test_threads_merged(self):
+        """Каждый поток пишет в свои значения; вывод складывает все потоки"""
+        registry = MetricsRegistry()
+        rows = registry.counter("rows_total", "Rows")
+        latency = registry.histogram("latency_seconds", "Latency")
+
+        def work():
+            for _ in range(1000):
+                rows.inc()
+                latency.observe(0.002)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert rows.value() == 4000
+        assert latency.count() == 4000
+
+    def test_disabled(self):
+        """Выключенный набор метрик ничего не записывает"""
+        registry = MetricsRegistry(enabled=False)
+        rows = registry.counter("rows_total", "Rows")
+
+        rows.inc(amount=10)
+
+        assert rows.value() == 0
+
+    def test_state_family(self):
+        """Значения, снятые из stats(); неизвестные (None) не выводятся"""
+        registry = MetricsRegistry()
+
+        text = registry.render(
+            [
+                family("pool_waiters", "gauge", "Waiters", {None: 2}),
+                family("cache_bytes", "gauge", "Bytes", {(("backend", "redis"),): None}),
+            ]
+        )
+
+        assert "fdbproxy_pool_waiters 2" in text
+        assert "# TYPE fdbproxy_cache_bytes gauge" in text
+        assert "fdbproxy_cache_bytes{" not in text
+
+    def test_bounded_label(self):
+        """Сверх лимита новые значения метки заменяются на other"""
+        label = BoundedLabel(2)
+
+        assert [label(v) for v in ("a", "b", "c", "a")] == ["a", "b", "other", "a"]
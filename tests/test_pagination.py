@@ -0,0 +1,79 @@
+"""
+Тесты сессий постраничной выдачи
+"""
+
+import pytest
+
+from app.cache import QueryCache
+from app.pagination import (
+    PageSessionError,
+    PageSessions,
+    PageTokenError,
+    decode_token,
+    encode_token,
+)
+from app.results import QueryResult, describe_columns
+from tests.fakes import column
+
+
+def make_result(rows):
+    return QueryResult(describe_columns([column("ID", int)]), [(i,) for i in range(rows)])
+
+
+@pytest.fixture
+def sessions():
+    return PageSessions(QueryCache(max_bytes=1024 * 1024, shards=1, sweep_interval=0), ttl=60)
+
+
+class TestPageSessions:
+    """Тесты PageSessions"""
+
+    def test_token_roundtrip(self):
+        """Токен кодирует сессию и номер страницы"""
+        assert decode_token(encode_token("abc_-1", 7)) == ("abc_-1", 7)
+        for token in ("", "!!!", encode_token("abc", 0), "YWJj"):
+            with pytest.raises(PageTokenError):
+                decode_token(token)
+
+    def test_pages_stored_separately(self, sessions):
+        """Каждая страница, кроме первой, - отдельная запись кеша"""
+        first, token = sessions.open("key", make_result(5), page_size=2)
+
+        assert first.rows == [(0,), (1,)]
+        # Заголовок сессии + страницы 1 и 2
+        assert len(sessions.cache) == 3
+
+        second, token = sessions.read(token, "key")
+        third, token = sessions.read(token, "key")
+
+        assert (second.rows, third.rows, token) == ([(2,), (3,)], [(4,)], None)
+        assert third.columns[0].name == "ID"
+        assert sessions.stats()["pages_served"] == 3
+
+    def test_expired_session(self, sessions):
+        """Удаленная из кеша сессия - PageTokenError"""
+        _, token = sessions.open("key", make_result(3), page_size=1)
+        sessions.cache.clear()
+
+        with pytest.raises(PageTokenError, match="expired"):
+            sessions.read(token, "key")
+        assert sessions.stats()["expired"] == 1
+
+    def test_page_out_of_range(self, sessions):
+        """Номер страницы за пределами сессии отклоняется"""
+        _, token = sessions.open("key", make_result(3), page_size=2)
+        session_id, _ = decode_token(token)
+
+        with pytest.raises(PageTokenError):
+            sessions.read(encode_token(session_id, 5), "key")
+
+    def test_result_too_large(self):
+        """Если страница не помещается в кеш, токен не выдается, сохраненное удаляется"""
+        sessions = PageSessions(QueryCache(max_bytes=2048, shards=1, sweep_interval=0), ttl=60)
+
+        with pytest.raises(PageSessionError, match="too large"):
+            sessions.open("key", make_result(3000), page_size=1000)
+
+        assert len(sessions.cache) == 0
+        assert sessions.stats()["rejected"] == 1
+        assert sessions.stats()["opened"] == 0
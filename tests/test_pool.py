@@ -0,0 +1,181 @@
+"""
+Тесты пула соединений
+"""
+
+import threading
+import time
+
+import pytest
+
+from app.pool import ConnectionPool, PoolTimeoutError, PoolClosedError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise RuntimeError("connection lost")
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Соединение-заглушка вместо fdb.Connection"""
+
+    def __init__(self):
+        self.broken = False
+        self.closed = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.broken:
+            raise RuntimeError("connection lost")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnector:
+    def __init__(self):
+        self.created = []
+
+    def __call__(self):
+        conn = FakeConnection()
+        self.created.append(conn)
+        return conn
+
+
+def make_pool(**kwargs):
+    connector = FakeConnector()
+    params = dict(min_size=1, max_size=2, acquire_timeout=0.2, max_lifetime=0, ping_interval=0)
+    params.update(kwargs)
+    return ConnectionPool(connector, **params), connector
+
+
+class TestConnectionPool:
+    """Тесты ConnectionPool"""
+
+    def test_warm_connections_on_start(self):
+        """При старте должно открываться min_size соединений"""
+        pool, connector = make_pool(min_size=2, max_size=4)
+        pool.start()
+
+        assert len(connector.created) == 2
+        stats = pool.stats()
+        assert stats["idle"] == 2
+        assert stats["in_use"] == 0
+        pool.close()
+
+    def test_connection_reused(self):
+        """Возвращенное соединение должно переиспользоваться"""
+        pool, connector = make_pool()
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        assert first is second
+        assert len(connector.created) == 1
+        assert first.rollbacks >= 1
+
+    def test_max_size_respected(self):
+        """Больше max_size соединений не открывается, ожидание завершается таймаутом"""
+        pool, connector = make_pool(max_size=2)
+        a = pool.acquire()
+        b = pool.acquire()
+
+        with pytest.raises(PoolTimeoutError):
+            pool.acquire(timeout=0.05)
+
+        assert len(connector.created) == 2
+        assert pool.stats()["acquire_timeouts"] == 1
+        pool.release(a)
+        pool.release(b)
+
+    def test_waiter_gets_released_connection(self):
+        """Ожидающий поток должен получить освободившееся соединение"""
+        pool, _ = make_pool(max_size=1, acquire_timeout=2)
+        held = pool.acquire()
+        result = {}
+
+        def waiter():
+            result["conn"] = pool.acquire()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.05)
+        assert pool.stats()["waiters"] == 1
+
+        pool.release(held)
+        thread.join(timeout=2)
+
+        assert result["conn"] is held
+        assert pool.stats()["acquire_wait_max_ms"] > 0
+
+    def test_broken_connection_evicted(self):
+        """Сломанное соединение не должно возвращаться в пул"""
+        pool, connector = make_pool()
+
+        with pytest.raises(RuntimeError):
+            with pool.connection() as conn:
+                conn.broken = True
+                conn.cursor().execute("SELECT 1 FROM RDB$DATABASE")
+
+        assert conn.closed
+        stats = pool.stats()
+        assert stats["size"] == 0
+        assert stats["evicted_total"] == 1
+
+        with pool.connection() as fresh:
+            assert fresh is not conn
+
+    def test_max_lifetime_recycles(self):
+        """Соединение старше max_lifetime должно пересоздаваться"""
+        pool, connector = make_pool(max_lifetime=0.05)
+        with pool.connection() as first:
+            pass
+
+        time.sleep(0.06)
+        with pool.connection() as second:
+            pass
+
+        assert first is not second
+        assert first.closed
+        stats = pool.stats()
+        assert (stats["in_use"], stats["idle"], stats["size"]) == (0, 1, 1)
+
+    def test_maintain_pings_idle(self):
+        """Обслуживание должно вытеснять соединения, не прошедшие пинг"""
+        pool, connector = make_pool(min_size=1, ping_interval=0.01)
+        pool.start()
+        conn = connector.created[0]
+        conn.broken = True
+
+        time.sleep(0.02)
+        pool.maintain()
+
+        assert conn.closed
+        # Пул добирает соединения до min_size
+        assert len(connector.created) == 2
+        assert pool.stats()["idle"] == 1
+        pool.close()
+
+    def test_closed_pool_rejects(self):
+        """Закрытый пул не выдает соединения"""
+        pool, _ = make_pool()
+        pool.start()
+        pool.close()
+
+        with pytest.raises(PoolClosedError):
+            pool.acquire()
@@ -0,0 +1,97 @@
+"""
+Тесты фоновой проверки БД для health check
+"""
+
+import time
+
+from app.prober import HealthProber
+
+
+class FlakyProbe:
+    """Проверка, результат которой задается тестом"""
+
+    def __init__(self):
+        self.error = None
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+
+
+class TestHealthProber:
+    """Тесты порога неудач, устаревания состояния и фонового потока"""
+
+    def test_not_ready_before_first_check(self):
+        """Пока проверок не было, БД не готова"""
+        prober = HealthProber(FlakyProbe())
+
+        state = prober.state()
+
+        assert prober.ready is False
+        assert state["connected"] is False
+        assert state["last_check"] is None
+        assert state["checks_total"] == 0
+
+    def test_failure_threshold(self):
+        """Одна неудача не снимает готовность, failure_threshold подряд - снимает"""
+        probe = FlakyProbe()
+        prober = HealthProber(probe, failure_threshold=2)
+        assert prober.check() is True
+
+        probe.error = ConnectionError("connection refused")
+        assert prober.check() is False
+        assert prober.ready is True
+
+        prober.check()
+        state = prober.state()
+        assert prober.ready is False
+        assert state["connected"] is False
+        assert state["consecutive_failures"] == 2
+        assert state["last_error"] == "connection refused"
+        assert state["last_success"] is not None
+
+    def test_recovery(self):
+        """Первая успешная проверка после сбоя возвращает готовность"""
+        probe = FlakyProbe()
+        prober = HealthProber(probe, failure_threshold=1)
+        probe.error = RuntimeError()
+        prober.check()
+        assert prober.ready is False
+        assert prober.state()["last_error"] == "RuntimeError"
+
+        probe.error = None
+        prober.check()
+
+        state = prober.state()
+        assert state["ready"] is True
+        assert state["last_error"] is None
+        assert (state["checks_total"], state["failures_total"]) == (2, 1)
+
+    def test_stale_state(self, monkeypatch):
+        """Давно не обновлявшееся состояние не считается готовностью"""
+        prober = HealthProber(FlakyProbe(), interval=5, stale_after=20)
+        prober.check()
+        now = time.monotonic()
+
+        monkeypatch.setattr("app.prober.time.monotonic", lambda: now + 21)
+
+        assert prober.ready is False
+
+    def test_background_checks(self):
+        """start() проверяет сразу и затем раз в interval в фоне; close() останавливает"""
+        probe = FlakyProbe()
+        prober = HealthProber(probe, interval=0.1)
+
+        assert prober.start() is True
+        deadline = time.monotonic() + 5
+        while probe.calls < 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        prober.close()
+        calls = probe.calls
+        time.sleep(0.25)
+
+        assert calls >= 3
+        assert probe.calls == calls
+        assert prober.ready is True
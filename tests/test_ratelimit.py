@@ -0,0 +1,186 @@
+"""
+Тесты лимитов запросов на токен
+"""
+
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.ratelimit import (
+    MemoryRateLimitStore,
+    RateLimitExceeded,
+    RateLimiter,
+    RateLimitStoreError,
+    SqliteRateLimitStore,
+    create_rate_limiter,
+)
+from app.timeouts import CancelScope
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryRateLimitStore()
+        return
+    store = SqliteRateLimitStore(str(tmp_path / "limits.sqlite3"))
+    yield store
+    store.close()
+
+
+class TestRateLimiter:
+    """Тесты GCRA, одновременных запросов и бюджета стоимости"""
+
+    def test_requests_per_minute(self, store):
+        """Сверх лимита - RateLimitExceeded с Retry-After, отклоненный не расходует лимит"""
+        limiter = RateLimiter(store, per_minute=3, per_hour=0)
+
+        remaining = [limiter.acquire("t").headers["X-RateLimit-Remaining"] for _ in range(3)]
+        with pytest.raises(RateLimitExceeded) as exc:
+            limiter.acquire("t")
+
+        assert remaining == ["2", "1", "0"]
+        assert exc.value.retry_after == 20
+        assert exc.value.headers["Retry-After"] == "20"
+        assert exc.value.headers["X-RateLimit-Remaining"] == "0"
+        assert limiter.stats()["rejected"]["rate"] == 1
+
+        # Лимит у каждого токена свой
+        limiter.acquire("other")
+
+    def test_tightest_window_in_headers(self, store):
+        """Заголовки показывают окно, в котором осталось меньше запросов"""
+        limiter = RateLimiter(store, per_minute=10, per_hour=2)
+
+        headers = limiter.acquire("t").headers
+
+        assert headers["X-RateLimit-Limit"] == "2"
+        assert headers["X-RateLimit-Remaining"] == "1"
+        assert int(headers["X-RateLimit-Reset"]) >= time.time()
+
+    def test_concurrent(self, store):
+        """Одновременных запросов не больше concurrent; release освобождает место"""
+        limiter = RateLimiter(store, per_minute=0, per_hour=0, concurrent=2)
+
+        first = limiter.acquire("t")
+        limiter.acquire("t")
+        with pytest.raises(RateLimitExceeded):
+            limiter.acquire("t")
+
+        limiter.release(first)
+        limiter.acquire("t")
+        assert limiter.stats()["rejected"]["concurrency"] == 1
+
+    def test_expired_lease(self, store, monkeypatch):
+        """Аренда, не возвращенная упавшим процессом, истекает сама"""
+        limiter = RateLimiter(store, per_minute=0, per_hour=0, concurrent=1)
+        monkeypatch.setattr("app.ratelimit.LEASE_TTL", 0.01)
+        limiter.acquire("t")
+        with pytest.raises(RateLimitExceeded):
+            limiter.acquire("t")
+
+        time.sleep(0.02)
+        limiter.acquire("t")
+
+    def test_rows_budget(self, store):
+        """Токен, выбравший бюджет строк, получает 429 до погашения долга"""
+        limiter = RateLimiter(store, per_minute=0, per_hour=0, rows_per_window=100, cost_window=60)
+
+        lease = limiter.acquire("t")
+        lease.charge(150)
+        limiter.release(lease)
+
+        with pytest.raises(RateLimitExceeded) as exc:
+            limiter.acquire("t")
+        assert "100 rows per 60s budget exhausted" in str(exc.value)
+        # Долг 90 секунд при окне 60 - ждать около 30
+        assert 25 <= exc.value.retry_after <= 31
+
+    def test_db_seconds_budget(self, store):
+        """С бюджета списывается время БД запросов допуска, а не время допуска"""
+        limiter = RateLimiter(
+            store, per_minute=0, per_hour=0, db_seconds_per_window=60, cost_window=60
+        )
+
+        lease = limiter.acquire("t")
+        time.sleep(0.05)
+        limiter.release(lease)
+        # Без выполненных запросов (ответ из кеша) бюджет не тратится
+        limiter.release(limiter.acquire("t"))
+
+        lease = limiter.acquire("t")
+        lease.track(CancelScope(0)).add_db_time(50)
+        lease.track(CancelScope(0)).add_db_time(40)
+        limiter.release(lease)
+
+        with pytest.raises(RateLimitExceeded) as exc:
+            limiter.acquire("t")
+        assert "db_seconds" in str(exc.value)
+
+    def test_shared_between_processes(self, tmp_path):
+        """Два лимитера над одним файлом SQLite (как два worker'а) делят лимит"""
+        path = str(tmp_path / "limits.sqlite3")
+        first = RateLimiter(SqliteRateLimitStore(path), per_minute=2, per_hour=0)
+        second = RateLimiter(SqliteRateLimitStore(path), per_minute=2, per_hour=0)
+
+        first.acquire("t")
+        second.acquire("t")
+        with pytest.raises(RateLimitExceeded):
+            first.acquire("t")
+
+    def test_store_failure_allows(self):
+        """Недоступное хранилище не блокирует запросы"""
+
+        class BrokenStore(MemoryRateLimitStore):
+            def transact(self, keys, update):
+                raise RateLimitStoreError("database is locked")
+
+        limiter = RateLimiter(BrokenStore(), per_minute=1, concurrent=1)
+
+        limiter.acquire("t")
+        limiter.release(limiter.acquire("t"))
+        assert limiter.stats()["errors"] == 2
+
+
+class TestSqliteRateLimitStore:
+    """Тесты файла состояния лимитов"""
+
+    def test_rejects_shared_directory(self, tmp_path):
+        """Файл состояния в общей для записи директории отвергается"""
+        shared = tmp_path / "shared"
+        shared.mkdir()
+        os.chmod(shared, 0o1777)
+
+        with pytest.raises(PermissionError):
+            SqliteRateLimitStore(str(shared / "limits.sqlite3"))
+
+
+class TestCreateRateLimiter:
+    """Тесты выбора хранилища по настройкам"""
+
+    def config(self, tmp_path, backend):
+        return SimpleNamespace(
+            rate_limit_backend=backend,
+            rate_limit_path=str(tmp_path / "limits.sqlite3"),
+            rate_limit_per_minute=60,
+            rate_limit_per_hour=0,
+            rate_limit_concurrent=0,
+            rate_limit_rows_per_window=0,
+            rate_limit_db_seconds_per_window=0,
+            rate_limit_cost_window=3600,
+        )
+
+    def test_auto_backend(self, tmp_path, monkeypatch):
+        """auto: общий sqlite при нескольких worker-процессах, иначе memory"""
+        monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+        limiter = create_rate_limiter(self.config(tmp_path, "auto"))
+        assert isinstance(limiter.store, MemoryRateLimitStore)
+
+        monkeypatch.setenv("WEB_CONCURRENCY", "4")
+        limiter = create_rate_limiter(self.config(tmp_path, "auto"))
+        assert isinstance(limiter.store, SqliteRateLimitStore)
+        limiter.store.close()
+
+        limiter = create_rate_limiter(self.config(tmp_path, "memory"))
+        assert isinstance(limiter.store, MemoryRateLimitStore)
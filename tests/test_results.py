@@ -0,0 +1,177 @@
+"""
+Тесты представления результатов запроса
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+from app.results import (
+    QueryResult,
+    ResultLimits,
+    conversion_plan,
+    convert_rows,
+    describe_columns,
+    row_size,
+)
+from tests.fakes import column
+
+
+def make_result(rows):
+    description = [
+        column("ID", int, nullable=False),
+        column("CITY", str),
+        column("PRICE", Decimal, precision=18, scale=-2),
+        column("CREATED", datetime),
+    ]
+    return QueryResult(describe_columns(description), rows)
+
+
+class TestDescribeColumns:
+    """Тесты описания колонок по cursor.description"""
+
+    def test_firebird_types(self):
+        """Типы fdb должны отображаться в имена типов Firebird"""
+        columns = describe_columns(
+            [
+                column("ID", int, nullable=False),
+                column("NAME", str),
+                column("PRICE", Decimal, precision=18, scale=-2),
+                column("DAY", date),
+                ("NOTE", str, 0, 8, 0, 1, True),
+            ]
+        )
+
+        assert [c.type for c in columns] == [
+            "INTEGER",
+            "VARCHAR",
+            "DECIMAL",
+            "DATE",
+            "BLOB SUB_TYPE TEXT",
+        ]
+        assert columns[0].nullable is False
+        assert columns[1].length == 50
+        assert (columns[2].precision, columns[2].scale) == (18, 2)
+
+
+class TestQueryResult:
+    """Тесты QueryResult"""
+
+    def test_to_dicts(self):
+        """Строки должны преобразовываться в JSON-совместимые словари"""
+        result = make_result([(1, "Тбилиси", Decimal("1.50"), datetime(2025, 1, 2, 3, 4, 5))])
+
+        assert result.to_dicts() == [
+            {"ID": 1, "CITY": "Тбилиси", "PRICE": 1.5, "CREATED": "2025-01-02T03:04:05"}
+        ]
+
+    def test_columnar_rows_layout(self):
+        """Колоночный формат: описание колонок один раз, строки массивами"""
+        result = make_result([(1, "A", None, None), (2, "B", None, None)])
+
+        columnar = result.to_columnar()
+
+        assert [c["name"] for c in columnar["columns"]] == ["ID", "CITY", "PRICE", "CREATED"]
+        assert columnar["columns"][2]["type"] == "DECIMAL"
+        assert columnar["data"] == [[1, "A", None, None], [2, "B", None, None]]
+
+    def test_columnar_columns_layout(self):
+        """layout=columns должен отдавать массивы по колонкам"""
+        result = make_result([(1, "A", None, None), (2, "B", None, None)])
+
+        columnar = result.to_columnar(layout="columns")
+
+        assert columnar["data"][0] == [1, 2]
+        assert columnar["data"][1] == ["A", "B"]
+
+    def test_dictionary_encoding_low_cardinality(self):
+        """Строковая колонка с малым числом значений кодируется словарем"""
+        cities = ["Тбилиси", "Батуми", None]
+        result = make_result([(i, cities[i % 3], None, None) for i in range(60)])
+
+        columnar = result.to_columnar(layout="columns")
+
+        city = columnar["columns"][1]
+        assert city["dictionary"] == ["Тбилиси", "Батуми"]
+        assert columnar["data"][1][:4] == [0, 1, None, 0]
+        # Числовые колонки не кодируются
+        assert columnar["columns"][0]["dictionary"] is None
+
+    def test_no_dictionary_for_high_cardinality(self):
+        """Уникальные строки не должны кодироваться словарем"""
+        result = make_result([(i, f"name-{i}", None, None) for i in range(60)])
+
+        columnar = result.to_columnar()
+
+        assert columnar["columns"][1]["dictionary"] is None
+        assert columnar["data"][5][1] == "name-5"
+
+    def test_empty_result(self):
+        """Пустой результат сохраняет описание колонок"""
+        columnar = make_result([]).to_columnar()
+
+        assert len(columnar["columns"]) == 4
+        assert columnar["data"] == []
+
+
+class TestConversionPlan:
+    """Тесты плана преобразования колонок"""
+
+    def test_only_columns_needing_conversion(self):
+        """Числа и строки копируются как есть, остальные колонки получают преобразователь"""
+        result = make_result([])
+        plan = conversion_plan(result.columns)
+
+        assert [i for i, _ in plan] == [2, 3]
+
+    def test_convert_rows(self):
+        """План применяется к колонкам целиком, NULL сохраняется"""
+        # BLOB SUB_TYPE 0: display_size 0, sub_type 0 в scale
+        columns = describe_columns(
+            [column("ID", int), ("DATA", str, 0, 8, 0, 0, True), column("D", date)]
+        )
+        rows = [(1, b"\xd0\x90", date(2025, 1, 2)), (2, None, None)]
+
+        assert convert_rows(rows, conversion_plan(columns)) == [
+            (1, "А", "2025-01-02"),
+            (2, None, None),
+        ]
+
+    def test_no_plan_returns_rows(self):
+        """Без преобразований строки не копируются"""
+        rows = [(1, "a")]
+        assert convert_rows(rows, []) is rows
+
+
+class TestResultLimits:
+    """Тесты лимитов результата"""
+
+    def test_rows_limit(self):
+        """Лимит строк: лишние отбрасываются, следующий fetchmany не нужен"""
+        budget = ResultLimits(max_rows=5).budget()
+
+        assert budget.next_size(4) == 4
+        assert budget.take([(i,) for i in range(4)]) == [(0,), (1,), (2,), (3,)]
+        assert budget.next_size(4) == 2
+        assert budget.take([(4,), (5,)]) == [(4,)]
+        assert budget.exhausted is True
+
+    def test_exact_rows_not_truncated(self):
+        """Ровно max_rows строк - результат не обрезан"""
+        budget = ResultLimits(max_rows=2).budget()
+        budget.take([(1,), (2,)])
+
+        assert budget.exhausted is False
+
+    def test_bytes_limit(self):
+        """Лимит объема: строки принимаются, пока оценка объема в пределах"""
+        rows = [("x" * 100,)] * 10
+        budget = ResultLimits(max_bytes=row_size(rows) * 3.5).budget()
+
+        assert len(budget.take(rows)) == 3
+        assert budget.exhausted is True
+
+    def test_cache_suffix(self):
+        """Без лимитов ключ кеша не меняется"""
+        assert ResultLimits().cache_suffix() == ""
+        assert not ResultLimits()
+        assert ResultLimits(10, 0).cache_suffix() != ResultLimits(20, 0).cache_suffix()
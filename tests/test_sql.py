@@ -0,0 +1,65 @@
+"""
+Тесты нормализации и fingerprint SQL запросов
+"""
+
+from app.sql import normalize_query, strip_comments
+
+
+class TestNormalizeQuery:
+    """Тесты канонической формы запроса"""
+
+    def test_whitespace_comments_and_case(self):
+        """Пробелы, комментарии и регистр не меняют fingerprint"""
+        a = normalize_query("SELECT ID, NAME FROM STORGRP WHERE ID = ?")
+        b = normalize_query("""
+            select id,  name   -- список магазинов
+            from   storgrp /* все */
+            where id = ?;
+            """)
+
+        assert a.normalized == "SELECT ID, NAME FROM STORGRP WHERE ID = ?"
+        assert b.normalized == a.normalized
+        assert b.fingerprint == a.fingerprint
+        assert len(a.fingerprint) == 16
+
+    def test_literals_preserved(self):
+        """Строковые литералы и идентификаторы в кавычках не меняются"""
+        query = normalize_query("select 'a  -- b' as \"Mixed Name\" from t where x = 'It''s'")
+
+        assert query.normalized == "SELECT 'a  -- b' AS \"Mixed Name\" FROM T WHERE X = 'It''s'"
+        assert query.fingerprint != normalize_query("select 'A  -- B' from t").fingerprint
+
+    def test_different_queries_differ(self):
+        """Разные запросы дают разные fingerprint"""
+        assert (
+            normalize_query("SELECT * FROM A").fingerprint
+            != normalize_query("SELECT * FROM B").fingerprint
+        )
+
+    def test_cache_key_includes_params(self):
+        """Ключ кеша зависит от параметров, в том числе от их типа"""
+        query = normalize_query("SELECT * FROM T WHERE ID = ?")
+
+        assert query.cache_key() == query.fingerprint
+        assert query.cache_key((1,)) == query.cache_key([1])
+        assert query.cache_key((1,)) != query.cache_key((2,))
+        assert query.cache_key((1,)) != query.cache_key(("1",))
+
+    def test_memoized(self):
+        """Повторная нормализация того же текста не выполняется"""
+        text = "SELECT * FROM MEMO_TEST"
+        assert normalize_query(text) is normalize_query(text)
+
+
+class TestStripComments:
+    """Тесты удаления комментариев"""
+
+    def test_comments_outside_literals(self):
+        """Комментарии удаляются, маркеры комментариев в строках остаются"""
+        query = "SELECT '--x', '/*y*/' -- comment\nFROM T /* block */"
+
+        assert strip_comments(query) == "SELECT '--x', '/*y*/'  \nFROM T  "
+
+    def test_unterminated_block_comment(self):
+        """Незакрытый комментарий удаляется до конца текста"""
+        assert strip_comments("SELECT 1 /* DELETE") == "SELECT 1  "
@@ -0,0 +1,105 @@
+"""
+Тесты кеша подготовленных запросов на соединениях пула
+"""
+
+import pytest
+
+from app.sql import normalize_query
+from app.statements import StatementCache
+from tests.fakes import FakeServer
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+class TestStatementCache:
+    """Тесты LRU подготовленных запросов одного соединения"""
+
+    def test_prepare_once(self, server):
+        """Повторный запрос с другими параметрами не готовится заново"""
+        cache = StatementCache(server.connect(), capacity=4)
+
+        cache.execute(normalize_query("SELECT * FROM T WHERE ID = ?"), (1,))
+        cache.execute(normalize_query("select *  from t where id = ?"), (2,))
+
+        assert server.prepared == ["SELECT * FROM T WHERE ID = ?"]
+        assert [params for _, params in server.executed] == [(1,), (2,)]
+        stats = cache.stats.stats()
+        assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+    def test_lru_eviction(self, server):
+        """Сверх capacity вытесняется давно не использованный запрос"""
+        cache = StatementCache(server.connect(), capacity=2)
+        a, b, c = (normalize_query(f"SELECT * FROM {name}") for name in "ABC")
+
+        cache.execute(a)
+        cache.execute(b)
+        cache.execute(a)
+        cache.execute(c)
+        cache.execute(a)
+        cache.execute(b)
+
+        # B вытеснен при добавлении C и готовится заново
+        assert server.prepared == [f"SELECT * FROM {name}" for name in "ABCB"]
+        assert len(cache) == 2
+        assert cache.stats.stats()["evictions"] == 2
+
+    def test_failed_statement_dropped(self, server):
+        """Запрос, выполнение которого упало, удаляется из кеша"""
+        cache = StatementCache(server.connect(), capacity=2)
+        query = normalize_query("SELECT * FROM T")
+        cache.execute(query)
+
+        server.error = RuntimeError("unsuccessful metadata update")
+        with pytest.raises(RuntimeError):
+            cache.execute(query)
+        server.error = None
+        cache.execute(query)
+
+        assert len(server.prepared) == 2
+        assert cache.stats.stats()["invalidated"] == 1
+
+
+class TestDatabaseStatements:
+    """Подготовленные запросы в FirebirdDatabase"""
+
+    def test_reused_across_requests(self, fake_server):
+        """Соединение пула переиспользует подготовленный запрос между запросами"""
+        db = fake_server.db
+        for i in range(3):
+            db.execute("SELECT * FROM T WHERE ID = ?", (i,), use_cache=False)
+        list(db.stream_query("SELECT * FROM T WHERE ID = ?", (9,)))
+
+        assert fake_server.prepared == ["SELECT * FROM T WHERE ID = ?"]
+        assert db.statement_stats.stats()["hits"] == 3
+
+    def test_normalized_once(self, fake_server, monkeypatch):
+        """Запрос нормализуется один раз на вызов; готовая форма не пересчитывается"""
+        calls = []
+
+        def counting(query):
+            calls.append(query)
+            return normalize_query(query)
+
+        monkeypatch.setattr("app.database.normalize_query", counting)
+        db = fake_server.db
+
+        db.fetch("SELECT * FROM T WHERE ID = ?", (1,))
+        db.fetch("SELECT * FROM T WHERE ID = ?", (2,), use_cache=False)
+        assert len(calls) == 2
+
+        statement = normalize_query("SELECT * FROM T WHERE ID = ?")
+        db.fetch(statement.text, (3,), normalized=statement)
+        list(db.stream_query(statement.text, (4,), normalized=statement))
+        assert len(calls) == 2
+
+    def test_disabled(self, fake_server):
+        """statement_cache_size=0 - обычный execute без prepare"""
+        db = fake_server.db
+        db.statement_cache_size = 0
+        db.execute("SELECT * FROM T", use_cache=False)
+
+        assert fake_server.prepared == []
+        assert fake_server.executed[-1] == ("SELECT * FROM T", None)
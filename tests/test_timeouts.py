@@ -0,0 +1,246 @@
+"""
+Тесты таймаутов запросов и их отмены на сервере
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from app.config import settings
+from app.routers import query as query_router
+from app.timeouts import (
+    DISCONNECT,
+    CancelScope,
+    QueryCancelledError,
+    QueryTimeoutError,
+)
+from tests.fakes import column
+
+
+class TestCancelScope:
+    """Тесты дедлайна и отмены одного запроса"""
+
+    def test_no_timeout(self):
+        """timeout=0 - без дедлайна"""
+        scope = CancelScope(0)
+
+        assert scope.remaining() is None
+        assert scope.interrupted is False
+
+    def test_expired_before_start(self):
+        """Запрос, дождавшийся своей очереди после дедлайна, не начинается"""
+        scope = CancelScope(0.01)
+        time.sleep(0.02)
+
+        with pytest.raises(QueryTimeoutError):
+            scope.attach(object(), lambda conn: None)
+
+    def test_cancel_running(self):
+        """Отмена выполняющегося запроса уходит на его соединение"""
+        cancelled = []
+        scope = CancelScope(10)
+        scope.attach("conn", cancelled.append)
+
+        scope.cancel(DISCONNECT)
+        scope.cancel(DISCONNECT)
+
+        assert cancelled == ["conn"]
+        assert isinstance(scope.error(), QueryCancelledError)
+
+
+class TestDatabaseTimeouts:
+    """Таймауты в FirebirdDatabase поверх fake-соединений"""
+
+    def test_watchdog_cancels_on_server(self, fake_server):
+        """Без серверных таймаутов запрос прерывает сторож через cancel_operation"""
+        db = fake_server.db
+        db.query_timeout = 0.2
+        fake_server.delay = 5
+
+        started = time.monotonic()
+        with pytest.raises(QueryTimeoutError):
+            db.execute("SELECT * FROM T", use_cache=False)
+
+        assert time.monotonic() - started < 2
+        assert fake_server.cancels == 1
+        assert fake_server.immediate == []
+        assert db.watchdog.stats()["timed_out"] == 1
+
+        # Соединение вернулось в пул исправным и переиспользуется
+        fake_server.delay = 0
+        db.execute("SELECT * FROM T", use_cache=False)
+        assert len(fake_server.connections) == 1
+        assert db.pool.stats()["evicted_total"] == 0
+
+    def test_server_side_timeout(self, fake_server):
+        """Firebird 4+: таймаут выставляется на сессии и соблюдается сервером"""
+        fake_server.engine_version = 4.0
+        db = fake_server.db
+        db.query_timeout = 0.5
+
+        db.execute("SELECT * FROM T", use_cache=False)
+        db.execute("SELECT * FROM T", use_cache=False)
+        # Значение не менялось - команда отправлена один раз
+        assert fake_server.immediate == ["SET STATEMENT TIMEOUT 1 SECOND"]
+
+        fake_server.delay = 5
+        with pytest.raises(QueryTimeoutError):
+            db.execute("SELECT * FROM T", use_cache=False)
+        assert fake_server.cancels == 0
+
+    def test_cancel_from_another_thread(self, fake_server):
+        """Отмена (отключение клиента) прерывает выполняющийся запрос"""
+        db = fake_server.db
+        fake_server.delay = 5
+        scope = CancelScope(0)
+        errors = []
+
+        def run():
+            try:
+                db.fetch("SELECT * FROM T", scope=scope)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(0.1)
+        scope.cancel(DISCONNECT)
+        thread.join(timeout=2)
+
+        assert not thread.is_alive()
+        assert [type(e) for e in errors] == [QueryCancelledError]
+        assert db.watchdog.stats()["cancelled"] == 1
+
+    def test_timeout_not_logged_as_error(self, fake_server, caplog):
+        """Таймаут - ожидаемое завершение: в логе нет ERROR о сбое соединения"""
+        fake_server.delay = 5
+
+        with pytest.raises(QueryTimeoutError):
+            fake_server.db.fetch("SELECT * FROM T", scope=CancelScope(0.1))
+
+        errors = [r for r in caplog.records if r.name == "app.database" and r.levelname == "ERROR"]
+        assert not any("connection" in r.getMessage() for r in errors)
+
+    def test_db_time(self, fake_server):
+        """В scope копится время на сервере; ответ из кеша его не добавляет"""
+        fake_server.set_result([column("ID", int)], [(1,)])
+        fake_server.delay = 0.2
+        executed, cached = CancelScope(30), CancelScope(30)
+
+        fake_server.db.fetch("SELECT * FROM T", scope=executed)
+        fake_server.db.fetch("SELECT * FROM T", scope=cached)
+
+        assert executed.db_seconds >= 0.2
+        assert cached.db_seconds == 0
+
+    def _concurrent(self, fake_server, leader_scope, follower_scope):
+        """Ведущий и присоединившийся к нему одинаковый запрос: (результат, время) каждого"""
+        fake_server.set_result([column("ID", int)], [(1,)])
+        db = fake_server.db
+        outcomes = {}
+
+        def run(name, scope):
+            started = time.monotonic()
+            try:
+                outcome = db.fetch("SELECT * FROM T", scope=scope)[0]
+            except Exception as e:
+                outcome = e
+            outcomes[name] = (outcome, time.monotonic() - started)
+
+        leader = threading.Thread(target=run, args=("leader", leader_scope))
+        leader.start()
+        time.sleep(0.05)
+        follower = threading.Thread(target=run, args=("follower", follower_scope))
+        follower.start()
+        leader.join(timeout=5)
+        follower.join(timeout=5)
+        return outcomes["leader"], outcomes["follower"]
+
+    def test_follower_outlives_leader_timeout(self, fake_server):
+        """Таймаут ведущего не передается ожидающему: тот выполняет запрос сам"""
+        fake_server.delay = 0.3
+
+        leader, follower = self._concurrent(fake_server, CancelScope(0.1), CancelScope(30))
+
+        assert isinstance(leader[0], QueryTimeoutError)
+        assert len(follower[0]) == 1
+
+    def test_follower_own_timeout(self, fake_server):
+        """Ожидающий не ждет дольше своего таймаута"""
+        fake_server.delay = 1
+
+        leader, follower = self._concurrent(fake_server, CancelScope(30), CancelScope(0.2))
+
+        assert len(leader[0]) == 1
+        assert isinstance(follower[0], QueryTimeoutError)
+        assert follower[1] < 0.5
+
+    def test_follower_disconnect(self, fake_server):
+        """Отключение ожидающего клиента прекращает его ожидание"""
+        fake_server.delay = 1
+        scope = CancelScope(0)
+        threading.Timer(0.2, scope.cancel, args=(DISCONNECT,)).start()
+
+        leader, follower = self._concurrent(fake_server, CancelScope(30), scope)
+
+        assert isinstance(follower[0], QueryCancelledError)
+        assert follower[1] < 0.5
+        assert len(leader[0]) == 1
+
+    def test_watch_disconnect(self, monkeypatch):
+        """Отключение клиента во время ожидания ответа отменяет запрос"""
+        monkeypatch.setattr(query_router, "DISCONNECT_POLL_INTERVAL", 0.01)
+
+        class Disconnected:
+            async def is_disconnected(self):
+                return True
+
+        scope = CancelScope(0)
+        asyncio.run(query_router._watch_disconnect(Disconnected(), scope))
+
+        assert scope.reason == DISCONNECT
+
+
+class TestQueryTimeoutEndpoint:
+    """Таймауты /api/query"""
+
+    def test_request_timeout(self, client, auth_headers, fake_server):
+        """Запрос дольше timeout из тела прерывается, ответ - ошибка"""
+        fake_server.delay = 5
+
+        started = time.monotonic()
+        response = client.post(
+            "/api/query", json={"query": "SELECT * FROM T", "timeout": 0.2}, headers=auth_headers
+        ).json()
+
+        assert time.monotonic() - started < 2
+        assert response["success"] is False
+        assert response["error"] == "Query timed out after 0.2s"
+
+    def test_request_cannot_extend_timeout(self, client, auth_headers, fake_server, monkeypatch):
+        """Клиент не может попросить таймаут больше DB_QUERY_TIMEOUT"""
+        monkeypatch.setattr(settings, "db_query_timeout", 0.2)
+        fake_server.delay = 5
+
+        response = client.post(
+            "/api/query", json={"query": "SELECT * FROM T", "timeout": 100}, headers=auth_headers
+        ).json()
+
+        assert response["error"] == "Query timed out after 0.2s"
+
+    def test_stream_timeout(self, client, auth_headers, fake_server):
+        """Потоковый запрос по таймауту завершается trailer с ошибкой"""
+        fake_server.delay = 5
+
+        response = client.post(
+            "/api/query",
+            json={"query": "SELECT * FROM T", "stream": True, "timeout": 0.2},
+            headers=auth_headers,
+        )
+        trailer = json.loads(response.text.splitlines()[-1])["_trailer"]
+
+        assert trailer["success"] is False
+        assert trailer["error"] == "Query timed out after 0.2s"
@@ -0,0 +1,124 @@
+"""
+Тесты реестра API токенов
+"""
+
+import json
+import os
+
+import pytest
+
+from app.ratelimit import MemoryRateLimitStore, RateLimiter
+from app.tokens import TokenPolicy, TokenRegistry, hash_token
+
+
+def write_tokens(path, entries):
+    path.write_text(json.dumps({"tokens": entries}), encoding="utf-8")
+    # Время изменения должно отличаться даже на грубых файловых системах
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class TestTokenRegistry:
+    """Тесты поиска токенов, политик и перечитывания файла"""
+
+    def test_static_tokens(self):
+        """Токены из настроек с лимитами QUERY_TOKEN_LIMITS"""
+        registry = TokenRegistry(["a", "b"], limits={"b": (5, 100)})
+
+        auth = registry.lookup("b")
+
+        assert auth.token == "b"
+        assert auth.key == hash_token("b")
+        assert (auth.policy.max_rows, auth.policy.max_bytes) == (5, 100)
+        assert registry.lookup("a").policy.max_rows == 0
+        assert registry.lookup("c") is None
+        assert registry.lookup("") is None
+
+    def test_file_policies(self, tmp_path):
+        """Файл задает политики; токен можно указать только хешем"""
+        path = tmp_path / "tokens.json"
+        write_tokens(
+            path,
+            [
+                {"token": "pos-1", "name": "pos-1", "max_rows": 50, "cache_ttl": 30},
+                {"sha256": hash_token("reports"), "databases": ["shop.fdb"]},
+            ],
+        )
+        registry = TokenRegistry(["env-token"], path=str(path))
+
+        assert len(registry) == 3
+        pos = registry.lookup("pos-1")
+        assert (pos.label, pos.policy.max_rows, pos.policy.cache_ttl) == ("pos-1", 50, 30)
+        reports = registry.lookup("reports").policy
+        assert reports.allows_database("shop.fdb")
+        assert not reports.allows_database("other.fdb")
+        assert registry.lookup("env-token") is not None
+
+    def test_reload_on_change(self, tmp_path):
+        """Изменение файла подхватывается без перезапуска"""
+        path = tmp_path / "tokens.json"
+        write_tokens(path, [{"token": "old"}])
+        registry = TokenRegistry(path=str(path), reload_interval=0.001)
+
+        write_tokens(path, [{"token": "new"}])
+        registry._checked_at = 0
+
+        assert registry.lookup("new") is not None
+        assert registry.lookup("old") is None
+        assert registry.stats()["reloads"] == 2
+
+    def test_broken_file_keeps_tokens(self, tmp_path):
+        """Файл с ошибкой не применяется - действуют прежние токены"""
+        path = tmp_path / "tokens.json"
+        write_tokens(path, [{"token": "t"}])
+        registry = TokenRegistry(path=str(path))
+
+        write_tokens(path, [{"token": "t", "max_rowz": 1}])
+
+        assert registry.reload() is False
+        assert registry.lookup("t") is not None
+        assert registry.stats()["errors"] == 1
+
+    @pytest.mark.parametrize(
+        "entry",
+        [
+            {"name": "no token"},
+            {"token": "t", "sha256": hash_token("t")},
+            {"token": "t", "databases": "shop.fdb"},
+            {"token": "t", "max_rows": "5000"},
+            {"token": "t", "max_bytes": 1.5},
+            {"token": "t", "rate_limit_per_minute": -1},
+            {"token": "t", "rate_limit_concurrent": True},
+            {"token": "t", "cache_ttl": -30},
+            {"sha256": "not-a-digest"},
+        ],
+    )
+    def test_invalid_entries(self, tmp_path, entry):
+        """Записи без токена, с двумя токенами, неверными типами или значениями отклоняются"""
+        path = tmp_path / "tokens.json"
+        write_tokens(path, [entry])
+        registry = TokenRegistry(["env"])
+        registry.path = str(path)
+
+        assert registry.reload() is False
+        assert len(registry) == 1
+
+    def test_invalid_entry_logged(self, tmp_path, caplog):
+        """В логе - номер и имя записи и поле с ошибкой"""
+        path = tmp_path / "tokens.json"
+        write_tokens(path, [{"token": "a"}, {"token": "b", "name": "pos", "max_rows": "5000"}])
+
+        TokenRegistry(path=str(path))
+
+        message = " ".join(r.getMessage() for r in caplog.records if r.levelname == "ERROR")
+        assert "entry #1 (pos): max_rows: Input should be a valid integer" in message
+
+    def test_rate_limit_overrides(self):
+        """Политика переопределяет только заданные лимиты запросов"""
+        limiter = RateLimiter(MemoryRateLimitStore(), per_minute=60, per_hour=1000, concurrent=4)
+
+        limits = limiter.limits_for(TokenPolicy(rate_limit_per_minute=600))
+
+        assert limits.windows == [("minute", 600, 60.0), ("hour", 1000, 3600.0)]
+        assert limits.concurrent == 4
+        assert limiter.limits_for(TokenPolicy(name="x")) is limiter.limits
@@ -0,0 +1,74 @@
+"""
+Тесты трассировки фаз запроса
+"""
+
+import json
+
+import pytest
+
+from app.tracing import FileSpanExporter, Trace, _current, span
+
+
+@pytest.fixture
+def trace():
+    """Трасса текущего запроса"""
+    trace = Trace()
+    token = _current.set(trace)
+    yield trace
+    _current.reset(token)
+
+
+class TestTrace:
+    """Тесты фаз и Server-Timing"""
+
+    def test_span_without_trace(self):
+        """Вне запроса span ничего не записывает"""
+        with span("execute") as attributes:
+            attributes["rows"] = 1
+
+    def test_server_timing(self, trace):
+        """Повторы фазы складываются, порядок - по началу, total - последний"""
+        trace.add("validate", trace.started, trace.started + 1_000_000)
+        trace.add("execute", trace.started + 2_000_000, trace.started + 5_000_000)
+        trace.add("execute", trace.started + 6_000_000, trace.started + 7_500_000)
+
+        header = trace.server_timing(ended=trace.started + 10_000_000)
+
+        assert header == "validate;dur=1.00, execute;dur=4.50, total;dur=10.00"
+
+    def test_failed_span(self, trace):
+        """Фаза с исключением записывается с ошибкой"""
+        with pytest.raises(ValueError):
+            with span("fetch", fingerprint="abc"):
+                raise ValueError("boom")
+
+        name, _, _, attributes, failed = trace.spans[0]
+        assert (name, attributes, failed) == ("fetch", {"fingerprint": "abc"}, True)
+
+
+class TestFileSpanExporter:
+    """Тесты записи трасс в OTLP JSON"""
+
+    def test_export(self, tmp_path):
+        """Корневой span запроса и дочерние span'ы фаз в одной строке файла"""
+        path = tmp_path / "traces.jsonl"
+        exporter = FileSpanExporter(str(path), service_version="1.0.0")
+        trace = Trace("0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331")
+        trace.add("execute", trace.started + 1000, trace.started + 5000, {"rows": 2})
+
+        exporter.start()
+        exporter.export(trace, "POST /api/query", trace.started + 9000, {"status": 200}, False)
+        exporter.close()
+
+        lines = path.read_text().splitlines()
+        assert len(lines) == 1
+        resource_spans = json.loads(lines[0])["resourceSpans"][0]
+        spans = resource_spans["scopeSpans"][0]["spans"]
+        root, phase = spans
+        assert root["name"] == "POST /api/query"
+        assert root["traceId"] == "0af7651916cd43dd8448eb211c80319c"
+        assert root["parentSpanId"] == "b7ad6b7169203331"
+        assert phase["parentSpanId"] == root["spanId"]
+        assert int(phase["endTimeUnixNano"]) - int(phase["startTimeUnixNano"]) == 4000
+        assert phase["attributes"] == [{"key": "rows", "value": {"intValue": "2"}}]
+        assert exporter.stats()["exported"] == 1
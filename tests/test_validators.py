@@ -179,3 +179,58 @@ class TestSanitizeQuery:
         query = "  SELECT * FROM STORGRP  "
         result = sanitize_query(query)
         assert result == "SELECT * FROM STORGRP"
+
+    def test_keywords_in_literals_allowed(self):
+        """Ключевые слова в строках и идентификаторах в кавычках не блокируются"""
+        queries = [
+            "SELECT * FROM STORGRP WHERE NAME = 'DELETE'",
+            "SELECT 'a; DROP TABLE X' FROM RDB$DATABASE",
+            'SELECT "UPDATE" FROM "CREATE"',
+            "SELECT ID FROM T WHERE NOTE = 'It''s -- not a comment; DELETE'",
+        ]
+        for query in queries:
+            is_valid, error = validate_sql(query)
+            assert is_valid is True, query
+
+    def test_unterminated_literal_checked(self):
+        """Незакрытая кавычка не прячет ключевые слова за ней"""
+        is_valid, error = validate_sql("SELECT 'x FROM T; DELETE FROM T")
+        assert is_valid is False
+
+    def test_trailing_semicolon_allowed(self):
+        """Завершающая ; разрешена, второй запрос после нее - нет"""
+        assert validate_sql("SELECT * FROM T;")[0] is True
+        assert validate_sql("SELECT * FROM T; -- end")[0] is True
+
+        is_valid, error = validate_sql("SELECT * FROM T; SELECT * FROM G")
+        assert is_valid is False
+        assert "multiple statements" in error
+
+    def test_keyword_prefix_not_matched(self):
+        """Идентификаторы, содержащие ключевое слово, разрешены"""
+        assert validate_sql("SELECT UPDATED_AT, LAST_DELETE FROM T")[0] is True
+        assert validate_sql("SELECTED FROM T")[0] is False
+
+    def test_verdict_memoized(self):
+        """Повторный запрос (в том числе в другом регистре) не разбирается заново"""
+        from app.validators import _classify
+
+        validate_sql("SELECT * FROM MEMO_VALIDATE")
+        hits = _classify.cache_info().hits
+        validate_sql("select *  from memo_validate")
+
+        assert _classify.cache_info().hits == hits + 1
+
+    def test_worst_case_linear(self):
+        """Патологический ввод разбирается за линейное время"""
+        import time
+
+        for query in (
+            "SELECT " + "'" * 100_001,
+            "SELECT " + ";" * 100_000,
+            "SELECT " + "/*" * 50_000,
+            "SELECT " + "a " * 50_000 + "'",
+        ):
+            start = time.perf_counter()
+            validate_sql(query)
+            assert time.perf_counter() - start < 1.0